@@ -0,0 +1,86 @@
+import time
+import logging
+import datetime
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Shared by process_feedback (bumps the version after writing) and get_stats (reads it, and bumps
+# it after updating the counters): package this file next to their lambda_handler.py.
+
+# --- Constants ---
+# One item in a table with partition key 'CounterKey' (string), e.g. the stats counter table.
+# 'Version' is a number increased with an atomic ADD whenever the results table changes, so a
+# response computed at version N is still valid as long as the item still says N.
+DATA_VERSION_KEY = {'CounterKey': 'DATA_VERSION'}
+VERSION_ATTRIBUTE = 'Version'
+
+
+class DataVersion:
+    """
+    Reads and bumps the data version item. note_write() is cheap to call after every write: it
+    bumps at most once per min_interval_seconds (so a long upload shows up while it runs) and
+    remembers the rest for publish(), which the writer calls once when it is done.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, dynamodb_client, table_name, min_interval_seconds=5.0):
+        # dynamodb_client must accept plain Python types (see get_dynamodb_client)
+        self.dynamodb_client = dynamodb_client
+        self.table_name = table_name
+        self.min_interval_seconds = min_interval_seconds
+        self._lock = threading.Lock()
+        self._pending = False # Writes not yet covered by a bump
+        self._last_bump = float('-inf')
+
+    def read(self):
+        """Current version (0 before the first bump). Strongly consistent, so a bump is seen at once."""
+        response = self.dynamodb_client.get_item(
+            TableName=self.table_name,
+            Key=DATA_VERSION_KEY,
+            ConsistentRead=True,
+            ProjectionExpression='#v',
+            ExpressionAttributeNames={'#v': VERSION_ATTRIBUTE}
+        )
+        return int(response.get('Item', {}).get(VERSION_ATTRIBUTE, 0))
+
+    def bump(self):
+        """Increments the version. Returns the new version."""
+        response = self.dynamodb_client.update_item(
+            TableName=self.table_name,
+            Key=DATA_VERSION_KEY,
+            UpdateExpression='ADD #v :one SET #u = :now',
+            ExpressionAttributeNames={'#v': VERSION_ATTRIBUTE, '#u': 'UpdatedAt'},
+            ExpressionAttributeValues={':one': 1, ':now': datetime.datetime.now(datetime.timezone.utc).isoformat()},
+            ReturnValues='UPDATED_NEW'
+        )
+        return int(response.get('Attributes', {}).get(VERSION_ATTRIBUTE, 0))
+
+    def note_write(self):
+        """Records that the results table changed; bumps now if the last bump is old enough."""
+        with self._lock:
+            self._pending = True
+            if time.monotonic() - self._last_bump < self.min_interval_seconds:
+                return
+            self._pending = False
+            self._last_bump = time.monotonic()
+        self._bump_logged()
+
+    def publish(self):
+        """Bumps the version if writes were recorded since the last bump."""
+        with self._lock:
+            if not self._pending:
+                return
+            self._pending = False
+            self._last_bump = time.monotonic()
+        self._bump_logged()
+
+    def _bump_logged(self):
+        # Readers only miss an update until the next bump, so a failure must not fail the writer
+        try:
+            version = self.bump()
+            logger.info("Data version bumped to %s.", version)
+        except Exception as e:
+            logger.warning("Error bumping the data version in %s: %s", self.table_name, e)
+            with self._lock:
+                self._pending = True # Retried by the next note_write() or publish()
@@ -0,0 +1,22 @@
+from boto3.dynamodb.transform import TransformationInjector, copy_dynamodb_params
+
+# Shared by process_feedback, get_stats and export_csv (DYNAMODB_CLIENT_MODE=client): package this
+# file next to their lambda_handler.py.
+#
+# NOTE: TransformationInjector and copy_dynamodb_params are the (undocumented) hooks with which
+# boto3.resource('dynamodb') converts its client's parameters and results. They have been stable
+# across boto3 releases, but this is the one place to adapt if a boto3 upgrade changes them;
+# DYNAMODB_CLIENT_MODE=resource does not use them.
+
+
+def register_python_types(client):
+    """
+    Registers the conversion boto3.resource('dynamodb') applies to its client (plain Python
+    values in, plain Python values with Decimal numbers out) on a low-level DynamoDB client.
+    """
+    injector = TransformationInjector()
+    client.meta.events.register('provide-client-params.dynamodb', copy_dynamodb_params, unique_id='dynamodb-create-params-copy')
+    client.meta.events.register('before-parameter-build.dynamodb', injector.inject_condition_expressions, unique_id='dynamodb-condition-expression')
+    client.meta.events.register('before-parameter-build.dynamodb', injector.inject_attribute_value_input, unique_id='dynamodb-attr-value-input')
+    client.meta.events.register('after-call.dynamodb', injector.inject_attribute_value_output, unique_id='dynamodb-attr-value-output')
+    return client
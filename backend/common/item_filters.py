@@ -0,0 +1,150 @@
+import time
+import datetime
+
+from parallel_scan import parallel_scan, iter_scan_pages, add_projection
+
+# Shared by the read handlers (get_stats, export_csv): package this file next to their
+# lambda_handler.py, like the other sibling modules.
+
+# --- Constants ---
+# Attributes process_feedback writes on every item: the S3 key of the uploaded file and the ID of
+# the upload (one per object version). The source index is a GSI with partition key SourceObject
+# and sort key ProcessingTimestamp (projection ALL), so one file's rows are read with a Query.
+SOURCE_ATTRIBUTE = 'SourceObject'
+UPLOAD_ID_ATTRIBUTE = 'UploadId'
+TIMESTAMP_ATTRIBUTE = 'ProcessingTimestamp'
+# Query string parameters accepted by /stats and /export/csv
+FILTER_PARAMETERS = ('source', 'upload_id', 'from', 'to', 'category')
+
+
+def parse_timestamp(value, name, end_of_range=False):
+    """
+    ISO 8601 date or timestamp -> the naive UTC isoformat() that ProcessingTimestamp uses, so the
+    two compare as strings. A date alone means the whole day: its start for 'from', its end for 'to'.
+    """
+    try:
+        parsed = datetime.datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO 8601 date or timestamp (e.g. 2025-04-01 or 2025-04-01T09:00:00+09:00).")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    if end_of_range and len(value) == 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return parsed.isoformat()
+
+
+def parse_item_filter(query_parameters):
+    """
+    The filter of a request's query string ({} when it has none): source (S3 key of the uploaded
+    file), upload_id, from/to (inclusive, ISO 8601; stored timestamps are UTC) and category.
+    Raises ValueError with a message for the client.
+    """
+    item_filter = {}
+    for parameter in FILTER_PARAMETERS:
+        value = (query_parameters or {}).get(parameter)
+        if value is not None and str(value).strip():
+            item_filter[parameter] = str(value).strip()
+    if 'from' in item_filter:
+        item_filter['from'] = parse_timestamp(item_filter['from'], 'from')
+    if 'to' in item_filter:
+        item_filter['to'] = parse_timestamp(item_filter['to'], 'to', end_of_range=True)
+    if 'from' in item_filter and 'to' in item_filter and item_filter['from'] > item_filter['to']:
+        raise ValueError("from must not be later than to.")
+    return item_filter
+
+
+def timestamp_condition(item_filter, names, values):
+    """Condition on ProcessingTimestamp for from/to, or None."""
+    if 'from' not in item_filter and 'to' not in item_filter:
+        return None
+    names['#ts'] = TIMESTAMP_ATTRIBUTE
+    if 'from' in item_filter:
+        values[':from'] = item_filter['from']
+    if 'to' in item_filter:
+        values[':to'] = item_filter['to']
+    if 'from' in item_filter and 'to' in item_filter:
+        return '#ts BETWEEN :from AND :to'
+    return '#ts >= :from' if 'from' in item_filter else '#ts <= :to'
+
+
+def filter_read_args(item_filter, source_index_name=None):
+    """
+    ('query' or 'scan', read arguments) for the items matching item_filter. With a source and the
+    source index, a Query of that file's partition (the time window as the sort key condition);
+    otherwise a Scan. Conditions the key cannot express become a FilterExpression, which still
+    reads (and bills) every item of the Query or Scan.
+    """
+    names, values = {}, {}
+    key_conditions, filters = [], []
+    use_index = bool(source_index_name and 'source' in item_filter)
+    if 'source' in item_filter:
+        names['#src'] = SOURCE_ATTRIBUTE
+        values[':src'] = item_filter['source']
+        (key_conditions if use_index else filters).append('#src = :src')
+    time_condition = timestamp_condition(item_filter, names, values)
+    if time_condition is not None:
+        (key_conditions if use_index else filters).append(time_condition)
+    if 'upload_id' in item_filter:
+        names['#upl'] = UPLOAD_ID_ATTRIBUTE
+        values[':upl'] = item_filter['upload_id']
+        filters.append('#upl = :upl')
+    if 'category' in item_filter:
+        names['#cat'] = 'Category'
+        values[':cat'] = item_filter['category']
+        filters.append('#cat = :cat')
+
+    read_args = {}
+    if names:
+        read_args.update(ExpressionAttributeNames=names, ExpressionAttributeValues=values)
+    if key_conditions:
+        read_args.update(IndexName=source_index_name, KeyConditionExpression=' AND '.join(key_conditions))
+    if filters:
+        read_args['FilterExpression'] = ' AND '.join(filters)
+    return ('query' if use_index else 'scan'), read_args
+
+
+def query_all_items(table, attributes=None, **query_args):
+    """Every item of a Query, following LastEvaluatedKey (1 MB per page)."""
+    add_projection(query_args, attributes)
+    start = time.perf_counter()
+    response = table.query(**query_args)
+    items = response.get('Items', [])
+    scanned_count = response.get('ScannedCount', len(items))
+    while 'LastEvaluatedKey' in response:
+        response = table.query(ExclusiveStartKey=response['LastEvaluatedKey'], **query_args)
+        items.extend(response.get('Items', []))
+        scanned_count += response.get('ScannedCount', len(response.get('Items', [])))
+    print(f"Queried {len(items)} of {scanned_count} read items from index '{query_args.get('IndexName')}' in {time.perf_counter() - start:.2f}s.")
+    return items
+
+
+def read_filtered_items(table, item_filter, attributes=None, source_index_name=None, total_segments=1, max_workers=None):
+    """
+    (items matching item_filter reduced to `attributes`, 'query' or 'scan'). Only a filter with a
+    source is served by the source index; without one the whole table is scanned (in parallel segments).
+    """
+    read_path, read_args = filter_read_args(item_filter, source_index_name)
+    if read_path == 'query':
+        return query_all_items(table, attributes=attributes, **read_args), read_path
+    return parallel_scan(table, total_segments=total_segments, max_workers=max_workers, attributes=attributes, **read_args), read_path
+
+
+def iter_query_pages(table, attributes=None, **query_args):
+    """Yields the items of a Query one page (at most 1 MB) at a time."""
+    add_projection(query_args, attributes)
+    response = table.query(**query_args)
+    yield response.get('Items', [])
+    while 'LastEvaluatedKey' in response:
+        response = table.query(ExclusiveStartKey=response['LastEvaluatedKey'], **query_args)
+        yield response.get('Items', [])
+
+
+def iter_filtered_item_pages(table, item_filter, attributes=None, source_index_name=None, total_segments=1, max_workers=None):
+    """
+    (generator of item pages matching item_filter, 'query' or 'scan'): read_filtered_items() for
+    callers that stream the items out, so only a few pages are in memory at any time.
+    """
+    read_path, read_args = filter_read_args(item_filter, source_index_name)
+    if read_path == 'query':
+        return iter_query_pages(table, attributes=attributes, **read_args), read_path
+    return iter_scan_pages(table, total_segments=total_segments, max_workers=max_workers, attributes=attributes, **read_args), read_path
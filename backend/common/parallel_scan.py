@@ -0,0 +1,135 @@
+import time
+import queue
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Shared by the read handlers (get_stats, export_csv): package this file next to their
+# lambda_handler.py, like the other sibling modules.
+
+
+def projection_args(attributes):
+    """
+    Scan arguments that read only the given attributes. Placeholder names are used so that
+    attribute names which are DynamoDB reserved words still work.
+    """
+    return {
+        'ProjectionExpression': ', '.join(f'#p{i}' for i in range(len(attributes))),
+        'ExpressionAttributeNames': {f'#p{i}': name for i, name in enumerate(attributes)},
+    }
+
+
+def add_projection(read_args, attributes):
+    """Adds the ProjectionExpression of attributes to Scan/Query arguments, keeping the placeholder names of a FilterExpression."""
+    if attributes:
+        projection = projection_args(list(attributes))
+        read_args['ProjectionExpression'] = projection['ProjectionExpression']
+        read_args['ExpressionAttributeNames'] = dict(read_args.get('ExpressionAttributeNames') or {}, **projection['ExpressionAttributeNames'])
+    return read_args
+
+
+def thread_safe_scan(table):
+    """
+    The scan function to call from worker threads. boto3 clients are thread-safe but resources
+    are not, so for a Table resource the scan goes through its client (which converts types the same way).
+    """
+    meta = getattr(table, 'meta', None)
+    if meta is not None and getattr(meta, 'client', None) is not None and hasattr(table, 'name'):
+        return functools.partial(meta.client.scan, TableName=table.name)
+    return table.scan
+
+
+def scan_segment(scan, segment, total_segments, scan_args):
+    """All items of one segment, following LastEvaluatedKey (1 MB per page)."""
+    if total_segments > 1:
+        scan_args = dict(scan_args, Segment=segment, TotalSegments=total_segments)
+    response = scan(**scan_args)
+    items = response.get('Items', [])
+    while 'LastEvaluatedKey' in response:
+        response = scan(ExclusiveStartKey=response['LastEvaluatedKey'], **scan_args)
+        items.extend(response.get('Items', []))
+    return items
+
+
+def parallel_scan(table, total_segments=1, max_workers=None, attributes=None, **scan_args):
+    """
+    Returns every item of the table. With total_segments > 1 the scan is split into that many
+    segments (Segment/TotalSegments), read concurrently by a thread pool of max_workers threads
+    (default: one per segment). attributes limits the read to those attributes (ProjectionExpression);
+    other scan_args (e.g. a FilterExpression) are passed to every Scan call.
+    Items come segment by segment, so their order differs from a sequential scan.
+    """
+    total_segments = max(1, total_segments)
+    add_projection(scan_args, attributes)
+    scan = thread_safe_scan(table)
+    start = time.perf_counter()
+    if total_segments == 1:
+        items = scan_segment(scan, 0, 1, scan_args)
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers or total_segments, total_segments)) as executor:
+            # Any exception of a segment is raised here, after the other segments have finished
+            segments = list(executor.map(lambda segment: scan_segment(scan, segment, total_segments, scan_args), range(total_segments)))
+        items = [item for segment_items in segments for item in segment_items]
+    print(f"Scanned {len(items)} items in {total_segments} segment(s) in {time.perf_counter() - start:.2f}s.")
+    return items
+
+
+# Marks the end of one segment in the page queue of iter_scan_pages()
+SEGMENT_DONE = object()
+
+
+def iter_scan_pages(table, total_segments=1, max_workers=None, attributes=None, **scan_args):
+    """
+    Yields the items of the table one Scan page (at most 1 MB) at a time, for callers that write
+    the items out instead of keeping them (e.g. a streamed export). The segments are read by a
+    thread pool like parallel_scan(), but at most two pages per worker wait in memory: a worker
+    blocks until the caller has taken its pages. With one segment the worker still reads the next
+    page while the caller handles the current one.
+    """
+    total_segments = max(1, total_segments)
+    add_projection(scan_args, attributes)
+    scan = thread_safe_scan(table)
+    workers = min(max_workers or total_segments, total_segments)
+    pages = queue.Queue(maxsize=2 * workers)
+    stop = threading.Event() # Set when the caller stops early (error or closed generator)
+
+    def put_page(page):
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def read_segment(segment):
+        segment_args = dict(scan_args, Segment=segment, TotalSegments=total_segments) if total_segments > 1 else scan_args
+        try:
+            response = scan(**segment_args)
+            put_page(response.get('Items', []))
+            while 'LastEvaluatedKey' in response and not stop.is_set():
+                response = scan(ExclusiveStartKey=response['LastEvaluatedKey'], **segment_args)
+                put_page(response.get('Items', []))
+        except Exception as e:
+            put_page(e) # Raised in the caller's thread
+        else:
+            put_page(SEGMENT_DONE)
+
+    start = time.perf_counter()
+    item_count = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for segment in range(total_segments):
+            executor.submit(read_segment, segment)
+        try:
+            finished = 0
+            while finished < total_segments:
+                page = pages.get()
+                if page is SEGMENT_DONE:
+                    finished += 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    item_count += len(page)
+                    yield page
+        finally:
+            stop.set()
+    print(f"Streamed {item_count} items in {total_segments} segment(s) in {time.perf_counter() - start:.2f}s.")
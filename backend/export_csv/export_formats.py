@@ -0,0 +1,261 @@
+import csv
+import io
+import json
+import zlib
+import datetime
+from decimal import Decimal
+
+try:
+    import pyarrow # Optional: add the 'pyarrow' package (or a layer with it) to enable format=parquet
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# --- Constants ---
+# Exported columns in their default order, with their type. The values are converted once per
+# cell by the type's converter (CONVERTERS) and then written natively by each format:
+# 'int' and 'bool' become numbers and booleans in JSON Lines and Parquet, 'timestamp' (the naive
+# UTC isoformat of ProcessingTimestamp) a Parquet timestamp; CSV writes every value as text.
+EXPORT_COLUMNS = {
+    'CommentID': 'string',
+    'OriginalComment': 'string',
+    'ProcessingTimestamp': 'timestamp',
+    'OriginalCsvRowIndex': 'int',
+    'Sentiment': 'string',
+    'Category': 'string',
+    'Importance': 'int',
+    'IsHighRisk': 'bool',
+    'BedrockModelId': 'string',
+    'LLMError': 'string', # Include error info if available
+    'LLMRawResponseSnippet': 'string',
+    'LLMStatusCode': 'int',
+    'SourceObject': 'string', # Uploaded file (S3 key) and upload the row came from
+    'UploadId': 'string',
+}
+DEFAULT_FORMAT = 'csv'
+# Rows per Parquet row group: the rows of a group are buffered as Python values until it is
+# written, so this is a few scan pages (a full-width page is ~3,000 rows) to keep a job's memory
+# at a few pages plus two upload parts. Larger groups compress only slightly better.
+PARQUET_ROW_GROUP_ROWS = 10000
+
+
+def to_int(value):
+    """Decimal/int/numeric string -> int; None (empty cell, null) for anything else."""
+    if value is None or isinstance(value, bool):
+        return int(value) if isinstance(value, bool) else None
+    if isinstance(value, (int, Decimal)):
+        return int(value) if value % 1 == 0 else None
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        return None
+
+
+def to_bool(value):
+    """bool, Decimal 0/1 or 'True'/'False'/'Yes'/'No' strings (as seen in past logs) -> bool."""
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', 'yes')
+    return bool(value)
+
+
+def to_string(value):
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+CONVERTERS = {'string': to_string, 'timestamp': to_string, 'int': to_int, 'bool': to_bool}
+
+
+def parse_columns(value):
+    """
+    The columns= query parameter (comma separated, in the order given) -> list of column names.
+    Empty means every column. Raises ValueError with a message for the client.
+    """
+    if not value or not str(value).strip():
+        return list(EXPORT_COLUMNS)
+    columns = list(dict.fromkeys(name.strip() for name in str(value).split(',') if name.strip()))
+    unknown = [name for name in columns if name not in EXPORT_COLUMNS]
+    if unknown or not columns:
+        raise ValueError(f"Unknown column(s): {', '.join(unknown)}. Available: {', '.join(EXPORT_COLUMNS)}.")
+    return columns
+
+
+def parse_format(value):
+    """The format= query parameter -> format name. Raises ValueError with a message for the client."""
+    name = str(value or DEFAULT_FORMAT).strip().lower()
+    if name not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}.")
+    if name == 'parquet' and pyarrow is None:
+        raise ValueError("format=parquet is not available: the pyarrow package is not installed in this function.")
+    return name
+
+
+def row_converter(columns):
+    """Function item -> tuple of typed values in column order."""
+    converters = [(name, CONVERTERS[EXPORT_COLUMNS[name]]) for name in columns]
+    return lambda item: tuple(convert(item.get(name)) for name, convert in converters)
+
+
+# --- Formats ---
+# Each writer gets the typed rows a page at a time (write_rows) and passes the encoded bytes to
+# sink(bytes) as it goes, so a streamed export never holds more than a page (Parquet: a row group).
+class CsvWriter:
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+    binary = False
+
+    def __init__(self, columns, sink):
+        self.sink = sink
+        self.buffer = io.StringIO()
+        # QUOTE_ALL as before, for commas, quotes and newlines in the comment text
+        self.writer = csv.writer(self.buffer, quoting=csv.QUOTE_ALL)
+        self.writer.writerow(columns)
+        self.columns = columns
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+        self._flush()
+
+    def write_empty_message(self):
+        """Header plus a message row, for an export without data."""
+        self.writer.writerow(["No data to export."] + [""] * (len(self.columns) - 1))
+
+    def _flush(self):
+        self.sink(self.buffer.getvalue().encode('utf-8'))
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+    def close(self):
+        self._flush()
+
+
+class GzipCsvWriter(CsvWriter):
+    """The same CSV, gzip-compressed as it is written (a .csv.gz file)."""
+    content_type = 'application/gzip'
+    extension = 'csv.gz'
+    binary = True
+
+    def __init__(self, columns, sink):
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # wbits 31: gzip container
+        self.compressed_sink = sink
+        super().__init__(columns, lambda data: self.compressed_sink(self.compressor.compress(data)))
+
+    def close(self):
+        super().close()
+        self.compressed_sink(self.compressor.flush())
+
+
+class JsonLinesWriter:
+    """One JSON object per row (UTF-8, no ASCII escaping); missing values are null."""
+    content_type = 'application/x-ndjson'
+    extension = 'jsonl'
+    binary = False
+
+    def __init__(self, columns, sink):
+        self.columns = columns
+        self.sink = sink
+        self.encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    def write_rows(self, rows):
+        columns, encode = self.columns, self.encoder.encode
+        self.sink(''.join(encode(dict(zip(columns, row))) + '\n' for row in rows).encode('utf-8'))
+
+    def write_empty_message(self):
+        pass # An empty file is a valid (empty) JSON Lines export
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    """
+    Parquet with one typed column per exported column (strings are dictionary-encoded by the
+    writer, ProcessingTimestamp is a UTC timestamp). Rows are buffered per column and written
+    as row groups of PARQUET_ROW_GROUP_ROWS.
+    """
+    content_type = 'application/vnd.apache.parquet'
+    extension = 'parquet'
+    binary = True
+
+    def __init__(self, columns, sink, compression='snappy'):
+        types = {'string': pyarrow.string(), 'timestamp': pyarrow.timestamp('us', tz='UTC'), 'int': pyarrow.int64(), 'bool': pyarrow.bool_()}
+        self.columns = columns
+        self.schema = pyarrow.schema([(name, types[EXPORT_COLUMNS[name]]) for name in columns])
+        self.values = [[] for _ in columns]
+        self.buffered_rows = 0
+        self.output = SinkFile(sink)
+        self.writer = pyarrow.parquet.ParquetWriter(self.output, self.schema, compression=compression)
+
+    def write_rows(self, rows):
+        for row in rows:
+            for values, value in zip(self.values, row):
+                values.append(value)
+        self.buffered_rows += len(rows)
+        if self.buffered_rows >= PARQUET_ROW_GROUP_ROWS:
+            self._write_row_group()
+
+    def _write_row_group(self):
+        arrays = []
+        for field, values in zip(self.schema, self.values):
+            if pyarrow.types.is_timestamp(field.type):
+                arrays.append(to_timestamp_array(values, field.type))
+            else:
+                arrays.append(pyarrow.array(values, field.type))
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+        self.values = [[] for _ in self.columns]
+        self.buffered_rows = 0
+
+    def write_empty_message(self):
+        pass # The file still has the schema (zero rows)
+
+    def close(self):
+        if self.buffered_rows:
+            self._write_row_group()
+        self.writer.close()
+
+
+def to_timestamp_array(values, arrow_type):
+    """Naive UTC isoformat strings -> timestamp array. Malformed values become null."""
+    try:
+        # Parsed in C by the cast; fails as a whole on a single malformed value
+        return pyarrow.array(values, pyarrow.string()).cast(pyarrow.timestamp('us')).cast(arrow_type)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowNotImplementedError):
+        parsed = []
+        for value in values:
+            try:
+                moment = datetime.datetime.fromisoformat(value) if value else None
+            except ValueError:
+                moment = None
+            if moment is not None and moment.tzinfo is None:
+                moment = moment.replace(tzinfo=datetime.timezone.utc)
+            parsed.append(moment)
+        return pyarrow.array(parsed, arrow_type)
+
+
+class SinkFile(io.RawIOBase):
+    """Write-only file object that hands everything written to sink(bytes) (for pyarrow's writer)."""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self.sink(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+
+FORMATS = {
+    'csv': CsvWriter,
+    'csv.gz': GzipCsvWriter,
+    'jsonl': JsonLinesWriter,
+    'parquet': ParquetWriter,
+}
@@ -0,0 +1,165 @@
+import time
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+# --- Constants ---
+# One item per export job in a table with partition key 'JobId' (string). Status names follow the
+# checkpoint records of process_feedback; ExpiresAt (epoch seconds) can be the table's TTL attribute.
+JOB_STATUS_PENDING = 'PENDING'
+JOB_STATUS_RUNNING = 'RUNNING'
+JOB_STATUS_COMPLETE = 'COMPLETE'
+JOB_STATUS_FAILED = 'FAILED'
+# S3 rejects multipart parts smaller than 5 MiB (except the last one)
+MIN_PART_SIZE_BYTES = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+
+def parse_s3_uri(uri):
+    """'s3://bucket/prefix/' -> (bucket, prefix). The prefix is '' or ends with '/'."""
+    if not uri or not uri.startswith('s3://'):
+        raise ValueError(f"Not an S3 URI: {uri!r}")
+    bucket, _, prefix = uri[len('s3://'):].partition('/')
+    if prefix and not prefix.endswith('/'):
+        prefix += '/'
+    return bucket, prefix
+
+
+def utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+class ExportJobStore:
+    """
+    Status records of export jobs. The API invocation creates the record (PENDING), the worker
+    invocation claims it (RUNNING, with a lease so that an asynchronous retry of a worker that
+    timed out can take the job over), reports progress after every part and finishes it.
+    """
+
+    def __init__(self, dynamodb_client, table_name):
+        # dynamodb_client must accept plain Python types (see get_dynamodb_client)
+        self.dynamodb_client = dynamodb_client
+        self.table_name = table_name
+
+    def create(self, job_id, item_filter_json, ttl_seconds, export_format='csv', columns_json=None):
+        now = utc_now()
+        self.dynamodb_client.put_item(
+            TableName=self.table_name,
+            Item={
+                'JobId': job_id,
+                'JobStatus': JOB_STATUS_PENDING,
+                'ItemFilter': item_filter_json,
+                'ExportFormat': export_format,
+                'Columns': columns_json or '[]',
+                'CreatedAt': now,
+                'UpdatedAt': now,
+                'ExpiresAt': int(time.time()) + int(ttl_seconds),
+            },
+            ConditionExpression='attribute_not_exists(JobId)'
+        )
+
+    def load(self, job_id):
+        """The job record, or None if there is no such job."""
+        response = self.dynamodb_client.get_item(TableName=self.table_name, Key={'JobId': job_id}, ConsistentRead=True)
+        return response.get('Item')
+
+    def claim(self, job_id, lease_seconds):
+        """Marks a pending job (or a running one whose lease expired) as running. False if another worker has it or it is finished."""
+        now = int(time.time())
+        try:
+            self.dynamodb_client.update_item(
+                TableName=self.table_name,
+                Key={'JobId': job_id},
+                UpdateExpression='SET #s = :running, #l = :expires, #u = :updated',
+                ConditionExpression='#s = :pending OR (#s = :running AND #l < :now)',
+                ExpressionAttributeNames={'#s': 'JobStatus', '#l': 'LeaseExpiresAt', '#u': 'UpdatedAt'},
+                ExpressionAttributeValues={
+                    ':running': JOB_STATUS_RUNNING,
+                    ':pending': JOB_STATUS_PENDING,
+                    ':expires': now + int(lease_seconds),
+                    ':now': now,
+                    ':updated': utc_now(),
+                }
+            )
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def update(self, job_id, **attributes):
+        """SETs the given attributes (and UpdatedAt) on the job record."""
+        attributes['UpdatedAt'] = utc_now()
+        names = {f'#a{i}': name for i, name in enumerate(attributes)}
+        self.dynamodb_client.update_item(
+            TableName=self.table_name,
+            Key={'JobId': job_id},
+            UpdateExpression='SET ' + ', '.join(f'#a{i} = :v{i}' for i in range(len(attributes))),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={f':v{i}': value for i, value in enumerate(attributes.values())}
+        )
+
+
+class MultipartUpload:
+    """
+    Writes one S3 object as a multipart upload from a stream of byte chunks. Data is buffered up
+    to part_size_bytes; a full part is uploaded by a background thread while the caller produces
+    the next one, so at most two parts are held in memory. complete() uploads the rest (the last
+    part may be smaller) and returns the object size; abort() discards the uploaded parts.
+    """
+
+    def __init__(self, s3_client, bucket, key, part_size_bytes, on_part=None, **create_args):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size_bytes = max(MIN_PART_SIZE_BYTES, int(part_size_bytes))
+        self.on_part = on_part # Called with (part count, bytes uploaded) after each part
+        self.upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key, **create_args)['UploadId']
+        self.buffer = bytearray()
+        self.parts = []
+        self.bytes_uploaded = 0
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._in_flight = None
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.part_size_bytes:
+            self._flush()
+
+    def _flush(self):
+        if len(self.parts) + (self._in_flight is not None) >= MAX_PARTS:
+            raise ValueError(f"Export exceeds {MAX_PARTS} parts; increase EXPORT_PART_SIZE_MB.")
+        self._wait()
+        body, self.buffer = bytes(self.buffer), bytearray()
+        self._in_flight = self._executor.submit(self._upload_part, len(self.parts) + 1, body)
+
+    def _upload_part(self, part_number, body):
+        response = self.s3_client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=part_number, Body=body)
+        return {'PartNumber': part_number, 'ETag': response['ETag']}, len(body)
+
+    def _wait(self):
+        if self._in_flight is None:
+            return
+        in_flight, self._in_flight = self._in_flight, None
+        part, size = in_flight.result() # Raises the upload's exception
+        self.parts.append(part)
+        self.bytes_uploaded += size
+        if self.on_part is not None:
+            self.on_part(len(self.parts), self.bytes_uploaded)
+
+    def complete(self):
+        if self.buffer or (not self.parts and self._in_flight is None):
+            self._flush() # An empty object still needs one part
+        self._wait()
+        self._executor.shutdown()
+        self.s3_client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={'Parts': self.parts})
+        return self.bytes_uploaded
+
+    def abort(self):
+        self._executor.shutdown(wait=True)
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        except Exception as e:
+            # A bucket lifecycle rule (AbortIncompleteMultipartUpload) removes the parts later
+            print(f"Error aborting multipart upload of s3://{self.bucket}/{self.key}: {e}")
@@ -1,159 +1,410 @@
+import time
+MODULE_IMPORT_START = time.perf_counter() # Start of the import, for the cold-start report
 import json
 import boto3
 import os
-import csv
-import io
+import uuid
+import base64
 from decimal import Decimal # Important for DynamoDB numbers
+from dynamodb_types import register_python_types
+from item_filters import parse_item_filter, iter_filtered_item_pages
+from export_formats import FORMATS, parse_format, parse_columns, row_converter
+from export_jobs import (ExportJobStore, MultipartUpload, parse_s3_uri, utc_now,
+                         JOB_STATUS_COMPLETE, JOB_STATUS_FAILED)
 
 # --- Configuration ---
 DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME')
+# 'client' (default): a low-level DynamoDB client with the resource layer's type conversion
+# registered on it. 'resource': boto3.resource('dynamodb').Table, which also loads the resource
+# model at cold start. Both return items with plain Python values (numbers as Decimal).
+DYNAMODB_CLIENT_MODE = os.environ.get('DYNAMODB_CLIENT_MODE', 'client').lower()
+# The export scan is split into SCAN_TOTAL_SEGMENTS segments read in parallel by up to
+# SCAN_MAX_WORKERS threads (default: one per segment). 1 scans sequentially.
+SCAN_TOTAL_SEGMENTS = int(os.environ.get('SCAN_TOTAL_SEGMENTS', '4'))
+SCAN_MAX_WORKERS = int(os.environ.get('SCAN_MAX_WORKERS', '0')) or None
+# Optional GSI with partition key SourceObject and sort key ProcessingTimestamp (projection ALL), the
+# same as get_stats uses: ?source=<S3 key> exports that file's rows with a Query instead of a scan.
+SOURCE_INDEX_NAME = os.environ.get('SOURCE_INDEX_NAME')
+# --- Export Jobs (POST /export/jobs, GET /export/jobs/{job_id}) ---
+# Job status records (table with partition key JobId, string) and where the export files are written
+# (s3://bucket/prefix/). Both are needed for the job mode; GET /export/csv works without them.
+EXPORT_JOB_TABLE_NAME = os.environ.get('EXPORT_JOB_TABLE_NAME')
+EXPORT_S3_URI = os.environ.get('EXPORT_S3_URI')
+# Size of the multipart upload's parts (S3's minimum is 5 MiB); bounds the memory of a job
+EXPORT_PART_SIZE_MB = int(os.environ.get('EXPORT_PART_SIZE_MB', '8'))
+# Lifetime of the presigned download URL, and of the job records (ExpiresAt, for the table's TTL)
+EXPORT_URL_EXPIRES_SECONDS = int(os.environ.get('EXPORT_URL_EXPIRES_SECONDS', '900'))
+EXPORT_JOB_TTL_SECONDS = int(os.environ.get('EXPORT_JOB_TTL_SECONDS', str(7 * 24 * 3600)))
+# A job stops reading when less than this remains of the invocation, so that it can abort the
+# upload and mark itself FAILED before Lambda's timeout (a timed-out job would stay RUNNING)
+EXPORT_TIME_MARGIN_SECONDS = int(os.environ.get('EXPORT_TIME_MARGIN_SECONDS', '60'))
+# Exported file name: EXPORT_FILE_STEM plus the format's extension (feedback_analysis.csv, ...)
+EXPORT_FILE_STEM = 'feedback_analysis'
+# Compression of format=parquet ('snappy', 'zstd', 'gzip' or 'none')
+EXPORT_PARQUET_COMPRESSION = os.environ.get('EXPORT_PARQUET_COMPRESSION', 'snappy')
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*', # WARNING: Use a specific origin in production!
+    'Access-Control-Allow-Methods': 'GET,POST,OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
+}
 
 # --- AWS Clients ---
-# Use the resource for easier table interaction
-dynamodb_resource = boto3.resource('dynamodb')
-# Initialize table resource globally
+# The clients and table handle are created by the first invocation and reused while the container is warm
+dynamodb_resource = None # 'resource' mode only
+dynamodb_client = None # Accepts and returns plain Python types in both modes
 table = None
-if DYNAMODB_TABLE_NAME: # Only initialize if env var is set
-    try:
-        table = dynamodb_resource.Table(DYNAMODB_TABLE_NAME)
-        print(f"Initialized DynamoDB table resource: {DYNAMODB_TABLE_NAME}")
-    except Exception as e:
-        print(f"Error initializing DynamoDB table resource '{DYNAMODB_TABLE_NAME}' globally: {e}")
-        # Handle this error in the handler function
+s3_client = None # Job mode only
+lambda_client = None # Starts the job's worker invocation
+client_init_seconds = 0.0 # Time spent constructing the client, for the cold-start report
+
+
+class TableClient:
+    """The part of the Table resource used here (scan, query), on a low-level client."""
+
+    def __init__(self, client, table_name):
+        self.client = client
+        self.table_name = table_name
+
+    def scan(self, **kwargs):
+        return self.client.scan(TableName=self.table_name, **kwargs)
+
+    def query(self, **kwargs):
+        return self.client.query(TableName=self.table_name, **kwargs)
+
+
+def get_dynamodb_client():
+    """Returns the cached DynamoDB client, creating it on first use."""
+    global dynamodb_resource, dynamodb_client, client_init_seconds
+    if dynamodb_client is None:
+        init_start = time.perf_counter()
+        if DYNAMODB_CLIENT_MODE == 'resource':
+            dynamodb_resource = boto3.resource('dynamodb')
+            dynamodb_client = dynamodb_resource.meta.client
+        else:
+            dynamodb_client = register_python_types(boto3.client('dynamodb'))
+        client_init_seconds += time.perf_counter() - init_start
+    return dynamodb_client
+
+
+def get_table():
+    """Returns the cached table handle, creating it on first use. None if it cannot be created."""
+    global table
+    if table is None and DYNAMODB_TABLE_NAME: # Only initialize if env var is set
+        try:
+            client = get_dynamodb_client()
+            table = dynamodb_resource.Table(DYNAMODB_TABLE_NAME) if dynamodb_resource is not None else TableClient(client, DYNAMODB_TABLE_NAME)
+            print(f"Initialized DynamoDB table handle ({DYNAMODB_CLIENT_MODE}): {DYNAMODB_TABLE_NAME}")
+        except Exception as e:
+            print(f"Error initializing DynamoDB table handle '{DYNAMODB_TABLE_NAME}': {e}")
+            # Handle this error in the handler function
+    return table
+
+
+def get_s3_client():
+    """Returns the cached S3 client, creating it on first use."""
+    global s3_client, client_init_seconds
+    if s3_client is None:
+        init_start = time.perf_counter()
+        s3_client = boto3.client('s3')
+        client_init_seconds += time.perf_counter() - init_start
+    return s3_client
+
+
+def get_lambda_client():
+    global lambda_client
+    if lambda_client is None:
+        lambda_client = boto3.client('lambda')
+    return lambda_client
+
+
+def get_export_job_store():
+    """Returns the job store, or None if the job mode is not configured."""
+    if not (EXPORT_JOB_TABLE_NAME and EXPORT_S3_URI):
+        return None
+    return ExportJobStore(get_dynamodb_client(), EXPORT_JOB_TABLE_NAME)
+
+
+# --- Cold-Start Report ---
+# Module-level setup ends here. The report (import time, client construction time and the
+# duration of the first invocation) is printed once per container by lambda_handler().
+MODULE_IMPORT_SECONDS = time.perf_counter() - MODULE_IMPORT_START
+cold_start_report = None # Set by the first invocation of this container
 
 
 # --- Lambda Handler Function ---
 # Handler name is lambda_handler (standard for API Gateway proxy)
 def lambda_handler(event, context):
+    """Entry point. Prints the cold-start report after the container's first invocation."""
+    global cold_start_report
+    if cold_start_report is not None:
+        return handle_request(event, context)
+    cold_start_report = {}
+    invocation_start = time.perf_counter()
+    try:
+        return handle_request(event, context)
+    finally:
+        cold_start_report.update({
+            'import_ms': round(MODULE_IMPORT_SECONDS * 1000, 1),
+            'client_init_ms': round(client_init_seconds * 1000, 1),
+            'first_invocation_ms': round((time.perf_counter() - invocation_start) * 1000, 1),
+            'dynamodb_client_mode': DYNAMODB_CLIENT_MODE,
+        })
+        print(f"Cold start: {json.dumps(cold_start_report)}")
+
+
+def json_response(status_code, body):
+    """JSON response with the CORS headers of every route of this function."""
+    return {
+        'statusCode': status_code,
+        'headers': dict(CORS_HEADERS, **{'Content-Type': 'application/json'}),
+        'body': json.dumps(body),
+        'isBase64Encoded': False
+    }
+
+
+def handle_request(event, context):
     """
-    API endpoint to export analyzed comments as CSV.
-    NOTE: Scanning DynamoDB for export is inefficient for large tables.
+    API endpoint to export analyzed comments as CSV (or format=csv.gz|jsonl|parquet, columns=a,b,...).
+    ?source=<S3 key>&upload_id=&from=&to=&category= exports only the matching rows; with
+    SOURCE_INDEX_NAME set, a source is read by Query. NOTE: Without a source the table is scanned.
     """
     print("Executing ExportCsvLambda (renamed handler).")
 
+    # Export jobs: the worker invocation started by POST /export/jobs, and the job API
+    if event.get('action') == 'run_export_job':
+        return run_export_job(event.get('job_id'), context)
+    path = event.get('resource') or event.get('path') or ''
+    if path.endswith('/export/jobs') and event.get('httpMethod') == 'POST':
+        return start_export_job(event, context)
+    if '/export/jobs/' in path:
+        return get_export_job(event)
+
     # Check if table resource was initialized
+    table = get_table()
     if table is None:
-         print("Error: DynamoDB table resource not initialized.")
-         # Return error response with CORS headers
-         return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*', # WARNING: Use a specific origin in production!
-                'Access-Control-Allow-Methods': 'GET,OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-            },
-            'body': json.dumps({"error": f"Configuration error: DynamoDB table name not set or table resource initialization failed."}),
-            'isBase64Encoded': False # Added
-         }
+        print("Error: DynamoDB table resource not initialized.")
+        return json_response(500, {"error": "Configuration error: DynamoDB table name not set or table resource initialization failed."})
 
+    # Which comments to export (all of them, or those matching the query parameters), which
+    # columns (columns=) and in which format (format=csv|csv.gz|jsonl|parquet)
+    try:
+        item_filter, format_name, columns = parse_export_request(event.get('queryStringParameters') or {})
+    except ValueError as e:
+        return json_response(400, {"error": str(e)})
 
     try:
-        # You might add logic here to filter which comments to export
-        # based on query parameters (e.g., specific category, sentiment)
-        # For simplicity, let's export all processed comments.
-
-        print(f"Scanning DynamoDB table '{DYNAMODB_TABLE_NAME}' for export...")
-        response = table.scan()
-        items = response.get('Items', []) # Use .get with default empty list
-
-        # Handle pagination for large datasets
-        while 'LastEvaluatedKey' in response:
-            print("Scanning for more results...")
-            response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-            items.extend(response.get('Items', []))
-
-        print(f"Retrieved {len(items)} items for export.")
-
-        # Define CSV headers
-        # Ensure order is consistent
-        headers = [
-            'CommentID',
-            'OriginalComment',
-            'ProcessingTimestamp',
-            'OriginalCsvRowIndex',
-            'Sentiment',
-            'Category',
-            'Importance',
-            'IsHighRisk',
-            'BedrockModelId',
-            'LLMError', # Include error info if available
-            'LLMRawResponseSnippet',
-            'LLMStatusCode'
-        ]
-
-        output = io.StringIO()
-        writer = csv.DictWriter(output, fieldnames=headers, quoting=csv.QUOTE_ALL) # Use QUOTE_ALL for better handling of commas/quotes in text
-
-        writer.writeheader()
-        if not items:
-            # Write a message row if no data, but still provide headers
-             writer.writerow({header: "No data to export." if header == headers[0] else "" for header in headers})
-             print("No items found in the table. Writing empty CSV with message row.")
-        else:
-            for item in items:
-                # Process each item to ensure types are suitable for CSV
-                row_to_write = {}
-                for header in headers:
-                    value = item.get(header)
-
-                    # Convert Decimal values to standard types
-                    if isinstance(value, Decimal):
-                        # Attempt integer conversion if no decimal part, else float, else string
-                        try:
-                            if value % 1 == 0:
-                                 row_to_write[header] = int(value)
-                            else:
-                                 row_to_write[header] = float(value)
-                        except Exception:
-                             row_to_write[header] = str(value) # Fallback
-
-                    # Convert Boolean values to string representation ("True" or "False")
-                    elif isinstance(value, bool):
-                        row_to_write[header] = str(value)
-
-                    # Handle potential string representations of boolean (as seen in past logs)
-                    # Ensure these are also represented as "True" or "False" strings in CSV
-                    elif header == 'IsHighRisk' and isinstance(value, str):
-                         row_to_write[header] = str(value.lower() in ['true', 'yes']) # Convert 'True'/'False'/'Yes'/'No' strings to "True"/"False"
-
-                    # Keep other types as is (string). DictWriter handles None by leaving field empty.
-                    else:
-                        row_to_write[header] = value # DictWriter will write None as empty string
-
-                writer.writerow(row_to_write)
-
-        csv_content = output.getvalue()
-        status_code = 200 # Status is 200 even for empty data
+        chunks = []
+        row_count, _ = write_export(table, item_filter, format_name, columns, chunks.append)
+        content = b''.join(chunks)
+        file_format = FORMATS[format_name]
+        print(f"Exported {row_count} items as {format_name} ({len(content)} bytes).")
 
         # --- Return Response ---
-        # Return structure for API Gateway Lambda Proxy Integration for non-JSON body
+        # Return structure for API Gateway Lambda Proxy Integration for non-JSON body (status is 200 even for empty data)
         return {
-            'statusCode': status_code,
-            'headers': {
-                'Content-Type': 'text/csv',
-                'Content-Disposition': 'attachment; filename="feedback_analysis.csv"',
-                 # Add CORS headers for OPTIONS preflight request from frontend if necessary
-                 # (Even though window.location.href doesn't send OPTIONS, it's good practice if this endpoint might be used by fetch/XHR later)
-                'Access-Control-Allow-Origin': '*', # WARNING: Use a specific origin in production!
-                'Access-Control-Allow-Methods': 'GET,OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-            },
-            'body': csv_content,
-            'isBase64Encoded': False # <-- CRITICAL: Tell API Gateway the body is plain text
+            'statusCode': 200,
+            'headers': dict(CORS_HEADERS, **{
+                'Content-Type': file_format.content_type,
+                'Content-Disposition': f'attachment; filename="{EXPORT_FILE_STEM}.{file_format.extension}"',
+            }),
+            # Binary formats (csv.gz, parquet) are base64 encoded; API Gateway decodes them (binary media types)
+            'body': base64.b64encode(content).decode('ascii') if file_format.binary else content.decode('utf-8'),
+            'isBase64Encoded': file_format.binary # <-- CRITICAL: Tell API Gateway whether the body is plain text
         }
 
     except Exception as e:
         print(f"Error in ExportCsvLambda: {e}")
-        # Return error response with CORS headers
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json', # Error response is JSON
-                'Access-Control-Allow-Origin': '*', # WARNING: Use a specific origin in production!
-                'Access-Control-Allow-Methods': 'GET,OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-            },
-            'body': json.dumps({"error": f"Internal server error during export: {str(e)}"}),
-            'isBase64Encoded': False # Added
-        }
\ No newline at end of file
+        return json_response(500, {"error": f"Internal server error during export: {str(e)}"})
+
+
+def parse_export_request(query_parameters):
+    """(item filter, format name, column names) of an export request. Raises ValueError with a message for the client."""
+    return (parse_item_filter(query_parameters), parse_format(query_parameters.get('format')),
+            parse_columns(query_parameters.get('columns')))
+
+
+def write_export(table, item_filter, format_name, columns, sink, on_page=None):
+    """
+    Streams the matching items in the given format to sink(bytes), a page at a time. Only the
+    selected columns are read (ProjectionExpression); a source is queried from the source index,
+    anything else is scanned in parallel segments (with a FilterExpression). Each cell is converted
+    once to its column's type (export_formats.EXPORT_COLUMNS). on_page(rows so far) is called after
+    every page. Returns (row count, 'query' or 'scan').
+    """
+    print(f"Reading DynamoDB table '{DYNAMODB_TABLE_NAME}' for export (filter: {item_filter or 'none'}, format: {format_name}, {len(columns)} columns)...")
+    writer_class = FORMATS[format_name]
+    writer = writer_class(columns, sink, compression=EXPORT_PARQUET_COMPRESSION) if format_name == 'parquet' else writer_class(columns, sink)
+    to_row = row_converter(columns)
+    pages, read_path = iter_filtered_item_pages(
+        table, item_filter, columns,
+        source_index_name=SOURCE_INDEX_NAME, total_segments=SCAN_TOTAL_SEGMENTS, max_workers=SCAN_MAX_WORKERS
+    )
+    row_count = 0
+    try:
+        for page in pages:
+            writer.write_rows([to_row(item) for item in page])
+            row_count += len(page)
+            if on_page is not None:
+                on_page(row_count)
+    finally:
+        pages.close() # Stops the scan workers if the export ended early
+    if row_count == 0:
+        # Write a message row if no data (CSV), but still provide headers
+        writer.write_empty_message()
+        print("No items found in the table. Writing an empty export.")
+    writer.close()
+    return row_count, read_path
+
+
+# --- Export Jobs ---
+def export_file_name(format_name):
+    return f"{EXPORT_FILE_STEM}.{FORMATS[format_name].extension}"
+
+
+def export_object_key(job_id, format_name):
+    return f"{parse_s3_uri(EXPORT_S3_URI)[1]}{job_id}/{export_file_name(format_name)}"
+
+
+def start_export_job(event, context):
+    """
+    POST /export/jobs?source=&upload_id=&from=&to=&category=&format=&columns= (the parameters of GET /export/csv).
+    Records a PENDING job, starts the worker as an asynchronous invocation of this function and
+    returns 202 {"job_id", "status"} at once; the client polls GET /export/jobs/{job_id}.
+    """
+    job_store = get_export_job_store()
+    if job_store is None:
+        print("Error: export jobs need EXPORT_JOB_TABLE_NAME and EXPORT_S3_URI.")
+        return json_response(500, {"error": "Configuration error: EXPORT_JOB_TABLE_NAME or EXPORT_S3_URI environment variable is not set."})
+    try:
+        item_filter, format_name, columns = parse_export_request(event.get('queryStringParameters') or {})
+    except ValueError as e:
+        return json_response(400, {"error": str(e)})
+
+    job_id = uuid.uuid4().hex
+    try:
+        job_store.create(job_id, json.dumps(item_filter), EXPORT_JOB_TTL_SECONDS, format_name, json.dumps(columns))
+        get_lambda_client().invoke(
+            FunctionName=context.invoked_function_arn,
+            InvocationType='Event', # Asynchronous: the API response does not wait for the export
+            Payload=json.dumps({'action': 'run_export_job', 'job_id': job_id}).encode('utf-8')
+        )
+    except Exception as e:
+        print(f"Error starting export job {job_id}: {e}")
+        try:
+            job_store.update(job_id, JobStatus=JOB_STATUS_FAILED, ErrorMessage=f"Could not start the export: {e}")
+        except Exception:
+            pass
+        return json_response(500, {"error": f"Internal server error starting the export: {str(e)}"})
+    print(f"Started export job {job_id} (filter: {item_filter or 'none'}, format: {format_name}).")
+    return json_response(202, {"job_id": job_id, "status": "PENDING", "format": format_name})
+
+
+def get_export_job(event):
+    """
+    GET /export/jobs/{job_id}: {"job_id", "status", "row_count", "byte_count", ...}. A COMPLETE job
+    also has "download_url", a presigned GetObject URL valid for EXPORT_URL_EXPIRES_SECONDS.
+    """
+    job_store = get_export_job_store()
+    if job_store is None:
+        return json_response(500, {"error": "Configuration error: EXPORT_JOB_TABLE_NAME or EXPORT_S3_URI environment variable is not set."})
+    job_id = (event.get('pathParameters') or {}).get('job_id') or (event.get('path') or '').rstrip('/').rsplit('/', 1)[-1]
+    try:
+        job = job_store.load(job_id) if job_id else None
+        if job is None:
+            return json_response(404, {"error": f"Export job not found: {job_id}"})
+        body = {
+            "job_id": job_id,
+            "status": job.get('JobStatus'),
+            "row_count": int(job.get('RowCount', 0)),
+            "byte_count": int(job.get('ByteCount', 0)),
+            "format": job.get('ExportFormat', 'csv'),
+            "created_at": job.get('CreatedAt'),
+            "updated_at": job.get('UpdatedAt'),
+        }
+        if job.get('ErrorMessage'):
+            body['error_message'] = job['ErrorMessage']
+        if job.get('JobStatus') == JOB_STATUS_COMPLETE:
+            body['completed_at'] = job.get('CompletedAt')
+            body['download_url'] = get_s3_client().generate_presigned_url(
+                'get_object',
+                Params={
+                    'Bucket': parse_s3_uri(EXPORT_S3_URI)[0],
+                    'Key': job['ResultKey'],
+                    'ResponseContentDisposition': f'attachment; filename="{export_file_name(job.get("ExportFormat", "csv"))}"',
+                },
+                ExpiresIn=EXPORT_URL_EXPIRES_SECONDS
+            )
+            body['download_expires_in'] = EXPORT_URL_EXPIRES_SECONDS
+        return json_response(200, body)
+    except Exception as e:
+        print(f"Error reading export job {job_id}: {e}")
+        return json_response(500, {"error": f"Internal server error reading the export job: {str(e)}"})
+
+
+class ExportTimeLimitExceeded(Exception):
+    """The export job would not finish within the invocation's time limit."""
+
+
+def check_export_time(context, progress, rows):
+    """on_page of a job: records the row count and stops the export when the invocation is about to time out."""
+    progress['rows'] = rows
+    if context.get_remaining_time_in_millis() < EXPORT_TIME_MARGIN_SECONDS * 1000:
+        raise ExportTimeLimitExceeded(
+            f"The export did not finish within the function's time limit ({rows} rows written). "
+            "Narrow it with source/upload_id/from/to/category or columns, or increase the function timeout."
+        )
+
+
+def run_export_job(job_id, context):
+    """
+    Worker invocation of an export job: streams the matching items page by page through the
+    format's writer (write_export) into a multipart upload, so memory holds a few scan pages and at most two parts however
+    large the export is. Progress (rows, bytes) is recorded after every part.
+    """
+    job_store = get_export_job_store()
+    table = get_table()
+    if job_store is None or table is None or not job_id:
+        print(f"Error: cannot run export job {job_id!r} (job table, S3 URI or results table not configured).")
+        return {'statusCode': 500, 'body': json.dumps({"error": "Export job mode is not configured."})}
+    # The lease covers this invocation; a retry after a timeout may take the job over afterwards
+    if not job_store.claim(job_id, context.get_remaining_time_in_millis() / 1000 + 60):
+        print(f"Export job {job_id} is already running or finished. Skipping.")
+        return {'statusCode': 200, 'body': json.dumps({"job_id": job_id, "skipped": True})}
+
+    start = time.perf_counter()
+    bucket, _ = parse_s3_uri(EXPORT_S3_URI)
+    progress = {'rows': 0}
+    upload = None
+    try:
+        job = job_store.load(job_id)
+        item_filter = json.loads(job.get('ItemFilter') or '{}')
+        # Jobs started before format/columns existed are full CSV exports
+        format_name = job.get('ExportFormat', 'csv')
+        columns = json.loads(job.get('Columns') or '[]') or parse_columns(None)
+        key = export_object_key(job_id, format_name)
+        print(f"Running export job {job_id} to s3://{bucket}/{key} (filter: {item_filter or 'none'})...")
+        upload = MultipartUpload(
+            get_s3_client(), bucket, key, EXPORT_PART_SIZE_MB * 1024 * 1024,
+            on_part=lambda parts, size: job_store.update(job_id, RowCount=progress['rows'], ByteCount=size, PartCount=parts),
+            ContentType=FORMATS[format_name].content_type,
+            ContentDisposition=f'attachment; filename="{export_file_name(format_name)}"'
+        )
+        row_count, read_path = write_export(table, item_filter, format_name, columns, upload.write,
+                                            on_page=lambda rows: check_export_time(context, progress, rows))
+        byte_count = upload.complete()
+    except Exception as e:
+        print(f"Error in export job {job_id}: {e}")
+        if upload is not None:
+            upload.abort()
+        job_store.update(job_id, JobStatus=JOB_STATUS_FAILED, ErrorMessage=str(e)[:1000])
+        # Not raised: an asynchronous retry would fail the same way
+        return {'statusCode': 500, 'body': json.dumps({"job_id": job_id, "error": str(e)})}
+
+    elapsed = time.perf_counter() - start
+    job_store.update(
+        job_id, JobStatus=JOB_STATUS_COMPLETE, ResultKey=key, RowCount=row_count, ByteCount=byte_count,
+        PartCount=len(upload.parts), CompletedAt=utc_now(), ElapsedSeconds=Decimal(str(round(elapsed, 3)))
+    )
+    print(f"Export job {job_id} complete: {row_count} rows, {byte_count} bytes in {len(upload.parts)} part(s) ({read_path}) in {elapsed:.2f}s.")
+    return {'statusCode': 200, 'body': json.dumps({"job_id": job_id, "row_count": row_count, "byte_count": byte_count})}
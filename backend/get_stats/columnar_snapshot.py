@@ -0,0 +1,388 @@
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import datetime
+from array import array
+from collections import Counter
+from botocore.exceptions import ClientError
+from stats_counters import (TOTAL_ATTRIBUTE, PROCESSABLE_ATTRIBUTE, HIGH_RISK_ATTRIBUTE, SENTIMENT_PREFIX, CATEGORY_PREFIX,
+                            IMPORTANCE_PREFIX, SENTIMENT_IMPORTANCE_PREFIX, IMPORTANCE_LEVELS, SKIPPED_SENTIMENT, to_stats_counts)
+
+# --- Constants ---
+# File layout: magic, header length (uint32 LE), JSON header, then the columns, each starting at a
+# multiple of COLUMN_ALIGNMENT from the start of the data section (so numpy.frombuffer / Arrow can
+# read them in place, too). Fixed-width columns are little-endian.
+SNAPSHOT_MAGIC = b'FBCOLS01'
+SNAPSHOT_FORMAT_VERSION = 1
+COLUMN_ALIGNMENT = 8
+# Dictionary-encoded (categorical) columns: one uint8 code per row, the values listed in the header
+CODE_COLUMNS = ('Sentiment', 'Category')
+# Plain uint8 columns: Importance (clamped to 0-254) and IsHighRisk (0/1)
+NUMBER_COLUMNS = ('Importance', 'IsHighRisk')
+# Code 255 never names a value: the aggregation ORs it into rows that must not be counted
+EXCLUDED_CODE = 255
+MAX_IMPORTANCE = 254
+# Attributes the snapshot is built from (already passed through map_comment_item)
+SNAPSHOT_ATTRIBUTES = ('CommentID', 'ProcessingTimestamp', 'Sentiment', 'Category', 'Importance', 'IsHighRisk')
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+# HeadObject + GetObject(IfMatch) rounds when the snapshot is replaced in between
+DOWNLOAD_ATTEMPTS = 3
+# Change files: the stream consumer writes the items of each batch of results-table changes to
+# <snapshot key>.changes/<first sequence number, zero-padded>-<last>.json, and the refresh merges
+# them in key order (the sequence numbers of one shard, and so of one item's changes, increase)
+CHANGES_SUFFIX = '.changes/'
+SEQUENCE_NUMBER_DIGITS = 40
+DELETE_BATCH_SIZE = 1000 # DeleteObjects limit
+
+
+def parse_s3_uri(s3_uri):
+    """'s3://bucket/path/to/snapshot.bin' -> ('bucket', 'path/to/snapshot.bin')."""
+    if not s3_uri.startswith('s3://'):
+        raise ValueError(f"Not an S3 URI: {s3_uri}")
+    bucket, _, key = s3_uri[len('s3://'):].partition('/')
+    if not bucket or not key:
+        raise ValueError(f"S3 URI needs a bucket and a key: {s3_uri}")
+    return bucket, key
+
+
+# --- Vectorized Column Operations ---
+# The columns are bytes with one uint8 per row. bytes.count/find/translate and big-integer bitwise
+# operators all run as C loops over the whole column, so no Python code runs per row.
+def byte_mask(codes):
+    """bytes.translate table: 0xFF for the given codes, 0x00 for every other byte value."""
+    return bytes(EXCLUDED_CODE if value in codes else 0 for value in range(256))
+
+
+def bitwise_or(column, mask):
+    """Row-wise column | mask of two equally long byte columns."""
+    if not column:
+        return column
+    return (int.from_bytes(column, 'little') | int.from_bytes(mask, 'little')).to_bytes(len(column), 'little')
+
+
+def find_rows(column, code, limit, rows):
+    """Appends the indices of the rows holding code to rows, in row order, until rows has limit entries."""
+    needle = bytes((code,))
+    position = column.find(needle)
+    while position != -1 and len(rows) < limit:
+        rows.append(position)
+        position = column.find(needle, position + 1)
+    return rows
+
+
+# --- Reading a Snapshot ---
+class StatsSnapshot:
+    """
+    Read-only view of a snapshot file's bytes (a bytes object or an mmap). Columns are copied out of
+    the buffer on first use; the CommentID strings are only read for the rows a comment list needs.
+    """
+
+    def __init__(self, buffer):
+        if buffer[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError("Not a stats snapshot (bad magic).")
+        (header_length,) = struct.unpack_from('<I', buffer, len(SNAPSHOT_MAGIC))
+        header_start = len(SNAPSHOT_MAGIC) + 4
+        self.header = json.loads(bytes(buffer[header_start:header_start + header_length]).decode('utf-8'))
+        if self.header.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported stats snapshot format version: {self.header.get('format_version')}")
+        self.buffer = buffer
+        self.data_start = aligned(header_start + header_length)
+        self.rows = self.header['rows']
+        self.dictionaries = self.header['dictionaries']
+        self.columns = {}
+        self.cached_counts = None # A snapshot never changes, so its counts are computed once
+
+    @property
+    def watermark(self):
+        """Latest ProcessingTimestamp in the snapshot (None if no row had one)."""
+        return self.header.get('watermark')
+
+    @property
+    def refreshed_at(self):
+        return self.header.get('refreshed_at')
+
+    def column_bytes(self, name):
+        location = self.header['columns'][name]
+        start = self.data_start + location['offset']
+        return bytes(self.buffer[start:start + location['length']])
+
+    def column(self, name):
+        """A uint8 column as bytes (copied from the buffer once)."""
+        if name not in self.columns:
+            self.columns[name] = self.column_bytes(name)
+        return self.columns[name]
+
+    def comment_id(self, row):
+        """CommentID of one row, read straight from the buffer."""
+        offsets_start = self.data_start + self.header['columns']['CommentID.offsets']['offset']
+        start, end = struct.unpack_from('<II', self.buffer, offsets_start + 4 * row)
+        data_start = self.data_start + self.header['columns']['CommentID.data']['offset']
+        return bytes(self.buffer[data_start + start:data_start + end]).decode('utf-8')
+
+    def comment_ids(self):
+        """Every CommentID, in row order (for a refresh)."""
+        offsets = array('I')
+        offsets.frombytes(self.column_bytes('CommentID.offsets'))
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        data = self.column_bytes('CommentID.data')
+        return [data[offsets[row]:offsets[row + 1]].decode('utf-8') for row in range(self.rows)]
+
+    def excluded_mask(self):
+        """0xFF for the rows item_contributions() only counts towards the total (skipped analysis), else 0x00."""
+        sentiments = self.dictionaries['Sentiment']
+        skipped = {sentiments.index(SKIPPED_SENTIMENT)} if SKIPPED_SENTIMENT in sentiments else set()
+        return self.column('Sentiment').translate(byte_mask(skipped))
+
+    def counts(self):
+        """Same fields as stats_counters.to_stats_counts(), with the rules of item_contributions()."""
+        if self.cached_counts is None:
+            self.cached_counts = self.compute_counts()
+        return self.cached_counts
+
+    def compute_counts(self):
+        sentiment = self.column('Sentiment')
+        excluded = self.excluded_mask()
+        totals = Counter({TOTAL_ATTRIBUTE: self.rows})
+        totals[PROCESSABLE_ATTRIBUTE] = self.rows - excluded.count(bytes((EXCLUDED_CODE,)))
+        totals[HIGH_RISK_ATTRIBUTE] = bitwise_or(self.column('IsHighRisk'), excluded).count(b'\x01')
+        category = bitwise_or(self.column('Category'), excluded)
+        for code, value in enumerate(self.dictionaries['Category']):
+            totals[CATEGORY_PREFIX + value] += category.count(bytes((code,)))
+        importance = bitwise_or(self.column('Importance'), excluded)
+        for level in IMPORTANCE_LEVELS:
+            totals[f"{IMPORTANCE_PREFIX}{level}"] = importance.count(bytes((level,)))
+        for code, value in enumerate(self.dictionaries['Sentiment']):
+            if value == SKIPPED_SENTIMENT:
+                continue
+            totals[SENTIMENT_PREFIX + value] += sentiment.count(bytes((code,)))
+            # Importance of this sentiment's rows only: every other row becomes EXCLUDED_CODE
+            sentiment_importance = bitwise_or(importance, sentiment.translate(byte_mask(set(range(256)) - {code})))
+            for level in IMPORTANCE_LEVELS:
+                totals[f"{SENTIMENT_IMPORTANCE_PREFIX}{value}#{level}"] += sentiment_importance.count(bytes((level,)))
+        return to_stats_counts(totals)
+
+    def top_rows(self, comment_filter, limit, min_importance=0):
+        """
+        Row indices of the `limit` most important processable rows, highest first (ties in row order):
+        high-risk rows for 'high_risk', rows with Importance >= min_importance otherwise.
+        """
+        importance = bitwise_or(self.column('Importance'), self.excluded_mask())
+        if comment_filter == 'high_risk':
+            importance = bitwise_or(importance, self.column('IsHighRisk').translate(byte_mask({0})))
+        rows = []
+        for level in range(self.header.get('max_importance', 0), min_importance - 1, -1):
+            if len(find_rows(importance, level, limit, rows)) >= limit:
+                break
+        return rows
+
+
+def aligned(offset):
+    return (offset + COLUMN_ALIGNMENT - 1) // COLUMN_ALIGNMENT * COLUMN_ALIGNMENT
+
+
+# --- Building and Refreshing a Snapshot ---
+class SnapshotBuilder:
+    """
+    Mutable columns for a full build (no previous snapshot) or an incremental refresh (starts from
+    the previous snapshot's columns and merges the stream's change files). Rows are keyed by CommentID: a re-analyzed item overwrites its
+    row, a new item is appended. Rows of deleted items stay until the next full build.
+    """
+
+    def __init__(self, snapshot=None):
+        self.dictionaries = {name: list(snapshot.dictionaries[name]) if snapshot else [] for name in CODE_COLUMNS}
+        self.codes = {name: {value: code for code, value in enumerate(values)} for name, values in self.dictionaries.items()}
+        self.columns = {name: bytearray(snapshot.column(name)) if snapshot else bytearray() for name in CODE_COLUMNS + NUMBER_COLUMNS}
+        self.comment_ids = snapshot.comment_ids() if snapshot else []
+        self.row_of = {comment_id: row for row, comment_id in enumerate(self.comment_ids)}
+        self.watermark = snapshot.watermark if snapshot else None
+        self.max_importance = snapshot.header.get('max_importance', 0) if snapshot else 0
+
+    def encode(self, name, value):
+        """Dictionary code of a categorical value, adding the value to the dictionary if it is new."""
+        code = self.codes[name].get(value)
+        if code is None:
+            code = len(self.dictionaries[name])
+            if code >= EXCLUDED_CODE:
+                raise ValueError(f"More than {EXCLUDED_CODE} distinct {name} values; the snapshot cannot encode them.")
+            self.dictionaries[name].append(value)
+            self.codes[name][value] = code
+        return code
+
+    def upsert(self, mapped_item):
+        """Adds or overwrites the row of one item from map_comment_item(). Returns 'added', 'updated' or 'unchanged'."""
+        importance = min(max(mapped_item.get('Importance', 0), 0), MAX_IMPORTANCE)
+        values = {
+            'Sentiment': self.encode('Sentiment', mapped_item.get('Sentiment', 'Unknown')),
+            'Category': self.encode('Category', mapped_item.get('Category', 'Unknown')),
+            'Importance': importance,
+            'IsHighRisk': 1 if mapped_item.get('IsHighRisk', False) else 0,
+        }
+        self.max_importance = max(self.max_importance, importance)
+        timestamp = mapped_item.get('ProcessingTimestamp')
+        if timestamp and (self.watermark is None or timestamp > self.watermark):
+            self.watermark = timestamp
+        comment_id = mapped_item['CommentID']
+        row = self.row_of.get(comment_id)
+        if row is None:
+            self.row_of[comment_id] = len(self.comment_ids)
+            self.comment_ids.append(comment_id)
+            for name, value in values.items():
+                self.columns[name].append(value)
+            return 'added'
+        if all(self.columns[name][row] == value for name, value in values.items()):
+            return 'unchanged'
+        for name, value in values.items():
+            self.columns[name][row] = value
+        return 'updated'
+
+    def to_bytes(self):
+        """The snapshot file."""
+        encoded_ids = [comment_id.encode('utf-8') for comment_id in self.comment_ids]
+        offsets = array('I', [0])
+        for encoded_id in encoded_ids:
+            offsets.append(offsets[-1] + len(encoded_id))
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        sections = [(name, bytes(self.columns[name])) for name in CODE_COLUMNS + NUMBER_COLUMNS]
+        sections += [('CommentID.offsets', offsets.tobytes()), ('CommentID.data', b''.join(encoded_ids))]
+
+        columns, data, offset = {}, [], 0
+        for name, section in sections:
+            columns[name] = {'offset': offset, 'length': len(section), 'dtype': 'uint32' if name == 'CommentID.offsets' else 'uint8'}
+            padding = aligned(len(section)) - len(section)
+            data.append(section + b'\0' * padding)
+            offset += len(section) + padding
+        header = json.dumps({
+            'format_version': SNAPSHOT_FORMAT_VERSION,
+            'rows': len(self.comment_ids),
+            'refreshed_at': datetime.datetime.utcnow().isoformat(),
+            'watermark': self.watermark,
+            'max_importance': self.max_importance,
+            'dictionaries': self.dictionaries,
+            'columns': columns,
+        }, ensure_ascii=False).encode('utf-8')
+        prefix = SNAPSHOT_MAGIC + struct.pack('<I', len(header)) + header
+        return prefix + b'\0' * (aligned(len(prefix)) - len(prefix)) + b''.join(data)
+
+
+# --- Storage: S3, Cached in the Container's /tmp ---
+class SnapshotStore:
+    """
+    The snapshot object in S3. load() memory-maps a copy in cache_dir and checks S3 for a newer
+    object (one HeadObject) at most every check_seconds; the mapped snapshot is reused in between.
+    """
+
+    def __init__(self, s3_client, s3_uri, cache_dir='/tmp', check_seconds=60):
+        self.s3_client = s3_client
+        self.bucket, self.key = parse_s3_uri(s3_uri)
+        self.cache_dir = cache_dir
+        self.check_seconds = check_seconds
+        self.snapshot = None
+        self.etag = None
+        self.checked_at = None
+        self.mapped = None # (file, mmap) of the loaded snapshot
+
+    def cache_path(self, etag):
+        name = etag.strip('"')
+        return os.path.join(self.cache_dir, f"stats-snapshot-{name}.bin")
+
+    def load(self, force_check=False):
+        """The current snapshot, or None if none has been written yet."""
+        now = time.monotonic()
+        if self.snapshot is not None and not force_check and now - self.checked_at < self.check_seconds:
+            return self.snapshot
+        for attempt in range(DOWNLOAD_ATTEMPTS):
+            try:
+                etag = self.s3_client.head_object(Bucket=self.bucket, Key=self.key)['ETag']
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                    return None
+                raise
+            if self.snapshot is not None and etag == self.etag:
+                break
+            path = self.cache_path(etag)
+            if not os.path.exists(path):
+                try:
+                    self.download(path, etag)
+                except ClientError as e:
+                    # Replaced between HeadObject and GetObject: look up the new ETag and try again
+                    if e.response.get('Error', {}).get('Code') == 'PreconditionFailed' and attempt + 1 < DOWNLOAD_ATTEMPTS:
+                        continue
+                    raise
+            self.open(path, etag)
+            break
+        self.checked_at = now
+        return self.snapshot
+
+    def download(self, path, etag):
+        """
+        Streams the object to path (through a temporary name, so a partial file is never opened).
+        IfMatch makes S3 refuse (412) an object replaced since HeadObject, whose bytes would
+        otherwise be cached under the old ETag's name and trusted from then on.
+        """
+        partial_path = path + '.part'
+        body = self.s3_client.get_object(Bucket=self.bucket, Key=self.key, IfMatch=etag)['Body']
+        with open(partial_path, 'wb') as f:
+            for chunk in body.iter_chunks(DOWNLOAD_CHUNK_BYTES):
+                f.write(chunk)
+        os.replace(partial_path, path)
+        print(f"Downloaded stats snapshot s3://{self.bucket}/{self.key} ({os.path.getsize(path)} bytes) to {path}.")
+
+    def open(self, path, etag):
+        """Memory-maps a cached file, replacing (and deleting) the previously loaded one."""
+        snapshot_file = open(path, 'rb')
+        mapped = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        snapshot = StatsSnapshot(mapped)
+        if self.mapped is not None:
+            previous_path = self.mapped[0].name
+            self.mapped[1].close()
+            self.mapped[0].close()
+            if previous_path != path and os.path.exists(previous_path):
+                os.remove(previous_path) # /tmp is small; only the current snapshot is kept
+        self.mapped = (snapshot_file, mapped)
+        self.snapshot, self.etag = snapshot, etag
+
+    def save(self, data):
+        """Uploads a new snapshot and keeps a copy in the cache, so this container need not download it."""
+        etag = self.s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=data, ContentType='application/octet-stream')['ETag']
+        with open(self.cache_path(etag), 'wb') as f:
+            f.write(data)
+        return etag
+
+    # --- Change Files (written by the stream consumer, merged by the refresh) ---
+    def change_key(self, first_sequence_number, last_sequence_number):
+        return f"{self.key}{CHANGES_SUFFIX}{str(first_sequence_number).zfill(SEQUENCE_NUMBER_DIGITS)}-{last_sequence_number}.json"
+
+    def write_changes(self, first_sequence_number, last_sequence_number, mapped_items):
+        """
+        Stores the changed items of one stream batch. The key only depends on the batch's sequence
+        numbers, so a retried batch overwrites its own file instead of adding a second one.
+        """
+        body = '\n'.join(json.dumps(item, ensure_ascii=False, separators=(',', ':')) for item in mapped_items)
+        key = self.change_key(first_sequence_number, last_sequence_number)
+        self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=body.encode('utf-8'), ContentType='application/x-ndjson')
+        return key
+
+    def list_changes(self):
+        """Keys of the change files not yet merged, oldest first."""
+        keys, list_args = [], {'Bucket': self.bucket, 'Prefix': self.key + CHANGES_SUFFIX}
+        while True:
+            response = self.s3_client.list_objects_v2(**list_args)
+            keys.extend(entry['Key'] for entry in response.get('Contents', []))
+            if not response.get('IsTruncated'):
+                return sorted(keys)
+            list_args['ContinuationToken'] = response['NextContinuationToken']
+
+    def read_changes(self, key):
+        """The mapped items of one change file."""
+        body = self.s3_client.get_object(Bucket=self.bucket, Key=key)['Body'].read().decode('utf-8')
+        return [json.loads(line) for line in body.splitlines() if line]
+
+    def delete_changes(self, keys):
+        """Deletes merged change files (after the snapshot containing them has been saved)."""
+        for start in range(0, len(keys), DELETE_BATCH_SIZE):
+            self.s3_client.delete_objects(Bucket=self.bucket, Delete={'Objects': [{'Key': key} for key in keys[start:start + DELETE_BATCH_SIZE]], 'Quiet': True})
@@ -1,37 +1,202 @@
+import time
+MODULE_IMPORT_START = time.perf_counter() # Start of the import, for the cold-start report
 import json
 import boto3
 import os
+import sys
+import base64
+import heapq
+import hashlib
+import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal # Important for DynamoDB numbers
+from dynamodb_types import register_python_types
+from stats_counters import StatsCounterStore, item_contributions, stream_record_deltas, stream_batch_id, to_stats_counts, deserialize_image, DDB_BATCH_GET_MAX_KEYS
+from parallel_scan import parallel_scan, projection_args
+from data_version import DataVersion
+from item_filters import parse_item_filter, parse_timestamp, read_filtered_items
+from columnar_snapshot import SnapshotStore, SnapshotBuilder, SNAPSHOT_ATTRIBUTES
+from trend_rollups import (TrendRollupStore, GRANULARITIES, add_item_rollups, new_rollup_deltas, stream_record_rollup_deltas,
+                           parse_bucket_time, bucket_range, to_trend_bucket)
+from response_encoding import dumps_compact, choose_encoding, encode_response, json_number
 
 # --- Configuration ---
 DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME')
+# 'client' (default): a low-level DynamoDB client with the resource layer's type conversion
+# registered on it. 'resource': boto3.resource('dynamodb').Table, which also loads the resource
+# model at cold start. Both return items with plain Python values (numbers as Decimal).
+DYNAMODB_CLIENT_MODE = os.environ.get('DYNAMODB_CLIENT_MODE', 'client').lower()
+# Optional table of pre-aggregated counters (partition key 'CounterKey'). This function keeps it up
+# to date as the DynamoDB Streams consumer of the results table (view type NEW_AND_OLD_IMAGES);
+# once built, counts and percentages come from STATS_COUNTER_SHARDS counter items instead of a scan.
+STATS_TABLE_NAME = os.environ.get('STATS_TABLE_NAME')
+STATS_COUNTER_SHARDS = int(os.environ.get('STATS_COUNTER_SHARDS', '10'))
+# Full-table scans are split into SCAN_TOTAL_SEGMENTS segments read in parallel by up to
+# SCAN_MAX_WORKERS threads (default: one per segment). 1 scans sequentially.
+SCAN_TOTAL_SEGMENTS = int(os.environ.get('SCAN_TOTAL_SEGMENTS', '4'))
+SCAN_MAX_WORKERS = int(os.environ.get('SCAN_MAX_WORKERS', '0')) or None
+# Optional sparse GSIs of the results table (partition key HighRiskIndexKey / ImportantIndexKey,
+# sort key Importance, projection ALL). When set, the high-risk and important comment lists are
+# read with a Query in importance order instead of a scan.
+HIGH_RISK_INDEX_NAME = os.environ.get('HIGH_RISK_INDEX_NAME')
+IMPORTANT_INDEX_NAME = os.environ.get('IMPORTANT_INDEX_NAME')
+# Optional GSI of the results table with partition key SourceObject (the uploaded file's S3 key) and
+# sort key ProcessingTimestamp, projection ALL. When set, /stats?source=... reads that file's items
+# (within from/to) with a Query instead of scanning the whole table.
+SOURCE_INDEX_NAME = os.environ.get('SOURCE_INDEX_NAME')
+# Length of top_important_comments and high_risk_comments_list (?include_comments=true)
+STATS_COMMENT_LIST_LIMIT = int(os.environ.get('STATS_COMMENT_LIST_LIMIT', '100'))
+
+# Optional table holding the data version (partition key CounterKey, can be STATS_TABLE_NAME).
+# process_feedback bumps it after writing; /stats responses are cached per version in the warm
+# container and carry it in their ETag, so a repeat request without new data costs one GetItem.
+DATA_VERSION_TABLE_NAME = os.environ.get('DATA_VERSION_TABLE_NAME')
+# API responses of at least this many bytes are compressed (gzip, or br when the brotli package is
+# included) if the request's Accept-Encoding allows it; smaller ones are not worth the CPU time
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESSION_MIN_BYTES', '1024'))
+# Optional columnar snapshot of the results table (columnar_snapshot.py), e.g.
+# s3://feedback-stats-snapshots/stats/snapshot.bin, written by {"action": "refresh_stats_snapshot"}
+# (run it on a schedule). When set, unfiltered /stats requests compute the counts, charts and
+# comment lists from the snapshot instead of the counters or a scan; they lag by the refresh interval.
+STATS_SNAPSHOT_S3_URI = os.environ.get('STATS_SNAPSHOT_S3_URI')
+# Local copy of the snapshot, memory-mapped while the container is warm (Lambda can only write /tmp)
+STATS_SNAPSHOT_CACHE_DIR = os.environ.get('STATS_SNAPSHOT_CACHE_DIR', '/tmp')
+# A warm container checks S3 for a newer snapshot (one HeadObject) at most this often
+STATS_SNAPSHOT_CHECK_SECONDS = int(os.environ.get('STATS_SNAPSHOT_CHECK_SECONDS', '60'))
+
+# Optional table of hourly and daily rollups (partition key 'Granularity', sort key 'Bucket', both
+# strings), kept up to date by the same DynamoDB Streams consumer as the counters and read by GET /trends
+TREND_TABLE_NAME = os.environ.get('TREND_TABLE_NAME')
+
+# --- Trends (GET /trends) ---
+# Range returned when the request has no from/to, and the most buckets one request may cover
+TREND_DEFAULT_BUCKETS = {'hour': 48, 'day': 30}
+TREND_MAX_BUCKETS = {'hour': 24 * 31, 'day': 366 * 2}
+
+# --- Comment Listing (GET /comments) ---
+COMMENTS_PAGE_SIZE_DEFAULT = 50
+COMMENTS_PAGE_SIZE_MAX = 200
+COMMENT_FILTERS = ('all', 'high_risk', 'important') # ?filter=; 'all' is every processable comment
+TOP_IMPORTANCE_THRESHOLD = 4 # 'important' comments (and top_important_comments) have Importance >= this
+# A page may need several Scan calls when the filter is selective. Each call reads at most
+# COMMENTS_SCAN_LIMIT_MAX items, and one request makes at most COMMENTS_MAX_SCAN_CALLS calls;
+# after that it returns what it has, with a cursor to continue from.
+COMMENTS_SCAN_LIMIT_MAX = 1000
+COMMENTS_MAX_SCAN_CALLS = 8
+# Fields a client may request with ?fields= (the keys produced by map_comment_item)
+COMMENT_FIELDS = ('CommentID', 'OriginalComment', 'ProcessingTimestamp', 'OriginalCsvRowIndex', 'SourceObject', 'UploadId', 'BedrockModelId',
+                  'Sentiment', 'Category', 'Importance', 'IsHighRisk', 'LLMError', 'LLMRawResponseSnippet', 'LLMStatusCode')
+# Always read: the table key (for the cursor) and the attributes the filters look at
+COMMENT_FILTER_FIELDS = ('CommentID', 'Sentiment', 'Importance', 'IsHighRisk')
+# Sparse index key attributes written by process_feedback: (attribute, value)
+HIGH_RISK_INDEX_KEY = ('HighRiskIndexKey', 'HIGH_RISK')
+IMPORTANT_INDEX_KEY = ('ImportantIndexKey', 'IMPORTANT')
+
+# --- Scan Projections ---
+# Attributes read by full-table scans: counting needs only the fields item_contributions() looks
+# at; the comment lists of ?include_comments=true need everything but the raw LLM response snippet.
+COUNT_SCAN_ATTRIBUTES = ('Sentiment', 'Category', 'Importance', 'IsHighRisk')
+LIST_SCAN_ATTRIBUTES = tuple(field for field in COMMENT_FIELDS if field != 'LLMRawResponseSnippet')
 
 # --- AWS Clients ---
-# Use the resource for easier table interaction
-dynamodb_resource = boto3.resource('dynamodb')
-# Initialize table resource globally
+# The client and table handle are created by the first invocation and reused while the container is warm
+dynamodb_resource = None # 'resource' mode only
+dynamodb_client = None # Accepts and returns plain Python types in both modes
 table = None
-if DYNAMODB_TABLE_NAME: # Only initialize if env var is set
-    try:
-        table = dynamodb_resource.Table(DYNAMODB_TABLE_NAME)
-        print(f"Initialized DynamoDB table resource: {DYNAMODB_TABLE_NAME}")
-    except Exception as e:
-        print(f"Error initializing DynamoDB table resource '{DYNAMODB_TABLE_NAME}' globally: {e}")
-        # Handle this error in the handler function
+data_version = None # See get_data_version()
+s3_client = None # Snapshot mode only
+snapshot_store = None # See get_snapshot_store(); keeps the memory-mapped snapshot while warm
+client_init_seconds = 0.0 # Time spent constructing the client, for the cold-start report
 
 
-# --- Helper Function to Handle Decimal (from DynamoDB) for JSON ---
-# ADDED this function back
-def decimal_default(obj):
-    """JSON serializer for objects not serializable by default (like Decimal)"""
-    if isinstance(obj, Decimal):
-        # Check if it's an integer-like Decimal (no fractional part)
-        if obj % 1 == 0:
-            return int(obj)
+class TableClient:
+    """The part of the Table resource used here (scan, query), on a low-level client."""
+
+    def __init__(self, client, table_name):
+        self.client = client
+        self.table_name = table_name
+
+    def scan(self, **kwargs):
+        return self.client.scan(TableName=self.table_name, **kwargs)
+
+    def query(self, **kwargs):
+        return self.client.query(TableName=self.table_name, **kwargs)
+
+
+def get_dynamodb_client():
+    """Returns the cached DynamoDB client, creating it on first use."""
+    global dynamodb_resource, dynamodb_client, client_init_seconds
+    if dynamodb_client is None:
+        init_start = time.perf_counter()
+        if DYNAMODB_CLIENT_MODE == 'resource':
+            dynamodb_resource = boto3.resource('dynamodb')
+            dynamodb_client = dynamodb_resource.meta.client
         else:
-            return float(obj)
-    # If it's not a type we know how to serialize, raise the default TypeError
-    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+            dynamodb_client = register_python_types(boto3.client('dynamodb'))
+        client_init_seconds += time.perf_counter() - init_start
+    return dynamodb_client
+
+
+def get_table():
+    """Returns the cached table handle, creating it on first use. None if it cannot be created."""
+    global table
+    if table is None and DYNAMODB_TABLE_NAME: # Only initialize if env var is set
+        try:
+            client = get_dynamodb_client()
+            table = dynamodb_resource.Table(DYNAMODB_TABLE_NAME) if dynamodb_resource is not None else TableClient(client, DYNAMODB_TABLE_NAME)
+            print(f"Initialized DynamoDB table handle ({DYNAMODB_CLIENT_MODE}): {DYNAMODB_TABLE_NAME}")
+        except Exception as e:
+            print(f"Error initializing DynamoDB table handle '{DYNAMODB_TABLE_NAME}': {e}")
+            # Handle this error in the handler function
+    return table
+
+
+def get_data_version():
+    """Returns the data version tracker, or None if DATA_VERSION_TABLE_NAME is not set."""
+    global data_version
+    if data_version is None and DATA_VERSION_TABLE_NAME:
+        # No minimum interval: every change made here (counters, backfill) is published at once
+        data_version = DataVersion(get_dynamodb_client(), DATA_VERSION_TABLE_NAME, min_interval_seconds=0)
+    return data_version
+
+
+def get_s3_client():
+    """Returns the cached S3 client, creating it on first use."""
+    global s3_client, client_init_seconds
+    if s3_client is None:
+        init_start = time.perf_counter()
+        s3_client = boto3.client('s3')
+        client_init_seconds += time.perf_counter() - init_start
+    return s3_client
+
+
+def get_snapshot_store():
+    """Returns the columnar snapshot store, or None if STATS_SNAPSHOT_S3_URI is not set."""
+    global snapshot_store
+    if snapshot_store is None and STATS_SNAPSHOT_S3_URI:
+        snapshot_store = SnapshotStore(get_s3_client(), STATS_SNAPSHOT_S3_URI, STATS_SNAPSHOT_CACHE_DIR, STATS_SNAPSHOT_CHECK_SECONDS)
+    return snapshot_store
+
+
+def get_stats_counter_store():
+    """Returns the aggregate counter store, or None if STATS_TABLE_NAME is not set."""
+    if not STATS_TABLE_NAME:
+        return None
+    return StatsCounterStore(get_dynamodb_client(), STATS_TABLE_NAME, STATS_COUNTER_SHARDS)
+
+
+def get_trend_rollup_store():
+    """Returns the trend rollup store, or None if TREND_TABLE_NAME is not set."""
+    if not TREND_TABLE_NAME:
+        return None
+    return TrendRollupStore(get_dynamodb_client(), TREND_TABLE_NAME)
+
+
+# --- Helper Function to Handle Decimal (from DynamoDB) for JSON ---
+# JSON serializer for objects not serializable by default (like Decimal): int when integral, else float.
+# Only the comments cursor (raw DynamoDB keys) needs it; the response bodies are built from plain numbers.
+decimal_default = json_number
 
 
 # --- Helper Function to Map DynamoDB Item to Frontend-Friendly Dict ---
@@ -44,6 +209,9 @@ def map_comment_item(item):
         'ProcessingTimestamp': item.get('ProcessingTimestamp'),
         # Safely convert OriginalCsvRowIndex to int
         'OriginalCsvRowIndex': int(item.get('OriginalCsvRowIndex', 0)) if item.get('OriginalCsvRowIndex') is not None else 0, # Handle None explicitly
+        # The uploaded file and upload the row came from (absent on items written before they were recorded)
+        'SourceObject': item.get('SourceObject'),
+        'UploadId': item.get('UploadId'),
         'BedrockModelId': item.get('BedrockModelId', 'N/A'),
         'Sentiment': item.get('Sentiment', 'Unknown'),
         'Category': item.get('Category', 'Unknown'),
@@ -92,21 +260,695 @@ def get_empty_stats():
         "category_percentages": {},
         "high_risk_count": 0,
         "recommended_actions": {},
+        "importance_distribution": {str(level): 0 for level in range(1, 6)},
+        "sentiment_importance_matrix": {},
         "top_important_comments": [],
         "high_risk_comments_list": []
     }
 
 
+# --- Helper Function to Scan the Whole Results Table ---
+def scan_all_items(table, attributes):
+    """Every item of the table, reduced to `attributes`, read with a parallel segmented scan."""
+    return parallel_scan(table, total_segments=SCAN_TOTAL_SEGMENTS, max_workers=SCAN_MAX_WORKERS, attributes=attributes)
+
+
+# --- Helper Function to Count Mapped Comments (when no counters are available) ---
+def count_mapped_items(mapped_items):
+    """Same fields as stats_counters.to_stats_counts(), computed from the scanned items."""
+    totals = Counter()
+    for mapped_item in mapped_items:
+        totals.update(item_contributions(mapped_item))
+    return to_stats_counts(totals)
+
+
+# --- DynamoDB Streams Consumer: Keep the Aggregate Counters, Trend Rollups and Snapshot Up to Date ---
+def write_snapshot_changes(snapshot_store, records):
+    """
+    Stores the new images of one stream batch as a change file of the columnar snapshot, for the
+    next refresh to merge. Removed items are not recorded: their rows stay until a full build.
+    """
+    changed_items = []
+    for record in records:
+        new_item = deserialize_image(record.get('dynamodb', {}).get('NewImage'))
+        if new_item is not None:
+            mapped_item = map_comment_item(new_item)
+            changed_items.append({name: mapped_item[name] for name in SNAPSHOT_ATTRIBUTES if name in mapped_item})
+    if not changed_items:
+        return None
+    sequence_numbers = [record['dynamodb']['SequenceNumber'] for record in records]
+    return snapshot_store.write_changes(sequence_numbers[0], sequence_numbers[-1], changed_items)
+
+
+def update_stats_counters(records):
+    """
+    Applies one batch of results-table changes: counter and rollup deltas with atomic ADDs, and a
+    change file for the columnar snapshot. Every sink is idempotent per batch, so a retry of a batch
+    that failed halfway applies only what is missing.
+    """
+    counter_store = get_stats_counter_store()
+    rollup_store = get_trend_rollup_store()
+    snapshot_store = get_snapshot_store()
+    if counter_store is None and rollup_store is None and snapshot_store is None:
+        # Raising makes Lambda retry the batch instead of dropping the changes
+        raise RuntimeError("None of STATS_TABLE_NAME, TREND_TABLE_NAME and STATS_SNAPSHOT_S3_URI is set; cannot apply the stream records.")
+    update_calls = rollup_calls = 0
+    # Any exception propagates for the same reason: the whole batch is retried. The ADDs carry the
+    # batch's identity (applied markers), so a retry skips the chunks an earlier attempt applied
+    batch_id = stream_batch_id(records)
+    if snapshot_store is not None:
+        # First, as it is idempotent: a retried batch rewrites the same change file
+        write_snapshot_changes(snapshot_store, records)
+    if counter_store is not None:
+        deltas = Counter()
+        for record in records:
+            deltas.update(stream_record_deltas(record, map_comment_item))
+        update_calls = counter_store.add(deltas, batch_id)
+    if rollup_store is not None:
+        rollup_deltas = new_rollup_deltas()
+        for record in records:
+            stream_record_rollup_deltas(record, map_comment_item, rollup_deltas)
+        rollup_calls = rollup_store.add(rollup_deltas, batch_id)
+    # Cached /stats responses may predate these counts. Logged, never raised: a retried batch would count twice
+    if get_data_version() is not None:
+        data_version.note_write()
+    print(f"Applied {len(records)} stream records to the stats counters ({update_calls} updates applied) and trend rollups ({rollup_calls} updates applied).")
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'records': len(records), 'counter_updates': update_calls, 'rollup_updates': rollup_calls})
+    }
+
+
+# --- Rebuild Tool: Recompute the Aggregate Counters From Scratch ---
+def rebuild_stats_counters():
+    """
+    Scans the results table and replaces the counters with the recomputed totals. Invoke the
+    function with {"action": "rebuild_stats_counters"} once after creating the stats table,
+    after changing STATS_COUNTER_SHARDS, or to correct drift.
+    """
+    counter_store = get_stats_counter_store()
+    table = get_table()
+    if counter_store is None or table is None:
+        print("Error: rebuilding the stats counters needs DYNAMODB_TABLE_NAME and STATS_TABLE_NAME.")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({"error": "Configuration error: DYNAMODB_TABLE_NAME and STATS_TABLE_NAME must be set."})
+        }
+    try:
+        print(f"Rebuilding stats counters in '{STATS_TABLE_NAME}' from a scan of '{DYNAMODB_TABLE_NAME}'...")
+        totals = Counter()
+        scanned_items = 0
+        for item in scan_all_items(table, COUNT_SCAN_ATTRIBUTES):
+            totals.update(item_contributions(map_comment_item(item)))
+            scanned_items += 1
+        counter_store.replace_totals(totals)
+        if get_data_version() is not None:
+            data_version.note_write()
+        print(f"Rebuilt stats counters from {scanned_items} items.")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'scanned_items': scanned_items, 'counts': to_stats_counts(totals)})
+        }
+    except Exception as e:
+        print(f"Error rebuilding stats counters: {e}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({"error": f"Error rebuilding stats counters: {str(e)}"})
+        }
+
+
+# --- Rebuild Tool: Recompute the Trend Rollups From Scratch ---
+def rebuild_trend_rollups():
+    """
+    Scans the results table and replaces the hourly and daily rollups. Invoke the function with
+    {"action": "rebuild_trend_rollups"} once after creating the trend table (items processed before
+    the stream consumer maintained the rollups are only counted this way), or to correct drift.
+    """
+    rollup_store = get_trend_rollup_store()
+    table = get_table()
+    if rollup_store is None or table is None:
+        print("Error: rebuilding the trend rollups needs DYNAMODB_TABLE_NAME and TREND_TABLE_NAME.")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({"error": "Configuration error: DYNAMODB_TABLE_NAME and TREND_TABLE_NAME must be set."})
+        }
+    try:
+        print(f"Rebuilding trend rollups in '{TREND_TABLE_NAME}' from a scan of '{DYNAMODB_TABLE_NAME}'...")
+        deltas = new_rollup_deltas()
+        scanned_items = 0
+        for item in scan_all_items(table, COUNT_SCAN_ATTRIBUTES + ('ProcessingTimestamp',)):
+            add_item_rollups(deltas, map_comment_item(item))
+            scanned_items += 1
+        deleted_buckets = rollup_store.replace_all(deltas)
+        if get_data_version() is not None:
+            data_version.note_write()
+        print(f"Rebuilt {len(deltas)} trend buckets from {scanned_items} items ({deleted_buckets} stale buckets deleted).")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'scanned_items': scanned_items, 'buckets': len(deltas), 'deleted_buckets': deleted_buckets})
+        }
+    except Exception as e:
+        print(f"Error rebuilding trend rollups: {e}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({"error": f"Error rebuilding trend rollups: {str(e)}"})
+        }
+
+
+# --- Snapshot Job: Materialize the Results Table as a Columnar Snapshot ---
+def refresh_stats_snapshot(full=False):
+    """
+    Writes the columnar snapshot to STATS_SNAPSHOT_S3_URI. Invoke the function with
+    {"action": "refresh_stats_snapshot"} on a schedule (e.g. an EventBridge rule every 15 minutes):
+    it merges the change files the stream consumer wrote since the previous refresh into the
+    previous snapshot, without reading the table. The first refresh, and {"full": true}, build the
+    snapshot from a full scan, which also drops the rows of deleted items.
+    """
+    store = get_snapshot_store()
+    table = get_table()
+    if store is None or table is None:
+        print("Error: refreshing the stats snapshot needs DYNAMODB_TABLE_NAME and STATS_SNAPSHOT_S3_URI.")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({"error": "Configuration error: DYNAMODB_TABLE_NAME and STATS_SNAPSHOT_S3_URI must be set."})
+        }
+    try:
+        start = time.perf_counter()
+        previous = None if full else store.load(force_check=True)
+        incremental = previous is not None
+        builder = SnapshotBuilder(previous)
+        # Listed before a full scan, too: the scanned items include their changes. Files written
+        # later are merged by the next refresh (re-applying an item's newer image is harmless).
+        change_keys = store.list_changes()
+        changes = Counter()
+        read_items = 0
+        if incremental:
+            print(f"Refreshing stats snapshot ({previous.rows} rows) with {len(change_keys)} change file(s)...")
+            for key in change_keys:
+                for mapped_item in store.read_changes(key):
+                    changes[builder.upsert(mapped_item)] += 1
+                    read_items += 1
+        else:
+            print(f"Building stats snapshot from a full scan of '{DYNAMODB_TABLE_NAME}'...")
+            for item in scan_all_items(table, SNAPSHOT_ATTRIBUTES):
+                changes[builder.upsert(map_comment_item(item))] += 1
+                read_items += 1
+
+        result = {
+            'mode': 'incremental' if incremental else 'full',
+            'change_files': len(change_keys),
+            'read_items': read_items,
+            'added_rows': changes['added'],
+            'updated_rows': changes['updated'],
+            'rows': len(builder.comment_ids),
+        }
+        if incremental and not changes['added'] and not changes['updated']:
+            store.delete_changes(change_keys)
+            print(f"Stats snapshot is up to date ({read_items} changed items read).")
+            return {'statusCode': 200, 'body': json.dumps(dict(result, written=False))}
+        data = builder.to_bytes()
+        store.save(data)
+        # Only after the save: a refresh that fails before it merges the same files next time
+        store.delete_changes(change_keys)
+        # Cached /stats responses were computed from the previous snapshot
+        if get_data_version() is not None:
+            data_version.note_write()
+        print(f"Wrote stats snapshot ({len(data)} bytes): {json.dumps(result)} in {time.perf_counter() - start:.2f}s.")
+        return {'statusCode': 200, 'body': json.dumps(dict(result, written=True, bytes=len(data)))}
+    except Exception as e:
+        print(f"Error refreshing stats snapshot: {e}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({"error": f"Error refreshing stats snapshot: {str(e)}"})
+        }
+
+
+# Data version the loaded snapshot was last checked against S3 for (see load_stats_snapshot)
+snapshot_checked_version = None
+
+
+def load_stats_snapshot(version=None):
+    """
+    The columnar snapshot for an unfiltered /stats request, or None (not configured, not built yet,
+    or unreadable). A refresh bumps the data version after saving, so the first load at a new
+    version checks S3 right away instead of serving the warm copy for up to
+    STATS_SNAPSHOT_CHECK_SECONDS: a body cached under the new version's ETag is never computed
+    from the previous snapshot.
+    """
+    global snapshot_checked_version
+    store = get_snapshot_store()
+    if store is None:
+        return None
+    try:
+        snapshot = store.load(force_check=version is not None and version != snapshot_checked_version)
+        snapshot_checked_version = version
+        if snapshot is None:
+            print("Stats snapshot has not been written yet (run the refresh_stats_snapshot action).")
+        return snapshot
+    except Exception as e:
+        # The snapshot is an optimization: fall back to the counters or a scan
+        print(f"Error loading stats snapshot, using the counters or a scan instead: {e}")
+        return None
+
+
+def snapshot_comments(snapshot, comment_filter):
+    """
+    One comment list of the /stats response from the snapshot: its top rows, read with BatchGetItem
+    (current values; an item that no longer matches or was deleted since the refresh is left out).
+    """
+    min_importance = TOP_IMPORTANCE_THRESHOLD if comment_filter == 'important' else 0
+    comment_ids = [snapshot.comment_id(row) for row in snapshot.top_rows(comment_filter, STATS_COMMENT_LIST_LIMIT, min_importance)]
+    client = get_dynamodb_client()
+    items = {}
+    for start in range(0, len(comment_ids), DDB_BATCH_GET_MAX_KEYS):
+        keys = [{'CommentID': comment_id} for comment_id in comment_ids[start:start + DDB_BATCH_GET_MAX_KEYS]]
+        request = {DYNAMODB_TABLE_NAME: dict(Keys=keys, **projection_args(list(LIST_SCAN_ATTRIBUTES)))}
+        while request:
+            response = client.batch_get_item(RequestItems=request)
+            for item in response.get('Responses', {}).get(DYNAMODB_TABLE_NAME, []):
+                items[item['CommentID']] = map_comment_item(item)
+            request = response.get('UnprocessedKeys') or None
+    # BatchGetItem returns the items in any order
+    mapped_items = [items[comment_id] for comment_id in comment_ids if comment_id in items]
+    return heapq.nlargest(STATS_COMMENT_LIST_LIMIT, (item for item in mapped_items if comment_matches(item, comment_filter)), key=lambda item: item.get('Importance', 0))
+
+
+# --- Comment Listing: One Page of Comments per Request ---
+def comment_index(comment_filter):
+    """(index name, (key attribute, key value)) of the sparse GSI serving a filter, or None (scan)."""
+    if comment_filter == 'high_risk' and HIGH_RISK_INDEX_NAME:
+        return HIGH_RISK_INDEX_NAME, HIGH_RISK_INDEX_KEY
+    if comment_filter == 'important' and IMPORTANT_INDEX_NAME:
+        return IMPORTANT_INDEX_NAME, IMPORTANT_INDEX_KEY
+    return None
+
+
+def comment_key_attributes(comment_filter):
+    """Attributes of the key a listing resumes from: the table key, plus the index keys for a Query."""
+    index = comment_index(comment_filter)
+    if index is None:
+        return ('CommentID',)
+    return ('CommentID', index[1][0], 'Importance')
+
+
+def encode_cursor(last_key):
+    """Key to resume the scan or query from -> opaque URL-safe cursor string."""
+    return base64.urlsafe_b64encode(json.dumps(last_key, default=decimal_default).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, key_attributes=('CommentID',)):
+    """Cursor string -> ExclusiveStartKey. Raises ValueError for anything that is not a cursor we issued."""
+    try:
+        last_key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid cursor.")
+    if not isinstance(last_key, dict) or not isinstance(last_key.get('CommentID'), str):
+        raise ValueError("Invalid cursor.")
+    # A cursor of the other read path (scan vs. index query) cannot be resumed
+    if set(last_key) != set(key_attributes):
+        raise ValueError("Invalid cursor for this filter; start again without a cursor.")
+    return last_key
+
+
+def comment_matches(mapped_item, comment_filter):
+    """Same selection rules as the lists of the /stats response."""
+    if mapped_item.get('Sentiment') == 'Skipped - Empty':
+        return False
+    if comment_filter == 'high_risk':
+        return mapped_item.get('IsHighRisk', False) is True
+    if comment_filter == 'important':
+        return mapped_item.get('Importance', 0) >= TOP_IMPORTANCE_THRESHOLD
+    return True
+
+
+def parse_comments_query(query_parameters):
+    """Validates the query string of GET /comments. Raises ValueError with a message for the client."""
+    try:
+        limit = int(query_parameters.get('limit', COMMENTS_PAGE_SIZE_DEFAULT))
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer.")
+    if not 1 <= limit <= COMMENTS_PAGE_SIZE_MAX:
+        raise ValueError(f"limit must be between 1 and {COMMENTS_PAGE_SIZE_MAX}.")
+    comment_filter = query_parameters.get('filter', 'all')
+    if comment_filter not in COMMENT_FILTERS:
+        raise ValueError(f"filter must be one of: {', '.join(COMMENT_FILTERS)}.")
+    fields = list(COMMENT_FIELDS)
+    if query_parameters.get('fields'):
+        fields = [field.strip() for field in query_parameters['fields'].split(',') if field.strip()]
+        unknown_fields = [field for field in fields if field not in COMMENT_FIELDS]
+        if unknown_fields or not fields:
+            raise ValueError(f"Unknown fields: {', '.join(unknown_fields)}. Allowed: {', '.join(COMMENT_FIELDS)}.")
+    cursor = query_parameters.get('cursor')
+    exclusive_start_key = decode_cursor(cursor, comment_key_attributes(comment_filter)) if cursor else None
+    return limit, comment_filter, fields, exclusive_start_key
+
+
+def list_comments(table, limit, comment_filter, fields, exclusive_start_key=None):
+    """
+    Returns up to `limit` matching comments, projected to `fields`, and the key to continue from
+    (None when nothing is left). Only the requested fields plus COMMENT_FILTER_FIELDS are read
+    (ProjectionExpression). With the filter's sparse index configured the comments are queried
+    from it in descending importance; otherwise they are scanned and come in table order.
+    """
+    key_attributes = comment_key_attributes(comment_filter)
+    read_args = projection_args(list(dict.fromkeys(list(COMMENT_FILTER_FIELDS) + list(key_attributes) + fields)))
+    index = comment_index(comment_filter)
+    if index is not None:
+        index_name, (key_attribute, key_value) = index
+        read_args['ExpressionAttributeNames']['#k'] = key_attribute
+        read_args.update(IndexName=index_name, KeyConditionExpression='#k = :k', ExpressionAttributeValues={':k': key_value}, ScanIndexForward=False)
+        read = table.query
+    else:
+        read = table.scan
+    comments = []
+    last_key = exclusive_start_key
+    scanned_count = 0
+    for call in range(COMMENTS_MAX_SCAN_CALLS):
+        remaining = limit - len(comments)
+        # Start with what is still missing and widen the read when the filter keeps rejecting items
+        # (a sparse index holds only matching items, so a Query is normally done after one call)
+        read_limit = min(COMMENTS_SCAN_LIMIT_MAX, remaining << call)
+        if last_key is not None:
+            response = read(Limit=read_limit, ExclusiveStartKey=last_key, **read_args)
+        else:
+            response = read(Limit=read_limit, **read_args)
+        scanned_count += response.get('ScannedCount', len(response.get('Items', [])))
+        items = response.get('Items', [])
+        last_key = response.get('LastEvaluatedKey')
+        for index_in_page, item in enumerate(items):
+            mapped_item = map_comment_item(item)
+            if not comment_matches(mapped_item, comment_filter):
+                continue
+            comments.append({field: mapped_item[field] for field in fields if field in mapped_item})
+            if len(comments) == limit:
+                if index_in_page < len(items) - 1:
+                    # The page is full before the end of the read page: continue right after this item
+                    last_key = {attribute: item[attribute] for attribute in key_attributes}
+                break
+        if len(comments) == limit or last_key is None:
+            break
+    return comments, last_key, scanned_count
+
+
+def build_comment_list(table, mapped_items, comment_filter, snapshot=None):
+    """One comment list of the /stats response: queried from the filter's sparse index, or the top-k of the snapshot or the scanned items."""
+    if comment_index(comment_filter) is not None:
+        comments, _, _ = list_comments(table, STATS_COMMENT_LIST_LIMIT, comment_filter, list(LIST_SCAN_ATTRIBUTES))
+        return comments
+    if snapshot is not None:
+        return snapshot_comments(snapshot, comment_filter)
+    return top_comments(mapped_items, comment_filter, STATS_COMMENT_LIST_LIMIT)
+
+
+def top_comments(mapped_items, comment_filter, limit):
+    """
+    The `limit` most important matching comments of already scanned items, highest first.
+    A bounded heap (O(n log limit)) instead of sorting every comment; ties keep the scan order.
+    """
+    return heapq.nlargest(limit, (item for item in mapped_items if comment_matches(item, comment_filter)), key=lambda item: item.get('Importance', 0))
+
+
+# --- Backfill Tool: Add the Sparse Index Keys to Items Written Before They Existed ---
+def index_key_updates(mapped_item, item):
+    """SET/REMOVE clauses that make an item's sparse index keys match its analysis (empty if they do)."""
+    wanted = {
+        HIGH_RISK_INDEX_KEY: comment_matches(mapped_item, 'high_risk'),
+        IMPORTANT_INDEX_KEY: comment_matches(mapped_item, 'important'),
+    }
+    updates = []
+    for (attribute, value), member in wanted.items():
+        if member and item.get(attribute) != value:
+            updates.append(('SET', attribute, value))
+        elif not member and attribute in item:
+            updates.append(('REMOVE', attribute, None))
+    return updates
+
+
+def index_key_update_args(clauses):
+    """UpdateExpression and its attribute names/values for the clauses of index_key_updates."""
+    names = {f'#a{i}': attribute for i, (_, attribute, _) in enumerate(clauses)}
+    values = {f':v{i}': value for i, (action, _, value) in enumerate(clauses) if action == 'SET'}
+    sets = [f'#a{i} = :v{i}' for i, (action, _, _) in enumerate(clauses) if action == 'SET']
+    removes = [f'#a{i}' for i, (action, _, _) in enumerate(clauses) if action == 'REMOVE']
+    expression = ' '.join(part for part in (
+        'SET ' + ', '.join(sets) if sets else '',
+        'REMOVE ' + ', '.join(removes) if removes else '',
+    ) if part)
+    update_args = {'UpdateExpression': expression, 'ExpressionAttributeNames': names}
+    if values:
+        update_args['ExpressionAttributeValues'] = values
+    return update_args
+
+
+def backfill_index_keys():
+    """
+    Scans the results table and sets HighRiskIndexKey/ImportantIndexKey on items written before
+    process_feedback started writing them (and removes stale ones). Invoke the function with
+    {"action": "backfill_index_keys"} once before setting HIGH_RISK_INDEX_NAME/IMPORTANT_INDEX_NAME.
+    """
+    table = get_table()
+    if table is None:
+        print("Error: backfilling the index keys needs DYNAMODB_TABLE_NAME.")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({"error": "Configuration error: DYNAMODB_TABLE_NAME must be set."})
+        }
+    try:
+        client = get_dynamodb_client()
+        attributes = list(COMMENT_FILTER_FIELDS) + [HIGH_RISK_INDEX_KEY[0], IMPORTANT_INDEX_KEY[0]]
+        pending = []
+        scanned_items = 0
+        for item in scan_all_items(table, attributes):
+            scanned_items += 1
+            updates = index_key_updates(map_comment_item(item), item)
+            if updates:
+                pending.append((item['CommentID'], updates))
+
+        def apply(update):
+            comment_id, clauses = update
+            client.update_item(TableName=DYNAMODB_TABLE_NAME, Key={'CommentID': comment_id}, **index_key_update_args(clauses))
+
+        # UpdateItem calls are independent; a few threads keep a large backfill within the timeout
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(apply, pending))
+        if pending and get_data_version() is not None:
+            data_version.note_write()
+        print(f"Backfilled index keys on {len(pending)} of {scanned_items} items.")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'scanned_items': scanned_items, 'updated_items': len(pending)})
+        }
+    except Exception as e:
+        print(f"Error backfilling index keys: {e}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({"error": f"Error backfilling index keys: {str(e)}"})
+        }
+
+
+# --- Cold-Start Report ---
+# Module-level setup ends here. The report (import time, client construction time and the
+# duration of the first invocation) is printed once per container by lambda_handler().
+MODULE_IMPORT_SECONDS = time.perf_counter() - MODULE_IMPORT_START
+cold_start_report = None # Set by the first invocation of this container
+
+
 # --- Lambda Handler Function ---
 # Handler name is lambda_handler
 def lambda_handler(event, context):
+    """Entry point. Prints the cold-start report after the container's first invocation."""
+    global cold_start_report
+    if cold_start_report is not None:
+        return handle_request(event, context)
+    cold_start_report = {}
+    invocation_start = time.perf_counter()
+    try:
+        return handle_request(event, context)
+    finally:
+        cold_start_report.update({
+            'import_ms': round(MODULE_IMPORT_SECONDS * 1000, 1),
+            'client_init_ms': round(client_init_seconds * 1000, 1),
+            'first_invocation_ms': round((time.perf_counter() - invocation_start) * 1000, 1),
+            'dynamodb_client_mode': DYNAMODB_CLIENT_MODE,
+        })
+        print(f"Cold start: {json.dumps(cold_start_report)}")
+
+
+def handle_request(event, context):
     """
     API endpoint to get aggregated statistics (counts, percentages) from DynamoDB.
+    Also the DynamoDB Streams consumer and the rebuild tools of the aggregate counters and trend
+    rollups, and the snapshot job of the columnar snapshot.
+    """
+    # --- Non-API Events ---
+    # DynamoDB Streams batch from the results table
+    if event.get('Records') and event['Records'][0].get('eventSource') == 'aws:dynamodb':
+        return update_stats_counters(event['Records'])
+    # Manual invocation: {"action": "rebuild_stats_counters"}
+    if event.get('action') == 'rebuild_stats_counters':
+        return rebuild_stats_counters()
+    # Manual invocation: {"action": "backfill_index_keys"}
+    if event.get('action') == 'backfill_index_keys':
+        return backfill_index_keys()
+    # Manual or scheduled invocation: {"action": "refresh_stats_snapshot", "full": false}
+    if event.get('action') == 'refresh_stats_snapshot':
+        return refresh_stats_snapshot(full=bool(event.get('full')))
+    # Manual invocation: {"action": "rebuild_trend_rollups"}
+    if event.get('action') == 'rebuild_trend_rollups':
+        return rebuild_trend_rollups()
+
+    # GET /trends: hourly or daily counts of a time range, from the rollup table
+    if event.get('resource') == '/trends' or (event.get('path') or '').endswith('/trends'):
+        return encode_response(handle_trends_request(event), choose_encoding(request_header(event, 'Accept-Encoding')), RESPONSE_COMPRESSION_MIN_BYTES)
+
+    # GET /comments: one page of comments (the /stats response carries aggregates only)
+    if event.get('resource') == '/comments' or (event.get('path') or '').endswith('/comments'):
+        return encode_response(handle_comments_request(event), choose_encoding(request_header(event, 'Accept-Encoding')), RESPONSE_COMPRESSION_MIN_BYTES)
+
+    # GET /stats
+    encoding = choose_encoding(request_header(event, 'Accept-Encoding'))
+    return encode_response(handle_stats_request(event, encoding), encoding, RESPONSE_COMPRESSION_MIN_BYTES)
+
+
+# --- /stats Response Cache (per Data Version) ---
+# Shared modules (backend/common) the responses depend on. Deployed next to lambda_handler.py,
+# but loaded from backend/common when run from the repository (benchmarks), so found by module
+SHARED_SOURCE_MODULES = ('data_version', 'item_filters', 'parallel_scan', 'dynamodb_types')
+
+
+def stats_source_fingerprint():
+    """
+    Short hash of this function's code and response settings, part of every /stats ETag: every
+    .py file of the function directory plus the shared modules, by file name (the same hash
+    whether the shared modules are packaged alongside or loaded from backend/common).
+    """
+    function_dir = os.path.dirname(os.path.abspath(__file__))
+    source_paths = {name: os.path.join(function_dir, name) for name in os.listdir(function_dir) if name.endswith('.py')}
+    for module_name in SHARED_SOURCE_MODULES:
+        module = sys.modules.get(module_name)
+        if module is not None and getattr(module, '__file__', None):
+            source_paths.setdefault(os.path.basename(module.__file__), module.__file__)
+    digest = hashlib.sha256()
+    for name, path in sorted(source_paths.items()):
+        digest.update(name.encode('utf-8'))
+        with open(path, 'rb') as source_file:
+            digest.update(source_file.read())
+    digest.update(json.dumps([STATS_TABLE_NAME, STATS_COMMENT_LIST_LIMIT, HIGH_RISK_INDEX_NAME, IMPORTANT_INDEX_NAME, RESPONSE_COMPRESSION_MIN_BYTES, STATS_SNAPSHOT_S3_URI]).encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+
+# A deployment that changes the response (code or settings) also changes the ETags, so browsers
+# do not keep showing a response of the previous deployment after a 304
+STATS_SOURCE_FINGERPRINT = stats_source_fingerprint()
+stats_response_cache = {} # ETag -> response body, for stats_cache_version only
+stats_cache_version = None
+# Filtered requests (?source=&from=&to=&category=) add a variant each; the oldest is dropped beyond this
+STATS_RESPONSE_CACHE_MAX_ENTRIES = 64
+
+
+def stats_etag(version, include_comments, encoding=None, item_filter=None):
+    """Strong ETag of a /stats response: data version, deployment fingerprint, variant, filter and content coding."""
+    variant = "comments" if include_comments else "counts"
+    if item_filter:
+        variant += '-' + hashlib.sha256(json.dumps(item_filter, sort_keys=True).encode('utf-8')).hexdigest()[:8]
+    return f'"{version}-{STATS_SOURCE_FINGERPRINT}-{variant}{"-" + encoding if encoding else ""}"'
+
+
+def request_header(event, name):
+    """Value of an HTTP request header (names are case-insensitive; HTTP/2 clients send lower case)."""
+    for header_name, value in (event.get('headers') or {}).items():
+        if header_name.lower() == name.lower():
+            return value
+    return None
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header value (a list of ETags, weak or strong, or '*') names etag."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    # If-None-Match uses the weak comparison (RFC 9110), so W/"x" matches "x"
+    return any(candidate == '*' or candidate.removeprefix('W/') == etag for candidate in candidates)
+
+
+def handle_stats_request(event, encoding=None):
+    """
+    GET /stats. With DATA_VERSION_TABLE_NAME set, the response carries an ETag for the current data
+    version; a request whose If-None-Match names it gets 304, and other requests at the same version
+    are answered from the warm container's cache. Either way the only DynamoDB call is one GetItem.
+    """
+    global stats_cache_version
+    # By default only the counts and chart aggregates are returned; with the counters built, such a
+    # request reads a few counter items and never scans the results table. ?include_comments=true
+    # adds top_important_comments/high_risk_comments_list (the STATS_COMMENT_LIST_LIMIT most
+    # important of each; the dashboard pages through GET /comments instead).
+    query_parameters = event.get('queryStringParameters') or {}
+    include_comments = str(query_parameters.get('include_comments', 'false')).lower() == 'true'
+    # ?source=<S3 key>&from=&to=&category= restricts the stats to matching items (see item_filters.py)
+    try:
+        item_filter = parse_item_filter(query_parameters)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Access-Control-Allow-Methods': 'GET,OPTIONS', 'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'},
+            'body': json.dumps({"error": str(e)})
+        }
+
+    version = None
+    if get_data_version() is not None:
+        try:
+            version = data_version.read()
+        except Exception as e:
+            # Without the version nothing can be cached safely; compute the response as usual
+            print(f"Error reading the data version, computing stats without the cache: {e}")
+    if version is None:
+        return compute_stats_response(include_comments, item_filter)
+
+    # Each content coding is a different representation, so it gets its own ETag
+    etag = stats_etag(version, include_comments, encoding, item_filter)
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*', # WARNING: Use a specific origin in production!
+        'Access-Control-Allow-Methods': 'GET,OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,If-None-Match',
+        'Access-Control-Expose-Headers': 'ETag,Content-Encoding', # Lets the dashboard read the ETag cross-origin
+        'ETag': etag,
+        'Cache-Control': 'no-cache', # May be stored, but must be revalidated with If-None-Match
+    }
+    if etag_matches(request_header(event, 'If-None-Match'), etag):
+        print(f"Data version {version} unchanged; returning 304.")
+        return {'statusCode': 304, 'headers': headers, 'body': ''}
+
+    if stats_cache_version != version:
+        stats_response_cache.clear() # Responses of older versions can no longer be served
+        stats_cache_version = version
+    body = stats_response_cache.get(etag)
+    if body is not None:
+        print(f"Returning cached stats for data version {version}.")
+    else:
+        response = compute_stats_response(include_comments, item_filter, version)
+        if response['statusCode'] != 200:
+            return response
+        body = response['body']
+        # Keyed by the version read before computing: if the data changed meanwhile, the next
+        # request sees a newer version and recomputes, so a cached body is never older than its key
+        if len(stats_response_cache) >= STATS_RESPONSE_CACHE_MAX_ENTRIES:
+            del stats_response_cache[next(iter(stats_response_cache))]
+        stats_response_cache[etag] = body
+    return {'statusCode': 200, 'headers': headers, 'body': body}
+
+
+def compute_stats_response(include_comments, item_filter=None, version=None):
+    """
+    Computes the /stats response (counts, percentages, chart aggregates and optionally the lists).
+    With an item_filter, everything is computed from the matching items only. version is the
+    data version the response will be cached under, if any.
     """
     print("Executing GetStatsLambda (renamed handler).")
 
     # Check if table resource was initialized
     # This also implicitly checks if DYNAMODB_TABLE_NAME was set
+    table = get_table()
     if table is None:
          print("Error: DynamoDB table resource not initialized. DYNAMODB_TABLE_NAME environment variable might be missing.")
          # Return error response with CORS headers
@@ -116,72 +958,68 @@ def lambda_handler(event, context):
             'body': json.dumps({"error": f"Configuration error: DynamoDB table resource initialization failed. Is DYNAMODB_TABLE_NAME environment variable set correctly?"})
          }
 
-
     try:
-        # --- 1. Retrieve all items from DynamoDB ---
-        print(f"Scanning DynamoDB table '{DYNAMODB_TABLE_NAME}' for stats...")
-        response = table.scan()
-        items = response.get('Items', []) # Use .get with default empty list
-
-        # Handle pagination
-        while 'LastEvaluatedKey' in response:
-            print("Scanning for more results...")
-            response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-            items.extend(response.get('Items', []))
-
-        print(f"Retrieved {len(items)} items from DynamoDB.")
-
-        # --- 2. Handle Case with No Items ---
-        if not items:
-             print("No items found in the table. Returning empty stats.")
-             # Add CORS headers here as well
-             return {
-                 'statusCode': 200,
-                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Access-Control-Allow-Methods': 'GET,OPTIONS', 'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'},
-                 'body': json.dumps(get_empty_stats()) # Return the standard empty structure
-             }
+        # --- 1. Read the Columnar Snapshot or the Aggregate Counters (if configured) ---
+        counts = None
+        counts_source = 'scan'
+        # Both hold table-wide totals; a filtered request counts the items it reads
+        snapshot = load_stats_snapshot(version) if not item_filter else None
+        if snapshot is not None:
+            counts = snapshot.counts()
+            counts_source = 'snapshot'
+        counter_store = get_stats_counter_store() if not item_filter and counts is None else None
+        if counter_store is not None:
+            try:
+                totals = counter_store.read_totals()
+                if totals is not None:
+                    counts = to_stats_counts(totals)
+                    counts_source = 'counters'
+                else:
+                    print("Stats counters have not been built yet (run the rebuild_stats_counters action). Counting from a scan.")
+            except Exception as e:
+                # The counters are an optimization: fall back to counting the scanned items
+                print(f"Error reading stats counters, counting from a scan instead: {e}")
 
-        # --- 3. Aggregate Data ---
-        total_comments = len(items) # This is the total number of rows in the table
-        sentiment_counts = {}
-        category_counts = {}
-        high_risk_count = 0
-        processable_comments = [] # Store comments that were successfully analyzed or had LLM errors
+        # --- 2. Retrieve all items from DynamoDB (only when counting or listing needs them) ---
+        # A comment list served by its sparse index or the snapshot is read later and needs no scan
+        lists_need_scan = include_comments and snapshot is None and (comment_index('important') is None or comment_index('high_risk') is None)
+        mapped_items = [] # The items are mapped and clean (skipped rows are excluded from the lists later)
+        if item_filter:
+            # One file's rows by Query on the source index (or a filtered scan); the sparse indexes
+            # cover the whole table, so the lists are the top-k of these items
+            print(f"Reading items of '{DYNAMODB_TABLE_NAME}' matching {item_filter} for stats...")
+            filtered_items, counts_source = read_filtered_items(
+                table, item_filter, LIST_SCAN_ATTRIBUTES if include_comments else COUNT_SCAN_ATTRIBUTES,
+                source_index_name=SOURCE_INDEX_NAME, total_segments=SCAN_TOTAL_SEGMENTS, max_workers=SCAN_MAX_WORKERS
+            )
+            mapped_items = [map_comment_item(item) for item in filtered_items]
+            print(f"Retrieved {len(mapped_items)} matching items from DynamoDB.")
+            counts = count_mapped_items(mapped_items)
+        elif counts is None or lists_need_scan:
+            print(f"Scanning DynamoDB table '{DYNAMODB_TABLE_NAME}' for stats...")
+            scan_attributes = LIST_SCAN_ATTRIBUTES if lists_need_scan else COUNT_SCAN_ATTRIBUTES
+            mapped_items = [map_comment_item(item) for item in scan_all_items(table, scan_attributes)]
+            print(f"Retrieved {len(mapped_items)} items from DynamoDB.")
+            if counts is None:
+                counts = count_mapped_items(mapped_items)
 
-        for item in items:
-            # Map the item to a cleaner structure early in the loop
-            mapped_item = map_comment_item(item)
-
-            # Only count stats for items that were NOT explicitly skipped as empty
-            if mapped_item.get('Sentiment') != 'Skipped - Empty':
-                 sentiment = mapped_item.get('Sentiment', 'Unknown')
-                 category = mapped_item.get('Category', 'Unknown')
-                 is_high_risk = mapped_item.get('IsHighRisk', False) # Already boolean from map_comment_item
-                 importance = mapped_item.get('Importance', 0)     # Already int from map_comment_item
-
-                 sentiment_counts[sentiment] = sentiment_counts.get(sentiment, 0) + 1
-                 category_counts[category] = category_counts.get(category, 0) + 1
-
-                 if is_high_risk:
-                     high_risk_count += 1
-
-                 # Add items that weren't just skips to a list for filtering/sorting
-                 # The item is already mapped and clean
-                 processable_comments.append(mapped_item)
-
-
-        # Recalculate total comments for percentage base, excluding explicit skips
-        total_processable_comments = len(processable_comments) # Count of items in the processable_comments list
-        # Handle case where all items might have been skips, resulting in processable_comments being empty
-        if total_processable_comments == 0:
+        # --- 3. Handle Case with No Items ---
+        total_comments = counts['total_comments'] # This is the total number of rows in the table
+        # Percentages are based on the total number of comments, excluding explicit skips
+        total_processable_comments = counts['total_processable_comments']
+        if total_comments == 0 or total_processable_comments == 0:
              print("No processable comments found for stats aggregation. Returning empty stats.")
              # Add CORS headers here as well
              return {
                  'statusCode': 200,
                  'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Access-Control-Allow-Methods': 'GET,OPTIONS', 'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'},
-                 'body': json.dumps(get_empty_stats())
+                 # Return the standard empty structure (with the filter that matched nothing)
+                 'body': dumps_compact(dict(get_empty_stats(), filter=item_filter) if item_filter else get_empty_stats())
              }
 
+        sentiment_counts = counts['sentiment_counts']
+        category_counts = counts['category_counts']
+        high_risk_count = counts['high_risk_count']
 
         # Calculate percentages based on the total number of *processable* comments
         sentiment_percentages = {k: (v / total_processable_comments) * 100 for k, v in sentiment_counts.items()}
@@ -201,29 +1039,17 @@ def lambda_handler(event, context):
                  recommended_actions[category] = False
 
 
-        # --- 4. Prepare Filtered/Sorted Lists ---
-
-        # Sort processable comments by Importance (high to low)
-        # Use the already mapped items which have integer Importance
-        sorted_processable_comments = sorted(processable_comments, key=lambda x: x.get('Importance', 0), reverse=True)
+        # --- 4. Prepare the Comment Lists (the STATS_COMMENT_LIST_LIMIT most important of each) ---
+        top_important_comments_list = [] # Importance >= 4, highest first
+        high_risk_comments_list = [] # High-risk comments, highest importance first
+        if include_comments and item_filter:
+            top_important_comments_list = top_comments(mapped_items, 'important', STATS_COMMENT_LIST_LIMIT)
+            high_risk_comments_list = top_comments(mapped_items, 'high_risk', STATS_COMMENT_LIST_LIMIT)
+        elif include_comments:
+            top_important_comments_list = build_comment_list(table, mapped_items, 'important', snapshot)
+            high_risk_comments_list = build_comment_list(table, mapped_items, 'high_risk', snapshot)
 
-        # Identify top important comments (e.g., all with Importance >= 4)
-        top_important_comments_list = [
-            item for item in sorted_processable_comments
-            if item.get('Importance', 0) >= 4
-        ]
-        # Optional: Limit the list length if needed for the frontend display
-        # top_important_comments_list = top_important_comments_list[:20]
 
-
-        # Identify high-risk comments list (filtered from processable_comments)
-        high_risk_comments_list = [
-            item for item in processable_comments
-            if item.get('IsHighRisk', False) is True # Check the boolean field from mapped item
-        ]
-
-
-        # --- 5. Construct Final Stats Dictionary ---
         # --- 5. Construct Final Stats Dictionary ---
         stats = {
             "total_comments": total_comments,
@@ -234,18 +1060,26 @@ def lambda_handler(event, context):
             "category_percentages": category_percentages,
             "high_risk_count": high_risk_count,
             "recommended_actions": recommended_actions,
+            # Chart data: comments per importance level, and per sentiment and importance level
+            "importance_distribution": counts['importance_distribution'],
+            "sentiment_importance_matrix": counts['sentiment_importance_matrix'],
             "top_important_comments": top_important_comments_list,
             "high_risk_comments_list": high_risk_comments_list,
-            # ADD THIS LINE to return the full list of processable comments
-            "all_mapped_comments_list": processable_comments
+            "counts_source": counts_source # 'snapshot', 'counters' or 'scan' ('query' for a filter served by the source index)
         }
+        if snapshot is not None:
+            stats["snapshot_refreshed_at"] = snapshot.refreshed_at # UTC; the counts are as of this refresh
+        if item_filter:
+            stats["filter"] = item_filter # Normalized: from/to as UTC timestamps
 
-        print("Stats generated:", json.dumps(stats, default=decimal_default))
+        # Serialized once, for the log line and the response (compact separators, UTF-8 text; every
+        # number is already an int or float: map_comment_item, to_stats_counts and the scan Counters
+        # convert the Decimals, so no default= callback runs)
+        body = dumps_compact(stats)
+        print("Stats generated:", body)
 
 
         # --- 6. Return Response ---
-        # Use the helper function 'decimal_default' to handle any Decimal types that might still be present
-        # although most should be handled by map_comment_item
         return {
             'statusCode': 200,
             'headers': {
@@ -255,7 +1089,7 @@ def lambda_handler(event, context):
                 'Access-Control-Allow-Methods': 'GET,OPTIONS',
                 'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
             },
-            'body': json.dumps(stats, default=decimal_default)
+            'body': body
         }
 
     except Exception as e:
@@ -270,4 +1104,113 @@ def lambda_handler(event, context):
                 'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
             },
             'body': json.dumps({"error": f"Internal server error during stats retrieval: {str(e)}"})
-        }
\ No newline at end of file
+        }
+
+
+def handle_comments_request(event):
+    """
+    GET /comments?filter=all|high_risk|important&limit=50&fields=Importance,OriginalComment&cursor=...
+    Returns {"items": [...], "count": n, "next_cursor": "..." or null}. Pass next_cursor back as
+    ?cursor= for the following page; a page can hold fewer than `limit` items even when more follow.
+    """
+    cors_headers = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Access-Control-Allow-Methods': 'GET,OPTIONS', 'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'}
+    table = get_table()
+    if table is None:
+        print("Error: DynamoDB table resource not initialized. DYNAMODB_TABLE_NAME environment variable might be missing.")
+        return {
+            'statusCode': 500,
+            'headers': cors_headers,
+            'body': json.dumps({"error": "Configuration error: DynamoDB table resource initialization failed. Is DYNAMODB_TABLE_NAME environment variable set correctly?"})
+        }
+
+    try:
+        limit, comment_filter, fields, exclusive_start_key = parse_comments_query(event.get('queryStringParameters') or {})
+    except ValueError as e:
+        return {'statusCode': 400, 'headers': cors_headers, 'body': json.dumps({"error": str(e)})}
+
+    try:
+        comments, last_key, scanned_count = list_comments(table, limit, comment_filter, fields, exclusive_start_key)
+        print(f"Listed {len(comments)} comments (filter={comment_filter}, scanned {scanned_count} items, more={last_key is not None}).")
+        return {
+            'statusCode': 200,
+            'headers': cors_headers,
+            'body': dumps_compact({
+                'items': comments,
+                'count': len(comments),
+                'next_cursor': encode_cursor(last_key) if last_key is not None else None,
+            })
+        }
+    except Exception as e:
+        print(f"Error listing comments: {e}")
+        return {
+            'statusCode': 500,
+            'headers': cors_headers,
+            'body': json.dumps({"error": f"Internal server error during comment listing: {str(e)}"})
+        }
+
+
+def parse_trends_query(query_parameters):
+    """
+    Validates the query string of GET /trends: granularity (hour or day), from/to (ISO 8601, UTC
+    unless a time zone is given). Returns (granularity, first bucket, last bucket, every bucket in
+    between). Raises ValueError with a message for the client.
+    """
+    granularity = str(query_parameters.get('granularity') or 'day').lower()
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}.")
+    step = GRANULARITIES[granularity][1]
+    end = parse_bucket_time(parse_timestamp(query_parameters['to'], 'to', end_of_range=True)) if query_parameters.get('to') else datetime.datetime.utcnow()
+    if query_parameters.get('from'):
+        start = parse_bucket_time(parse_timestamp(query_parameters['from'], 'from'))
+    else:
+        start = end - step * (TREND_DEFAULT_BUCKETS[granularity] - 1)
+    if start > end:
+        raise ValueError("from must not be later than to.")
+    if (end - start) // step + 1 > TREND_MAX_BUCKETS[granularity]:
+        raise ValueError(f"A {granularity} trend covers at most {TREND_MAX_BUCKETS[granularity]} buckets; narrow from/to or use a coarser granularity.")
+    buckets = bucket_range(start, end, granularity)
+    return granularity, buckets[0], buckets[-1], buckets
+
+
+def handle_trends_request(event):
+    """
+    GET /trends?granularity=day&from=2025-04-01&to=2025-04-30
+    Returns {"granularity", "from", "to", "buckets": [...]}: every bucket in the range, oldest first,
+    with total_comments, total_processable_comments, high_risk_count, sentiment_counts and
+    category_counts (all zero for buckets without comments). Only the rollup items in range are read.
+    """
+    cors_headers = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Access-Control-Allow-Methods': 'GET,OPTIONS', 'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'}
+    rollup_store = get_trend_rollup_store()
+    if rollup_store is None:
+        print("Error: GET /trends needs TREND_TABLE_NAME.")
+        return {
+            'statusCode': 500,
+            'headers': cors_headers,
+            'body': json.dumps({"error": "Configuration error: TREND_TABLE_NAME environment variable is not set."})
+        }
+
+    try:
+        granularity, first_bucket, last_bucket, buckets = parse_trends_query(event.get('queryStringParameters') or {})
+    except ValueError as e:
+        return {'statusCode': 400, 'headers': cors_headers, 'body': json.dumps({"error": str(e)})}
+
+    try:
+        items = {item['Bucket']: item for item in rollup_store.query(granularity, first_bucket, last_bucket)}
+        print(f"Read {len(items)} {granularity} rollup items for {first_bucket}..{last_bucket} ({len(buckets)} buckets).")
+        return {
+            'statusCode': 200,
+            'headers': cors_headers,
+            'body': dumps_compact({
+                'granularity': granularity,
+                'from': first_bucket,
+                'to': last_bucket,
+                'buckets': [to_trend_bucket(items.get(bucket, {'Bucket': bucket})) for bucket in buckets],
+            })
+        }
+    except Exception as e:
+        print(f"Error reading trends: {e}")
+        return {
+            'statusCode': 500,
+            'headers': cors_headers,
+            'body': json.dumps({"error": f"Internal server error during trend retrieval: {str(e)}"})
+        }
@@ -0,0 +1,89 @@
+import gzip
+import json
+import base64
+from decimal import Decimal
+
+try:
+    import brotli # Optional: add the 'brotli' package to the function's ZIP to enable 'br'
+except ImportError:
+    brotli = None
+
+# --- Constants ---
+GZIP_LEVEL = 6 # zlib's default: most of level 9's ratio at a fraction of the CPU time
+BROTLI_QUALITY = 5 # Smaller than gzip -6 at a similar speed (quality 11 is far too slow per request)
+
+
+def json_number(obj):
+    """json.dumps default= for the Decimal numbers DynamoDB returns (int when integral, else float)."""
+    if isinstance(obj, Decimal):
+        # int() and one comparison are cheaper than the Decimal arithmetic of `obj % 1`
+        integer = int(obj)
+        return integer if integer == obj else float(obj)
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+def dumps_compact(value):
+    """
+    JSON without whitespace between tokens, with non-ASCII text as UTF-8 instead of \\uXXXX escapes
+    (a Japanese character is 3 bytes instead of 6). The value must hold plain Python numbers only:
+    map_comment_item and the count/trend builders convert DynamoDB's Decimals once, so the C encoder
+    runs without a default= callback (one Python call per number on the old path).
+    """
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+
+def choose_encoding(accept_encoding):
+    """
+    Content coding for an Accept-Encoding header value: 'br' (only if brotli is installed), 'gzip'
+    or None (identity). The highest q-value wins; on a tie br is preferred.
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        coding, _, parameters = part.partition(';')
+        weight = 1.0
+        for parameter in parameters.split(';'):
+            name, _, value = parameter.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for coding in (('br',) if brotli is not None else ()) + ('gzip',):
+        weight = weights.get(coding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def compress(data, encoding):
+    """Compresses UTF-8 bytes with 'br' or 'gzip'."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # mtime=0: the same body always compresses to the same bytes
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def encode_response(response, encoding, min_bytes):
+    """
+    Compresses the body of an API Gateway proxy response in place when encoding is set and the body
+    has at least min_bytes. The body is returned base64-encoded with isBase64Encoded, which API
+    Gateway decodes back to the compressed bytes (the API needs a binary media type, e.g. */*).
+    """
+    body = response.get('body')
+    if not isinstance(body, str) or response.get('isBase64Encoded'):
+        return response
+    # The body depends on Accept-Encoding, so shared caches must keep the variants apart
+    response['headers'] = dict(response.get('headers') or {}, Vary='Accept-Encoding')
+    if encoding is None:
+        return response
+    data = body.encode('utf-8')
+    if len(data) < min_bytes:
+        return response
+    response['body'] = base64.b64encode(compress(data, encoding)).decode('ascii')
+    response['isBase64Encoded'] = True
+    response['headers'] = dict(response.get('headers') or {}, **{'Content-Encoding': encoding})
+    return response
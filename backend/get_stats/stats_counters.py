@@ -0,0 +1,207 @@
+import time
+import random
+import datetime
+from collections import Counter
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+# --- Constants ---
+# Counter items live in their own table (partition key 'CounterKey'), one item per shard.
+# Every attribute except the key and 'RebuiltAt' is a count, updated with atomic ADD.
+COUNTER_KEY_PREFIX = 'ALL#'
+TOTAL_ATTRIBUTE = 'TotalComments' # Every item in the results table, skipped rows included
+PROCESSABLE_ATTRIBUTE = 'ProcessableComments' # Items not marked 'Skipped - Empty'
+HIGH_RISK_ATTRIBUTE = 'HighRiskComments'
+SENTIMENT_PREFIX = 'Sentiment#'
+CATEGORY_PREFIX = 'Category#'
+IMPORTANCE_PREFIX = 'Importance#' # Importance histogram: Importance#<level>
+SENTIMENT_IMPORTANCE_PREFIX = 'SentimentImportance#' # Matrix: SentimentImportance#<sentiment>#<level>
+IMPORTANCE_LEVELS = range(1, 6) # Levels charted by the dashboard; 0 (failed or skipped analysis) is not
+SKIPPED_SENTIMENT = 'Skipped - Empty'
+# Keeps each UpdateExpression well below the 4 KB limit however many categories the model invents
+MAX_TERMS_PER_UPDATE = 50
+# BatchGetItem accepts at most 100 keys per call
+DDB_BATCH_GET_MAX_KEYS = 100
+# Applied markers: each ADD of a stream batch is written in one transaction with a marker item
+# naming the batch and the update, so a retried batch skips the updates it already applied.
+# Markers expire (ExpiresAt, for the table's TTL) after the stream's 24-hour retention.
+APPLIED_MARKER_PREFIX = 'APPLIED#'
+APPLIED_MARKER_TTL_SECONDS = 2 * 24 * 3600
+
+type_deserializer = TypeDeserializer()
+
+
+def item_contributions(mapped_item):
+    """
+    Counter deltas of one results-table item, already normalized by map_comment_item().
+    Same rules as the scan-based aggregation in get_stats: skipped rows only count towards the total.
+    """
+    contributions = Counter({TOTAL_ATTRIBUTE: 1})
+    sentiment = mapped_item.get('Sentiment', 'Unknown')
+    if sentiment != SKIPPED_SENTIMENT:
+        contributions[PROCESSABLE_ATTRIBUTE] += 1
+        contributions[SENTIMENT_PREFIX + sentiment] += 1
+        contributions[CATEGORY_PREFIX + mapped_item.get('Category', 'Unknown')] += 1
+        if mapped_item.get('IsHighRisk', False):
+            contributions[HIGH_RISK_ATTRIBUTE] += 1
+        importance = mapped_item.get('Importance', 0)
+        if importance in IMPORTANCE_LEVELS:
+            contributions[f"{IMPORTANCE_PREFIX}{importance}"] += 1
+            contributions[f"{SENTIMENT_IMPORTANCE_PREFIX}{sentiment}#{importance}"] += 1
+    return contributions
+
+
+def deserialize_image(image):
+    """DynamoDB Streams image (typed AttributeValues) -> plain Python item, or None."""
+    if not image:
+        return None
+    return {name: type_deserializer.deserialize(value) for name, value in image.items()}
+
+
+def stream_record_deltas(record, map_item):
+    """
+    Counter deltas of one DynamoDB Streams record (view type NEW_AND_OLD_IMAGES): the new image's
+    contributions minus the old image's. Overwriting an item with the same analysis (re-processing
+    a file, a repeated batch inference event) therefore changes nothing.
+    """
+    images = record.get('dynamodb', {})
+    deltas = Counter()
+    new_item = deserialize_image(images.get('NewImage'))
+    old_item = deserialize_image(images.get('OldImage'))
+    if new_item is not None:
+        deltas.update(item_contributions(map_item(new_item)))
+    if old_item is not None:
+        deltas.subtract(item_contributions(map_item(old_item)))
+    return deltas
+
+
+def stream_batch_id(records):
+    """
+    Identifies a batch of stream records by its first and last sequence number: Lambda retries a
+    failed batch with the same records (keep BisectBatchOnFunctionError off, as a split batch
+    has new identities).
+    """
+    return f"{records[0]['dynamodb']['SequenceNumber']}-{records[-1]['dynamodb']['SequenceNumber']}"
+
+
+def apply_once(dynamodb_client, marker_table, marker_key, update):
+    """
+    Runs one Update (TransactWriteItems form) together with the Put of a marker item, in one
+    transaction conditioned on the marker not existing yet. Returns False if the update had
+    already been applied (by an earlier attempt at the same batch), True otherwise.
+    """
+    marker = dict(marker_key, ExpiresAt=int(time.time()) + APPLIED_MARKER_TTL_SECONDS)
+    try:
+        dynamodb_client.transact_write_items(TransactItems=[
+            {'Put': {'TableName': marker_table, 'Item': marker, 'ConditionExpression': 'attribute_not_exists(#k)',
+                     'ExpressionAttributeNames': {'#k': next(iter(marker_key))}}},
+            {'Update': update},
+        ])
+        return True
+    except ClientError as e:
+        reasons = e.response.get('CancellationReasons') or []
+        if e.response.get('Error', {}).get('Code') == 'TransactionCanceledException' and reasons and reasons[0].get('Code') == 'ConditionalCheckFailed':
+            return False
+        raise
+
+
+def to_stats_counts(totals):
+    """
+    Summed counter attributes -> the count fields of the /stats response. The importance histogram
+    always has all five levels; the matrix maps sentiment -> level -> count (levels as strings, as in JSON).
+    """
+    sentiment_counts = {}
+    category_counts = {}
+    importance_distribution = {str(level): 0 for level in IMPORTANCE_LEVELS}
+    sentiment_importance_matrix = {}
+    for name, value in totals.items():
+        if value <= 0:
+            continue # Every item with this value was deleted or re-analyzed
+        if name.startswith(SENTIMENT_IMPORTANCE_PREFIX):
+            sentiment, _, level = name[len(SENTIMENT_IMPORTANCE_PREFIX):].rpartition('#')
+            row = sentiment_importance_matrix.setdefault(sentiment, {str(n): 0 for n in IMPORTANCE_LEVELS})
+            row[level] = value
+        elif name.startswith(SENTIMENT_PREFIX):
+            sentiment_counts[name[len(SENTIMENT_PREFIX):]] = value
+        elif name.startswith(CATEGORY_PREFIX):
+            category_counts[name[len(CATEGORY_PREFIX):]] = value
+        elif name.startswith(IMPORTANCE_PREFIX):
+            importance_distribution[name[len(IMPORTANCE_PREFIX):]] = value
+    return {
+        'total_comments': max(0, totals.get(TOTAL_ATTRIBUTE, 0)),
+        'total_processable_comments': max(0, totals.get(PROCESSABLE_ATTRIBUTE, 0)),
+        'sentiment_counts': sentiment_counts,
+        'category_counts': category_counts,
+        'high_risk_count': max(0, totals.get(HIGH_RISK_ATTRIBUTE, 0)),
+        'importance_distribution': importance_distribution,
+        'sentiment_importance_matrix': sentiment_importance_matrix,
+    }
+
+
+class StatsCounterStore:
+    """
+    Sharded aggregate counters. Writers ADD their deltas to one randomly chosen shard item, so
+    concurrent writers rarely touch the same item; readers fetch all shard items with BatchGetItem
+    and sum them. Changing shard_count requires a rebuild (replace_totals) to keep the totals.
+    """
+
+    def __init__(self, dynamodb_client, table_name, shard_count=10):
+        # dynamodb_client must accept plain Python types (see get_dynamodb_client)
+        self.dynamodb_client = dynamodb_client
+        self.table_name = table_name
+        self.shard_count = max(1, shard_count)
+
+    def shard_key(self, shard):
+        return f"{COUNTER_KEY_PREFIX}{shard:02d}"
+
+    def add(self, deltas, batch_id):
+        """
+        Adds the non-zero deltas of one stream batch to a random shard, MAX_TERMS_PER_UPDATE terms
+        per transaction with an applied marker (apply_once). A retry of the batch (same batch_id)
+        applies only the chunks that did not succeed before. Returns the number of chunks applied.
+        """
+        terms = [(name, value) for name, value in sorted(deltas.items()) if value]
+        key = {'CounterKey': self.shard_key(random.randrange(self.shard_count))}
+        applied = 0
+        for start in range(0, len(terms), MAX_TERMS_PER_UPDATE):
+            chunk = terms[start:start + MAX_TERMS_PER_UPDATE]
+            applied += apply_once(self.dynamodb_client, self.table_name, {'CounterKey': f"{APPLIED_MARKER_PREFIX}{batch_id}#{start // MAX_TERMS_PER_UPDATE}"}, {
+                'TableName': self.table_name,
+                'Key': key,
+                'UpdateExpression': 'ADD ' + ', '.join(f'#a{i} :v{i}' for i in range(len(chunk))),
+                'ExpressionAttributeNames': {f'#a{i}': name for i, (name, _) in enumerate(chunk)},
+                'ExpressionAttributeValues': {f':v{i}': value for i, (_, value) in enumerate(chunk)},
+            })
+        return applied
+
+    def read_totals(self):
+        """Sums all shard items. Returns None if no counter item exists yet (never built)."""
+        keys = [{'CounterKey': self.shard_key(shard)} for shard in range(self.shard_count)]
+        items = []
+        for start in range(0, len(keys), DDB_BATCH_GET_MAX_KEYS):
+            request = {self.table_name: {'Keys': keys[start:start + DDB_BATCH_GET_MAX_KEYS]}}
+            while request:
+                response = self.dynamodb_client.batch_get_item(RequestItems=request)
+                items.extend(response.get('Responses', {}).get(self.table_name, []))
+                request = response.get('UnprocessedKeys') or None
+        if not items:
+            return None
+        totals = Counter()
+        for item in items:
+            for name, value in item.items():
+                if name not in ('CounterKey', 'RebuiltAt'):
+                    totals[name] += int(value)
+        return totals
+
+    def replace_totals(self, totals):
+        """
+        Rebuild: stores the totals in shard 0 and empties the other shards. Deltas ADDed by a
+        concurrent writer between the rebuild's scan and this call are lost, so run it while no
+        uploads are being processed.
+        """
+        item = {name: value for name, value in totals.items() if value}
+        item['CounterKey'] = self.shard_key(0)
+        item['RebuiltAt'] = datetime.datetime.utcnow().isoformat()
+        self.dynamodb_client.put_item(TableName=self.table_name, Item=item)
+        for shard in range(1, self.shard_count):
+            self.dynamodb_client.delete_item(TableName=self.table_name, Key={'CounterKey': self.shard_key(shard)})
@@ -0,0 +1,177 @@
+import datetime
+from collections import Counter, defaultdict
+from stats_counters import (TOTAL_ATTRIBUTE, PROCESSABLE_ATTRIBUTE, HIGH_RISK_ATTRIBUTE, SENTIMENT_PREFIX, CATEGORY_PREFIX,
+                            MAX_TERMS_PER_UPDATE, APPLIED_MARKER_PREFIX, item_contributions, deserialize_image, apply_once)
+
+# --- Constants ---
+# Rollup items live in their own table: partition key 'Granularity' ('hour' or 'day'), sort key
+# 'Bucket' (the bucket's start in UTC, e.g. '2025-04-01T09' or '2025-04-01', so buckets sort by
+# time as strings). Every attribute except the keys and 'RebuiltAt' is a count, updated with ADD.
+# The applied markers of the stream consumer (see stats_counters.apply_once) are items with the
+# Granularity 'APPLIED#', which no query of a granularity reads.
+GRANULARITY_ATTRIBUTE = 'Granularity'
+BUCKET_ATTRIBUTE = 'Bucket'
+# granularity -> strftime format of its bucket, and the bucket length
+GRANULARITIES = {
+    'hour': ('%Y-%m-%dT%H', datetime.timedelta(hours=1)),
+    'day': ('%Y-%m-%d', datetime.timedelta(days=1)),
+}
+# The counters a bucket keeps: same names as the aggregate counters, without the importance ones
+ROLLUP_PREFIXES = (SENTIMENT_PREFIX, CATEGORY_PREFIX)
+ROLLUP_TOTALS = (TOTAL_ATTRIBUTE, PROCESSABLE_ATTRIBUTE, HIGH_RISK_ATTRIBUTE)
+
+
+def parse_bucket_time(timestamp):
+    """ProcessingTimestamp (naive UTC isoformat) -> datetime, or None if it is missing or malformed."""
+    if not timestamp:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(str(timestamp))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def bucket_key(moment, granularity):
+    """Bucket (sort key value) of a naive UTC datetime."""
+    return moment.strftime(GRANULARITIES[granularity][0])
+
+
+def bucket_range(start, end, granularity):
+    """Every bucket from the one holding start to the one holding end (naive UTC datetimes), oldest first."""
+    step = GRANULARITIES[granularity][1]
+    moment = datetime.datetime.strptime(bucket_key(start, granularity), GRANULARITIES[granularity][0])
+    buckets = []
+    while moment <= end:
+        buckets.append(bucket_key(moment, granularity))
+        moment += step
+    return buckets
+
+
+def rollup_contributions(mapped_item):
+    """
+    (hour bucket, day bucket, counter deltas) of one item from map_comment_item(), or None if it has
+    no ProcessingTimestamp. The deltas follow item_contributions(): skipped rows only count towards the total.
+    """
+    moment = parse_bucket_time(mapped_item.get('ProcessingTimestamp'))
+    if moment is None:
+        return None
+    contributions = Counter({name: value for name, value in item_contributions(mapped_item).items()
+                             if name in ROLLUP_TOTALS or name.startswith(ROLLUP_PREFIXES)})
+    return bucket_key(moment, 'hour'), bucket_key(moment, 'day'), contributions
+
+
+def add_item_rollups(deltas, mapped_item, sign=1):
+    """Adds (sign=1) or subtracts (sign=-1) one item's contributions to {(granularity, bucket): Counter}."""
+    contributions = rollup_contributions(mapped_item)
+    if contributions is None:
+        return
+    hour, day, counts = contributions
+    for key in (('hour', hour), ('day', day)):
+        for name, value in counts.items():
+            deltas[key][name] += sign * value
+
+
+def stream_record_rollup_deltas(record, map_item, deltas):
+    """
+    Adds the rollup deltas of one DynamoDB Streams record to deltas: the new image's contributions
+    minus the old image's. Re-processing a file moves its items from their old buckets to the new ones.
+    """
+    images = record.get('dynamodb', {})
+    new_item = deserialize_image(images.get('NewImage'))
+    old_item = deserialize_image(images.get('OldImage'))
+    if new_item is not None:
+        add_item_rollups(deltas, map_item(new_item), 1)
+    if old_item is not None:
+        add_item_rollups(deltas, map_item(old_item), -1)
+    return deltas
+
+
+def new_rollup_deltas():
+    return defaultdict(Counter)
+
+
+def to_trend_bucket(item):
+    """Rollup item -> one bucket of the /trends response."""
+    bucket = {
+        'bucket': item[BUCKET_ATTRIBUTE],
+        'total_comments': max(0, int(item.get(TOTAL_ATTRIBUTE, 0))),
+        'total_processable_comments': max(0, int(item.get(PROCESSABLE_ATTRIBUTE, 0))),
+        'high_risk_count': max(0, int(item.get(HIGH_RISK_ATTRIBUTE, 0))),
+        'sentiment_counts': {},
+        'category_counts': {},
+    }
+    for name, value in item.items():
+        if name.startswith(SENTIMENT_PREFIX) and int(value) > 0:
+            bucket['sentiment_counts'][name[len(SENTIMENT_PREFIX):]] = int(value)
+        elif name.startswith(CATEGORY_PREFIX) and int(value) > 0:
+            bucket['category_counts'][name[len(CATEGORY_PREFIX):]] = int(value)
+    return bucket
+
+
+class TrendRollupStore:
+    """
+    Hourly and daily rollup items. A stream batch adds its deltas with one transaction per touched
+    bucket (items of one upload fall into a few buckets); readers Query one granularity's bucket range.
+    """
+
+    def __init__(self, dynamodb_client, table_name):
+        # dynamodb_client must accept plain Python types (see get_dynamodb_client)
+        self.dynamodb_client = dynamodb_client
+        self.table_name = table_name
+
+    def add(self, deltas, batch_id):
+        """
+        Adds {(granularity, bucket): Counter} of one stream batch to the buckets, each chunk in a
+        transaction with an applied marker, so a retry of the batch (same batch_id) adds only what
+        did not succeed before. Returns the number of chunks applied.
+        """
+        applied = 0
+        for (granularity, bucket), counts in sorted(deltas.items()):
+            terms = [(name, value) for name, value in sorted(counts.items()) if value]
+            for start in range(0, len(terms), MAX_TERMS_PER_UPDATE):
+                chunk = terms[start:start + MAX_TERMS_PER_UPDATE]
+                marker_key = {GRANULARITY_ATTRIBUTE: APPLIED_MARKER_PREFIX, BUCKET_ATTRIBUTE: f"{batch_id}#{granularity}#{bucket}#{start // MAX_TERMS_PER_UPDATE}"}
+                applied += apply_once(self.dynamodb_client, self.table_name, marker_key, {
+                    'TableName': self.table_name,
+                    'Key': {GRANULARITY_ATTRIBUTE: granularity, BUCKET_ATTRIBUTE: bucket},
+                    'UpdateExpression': 'ADD ' + ', '.join(f'#a{i} :v{i}' for i in range(len(chunk))),
+                    'ExpressionAttributeNames': {f'#a{i}': name for i, (name, _) in enumerate(chunk)},
+                    'ExpressionAttributeValues': {f':v{i}': value for i, (_, value) in enumerate(chunk)},
+                })
+        return applied
+
+    def query(self, granularity, first_bucket, last_bucket):
+        """Rollup items of one granularity from first_bucket to last_bucket (inclusive), oldest first."""
+        query_args = {
+            'TableName': self.table_name,
+            'KeyConditionExpression': '#g = :g AND #b BETWEEN :first AND :last',
+            'ExpressionAttributeNames': {'#g': GRANULARITY_ATTRIBUTE, '#b': BUCKET_ATTRIBUTE},
+            'ExpressionAttributeValues': {':g': granularity, ':first': first_bucket, ':last': last_bucket},
+        }
+        response = self.dynamodb_client.query(**query_args)
+        items = response.get('Items', [])
+        while 'LastEvaluatedKey' in response:
+            response = self.dynamodb_client.query(ExclusiveStartKey=response['LastEvaluatedKey'], **query_args)
+            items.extend(response.get('Items', []))
+        return items
+
+    def replace_all(self, deltas):
+        """
+        Rebuild: writes the recomputed buckets and deletes every other bucket. As with the counters'
+        rebuild, deltas added by a concurrent stream batch are lost, so run it while no uploads are processed.
+        """
+        rebuilt_at = datetime.datetime.utcnow().isoformat()
+        for (granularity, bucket), counts in deltas.items():
+            item = {name: value for name, value in counts.items() if value}
+            item.update({GRANULARITY_ATTRIBUTE: granularity, BUCKET_ATTRIBUTE: bucket, 'RebuiltAt': rebuilt_at})
+            self.dynamodb_client.put_item(TableName=self.table_name, Item=item)
+        deleted = 0
+        for granularity in GRANULARITIES:
+            for item in self.query(granularity, '0', '9'):
+                if (granularity, item[BUCKET_ATTRIBUTE]) not in deltas:
+                    self.dynamodb_client.delete_item(TableName=self.table_name, Key={GRANULARITY_ATTRIBUTE: granularity, BUCKET_ATTRIBUTE: item[BUCKET_ATTRIBUTE]})
+                    deleted += 1
+        return deleted
@@ -0,0 +1,136 @@
+import json
+import logging
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+# --- Helper Function to Normalize a Comment Before Hashing ---
+def normalize_comment(comment):
+    """
+    Normalizes a comment so trivial variations of the same text share one cache entry:
+    NFKC (full-width/half-width forms), collapsed whitespace, and case folding.
+    """
+    normalized = unicodedata.normalize('NFKC', comment)
+    return ' '.join(normalized.split()).casefold()
+
+
+def build_cache_key(comment, model_id, prompt_version):
+    """Content-addressed key: SHA-256 of the normalized comment, model ID and prompt version."""
+    key_source = '\x1f'.join([model_id, prompt_version, normalize_comment(comment)])
+    return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Two-tier cache of successful analysis results (the parsed sentiment/category/importance/isHighRisk dict).
+
+    Tier 1 is an in-memory LRU that lives as long as the warm Lambda container.
+    Tier 2 is an optional DynamoDB table (partition key 'CacheKey', TTL attribute 'ExpiresAt')
+    shared by every upload and container. Failed analyses are never cached.
+    Thread-safe: get() and put() are called from the Bedrock worker pool.
+    """
+
+    def __init__(self, model_id, prompt_version, max_entries=10000, dynamodb_client=None, table_name=None, ttl_seconds=30 * 24 * 3600):
+        self.model_id = model_id
+        self.prompt_version = prompt_version
+        self.max_entries = max_entries
+        # dynamodb_client must accept plain Python types (e.g. dynamodb_resource.meta.client)
+        self.dynamodb_client = dynamodb_client
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+
+        self._entries = OrderedDict() # cache_key -> analysis dict, least recently used first
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Zeroes the hit/miss counters (call at the start of each invocation)."""
+        with self._lock:
+            self.memory_hits = 0
+            self.persistent_hits = 0
+            self.misses = 0
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'memory_hits': self.memory_hits,
+                'persistent_hits': self.persistent_hits,
+                'misses': self.misses,
+            }
+
+    def get(self, comment):
+        """Returns a copy of the cached analysis for the comment, or None on a miss."""
+        cache_key = build_cache_key(comment, self.model_id, self.prompt_version)
+
+        with self._lock:
+            analysis = self._entries.get(cache_key)
+            if analysis is not None:
+                self._entries.move_to_end(cache_key)
+                self.memory_hits += 1
+                return dict(analysis)
+
+        analysis = self._get_persistent(cache_key)
+        with self._lock:
+            if analysis is not None:
+                self.persistent_hits += 1
+                self._remember(cache_key, analysis)
+                return dict(analysis)
+            self.misses += 1
+        return None
+
+    def put(self, comment, analysis):
+        """Stores a successful analysis in both tiers."""
+        cache_key = build_cache_key(comment, self.model_id, self.prompt_version)
+        with self._lock:
+            self._remember(cache_key, dict(analysis))
+        self._put_persistent(cache_key, analysis)
+
+    def _remember(self, cache_key, analysis):
+        # Caller holds the lock
+        self._entries[cache_key] = analysis
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_persistent(self, cache_key):
+        if not self.table_name:
+            return None
+        try:
+            response = self.dynamodb_client.get_item(TableName=self.table_name, Key={'CacheKey': cache_key})
+        except Exception as e:
+            # The cache is an optimization: on any error, fall back to calling Bedrock
+            logger.warning("Analysis cache lookup failed for key %s...: %s", cache_key[:12], e)
+            return None
+        item = response.get('Item')
+        if not item:
+            return None
+        # DynamoDB TTL deletes expired items lazily, so check the expiry ourselves too
+        if int(item.get('ExpiresAt', 0)) < time.time():
+            return None
+        try:
+            return json.loads(item['Analysis'])
+        except (KeyError, ValueError, TypeError):
+            return None
+
+    def _put_persistent(self, cache_key, analysis):
+        if not self.table_name:
+            return
+        try:
+            self.dynamodb_client.put_item(
+                TableName=self.table_name,
+                Item={
+                    'CacheKey': cache_key,
+                    # Stored as a JSON string so the model's exact value types come back unchanged
+                    'Analysis': json.dumps(analysis, ensure_ascii=False),
+                    'ModelId': self.model_id,
+                    'PromptVersion': self.prompt_version,
+                    'ExpiresAt': int(time.time()) + self.ttl_seconds,
+                }
+            )
+        except Exception as e:
+            logger.warning("Could not store analysis cache entry %s...: %s", cache_key[:12], e)
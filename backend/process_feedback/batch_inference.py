@@ -0,0 +1,277 @@
+import os
+import json
+import uuid
+import hashlib
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# Terminal states of a model invocation job (EventBridge "Batch Inference Job State Change")
+BATCH_JOB_SUCCEEDED_STATUSES = ('Completed', 'PartiallyCompleted')
+BATCH_JOB_FAILED_STATUSES = ('Failed', 'Stopped', 'Expired')
+# Job metadata written next to the input, read back by the completion handler
+BATCH_JOB_MANIFEST_NAME = 'job.json'
+# Rows whose comment repeats an earlier record's text, next to the manifest (not under input/)
+BATCH_JOB_DUPLICATES_NAME = 'duplicates.jsonl'
+# recordId is the CSV row index, zero-padded so record IDs sort like the rows
+RECORD_ID_DIGITS = 11
+# Bedrock rejects jobs with fewer records than this
+BEDROCK_MIN_RECORDS_PER_JOB = 100
+
+
+def parse_s3_uri(s3_uri):
+    """'s3://bucket/some/prefix' -> ('bucket', 'some/prefix') (prefix without a trailing slash)."""
+    if not s3_uri.startswith('s3://'):
+        raise ValueError(f"Not an S3 URI: {s3_uri}")
+    bucket, _, prefix = s3_uri[len('s3://'):].partition('/')
+    return bucket, prefix.strip('/')
+
+
+def build_batch_job_name(object_identity):
+    """Deterministic job name per object version, so a duplicate S3 event finds the existing job."""
+    return 'feedback-' + hashlib.sha256(object_identity.encode('utf-8')).hexdigest()[:40]
+
+
+def record_id_for_row(original_row_index):
+    return str(original_row_index).zfill(RECORD_ID_DIGITS)
+
+
+def row_for_record_id(record_id):
+    return int(record_id)
+
+
+def build_batch_results_identity(object_identity):
+    """Identity of the job-results pass over an object version (used for its own checkpoint)."""
+    return f"{object_identity}#batch-results"
+
+
+def iter_jsonl_lines(s3_client, bucket, key, chunk_size=64 * 1024):
+    """Yields the non-empty lines of a JSONL object as decoded strings, one chunk in memory at a time."""
+    for line, _ in iter_jsonl_lines_from(s3_client, bucket, key, chunk_size=chunk_size):
+        yield line
+
+
+def iter_jsonl_lines_from(s3_client, bucket, key, start_offset=0, chunk_size=64 * 1024):
+    """
+    Yields (line, next_offset) for the non-empty lines of a JSONL object, starting at byte
+    start_offset (a ranged GET). next_offset is the offset just past the line: a resumed read
+    that starts there continues with the following line.
+    """
+    get_object_args = {'Bucket': bucket, 'Key': key}
+    if start_offset > 0:
+        get_object_args['Range'] = f'bytes={start_offset}-'
+    try:
+        body = s3_client.get_object(**get_object_args)['Body']
+    except ClientError as e:
+        if start_offset > 0 and e.response.get('Error', {}).get('Code') == 'InvalidRange':
+            return # The offset is already at the end of the object
+        raise
+    offset = start_offset
+    pending = b''
+    for chunk in body.iter_chunks(chunk_size=chunk_size):
+        pending += chunk
+        lines = pending.split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            offset += len(line) + 1
+            if line.strip():
+                yield line.decode('utf-8'), offset
+    if pending.strip():
+        yield pending.decode('utf-8'), offset + len(pending)
+
+
+def list_object_keys(s3_client, bucket, prefix):
+    keys = []
+    list_args = {'Bucket': bucket, 'Prefix': prefix}
+    while True:
+        response = s3_client.list_objects_v2(**list_args)
+        keys.extend(entry['Key'] for entry in response.get('Contents', []))
+        if not response.get('IsTruncated'):
+            return keys
+        list_args['ContinuationToken'] = response['NextContinuationToken']
+
+
+class BatchInputWriter:
+    """
+    Writes batch inference records ({"recordId", "modelInput"}) as JSONL part files under an
+    S3 prefix, at most max_records_per_file per file. Each part is spooled to a local temp
+    file and uploaded when full (upload_file switches to multipart for large parts), so
+    memory does not grow with the file.
+    """
+
+    def __init__(self, s3_client, bucket, prefix, max_records_per_file=50000):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.max_records_per_file = max_records_per_file
+        self.record_count = 0
+        self.uploaded_keys = []
+        self._part = None # Open temp file of the current part
+        self._part_records = 0
+
+    def add(self, record_id, model_input):
+        if self._part is None:
+            self._part = tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.jsonl', delete=False)
+            self._part_records = 0
+        self._part.write(json.dumps({'recordId': record_id, 'modelInput': model_input}, ensure_ascii=False) + '\n')
+        self._part_records += 1
+        self.record_count += 1
+        if self._part_records >= self.max_records_per_file:
+            self._upload_part()
+
+    def close(self):
+        """Uploads the last part. Returns the keys of all uploaded parts."""
+        if self._part is not None:
+            self._upload_part()
+        return self.uploaded_keys
+
+    def discard(self):
+        """Drops the part not uploaded yet (parts already uploaded stay)."""
+        if self._part is not None:
+            self._part.close()
+            os.remove(self._part.name)
+            self._part = None
+
+    def _upload_part(self):
+        self._part.close()
+        key = f"{self.prefix}/part-{len(self.uploaded_keys):05d}.jsonl"
+        try:
+            self.s3_client.upload_file(self._part.name, self.bucket, key)
+        finally:
+            os.remove(self._part.name)
+            self._part = None
+        self.uploaded_keys.append(key)
+        logger.info("Uploaded batch input part s3://%s/%s (%s records).", self.bucket, key, self._part_records)
+
+
+class DuplicateRowWriter:
+    """
+    Spools the rows whose comment is already in the batch input (same analysis cache key) as
+    JSONL lines {"recordId": <record of the first occurrence>, "row": <CSV row index>, "comment": ...}.
+    The job analyzes each distinct text once; the completion handler stores the result for
+    every row listed here too. The spool is a local temp file, uploaded by close().
+    """
+
+    def __init__(self, s3_client, bucket, key):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.row_count = 0
+        self._spool = None
+
+    def add(self, record_id, original_row_index, comment):
+        if self._spool is None:
+            self._spool = tempfile.NamedTemporaryFile('w+', encoding='utf-8', suffix='.jsonl', delete=False)
+        self._spool.write(json.dumps({'recordId': record_id, 'row': original_row_index, 'comment': comment}, ensure_ascii=False) + '\n')
+        self.row_count += 1
+
+    def __iter__(self):
+        """Yields (record_id, original_row_index, comment) from the local spool."""
+        if self._spool is None:
+            return
+        self._spool.flush()
+        with open(self._spool.name, encoding='utf-8') as spool:
+            for line in spool:
+                entry = json.loads(line)
+                yield entry['recordId'], entry['row'], entry['comment']
+
+    def close(self):
+        """Uploads the spool. Returns its key, or None if no row was added."""
+        if self._spool is None:
+            return None
+        self._spool.close()
+        try:
+            self.s3_client.upload_file(self._spool.name, self.bucket, self.key)
+        finally:
+            os.remove(self._spool.name)
+            self._spool = None
+        logger.info("Uploaded %s duplicate rows to s3://%s/%s.", self.row_count, self.bucket, self.key)
+        return self.key
+
+    def discard(self):
+        if self._spool is not None:
+            self._spool.close()
+            os.remove(self._spool.name)
+            self._spool = None
+
+
+def load_duplicate_rows(s3_client, bucket, key):
+    """recordId -> [(CSV row index, comment), ...] from a file written by DuplicateRowWriter ({} without a key)."""
+    duplicate_rows = {}
+    if key:
+        for line in iter_jsonl_lines(s3_client, bucket, key):
+            entry = json.loads(line)
+            duplicate_rows.setdefault(entry['recordId'], []).append((entry['row'], entry['comment']))
+    return duplicate_rows
+
+
+# --- Job Clients ---
+class BedrockBatchJobClient:
+    """Submits model invocation jobs to Bedrock. The job reports completion through EventBridge."""
+
+    completes_synchronously = False
+    min_records = BEDROCK_MIN_RECORDS_PER_JOB
+
+    def __init__(self, bedrock_client, role_arn):
+        self.bedrock_client = bedrock_client
+        self.role_arn = role_arn
+
+    def submit(self, job_name, model_id, input_uri, output_uri):
+        """Returns the job ARN."""
+        response = self.bedrock_client.create_model_invocation_job(
+            jobName=job_name,
+            roleArn=self.role_arn,
+            modelId=model_id,
+            inputDataConfig={'s3InputDataConfig': {'s3Uri': input_uri, 's3InputFormat': 'JSONL'}},
+            outputDataConfig={'s3OutputDataConfig': {'s3Uri': output_uri}}
+        )
+        return response['jobArn']
+
+
+class LocalBatchJobClient:
+    """
+    Offline stand-in for a model invocation job: runs every input record through
+    bedrock_runtime_client.invoke_model (e.g. a fake model) and writes the output JSONL the way
+    Bedrock does (<output prefix>/<job id>/<input file>.out), before submit() returns.
+    """
+
+    completes_synchronously = True
+    min_records = 1
+
+    def __init__(self, s3_client, bedrock_runtime_client, max_workers=8):
+        self.s3_client = s3_client
+        self.bedrock_runtime_client = bedrock_runtime_client
+        self.max_workers = max_workers
+
+    def _run_record(self, line, model_id):
+        record = json.loads(line)
+        output = {'recordId': record['recordId'], 'modelInput': record['modelInput']}
+        try:
+            response = self.bedrock_runtime_client.invoke_model(
+                body=json.dumps(record['modelInput']).encode('utf-8'),
+                modelId=model_id,
+                contentType='application/json',
+                accept='application/json'
+            )
+            output['modelOutput'] = json.loads(response['body'].read().decode('utf-8'))
+        except Exception as e:
+            output['error'] = {'errorCode': 500, 'errorMessage': str(e)}
+        return json.dumps(output, ensure_ascii=False)
+
+    def submit(self, job_name, model_id, input_uri, output_uri):
+        job_id = uuid.uuid4().hex[:12]
+        input_bucket, input_prefix = parse_s3_uri(input_uri)
+        output_bucket, output_prefix = parse_s3_uri(output_uri)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for key in list_object_keys(self.s3_client, input_bucket, input_prefix + '/'):
+                if not key.endswith('.jsonl'):
+                    continue
+                output_lines = executor.map(lambda line: self._run_record(line, model_id), iter_jsonl_lines(self.s3_client, input_bucket, key))
+                output_key = f"{output_prefix}/{job_id}/{key.rsplit('/', 1)[-1]}.out"
+                self.s3_client.put_object(Bucket=output_bucket, Key=output_key, Body=('\n'.join(output_lines) + '\n').encode('utf-8'))
+        return f"arn:aws:bedrock:local:000000000000:model-invocation-job/{job_id}"
@@ -0,0 +1,122 @@
+import time
+import uuid
+import hashlib
+
+from botocore.exceptions import ClientError
+
+# --- Constants ---
+CHECKPOINT_STATUS_IN_PROGRESS = 'IN_PROGRESS'
+CHECKPOINT_STATUS_COMPLETE = 'COMPLETE'
+# Namespace for deterministic CommentIDs (uuid5 of the object identity plus the row index)
+COMMENT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'commentanalysis/process_feedback')
+
+
+def build_object_identity(bucket_name, object_key, object_version):
+    """Stable identity of one uploaded object version ('s3://bucket/key?version=...')."""
+    return f"s3://{bucket_name}/{object_key}?version={object_version}"
+
+
+def build_upload_id(object_identity):
+    """
+    Short ID of one uploaded object version, stored on its items as UploadId. Re-uploading a file
+    under the same key is a new version, so the two uploads can be told apart.
+    """
+    return hashlib.sha256(object_identity.encode('utf-8')).hexdigest()[:16]
+
+
+def build_comment_id(object_identity, original_row_index):
+    """
+    Deterministic CommentID for one CSV row. Reprocessing the same row of the same object
+    version (S3 retry, resumed invocation) overwrites the same item instead of adding a duplicate.
+    """
+    return str(uuid.uuid5(COMMENT_ID_NAMESPACE, f"{object_identity}#row={original_row_index}"))
+
+
+class CheckpointStore:
+    """
+    Progress records for large uploads, one item per object version in a DynamoDB table
+    (partition key 'CheckpointId').
+
+    The record holds the next row to process (row index and byte offset into the object),
+    the CSV header, cumulative counters, and a lease so only one invocation works on an
+    object at a time. Every row before NextRowIndex is committed to the results table.
+    A pass that reads several objects (the output files of a batch inference job) also records
+    SourceKey, the object the offsets refer to.
+    """
+
+    def __init__(self, dynamodb_client, table_name):
+        # dynamodb_client must accept plain Python types (e.g. dynamodb_resource.meta.client)
+        self.dynamodb_client = dynamodb_client
+        self.table_name = table_name
+
+    @staticmethod
+    def checkpoint_id(object_identity):
+        return hashlib.sha256(object_identity.encode('utf-8')).hexdigest()
+
+    def load(self, object_identity):
+        """Returns the checkpoint item for the object, or None if it was never started."""
+        response = self.dynamodb_client.get_item(
+            TableName=self.table_name,
+            Key={'CheckpointId': self.checkpoint_id(object_identity)},
+            ConsistentRead=True
+        )
+        return response.get('Item')
+
+    def acquire_lease(self, object_identity, owner, lease_seconds):
+        """
+        Takes the processing lease for the object. Returns False if another invocation holds
+        an unexpired lease or the object is already complete (a duplicate S3 delivery).
+        """
+        now = int(time.time())
+        try:
+            self.dynamodb_client.update_item(
+                TableName=self.table_name,
+                Key={'CheckpointId': self.checkpoint_id(object_identity)},
+                UpdateExpression='SET ObjectIdentity = :identity, LeaseOwner = :owner, LeaseExpiresAt = :expires, UpdatedAt = :now',
+                ConditionExpression=(
+                    '(attribute_not_exists(CheckpointId) OR LeaseExpiresAt < :now OR LeaseOwner = :owner) '
+                    'AND (attribute_not_exists(CheckpointStatus) OR CheckpointStatus <> :complete)'
+                ),
+                ExpressionAttributeValues={
+                    ':identity': object_identity,
+                    ':owner': owner,
+                    ':expires': now + int(lease_seconds),
+                    ':now': now,
+                    ':complete': CHECKPOINT_STATUS_COMPLETE,
+                }
+            )
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def save(self, object_identity, owner, next_row_index, next_byte_offset, fieldnames, totals, status=CHECKPOINT_STATUS_IN_PROGRESS, release_lease=False, source_key=None):
+        """
+        Records progress. Only the current lease owner may write. With release_lease=True the
+        lease expires immediately so the continuation invocation can take it over.
+        """
+        now = int(time.time())
+        values = {
+            ':next_row': next_row_index,
+            ':next_offset': next_byte_offset,
+            ':fieldnames': fieldnames,
+            ':totals': totals,
+            ':status': status,
+            ':now': now,
+            ':owner': owner,
+        }
+        update_expression = 'SET NextRowIndex = :next_row, NextByteOffset = :next_offset, Fieldnames = :fieldnames, Totals = :totals, CheckpointStatus = :status, UpdatedAt = :now'
+        if source_key is not None:
+            update_expression += ', SourceKey = :source_key'
+            values[':source_key'] = source_key
+        if release_lease:
+            update_expression += ', LeaseExpiresAt = :released'
+            values[':released'] = 0
+        self.dynamodb_client.update_item(
+            TableName=self.table_name,
+            Key={'CheckpointId': self.checkpoint_id(object_identity)},
+            UpdateExpression=update_expression,
+            ConditionExpression='LeaseOwner = :owner',
+            ExpressionAttributeValues=values
+        )
@@ -0,0 +1,163 @@
+import logging
+import time
+import random
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# BatchWriteItem accepts at most 25 put/delete requests per call
+DDB_BATCH_WRITE_MAX_ITEMS = 25
+
+
+class BatchItemWriter:
+    """
+    Buffers DynamoDB items and writes them with BatchWriteItem in groups of 25.
+
+    Each item is added with a tag (process_feedback uses "did the LLM analysis succeed")
+    so the caller can tell, after the final flush, how many items of each kind were
+    actually stored. UnprocessedItems are retried with exponential backoff and jitter;
+    items that still cannot be written are counted in failed_count.
+    Every write request is timed as the 'dynamodb_write' stage when a stage_timer is given.
+    on_write, if given, is called after every group of which at least one item was stored.
+    Not thread-safe: use it from one thread at a time (see BatchItemWriterPool for parallel writers).
+    """
+
+    def __init__(self, dynamodb_client, table_name, max_attempts=6, base_backoff_seconds=0.05, max_backoff_seconds=2.0, stage_timer=None, on_write=None):
+        # dynamodb_client must accept plain Python types (e.g. dynamodb_resource.meta.client)
+        self.dynamodb_client = dynamodb_client
+        self.table_name = table_name
+        self.max_attempts = max_attempts
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.stage_timer = stage_timer
+        self.on_write = on_write
+
+        self.pending = [] # List of (item, tag) waiting for the next flush
+        self.round_trips = 0 # Number of DynamoDB write requests sent (including retries)
+        self.written_by_tag = Counter() # Successfully written item counts, keyed by tag
+        self.failed_count = 0 # Items that could not be written after all retries
+
+    def add(self, item, tag=None):
+        """Queues one item, flushing a full 25-item group as soon as it is available."""
+        self.pending.append((item, tag))
+        if len(self.pending) >= DDB_BATCH_WRITE_MAX_ITEMS:
+            self._write(self.pending[:DDB_BATCH_WRITE_MAX_ITEMS])
+            self.pending = self.pending[DDB_BATCH_WRITE_MAX_ITEMS:]
+
+    def flush(self):
+        """Writes everything still buffered. Call once after the last add()."""
+        while self.pending:
+            self._write(self.pending[:DDB_BATCH_WRITE_MAX_ITEMS])
+            self.pending = self.pending[DDB_BATCH_WRITE_MAX_ITEMS:]
+
+    def _write(self, group):
+        written_before = sum(self.written_by_tag.values())
+        self._write_group(group)
+        if self.on_write is not None and sum(self.written_by_tag.values()) > written_before:
+            self.on_write()
+
+    def _record_write_time(self, write_start):
+        if self.stage_timer is not None:
+            self.stage_timer.record('dynamodb_write', time.perf_counter() - write_start)
+
+    def _sleep_before_retry(self, attempt):
+        # Full jitter: sleep a random time up to the exponential backoff ceiling
+        backoff = min(self.max_backoff_seconds, self.base_backoff_seconds * (2 ** attempt))
+        time.sleep(random.uniform(0, backoff))
+
+    def _write_group(self, group):
+        """Writes up to 25 (item, tag) pairs, retrying UnprocessedItems with backoff."""
+        # Map each item's CommentID back to its tag so retried items keep their tag
+        tags_by_id = {item['CommentID']: tag for item, tag in group}
+        requests = [{'PutRequest': {'Item': item}} for item, _ in group]
+
+        for attempt in range(self.max_attempts):
+            if attempt > 0:
+                self._sleep_before_retry(attempt)
+            try:
+                self.round_trips += 1
+                write_start = time.perf_counter()
+                try:
+                    response = self.dynamodb_client.batch_write_item(RequestItems={self.table_name: requests})
+                finally:
+                    self._record_write_time(write_start)
+            except Exception as e:
+                logger.warning("Error in BatchWriteItem for %s items (attempt %s/%s): %s", len(requests), attempt + 1, self.max_attempts, e)
+                continue
+
+            unprocessed = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            unprocessed_ids = {request['PutRequest']['Item']['CommentID'] for request in unprocessed}
+            for request in requests:
+                comment_id = request['PutRequest']['Item']['CommentID']
+                if comment_id not in unprocessed_ids:
+                    self.written_by_tag[tags_by_id[comment_id]] += 1
+
+            if not unprocessed:
+                return
+            logger.info("BatchWriteItem left %s unprocessed items (attempt %s/%s). Retrying with backoff...", len(unprocessed), attempt + 1, self.max_attempts)
+            requests = unprocessed
+
+        # Still not written after all attempts. If the whole request kept raising (e.g. one
+        # invalid item), fall back to single puts so one bad item does not fail its neighbours.
+        if len(requests) > 1 and len(requests) == len(group):
+            logger.warning("Falling back to individual writes for %s items.", len(requests))
+            for request in requests:
+                item = request['PutRequest']['Item']
+                try:
+                    self.round_trips += 1
+                    write_start = time.perf_counter()
+                    try:
+                        self.dynamodb_client.put_item(TableName=self.table_name, Item=item)
+                    finally:
+                        self._record_write_time(write_start)
+                    self.written_by_tag[tags_by_id[item['CommentID']]] += 1
+                except Exception as e:
+                    logger.error("Error writing item %s to DynamoDB: %s", item['CommentID'], e)
+                    self.failed_count += 1
+            return
+
+        logger.error("Giving up on %s items after %s BatchWriteItem attempts.", len(requests), self.max_attempts)
+        self.failed_count += len(requests)
+
+
+class BatchItemWriterPool:
+    """
+    One BatchItemWriter per thread, for several persist workers writing in parallel.
+    writer_factory() creates the writer of a thread on its first add(). The counters are summed
+    over all writers, so once the workers are idle the pool reads like a single BatchItemWriter.
+    """
+
+    def __init__(self, writer_factory):
+        self.writer_factory = writer_factory
+        self.writers = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def add(self, item, tag=None):
+        writer = getattr(self._local, 'writer', None)
+        if writer is None:
+            writer = self._local.writer = self.writer_factory()
+            with self._lock:
+                self.writers.append(writer)
+        writer.add(item, tag)
+
+    def flush(self):
+        """Writes what every writer still buffers. Only call while no thread is adding items."""
+        with self._lock:
+            writers = list(self.writers)
+        for writer in writers:
+            writer.flush()
+
+    @property
+    def round_trips(self):
+        return sum(writer.round_trips for writer in self.writers)
+
+    @property
+    def written_by_tag(self):
+        return sum((writer.written_by_tag for writer in self.writers), Counter())
+
+    @property
+    def failed_count(self):
+        return sum(writer.failed_count for writer in self.writers)
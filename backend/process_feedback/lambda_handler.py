@@ -1,29 +1,219 @@
+import time
+MODULE_IMPORT_START = time.perf_counter() # Start of the import, for the cold-start report
 import json
 import boto3
 import os
+import logging
 import csv
 import uuid
-import io
 import urllib.parse
 import datetime
 import re # Import regular expressions for robust JSON extraction
-# import time # Not used, can remove
+import hashlib
+import asyncio
+import itertools
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from dynamodb_types import register_python_types
+from ddb_batch_writer import BatchItemWriter, BatchItemWriterPool
+from analysis_cache import AnalysisCache, build_cache_key
+from throttling import AdaptiveRateController, DeadlineExceeded
+from checkpoint_store import CheckpointStore, build_object_identity, build_comment_id, build_upload_id, CHECKPOINT_STATUS_IN_PROGRESS, CHECKPOINT_STATUS_COMPLETE
+from stage_metrics import StageTimer
+from rule_classifier import RuleClassifier, load_rules
+from shard_coordinator import plan_shards, sum_shard_totals, build_shard_identity, ShardJobStore, LambdaShardDispatcher, LocalProcessPoolDispatcher
+from staged_pipeline import StagedPipeline
+from data_version import DataVersion
+from batch_inference import (BatchInputWriter, BedrockBatchJobClient, LocalBatchJobClient, parse_s3_uri, build_batch_job_name,
+                             record_id_for_row, row_for_record_id, iter_jsonl_lines_from, list_object_keys, build_batch_results_identity,
+                             DuplicateRowWriter, load_duplicate_rows,
+                             BATCH_JOB_SUCCEEDED_STATUSES, BATCH_JOB_FAILED_STATUSES, BATCH_JOB_MANIFEST_NAME, BATCH_JOB_DUPLICATES_NAME)
 
 # --- Configuration (Using Environment Variables) ---
 # Make sure these environment variables are set in your Lambda function configuration
+# Log level for this function. INFO logs a few lines per invocation; DEBUG adds several lines
+# per comment (prompt/response snippets), which gets expensive in CloudWatch at volume.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# CloudWatch namespace for the per-invocation stage metrics (Embedded Metric Format log line).
+# Set to an empty string to turn the metrics off.
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'CommentAnalysis/ProcessFeedback')
 S3_BUCKET_NAME = os.environ.get('S3_BUCKET_NAME')
 DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME')
 # Set this to 'amazon.titan-text-express-v1' or similar on-demand Titan Text model
 BEDROCK_MODEL_ID = os.environ.get('BEDROCK_MODEL_ID')
+# Maximum number of Bedrock invoke_model calls in flight at the same time.
+# Raise it until Bedrock starts throttling for the model's on-demand quota.
+BEDROCK_MAX_CONCURRENCY = max(1, int(os.environ.get('BEDROCK_MAX_CONCURRENCY', '8')))
+# Adaptive Bedrock rate control: the request rate starts at the initial value (default: the max,
+# so nothing is slowed down until Bedrock actually throttles) and adapts (AIMD) between the min and max.
+# Throttled calls are retried with jitter up to the attempt limit.
+BEDROCK_MIN_RATE_PER_SECOND = float(os.environ.get('BEDROCK_MIN_RATE_PER_SECOND', '0.2'))
+BEDROCK_MAX_RATE_PER_SECOND = float(os.environ.get('BEDROCK_MAX_RATE_PER_SECOND', '50'))
+BEDROCK_INITIAL_RATE_PER_SECOND = float(os.environ.get('BEDROCK_INITIAL_RATE_PER_SECOND', str(BEDROCK_MAX_RATE_PER_SECOND)))
+BEDROCK_MAX_RETRY_ATTEMPTS = int(os.environ.get('BEDROCK_MAX_RETRY_ATTEMPTS', '8'))
+# Time kept free at the end of the invocation for flushing DynamoDB writes (no Bedrock retries after this)
+DEADLINE_SAFETY_MARGIN_SECONDS = float(os.environ.get('DEADLINE_SAFETY_MARGIN_SECONDS', '15'))
+# Optional DynamoDB table (partition key 'CheckpointId') for resumable processing of large files.
+# When set, progress is checkpointed every CHECKPOINT_INTERVAL_ROWS rows, and when less than
+# CONTINUATION_RESERVE_SECONDS remain the function re-invokes itself to continue from the checkpoint.
+CHECKPOINT_TABLE_NAME = os.environ.get('CHECKPOINT_TABLE_NAME')
+CHECKPOINT_INTERVAL_ROWS = max(1, int(os.environ.get('CHECKPOINT_INTERVAL_ROWS', '1000')))
+CONTINUATION_RESERVE_SECONDS = float(os.environ.get('CONTINUATION_RESERVE_SECONDS', '60'))
+# Fan-out of large files across parallel workers: 'off' (default), 'lambda' (one asynchronous
+# invocation of this function per shard; needs CHECKPOINT_TABLE_NAME for the completion record)
+# or 'local' (a local process pool stands in for the Lambda workers, for offline testing).
+# Files smaller than two shards are processed inline.
+SHARD_FANOUT_MODE = os.environ.get('SHARD_FANOUT_MODE', 'off').lower()
+SHARD_TARGET_BYTES = max(1, int(os.environ.get('SHARD_TARGET_BYTES', str(16 * 1024 * 1024))))
+SHARD_MAX_COUNT = max(1, int(os.environ.get('SHARD_MAX_COUNT', '32')))
+SHARD_LOCAL_MAX_WORKERS = max(1, int(os.environ.get('SHARD_LOCAL_MAX_WORKERS', str(os.cpu_count() or 2))))
+# Number of comments packed into one Bedrock prompt. 1 (default) keeps one comment per call.
+BEDROCK_BATCH_SIZE = max(1, int(os.environ.get('BEDROCK_BATCH_SIZE', '1')))
+# Upper bound for maxTokenCount of a batched request (Titan Text Express allows up to 8192)
+BEDROCK_BATCH_MAX_TOKENS = int(os.environ.get('BEDROCK_BATCH_MAX_TOKENS', '4096'))
+# Optional DynamoDB table (partition key 'CacheKey', TTL on 'ExpiresAt') that shares analysis
+# results across uploads. If unset, only the in-memory cache of the warm container is used.
+ANALYSIS_CACHE_TABLE_NAME = os.environ.get('ANALYSIS_CACHE_TABLE_NAME')
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYSIS_CACHE_MAX_ENTRIES', '10000'))
+ANALYSIS_CACHE_TTL_DAYS = int(os.environ.get('ANALYSIS_CACHE_TTL_DAYS', '30'))
+# Rule-based pre-classifier for trivial comments ("none", "特になし", "thanks", "-"), which are
+# labeled locally instead of by Bedrock. RULE_LEXICON_PATH optionally points to a JSON lexicon
+# packaged with the function (same shape as rule_classifier.DEFAULT_RULES).
+RULE_CLASSIFIER_ENABLED = os.environ.get('RULE_CLASSIFIER_ENABLED', 'true').lower() == 'true'
+RULE_LEXICON_PATH = os.environ.get('RULE_LEXICON_PATH')
+RULE_MIN_COMMENT_LENGTH = int(os.environ.get('RULE_MIN_COMMENT_LENGTH', '2'))
+# Staged ingest pipeline (parse -> analyze -> normalize -> persist, bounded queues in between).
+# The analyze stage runs BEDROCK_MAX_CONCURRENCY workers; the persist stage runs
+# DYNAMODB_WRITE_CONCURRENCY workers, each with its own 25-item batch writer.
+# The queue sizes cap how much work waits in front of a stage that is slower than the one
+# before it (comment groups for analyze, items for normalize/persist).
+DYNAMODB_WRITE_CONCURRENCY = max(1, int(os.environ.get('DYNAMODB_WRITE_CONCURRENCY', '2')))
+PIPELINE_ANALYZE_QUEUE_SIZE = max(1, int(os.environ.get('PIPELINE_ANALYZE_QUEUE_SIZE', str(BEDROCK_MAX_CONCURRENCY * 4))))
+PIPELINE_QUEUE_SIZE = max(1, int(os.environ.get('PIPELINE_QUEUE_SIZE', '500')))
+# Bedrock batch inference for very large uploads: files with at least BATCH_INFERENCE_MIN_ROWS rows
+# (0 = off) are written as JSONL prompts under BATCH_INFERENCE_S3_URI (keep it outside the upload
+# bucket's trigger) and analyzed by a model invocation job instead of on-demand calls.
+# BATCH_INFERENCE_JOB_CLIENT is 'bedrock' (needs BATCH_INFERENCE_ROLE_ARN; the job's EventBridge
+# state-change event invokes this function again to store the results) or 'local' (runs the
+# records through bedrock_runtime_client in-process, for offline testing).
+BATCH_INFERENCE_MIN_ROWS = int(os.environ.get('BATCH_INFERENCE_MIN_ROWS', '0'))
+BATCH_INFERENCE_S3_URI = os.environ.get('BATCH_INFERENCE_S3_URI')
+BATCH_INFERENCE_ROLE_ARN = os.environ.get('BATCH_INFERENCE_ROLE_ARN')
+BATCH_INFERENCE_JOB_CLIENT = os.environ.get('BATCH_INFERENCE_JOB_CLIENT', 'bedrock').lower()
+BATCH_INFERENCE_MAX_RECORDS_PER_FILE = max(1, int(os.environ.get('BATCH_INFERENCE_MAX_RECORDS_PER_FILE', '50000')))
+# 'client' (default): a low-level DynamoDB client with the resource layer's type conversion
+# registered on it. 'resource': boto3.resource('dynamodb').meta.client, which also loads the
+# resource model at cold start. Both accept and return plain Python types.
+DYNAMODB_CLIENT_MODE = os.environ.get('DYNAMODB_CLIENT_MODE', 'client').lower()
+# Optional table (partition key CounterKey, can be the stats counter table) holding the data
+# version: bumped after items are written (at most every DATA_VERSION_MIN_INTERVAL_SECONDS during a
+# run, and once at its end) so that get_stats can serve cached responses until the data changes.
+DATA_VERSION_TABLE_NAME = os.environ.get('DATA_VERSION_TABLE_NAME')
+DATA_VERSION_MIN_INTERVAL_SECONDS = float(os.environ.get('DATA_VERSION_MIN_INTERVAL_SECONDS', '5'))
 
 # --- Constants ---
 COMMENT_COLUMN_NAME = 'Comment' # The expected name of the column with comments
-
-# --- AWS Clients (Initialized Globally for potential reuse) ---
+CSV_STREAM_CHUNK_BYTES = 64 * 1024 # Size of each read from the S3 object stream
+CSV_PARSE_CHUNK_ROWS = 100 # Rows read per hand-off from the parse thread to the event loop
+SINGLE_COMMENT_MAX_TOKENS = 500 # maxTokenCount of a single-comment request
+# Sparse index keys: set only on analyzed items that are high-risk / have Importance >= 4, so a
+# GSI keyed on them (sort key Importance) holds exactly the dashboard's two comment lists
+HIGH_RISK_INDEX_KEY = ('HighRiskIndexKey', 'HIGH_RISK')
+IMPORTANT_INDEX_KEY = ('ImportantIndexKey', 'IMPORTANT')
+TOP_IMPORTANCE_THRESHOLD = 4
+
+# --- Logging ---
+# The Lambda runtime attaches its handler to the root logger; the level applies to every module here
+logging.getLogger().setLevel(LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+# --- AWS Clients (Created on First Use, Reused by Warm Invocations) ---
 # Using configuration from the environment/Lambda execution role
-s3_client = boto3.client('s3')
-dynamodb_resource = boto3.resource('dynamodb')
-bedrock_runtime_client = boto3.client('bedrock-runtime')
+# Nothing is constructed at import: an invocation only pays for the clients its path needs
+# (a plain upload never touches the Bedrock control plane or Lambda). Use the get_*() functions;
+# the module-level names only hold the cached clients.
+# The botocore connection pool (default 10) is sized to the worker pool so that
+# concurrent invoke_model calls never wait for a free HTTP connection.
+aws_client_config = Config(max_pool_connections=max(BEDROCK_MAX_CONCURRENCY, 10))
+s3_client = None
+dynamodb_client = None # Accepts plain Python types (str, int, bool) like Table.put_item does
+lambda_client = None # Used to start the continuation invocation
+bedrock_runtime_client = None
+bedrock_client = None # Control plane: model invocation (batch inference) jobs
+client_init_seconds = 0.0 # Total time spent constructing clients in this container
+client_init_lock = threading.Lock()
+
+
+def get_cached_client(name, factory):
+    """Returns the module-level client `name`, constructing it with factory() on first use."""
+    global client_init_seconds
+    client = globals()[name]
+    if client is None:
+        # Locked so that the Bedrock worker threads of the first invocation build only one client
+        with client_init_lock:
+            client = globals()[name]
+            if client is None:
+                init_start = time.perf_counter()
+                client = globals()[name] = factory()
+                client_init_seconds += time.perf_counter() - init_start
+    return client
+
+
+def build_dynamodb_client():
+    if DYNAMODB_CLIENT_MODE == 'resource':
+        return boto3.resource('dynamodb', config=aws_client_config).meta.client
+    return register_python_types(boto3.client('dynamodb', config=aws_client_config))
+
+
+def get_s3_client():
+    return get_cached_client('s3_client', lambda: boto3.client('s3'))
+
+
+def get_dynamodb_client():
+    return get_cached_client('dynamodb_client', build_dynamodb_client)
+
+
+def get_lambda_client():
+    return get_cached_client('lambda_client', lambda: boto3.client('lambda'))
+
+
+def get_bedrock_runtime_client():
+    # botocore's own retries are turned off for Bedrock: the adaptive rate controller below retries
+    # throttled calls itself, so it sees every throttling response and can slow down.
+    return get_cached_client('bedrock_runtime_client', lambda: boto3.client('bedrock-runtime', config=aws_client_config.merge(Config(retries={'total_max_attempts': 1}))))
+
+
+def get_bedrock_client():
+    return get_cached_client('bedrock_client', lambda: boto3.client('bedrock'))
+
+
+# --- Data Version (Lets get_stats Cache Its Responses Until the Results Change) ---
+data_version = None # Created by the first invocation when DATA_VERSION_TABLE_NAME is set
+
+
+def note_results_written():
+    """on_write callback of the batch writers (called from the persist threads)."""
+    if data_version is not None:
+        data_version.note_write()
+
+
+# --- Bedrock Rate Controller (learned rate survives across warm invocations) ---
+bedrock_rate_controller = AdaptiveRateController(
+    initial_rate=BEDROCK_INITIAL_RATE_PER_SECOND,
+    min_rate=BEDROCK_MIN_RATE_PER_SECOND,
+    max_rate=BEDROCK_MAX_RATE_PER_SECOND,
+    max_concurrency=BEDROCK_MAX_CONCURRENCY,
+    max_attempts=BEDROCK_MAX_RETRY_ATTEMPTS
+)
+
+# --- Rule-Based Pre-Classifier (lexicon compiled once per container) ---
+rule_classifier = RuleClassifier(load_rules(RULE_LEXICON_PATH), min_length=RULE_MIN_COMMENT_LENGTH) if RULE_CLASSIFIER_ENABLED else None
+
+# --- Per-Stage Timers (reset per invocation) ---
+stage_timer = StageTimer()
 
 # --- Prompt Definition ---
 # Define the core instruction for the model.
@@ -49,449 +239,1739 @@ bedrock_prompt_template = f"""{instruction}
 Comment: {{comment_placeholder}}
 """
 
+# Batched variant: several comments per request, each tagged with a local ID, answered as a JSON array.
+# The fixed instruction tokens and request overhead are paid once per batch instead of once per comment.
+batch_instruction = """Analyze each of the following feedback comments and provide the analysis results as a JSON array with exactly one object per comment.
+
+Each JSON object must contain the following keys and value types:
+- id (string: the ID shown in square brackets before the comment, copied exactly, e.g. "c1")
+- sentiment (string: "Positive", "Negative", "Neutral", "Mixed")
+- category (string: "Lecture Content", "Lecture Materials", "Operations", "Other")
+- importance (integer: 1 to 5, where 5 is highest urgency/impact)
+- isHighRisk (boolean: true or false)
+
+Respond **EXACTLY and ONLY** with the JSON array. Do NOT include any other text, explanations, or conversational filler before or after the JSON array."""
+
+bedrock_batch_prompt_template = f"""{batch_instruction}
+
+Comments:
+{{comments_placeholder}}
+"""
+
+# Version of the prompts, part of every analysis cache key. Derived from the template text so
+# editing an instruction automatically invalidates results cached for the old prompt.
+PROMPT_VERSION = hashlib.sha256((bedrock_prompt_template + bedrock_batch_prompt_template).encode('utf-8')).hexdigest()[:12]
+
+# Text around the comment in a single-comment prompt. Stored with each batch job, so the
+# completion handler can take the comment back out of the echoed modelInput exactly.
+PROMPT_PREFIX, PROMPT_SUFFIX = bedrock_prompt_template.format(comment_placeholder='\x00').split('\x00')
+
+# --- Analysis Result Cache (survives across warm invocations) ---
+# Course surveys repeat the same short answers ("特になし", "Good", "N/A") many times,
+# so identical comments are analyzed by Bedrock only once.
+analysis_cache = AnalysisCache(
+    model_id=BEDROCK_MODEL_ID or '',
+    prompt_version=PROMPT_VERSION,
+    max_entries=ANALYSIS_CACHE_MAX_ENTRIES,
+    dynamodb_client=None, # Set on the first invocation that uses the persistent tier
+    table_name=ANALYSIS_CACHE_TABLE_NAME,
+    ttl_seconds=ANALYSIS_CACHE_TTL_DAYS * 24 * 3600
+)
+
+# --- Helper Function to Name the Upload a Row Came From ---
+def build_source_attributes(object_key, object_identity):
+    """
+    Attributes written on every item of one upload: SourceObject (the S3 key; partition key of the
+    source index, sort key ProcessingTimestamp) and UploadId (one per object version).
+    """
+    return {'SourceObject': object_key, 'UploadId': build_upload_id(object_identity)}
+
+
+# --- Helper Function to Build the Placeholder Item for Empty Comments ---
+def build_skipped_item(comment, original_row_index, unique_id, source=None):
+    """
+    Builds the DynamoDB item stored for an empty/whitespace-only comment (no LLM call is made).
+    source: the upload's build_source_attributes().
+    """
+    return {
+        **(source or {}),
+        'CommentID': unique_id,
+        'OriginalComment': comment, # Store the original value (might be empty string)
+        'ProcessingTimestamp': datetime.datetime.utcnow().isoformat(),
+        'OriginalCsvRowIndex': original_row_index,
+        'Sentiment': 'Skipped - Empty',
+        'Category': 'Skipped - Empty',
+        'Importance': 0, # Default numeric/boolean values
+        'IsHighRisk': False,
+        'LLMError': 'Comment was empty or whitespace-only',
+        'BedrockModelId': 'N/A' # No LLM call was made
+    }
+
+
+# --- Helper Function to Build the Titan Text Request Body ---
+def build_bedrock_request_body(bedrock_prompt, max_token_count):
+    """Request body for invoke_model, also used as the modelInput of batch inference records."""
+    return {
+        "inputText": bedrock_prompt,
+        "textGenerationConfig": {
+            "maxTokenCount": max_token_count,
+            "temperature": 0.1, # Low temp for deterministic/structured output
+            "topP": 1,
+            # Omit stopSequences entirely if not needed or causing issues
+        }
+    }
+
+
+# --- Helper Function to Call Bedrock and Return the Model's Output Text ---
+def invoke_bedrock_text(bedrock_prompt, max_token_count, log_label):
+    """
+    Sends one prompt to Bedrock and returns (output_text, None) on success, or
+    (None, error_dict) where error_dict has an 'Error' key if the call failed or the
+    response had an unexpected structure. Runs on the worker pool (boto3 clients are thread-safe).
+    """
+    # Print a snippet of the full prompt
+    logger.debug("Full Bedrock Prompt (snippet):\n---\n%.500s\n---", bedrock_prompt)
+
+
+    # --- Prepare Bedrock Request Body ---
+    bedrock_request_body = build_bedrock_request_body(bedrock_prompt, max_token_count)
+
+    # Convert the body dictionary to a JSON string bytes
+    body_bytes = json.dumps(bedrock_request_body).encode('utf-8')
+
+    # --- Call Bedrock API and Process Response ---
+    raw_llm_response_text = None # Initialize raw text to None
+
+    try: # This try block catches Bedrock API call errors
+        logger.debug("Calling Bedrock API with model %s...", BEDROCK_MODEL_ID)
+        # Throttling/service-unavailable errors are retried by the controller until the deadline;
+        # anything it gives up on lands in the except blocks below as a failed analysis.
+        # Each attempt is timed on its own (waiting for a rate-limit token is not Bedrock latency)
+        def call_bedrock():
+            with stage_timer.time('bedrock_call'):
+                return get_bedrock_runtime_client().invoke_model(
+                    body=body_bytes,
+                    modelId=BEDROCK_MODEL_ID,
+                    contentType='application/json',
+                    accept='application/json'
+                )
+        bedrock_response = bedrock_rate_controller.call(call_bedrock)
+        logger.debug("Bedrock API call successful.")
+
+        # --- Parse the Bedrock response body (specific to Titan Text models) ---
+        response_body = bedrock_response['body'].read().decode('utf-8')
+        # logger.debug("Bedrock Response Body: %s", json.dumps(json.loads(response_body), indent=2)) # Uncomment for detailed debugging
+
+        response_body_json = json.loads(response_body)
+
+        if 'results' in response_body_json and len(response_body_json['results']) > 0:
+             raw_llm_response_text = response_body_json['results'][0].get('outputText')
+        if raw_llm_response_text is None:
+             logger.warning("Bedrock response did not contain expected 'results' or 'outputText' structure.")
+             return None, {'Error': 'Bedrock output structure unexpected', 'RawResponseSnippet': response_body[:500]}
+
+        logger.debug("Extracted outputText: '%.500s'", raw_llm_response_text)
+        return raw_llm_response_text, None
+
+    except get_bedrock_runtime_client().exceptions.ModelErrorException as model_err:
+         error_message = model_err.message
+         status_code = model_err.response['ResponseMetadata']['HTTPStatusCode']
+         error_body = model_err.response.get('body', b'').decode('utf-8')
+
+         logger.error("Bedrock Model Error for %s: Status: %s, Message: %s, Body: %s", log_label, status_code, error_message, error_body[:200])
+         # Return the Bedrock API error details, parsing won't happen
+         return None, {
+             'Error': f'Bedrock Model Error: {error_message}',
+             'StatusCode': status_code,
+             'RawResponseSnippet': error_body[:500]
+         }
+    except DeadlineExceeded as e:
+         # Not a verdict on the comment: with a checkpoint table the row is left for the next invocation
+         logger.info("Bedrock call for %s not made: %s", log_label, e)
+         return None, {'Error': f'Bedrock call not made: {e}', 'DeadlineExceeded': True, 'RawResponseSnippet': None}
+    except Exception as e:
+         logger.error("An unexpected error occurred during Bedrock call setup or initial response read for %s: %s", log_label, e)
+         return None, {'Error': f'Unexpected Bedrock call error: {e}', 'RawResponseSnippet': None}
+
+
+# --- Helper Function to Analyze a Single Comment with Bedrock ---
+def invoke_bedrock_analysis(comment):
+    """
+    Calls Bedrock for a single comment and extracts the analysis JSON from the output text.
+    Returns the parsed analysis dict, or a dict with an 'Error' key if the Bedrock call or
+    the response parsing failed.
+    """
+    # --- Construct Bedrock Prompt ---
+    with stage_timer.time('prompt_build'):
+        bedrock_prompt = bedrock_prompt_template.format(comment_placeholder=comment)
+    raw_llm_response_text, error = invoke_bedrock_text(bedrock_prompt, SINGLE_COMMENT_MAX_TOKENS, f"comment '{comment[:50]}...'")
+    if error is not None:
+        return error
+    with stage_timer.time('json_extraction'):
+        return parse_analysis_output(raw_llm_response_text)
+
+
+# --- Helper Function to Analyze Several Comments in One Bedrock Call ---
+def invoke_bedrock_batch_analysis(comments_by_id):
+    """
+    Packs several comments into one prompt, each tagged with its stable local ID, and asks
+    for a JSON array back. Returns {local_id: analysis_dict} for the entries that came back
+    valid. IDs that are missing from the result (malformed response, call failure, missing
+    keys) should be retried with single-comment calls by the caller. Returns None if the call
+    was not made before the invocation deadline.
+    """
+    with stage_timer.time('prompt_build'):
+        # Newlines inside a comment would blur the one-comment-per-line layout of the prompt
+        comment_lines = [f"[{local_id}] {' '.join(comment.split())}" for local_id, comment in comments_by_id.items()]
+        bedrock_prompt = bedrock_batch_prompt_template.format(comments_placeholder='\n'.join(comment_lines))
+    max_token_count = min(BEDROCK_BATCH_MAX_TOKENS, 200 + 100 * len(comments_by_id)) # ~100 output tokens per comment
+
+    raw_llm_response_text, error = invoke_bedrock_text(bedrock_prompt, max_token_count, f"batch of {len(comments_by_id)} comments")
+    if error is not None:
+        if error.get('DeadlineExceeded'):
+            return None
+        logger.warning("Batch analysis call failed (%s). Falling back to single-comment calls.", error['Error'])
+        return {}
+    with stage_timer.time('json_extraction'):
+        return parse_batch_analysis_output(raw_llm_response_text, comments_by_id.keys())
+
+
+# --- Helper Function to Extract the Analysis JSON Array from a Batch Response ---
+def parse_batch_analysis_output(raw_llm_response_text, expected_ids):
+    """
+    Extracts the JSON array from a batched response (first '[' to last ']', the array
+    counterpart of the single-comment brace extraction) and validates each entry.
+    Returns {local_id: analysis_dict} for valid entries only.
+    """
+    expected_ids = set(expected_ids)
+    text_to_parse = raw_llm_response_text.strip()
+
+    first_bracket = text_to_parse.find('[')
+    last_bracket = text_to_parse.rfind(']')
+    if first_bracket == -1 or last_bracket == -1 or last_bracket <= first_bracket:
+        logger.error("Could not find JSON array markers ([]) in batched Bedrock output.")
+        return {}
+
+    try:
+        parsed_json_data = json.loads(text_to_parse[first_bracket : last_bracket + 1])
+    except json.JSONDecodeError as j:
+        logger.error("Error parsing extracted batch content as JSON: %s", j)
+        return {}
+    if not isinstance(parsed_json_data, list):
+        logger.error("Batched Bedrock output is not a JSON array.")
+        return {}
+
+    analyses_by_id = {}
+    duplicate_ids = set()
+    expected_keys = ['sentiment', 'category', 'importance', 'isHighRisk']
+    for entry in parsed_json_data:
+        if not isinstance(entry, dict):
+            continue
+        local_id = str(entry.get('id', '')).strip('[] ')
+        if local_id not in expected_ids:
+            continue
+        # Unlike single-comment mode, an entry missing keys is treated as malformed: in a batch it
+        # usually means the model lost track of which comment it was answering.
+        missing_keys = [key for key in expected_keys if key not in entry]
+        if missing_keys:
+            logger.warning("Batch entry '%s' missing expected keys: %s. Will retry it alone.", local_id, missing_keys)
+            continue
+        if local_id in analyses_by_id:
+            duplicate_ids.add(local_id)
+        analyses_by_id[local_id] = {key: entry[key] for key in expected_keys}
+
+    # An ID answered twice cannot be trusted either way
+    for local_id in duplicate_ids:
+        del analyses_by_id[local_id]
+
+    missing_ids = expected_ids - set(analyses_by_id)
+    if missing_ids:
+        logger.warning("Batched Bedrock output missing valid results for IDs: %s", sorted(missing_ids))
+    return analyses_by_id
+
+
+# --- Helper Function to Extract the Analysis JSON from the Model Output Text ---
+def parse_analysis_output(raw_llm_response_text):
+    """
+    Extracts and parses the JSON object from the model's outputText.
+    Returns the analysis dict, or a dict with an 'Error' key if no valid JSON object was found.
+    """
+    json_object_str = None # Variable to hold the string that should be JSON
+    try:
+        text_to_parse = raw_llm_response_text.strip()
+
+        # **Revised JSON extraction logic:** Find the first { and last }
+        first_brace = text_to_parse.find('{')
+        last_brace = text_to_parse.rfind('}')
+
+        if first_brace == -1 or last_brace == -1 or last_brace <= first_brace:
+            # If curly braces aren't found, it's not a valid JSON object output
+            logger.error("Could not find JSON object markers ({}) in Bedrock output.")
+            return {'Error': 'Could not find JSON object in output text', 'RawResponseSnippet': raw_llm_response_text[:500]}
+
+        # Extract the content between the first { and last } (inclusive)
+        json_object_str = text_to_parse[first_brace : last_brace + 1].strip()
+        logger.debug("Extracted potential JSON object using first { and last }.")
+
+        parsed_json_data = json.loads(json_object_str)
+        logger.debug("Successfully parsed extracted JSON string.")
+
+        # --- Add logic to handle the {"rows": [...]} wrapping ---
+        if isinstance(parsed_json_data, dict) and 'rows' in parsed_json_data and isinstance(parsed_json_data['rows'], list) and len(parsed_json_data['rows']) > 0 and isinstance(parsed_json_data['rows'][0], dict):
+             # Found the expected wrapping, extract the inner dictionary
+             sentiment_data = parsed_json_data['rows'][0]
+             logger.debug("Unwrapped JSON from {'rows': [...]} structure.")
+        else:
+             # Assume the parsed data IS the expected sentiment_data structure
+             sentiment_data = parsed_json_data
+             logger.debug("Parsed JSON is the expected structure (or unwrapping not needed).")
+
+        # Basic validation of parsed JSON structure and types (using the potentially unwrapped data)
+        if not sentiment_data or not isinstance(sentiment_data, dict):
+            # This case means parsed_json_data was empty or did not contain the expected 'rows' structure correctly
+            logger.error("Parsed JSON data was unexpectedly empty or invalid after unwrapping attempt.")
+            return {'Error': 'Parsed JSON empty or invalid after unwrapping', 'RawResponseSnippet': json_object_str[:500]}
+
+        expected_keys = ['sentiment', 'category', 'importance', 'isHighRisk']
+        missing_keys = [key for key in expected_keys if key not in sentiment_data]
+        if missing_keys:
+            logger.warning("Parsed JSON response missing expected keys: %s. Data: %s", missing_keys, sentiment_data)
+            # We still count this as a successful analysis/parse, but log the warning.
+
+        # Optional: Validate value types/ranges if needed more strictly before DDB write
+        # e.g., Check if sentiment is one of the allowed strings, importance is 1-5, isHighRisk is bool
+        return sentiment_data
+
+    except json.JSONDecodeError as j:
+         logger.error("Error parsing extracted content as JSON: %s", j)
+         logger.error("Content that failed parsing: '%s'", json_object_str)
+         return {'Error': f'JSON parsing failed: {j}', 'RawResponseSnippet': json_object_str[:500]}
+    except Exception as e: # Catch other potential errors during parsing/unwrapping
+         logger.error("Unexpected error during Bedrock output parsing/unwrapping: %s", e)
+         # Log the content that caused error if available, default to raw outputText
+         content_snippet = json_object_str[:500] if json_object_str else (raw_llm_response_text[:500] if raw_llm_response_text else None)
+         return {'Error': f'Bedrock content parsing/unwrapping error: {e}', 'RawResponseSnippet': content_snippet}
+
+
+# --- Helper Function to Map Analysis Results (or Errors) onto a DynamoDB Item ---
+def build_analysis_item(comment, original_row_index, unique_id, sentiment_data, model_id=None, source=None):
+    """
+    Builds the DynamoDB item for an analyzed comment from the parsed analysis or error dict.
+    model_id defaults to BEDROCK_MODEL_ID; the rule tier passes its own ID. source: the upload's
+    build_source_attributes().
+    """
+    ddb_item = {
+        **(source or {}),
+        'CommentID': unique_id,
+        'OriginalComment': comment,
+        'ProcessingTimestamp': datetime.datetime.utcnow().isoformat(),
+        'OriginalCsvRowIndex': original_row_index,
+        'BedrockModelId': model_id or BEDROCK_MODEL_ID # Always record which model was attempted (even if analysis failed)
+    }
+
+    # Add analysis results or error info based on sentiment_data
+    if 'Error' not in sentiment_data:
+        # Successfully parsed analysis results (after potential unwrapping)
+        logger.debug("Mapping analysis results to DynamoDB item structure for %s.", unique_id)
+        # Use .get with a default in case the model misses a key or provides None/empty
+        ddb_item['Sentiment'] = sentiment_data.get('sentiment', 'Unknown')
+        ddb_item['Category'] = sentiment_data.get('category', 'Unknown')
+
+        # Handle Importance (must be DynamoDB Number)
+        # Get importance, defaulting to 0 if key is missing
+        importance = sentiment_data.get('importance')
+        try:
+            # Ensure it's treated as a number; int() is fine for DynamoDB Number type
+            # Handle cases where model might return importance as a string like "4" (as seen in logs)
+            ddb_item['Importance'] = int(importance) if importance is not None and importance != '' else 0
+        except (ValueError, TypeError):
+             logger.warning("Could not parse Importance '%s' as integer for item %s. Storing as 0.", importance, unique_id)
+             ddb_item['Importance'] = 0 # Default to 0 on parse failure
+
+        # Handle IsHighRisk (must be DynamoDB Boolean)
+        # Get risk, defaulting to False if key is missing
+        risk = sentiment_data.get('isHighRisk')
+        # Check explicitly for Python bool True/False or string representations ('true', 'false', 'yes', 'no')
+        if isinstance(risk, bool):
+             ddb_item['IsHighRisk'] = risk
+        elif isinstance(risk, str):
+             risk_lower = risk.lower()
+             if risk_lower in ['true', 'yes']:
+                 ddb_item['IsHighRisk'] = True
+             elif risk_lower in ['false', 'no']:
+                  ddb_item['IsHighRisk'] = False
+             else:
+                  logger.warning("Could not parse IsHighRisk string '%s' as boolean for item %s. Storing as False.", risk, unique_id)
+                  ddb_item['IsHighRisk'] = False # Default to False on unparseable string
+        else:
+             logger.warning("Could not parse IsHighRisk value '%s' as boolean for item %s. Storing as False.", risk, unique_id)
+             ddb_item['IsHighRisk'] = False # Default to False for unexpected types
+
+    else:
+        # Bedrock call or parsing failed, add error details
+        logger.debug("Storing error details for item %s (Original Row: %s) due to LLM analysis/parsing failure.", unique_id, original_row_index)
+        ddb_item['LLMError'] = sentiment_data['Error']
+        if sentiment_data.get('RawResponseSnippet') is not None:
+             ddb_item['LLMRawResponseSnippet'] = sentiment_data['RawResponseSnippet']
+        if sentiment_data.get('StatusCode') is not None:
+             # Ensure StatusCode is stored as a Number if it's an int
+             try:
+                  ddb_item['LLMStatusCode'] = int(sentiment_data['StatusCode'])
+             except (ValueError, TypeError):
+                  ddb_item['LLMStatusCode'] = str(sentiment_data['StatusCode']) # Store as string if not int
+
+        # Store 'Failed Analysis' status and default values for primary attributes
+        ddb_item['Sentiment'] = 'Failed Analysis'
+        ddb_item['Category'] = 'Failed Analysis'
+        ddb_item['Importance'] = 0
+        ddb_item['IsHighRisk'] = False
+        # BedrockModelId is already added above
+
+    # Sparse index keys (absent on failed analyses, which have Importance 0 and no risk)
+    if ddb_item['IsHighRisk']:
+        ddb_item[HIGH_RISK_INDEX_KEY[0]] = HIGH_RISK_INDEX_KEY[1]
+    if ddb_item['Importance'] >= TOP_IMPORTANCE_THRESHOLD:
+        ddb_item[IMPORTANT_INDEX_KEY[0]] = IMPORTANT_INDEX_KEY[1]
+
+    # None values mean the attribute is simply not included in the item.
+    return {k: v for k, v in ddb_item.items() if v is not None}
+
+
+# --- Helpers for Streaming CSV Ingestion ---
+class CsvLineStream:
+    """
+    Iterates the chunks of an S3 StreamingBody (body.iter_chunks()) line by line, line endings
+    kept, decoding as it goes.
+    Only one chunk plus one partial line is held in memory at a time. Lines are split on the
+    b'\\n' byte (never part of a multi-byte UTF-8 character), like a file opened with newline='',
+    so csv can still join quoted multi-line fields.
+    bytes_consumed is the offset in the object just past the last line handed out; after
+    csv.DictReader yields a row it is exactly where the next row starts.
+    Time spent waiting for each chunk is recorded as the 's3_download' stage and summed in download_seconds.
+    """
+
+    def __init__(self, chunks, start_offset=0):
+        self.chunks = chunks
+        self.bytes_consumed = start_offset
+        self.download_seconds = 0.0
+
+    def __iter__(self):
+        pending = b''
+        chunk_iterator = iter(self.chunks)
+        while True:
+            fetch_start = time.perf_counter()
+            chunk = next(chunk_iterator, None)
+            fetch_seconds = time.perf_counter() - fetch_start
+            self.download_seconds += fetch_seconds
+            stage_timer.record('s3_download', fetch_seconds)
+            if chunk is None:
+                break
+            pending += chunk
+            lines = pending.split(b'\n')
+            pending = lines.pop() # Last piece has no newline yet; keep it for the next chunk
+            for line in lines:
+                self.bytes_consumed += len(line) + 1
+                yield (line + b'\n').decode('utf-8')
+        if pending:
+            self.bytes_consumed += len(pending)
+            yield pending.decode('utf-8')
+
+
+def iter_comment_rows(csv_reader, first_row_index=2, line_stream=None):
+    """
+    Yields {'text', 'original_row_index'} for every row after the header, as it is parsed.
+    first_row_index is 2 for a fresh file (row 1 is the header) or the checkpointed row when resuming.
+    Parsing time per row is recorded as the 'csv_parse' stage, minus any S3 wait inside it
+    (taken from line_stream.download_seconds when the stream is given).
+    """
+    rows = iter(csv_reader)
+    row_index = first_row_index
+    while True:
+        parse_start = time.perf_counter()
+        download_before = line_stream.download_seconds if line_stream is not None else 0.0
+        row = next(rows, None)
+        if row is None:
+            break
+        download_seconds = (line_stream.download_seconds - download_before) if line_stream is not None else 0.0
+        stage_timer.record('csv_parse', time.perf_counter() - parse_start - download_seconds)
+        # Yield even empty/whitespace comments; they are flagged (and stored as skipped) later
+        # so every row after the header keeps its original row index
+        yield {'text': row.get(COMMENT_COLUMN_NAME), 'original_row_index': row_index}
+        row_index += 1
+
+
+def read_row_chunk(row_iterator, max_rows, line_stream):
+    """
+    Reads up to max_rows rows from iter_comment_rows() (on the parse thread: the S3 stream blocks).
+    Each row gets 'next_byte_offset', the offset where the row after it starts.
+    Returns (rows, error); a parse error part-way through comes back with the rows read before it.
+    """
+    rows = []
+    try:
+        for comment_info in itertools.islice(row_iterator, max_rows):
+            comment_info['next_byte_offset'] = line_stream.bytes_consumed
+            rows.append(comment_info)
+    except Exception as e:
+        return rows, e
+    return rows, None
+
+
+# --- Worker Function: Analyze a Group of Comments ---
+def analyze_comment_batch(comment_infos):
+    """
+    Runs on the analyze stage threads. Analyzes up to BEDROCK_BATCH_SIZE non-empty comments and
+    returns ([(comment_info, sentiment_data), ...], bedrock_invocations).
+    Cached comments skip Bedrock; the rest go into one batched prompt (when there are 2+),
+    and only comments missing from the batched answer fall back to single-comment calls.
+    Mapping onto DynamoDB items is left to the normalize stage.
+    """
+    sentiment_by_local_id = {}
+    bedrock_invocations = 0
+
+    # Stable local IDs: the comment's position within this group
+    comment_infos_by_id = {f"c{position + 1}": comment_info for position, comment_info in enumerate(comment_infos)}
+
+    # Repeated comments reuse the cached analysis instead of calling Bedrock again
+    uncached_ids = []
+    for local_id, comment_info in comment_infos_by_id.items():
+        logger.debug("--- Processing item for Original Row: %s ---", comment_info['original_row_index'])
+        logger.debug("Comment text (raw): '%.200s'", comment_info['text'])
+        cached = analysis_cache.get(comment_info['text'])
+        if cached is not None:
+            logger.debug("Analysis cache hit for original row %s. Skipping Bedrock call.", comment_info['original_row_index'])
+            sentiment_by_local_id[local_id] = cached
+        else:
+            uncached_ids.append(local_id)
+
+    # Calls not made before the invocation deadline are not counted as invocations
+    if len(uncached_ids) > 1:
+        batch_results = invoke_bedrock_batch_analysis({local_id: comment_infos_by_id[local_id]['text'] for local_id in uncached_ids})
+        bedrock_invocations += 0 if batch_results is None else 1
+        for local_id, sentiment_data in (batch_results or {}).items():
+            sentiment_by_local_id[local_id] = sentiment_data
+            analysis_cache.put(comment_infos_by_id[local_id]['text'], sentiment_data)
+
+    # Single-comment calls: the normal path when batching is off, the fallback otherwise
+    for local_id in uncached_ids:
+        if local_id in sentiment_by_local_id:
+            continue
+        sentiment_data = invoke_bedrock_analysis(comment_infos_by_id[local_id]['text'])
+        bedrock_invocations += 0 if sentiment_data.get('DeadlineExceeded') else 1
+        if 'Error' not in sentiment_data:
+            analysis_cache.put(comment_infos_by_id[local_id]['text'], sentiment_data)
+        sentiment_by_local_id[local_id] = sentiment_data
+
+    results = [(comment_info, sentiment_by_local_id[local_id]) for local_id, comment_info in comment_infos_by_id.items()]
+    return results, bedrock_invocations
+
+
+# --- Fan-out Coordinator: Split a Large File into Shards for Parallel Workers ---
+def get_shard_dispatcher(context):
+    """Returns the dispatcher for SHARD_FANOUT_MODE, or None if the file should be processed inline."""
+    if SHARD_FANOUT_MODE == 'local':
+        return LocalProcessPoolDispatcher(lambda_handler, SHARD_LOCAL_MAX_WORKERS)
+    if SHARD_FANOUT_MODE == 'lambda':
+        if not CHECKPOINT_TABLE_NAME or context is None:
+            logger.warning("SHARD_FANOUT_MODE=lambda needs CHECKPOINT_TABLE_NAME and a Lambda context. Processing inline.")
+            return None
+        return LambdaShardDispatcher(get_lambda_client(), context.invoked_function_arn)
+    return None
+
+
+def run_fanout_coordinator(dispatcher, bucket_name, object_key, object_version_id, object_etag, object_identity, file_size):
+    """
+    Splits the object into row-aligned byte ranges and hands each one to a worker (a shard event
+    for this same handler, which reads its range with a ranged GET).
+    Returns the coordinator's response, or None if the file turned out to be a single shard
+    and should be processed inline.
+    """
+    # Bounded number of shards: very large files get proportionally larger shards
+    target_shard_bytes = max(SHARD_TARGET_BYTES, -(-file_size // SHARD_MAX_COUNT))
+
+    get_object_args = {'Bucket': bucket_name, 'Key': object_key}
+    if object_version_id:
+        get_object_args['VersionId'] = object_version_id
+    elif object_etag:
+        get_object_args['IfMatch'] = object_etag
+    try:
+        logger.info("Planning shards of about %s bytes for s3://%s/%s (%s bytes)...", target_shard_bytes, bucket_name, object_key, file_size)
+        response = get_s3_client().get_object(**get_object_args)
+        line_stream = CsvLineStream(response['Body'].iter_chunks(chunk_size=CSV_STREAM_CHUNK_BYTES))
+        fieldnames, shards = plan_shards(line_stream, target_shard_bytes)
+    except Exception as e:
+        logger.error("Error planning shards for file '%s': %s", object_key, e)
+        return {
+            'statusCode': 500,
+            'body': json.dumps(f'Error planning shards: {e}')
+        }
+
+    if COMMENT_COLUMN_NAME not in fieldnames:
+        error_message = f"Error: CSV file '{object_key}' does not contain a '{COMMENT_COLUMN_NAME}' column. Found columns: {fieldnames}"
+        logger.error(error_message)
+        return {
+            'statusCode': 400,
+            'body': json.dumps(error_message)
+        }
+    if len(shards) <= 1:
+        logger.info("File fits in a single shard. Processing inline.")
+        return None
+
+    # --- Completion Record ---
+    job_store = None
+    if CHECKPOINT_TABLE_NAME:
+        job_store = ShardJobStore(get_dynamodb_client(), CHECKPOINT_TABLE_NAME)
+        try:
+            if not job_store.create_job(object_identity, len(shards)):
+                logger.info("A fan-out job for %s already exists. Skipping duplicate trigger.", object_identity)
+                return {
+                    'statusCode': 200,
+                    'body': json.dumps(f'Skipped: s3://{bucket_name}/{object_key} is already being processed by a fan-out job.')
+                }
+        except Exception as e:
+            logger.error("Error creating fan-out job record in '%s': %s", CHECKPOINT_TABLE_NAME, e)
+            return {
+                'statusCode': 500,
+                'body': json.dumps(f'Error accessing checkpoint table: {e}')
+            }
+
+    # --- Dispatch ---
+    shard_events = [{
+        'bucket_name': bucket_name,
+        'object_key': object_key,
+        'version_id': object_version_id,
+        'etag': object_etag,
+        'shard': dict(shard, count=len(shards), fieldnames=fieldnames),
+    } for shard in shards]
+    logger.info("Dispatching %s shards with %s.", len(shards), type(dispatcher).__name__)
+    try:
+        shard_responses = dispatcher.dispatch(shard_events)
+    except Exception as e:
+        # Shards already started keep running; their checkpoints make a re-run resume them
+        logger.error("Error dispatching shards: %s", e)
+        return {
+            'statusCode': 500,
+            'body': json.dumps(f'Error dispatching shards: {e}')
+        }
+
+    summary = {
+        'message': f'Fanned out s3://{bucket_name}/{object_key} into {len(shards)} shards.',
+        'shard_count': len(shards),
+        'shards': [{'index': shard['index'], 'first_row_index': shard['first_row_index'], 'bytes': shard['end_offset'] - shard['start_offset']} for shard in shards],
+        'file_processed': f's3://{bucket_name}/{object_key}'
+    }
+    if not dispatcher.returns_results:
+        # Workers run asynchronously; the last one to finish writes FileTotals into the completion record
+        return {
+            'statusCode': 200,
+            'body': json.dumps(summary)
+        }
+
+    # --- Aggregate the Shard Summaries (local fan-out) ---
+    shard_totals = []
+    failed_shards = []
+    for shard, shard_response in zip(shards, shard_responses):
+        shard_body = json.loads(shard_response.get('body') or 'null')
+        if shard_response.get('statusCode') != 200 or not isinstance(shard_body, dict) or 'shard' not in shard_body:
+            failed_shards.append(shard['index'])
+            logger.error("Shard %s did not complete: %s", shard['index'], shard_response.get('body'))
+            continue
+        shard_totals.append(shard_body['shard']['shard_totals'])
+    summary['file_totals'] = sum_shard_totals(shard_totals)
+    summary['failed_shards'] = failed_shards
+    logger.info("Fan-out finished. File totals: %s, failed shards: %s", summary['file_totals'], failed_shards)
+    return {
+        'statusCode': 200 if not failed_shards else 500,
+        'body': json.dumps(summary)
+    }
+
+
+# --- Bedrock Batch Inference: Submit a Model Invocation Job for a Very Large File ---
+def get_batch_job_client():
+    """Returns the job client for BATCH_INFERENCE_JOB_CLIENT, or None if batch inference is off."""
+    if BATCH_INFERENCE_MIN_ROWS <= 0:
+        return None
+    if not BATCH_INFERENCE_S3_URI:
+        logger.warning("BATCH_INFERENCE_MIN_ROWS is set but BATCH_INFERENCE_S3_URI is not. Using on-demand calls.")
+        return None
+    if BATCH_INFERENCE_JOB_CLIENT == 'local':
+        return LocalBatchJobClient(get_s3_client(), get_bedrock_runtime_client(), max_workers=BEDROCK_MAX_CONCURRENCY)
+    if not BATCH_INFERENCE_ROLE_ARN:
+        logger.warning("BATCH_INFERENCE_JOB_CLIENT=bedrock needs BATCH_INFERENCE_ROLE_ARN. Using on-demand calls.")
+        return None
+    return BedrockBatchJobClient(get_bedrock_client(), BATCH_INFERENCE_ROLE_ARN)
+
+
+def run_batch_inference_submission(job_client, bucket_name, object_key, object_version_id, object_etag, object_identity,
+                                   context=None, stop_reading_at=float('inf')):
+    """
+    Analyzes a file with at least BATCH_INFERENCE_MIN_ROWS rows through a model invocation job.
+    Empty comments, rule-tier matches and cache hits are stored right away; every other distinct
+    comment (by analysis cache key) becomes one JSONL record (recordId = CSV row index of its first
+    occurrence, modelInput = the single-comment request) and the job is submitted. Later rows with
+    the same text go to the duplicates file instead. run_batch_inference_completion() stores the
+    job's results for every row.
+    Returns the response, or None if the file is below the threshold and should be processed inline.
+    """
+    get_object_args = {'Bucket': bucket_name, 'Key': object_key}
+    if object_version_id:
+        get_object_args['VersionId'] = object_version_id
+    elif object_etag:
+        get_object_args['IfMatch'] = object_etag
+
+    # --- Count Rows, Reading Only as Far as the Threshold ---
+    try:
+        response = get_s3_client().get_object(**get_object_args)
+        row_reader = csv.reader(CsvLineStream(response['Body'].iter_chunks(chunk_size=CSV_STREAM_CHUNK_BYTES)))
+        next(row_reader, None) # Header
+        row_count = sum(1 for _ in itertools.islice(row_reader, BATCH_INFERENCE_MIN_ROWS))
+        response['Body'].close()
+    except Exception as e:
+        logger.warning("Could not count the rows of %s: %s. Processing inline.", object_key, e)
+        return None
+    if row_count < BATCH_INFERENCE_MIN_ROWS:
+        return None
+
+    job_bucket, job_root = parse_s3_uri(BATCH_INFERENCE_S3_URI)
+    job_name = build_batch_job_name(object_identity)
+    job_prefix = f"{job_root}/{job_name}" if job_root else job_name
+    manifest_key = f"{job_prefix}/{BATCH_JOB_MANIFEST_NAME}"
+    try:
+        get_s3_client().head_object(Bucket=job_bucket, Key=manifest_key)
+        logger.info("Batch inference job %s for %s was already submitted. Skipping duplicate trigger.", job_name, object_identity)
+        return {
+            'statusCode': 200,
+            'body': json.dumps(f'Skipped: a batch inference job for s3://{bucket_name}/{object_key} was already submitted.')
+        }
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+            logger.error("Error checking for an existing batch inference job at s3://%s/%s: %s", job_bucket, manifest_key, e)
+            return {
+                'statusCode': 500,
+                'body': json.dumps(f'Error checking batch inference job: {e}')
+            }
+
+    # --- Write the Batch Input; Store What Needs No Model Call Right Away ---
+    logger.info("File has at least %s rows. Writing batch inference input for job %s...", BATCH_INFERENCE_MIN_ROWS, job_name)
+    ddb_writer = BatchItemWriter(get_dynamodb_client(), DYNAMODB_TABLE_NAME, stage_timer=stage_timer, on_write=note_results_written)
+    input_writer = BatchInputWriter(get_s3_client(), job_bucket, f"{job_prefix}/input", BATCH_INFERENCE_MAX_RECORDS_PER_FILE)
+    duplicate_writer = DuplicateRowWriter(get_s3_client(), job_bucket, f"{job_prefix}/{BATCH_JOB_DUPLICATES_NAME}")
+    record_ids_by_cache_key = {} # Analysis cache key -> recordId of the comment's first occurrence
+    first_records = [] # Kept in case there are too few records for a job (analyzed on demand instead)
+    source = build_source_attributes(object_key, object_identity)
+    totals = {'total_rows': 0, 'comments_skipped_empty': 0, 'rule_classified': 0, 'analysis_cache_hits': 0, 'batch_records': 0, 'batch_duplicate_rows': 0}
+    try:
+        response = get_s3_client().get_object(**get_object_args)
+        line_stream = CsvLineStream(response['Body'].iter_chunks(chunk_size=CSV_STREAM_CHUNK_BYTES))
+        csv_reader = csv.DictReader(line_stream)
+        for comment_info in iter_comment_rows(csv_reader, line_stream=line_stream):
+            totals['total_rows'] += 1
+            comment = comment_info.get('text', '')
+            original_row_index = comment_info['original_row_index']
+            comment_info['comment_id'] = build_comment_id(object_identity, original_row_index)
+            if not comment or not comment.strip():
+                totals['comments_skipped_empty'] += 1
+                ddb_writer.add(build_skipped_item(comment, original_row_index, comment_info['comment_id'], source=source), tag=False)
+                continue
+            rule_match = rule_classifier.classify(comment) if rule_classifier is not None else None
+            if rule_match is not None:
+                totals['rule_classified'] += 1
+                ddb_writer.add(build_analysis_item(comment, original_row_index, comment_info['comment_id'], rule_match[1], model_id=rule_classifier.model_id, source=source), tag=True)
+                continue
+            # Same text as a comment already in the input: analyzed once, stored for both rows
+            cache_key = build_cache_key(comment, analysis_cache.model_id, analysis_cache.prompt_version)
+            first_record_id = record_ids_by_cache_key.get(cache_key)
+            if first_record_id is not None:
+                duplicate_writer.add(first_record_id, original_row_index, comment)
+                continue
+            cached = analysis_cache.get(comment)
+            if cached is not None:
+                totals['analysis_cache_hits'] += 1
+                ddb_writer.add(build_analysis_item(comment, original_row_index, comment_info['comment_id'], cached, source=source), tag=True)
+                continue
+            record_id = record_id_for_row(original_row_index)
+            record_ids_by_cache_key[cache_key] = record_id
+            input_writer.add(record_id, build_bedrock_request_body(bedrock_prompt_template.format(comment_placeholder=comment), SINGLE_COMMENT_MAX_TOKENS))
+            if len(first_records) < job_client.min_records:
+                first_records.append(comment_info)
+        totals['batch_records'] = input_writer.record_count
+        totals['batch_duplicate_rows'] = duplicate_writer.row_count
+    except Exception as e:
+        input_writer.discard()
+        duplicate_writer.discard()
+        ddb_writer.flush()
+        logger.error("Error writing batch inference input for file '%s': %s", object_key, e)
+        return {
+            'statusCode': 500,
+            'body': json.dumps(f'Error writing batch inference input: {e}')
+        }
+
+    summary = {
+        'message': f'Submitted batch inference job {job_name} for {totals["batch_records"]} comments of s3://{bucket_name}/{object_key}.',
+        'batch_job_name': job_name,
+        'file_processed': f's3://{bucket_name}/{object_key}'
+    }
+
+    # --- Too Few Records for a Job: Analyze Them On Demand ---
+    if input_writer.record_count < job_client.min_records:
+        input_writer.discard()
+        logger.info("Only %s comments need the model (a job needs %s). Analyzing them on demand.", input_writer.record_count, job_client.min_records)
+        groups = [first_records[i:i + BEDROCK_BATCH_SIZE] for i in range(0, len(first_records), BEDROCK_BATCH_SIZE)]
+        totals.update(llm_analysis_failed=0, bedrock_invocations=0, batch_records=0)
+        results_by_record_id = {} # For the duplicate rows
+        with ThreadPoolExecutor(max_workers=BEDROCK_MAX_CONCURRENCY) as executor:
+            for analyzed_comments, invocations in executor.map(analyze_comment_batch, groups):
+                totals['bedrock_invocations'] += invocations
+                for comment_info, sentiment_data in analyzed_comments:
+                    analysis_succeeded = 'Error' not in sentiment_data
+                    totals['llm_analysis_failed'] += 0 if analysis_succeeded else 1
+                    results_by_record_id[record_id_for_row(comment_info['original_row_index'])] = sentiment_data
+                    ddb_writer.add(build_analysis_item(comment_info['text'], comment_info['original_row_index'], comment_info['comment_id'], sentiment_data, source=source), tag=analysis_succeeded)
+        for record_id, original_row_index, comment in duplicate_writer:
+            sentiment_data = results_by_record_id[record_id]
+            analysis_succeeded = 'Error' not in sentiment_data
+            totals['llm_analysis_failed'] += 0 if analysis_succeeded else 1
+            ddb_writer.add(build_analysis_item(comment, original_row_index, build_comment_id(object_identity, original_row_index), sentiment_data, source=source), tag=analysis_succeeded)
+        duplicate_writer.discard()
+        ddb_writer.flush()
+        totals['successfully_analyzed_and_stored'] = ddb_writer.written_by_tag[True]
+        totals['dynamodb_write_failed'] = ddb_writer.failed_count
+        summary.update(message=f'CSV processing complete. Total comments found: {totals["total_rows"]}.', batch_job_name=None, file_totals=totals)
+        return {
+            'statusCode': 200,
+            'body': json.dumps(summary)
+        }
+
+    # --- Submit the Job ---
+    try:
+        input_writer.close()
+        duplicates_key = duplicate_writer.close()
+        ddb_writer.flush()
+        input_uri = f"s3://{job_bucket}/{job_prefix}/input/"
+        output_uri = f"s3://{job_bucket}/{job_prefix}/output/"
+        # The manifest goes first: the completion handler (which may run inside submit() for the
+        # local client) needs it, and its existence marks the job as submitted
+        job_manifest = {
+            'job_name': job_name,
+            'bucket_name': bucket_name,
+            'object_key': object_key,
+            'version_id': object_version_id,
+            'etag': object_etag,
+            'object_identity': object_identity,
+            'model_id': BEDROCK_MODEL_ID,
+            'prompt_version': PROMPT_VERSION,
+            'prompt_prefix': PROMPT_PREFIX,
+            'prompt_suffix': PROMPT_SUFFIX,
+            'input_uri': input_uri,
+            'output_uri': output_uri,
+            'duplicates_key': duplicates_key, # None if every comment in the input is distinct
+            'submitted_at': datetime.datetime.utcnow().isoformat(),
+            'totals': dict(totals, stored_without_model=ddb_writer.written_by_tag[True], dynamodb_write_failed=ddb_writer.failed_count),
+        }
+        get_s3_client().put_object(Bucket=job_bucket, Key=manifest_key, Body=json.dumps(job_manifest, ensure_ascii=False).encode('utf-8'))
+        logger.info("Submitting batch inference job %s with %s records (%s)...", job_name, totals['batch_records'], type(job_client).__name__)
+        job_arn = job_client.submit(job_name, BEDROCK_MODEL_ID, input_uri, output_uri)
+        logger.info("Batch inference job submitted: %s", job_arn)
+    except Exception as e:
+        logger.error("Error submitting batch inference job %s: %s", job_name, e)
+        # The manifest marks the job as submitted, so it must not outlive a failed submit: a retry
+        # would skip the file for good. Raising makes Lambda retry the asynchronous S3 invocation.
+        try:
+            get_s3_client().delete_object(Bucket=job_bucket, Key=manifest_key)
+        except Exception as delete_error:
+            logger.error("Could not delete the manifest s3://%s/%s of the failed job: %s. Delete it before re-running the file.", job_bucket, manifest_key, delete_error)
+        raise
+
+    if job_client.completes_synchronously:
+        # Local stand-in: the output is already there, store it now
+        return run_batch_inference_completion({'batchJobName': job_name, 'batchJobArn': job_arn, 'status': 'Completed'}, context, stop_reading_at)
+
+    summary.update(batch_job_arn=job_arn, submission_totals=job_manifest['totals'])
+    return {
+        'statusCode': 200,
+        'body': json.dumps(summary)
+    }
+
+
+# --- Bedrock Batch Inference: Store the Results of a Finished Job ---
+def run_batch_inference_completion(job_detail, context=None, stop_reading_at=float('inf')):
+    """
+    Handles the EventBridge state change of a model invocation job submitted by this function.
+    Streams every output JSONL file line by line through the same JSON extraction
+    (parse_analysis_output) and DynamoDB mapping (build_analysis_item) as on-demand calls.
+    With a checkpoint table the position (output file and byte offset) is committed every
+    CHECKPOINT_INTERVAL_ROWS records, and when time runs low the rest of the output goes to a
+    continuation invocation, like a large CSV. Each result is also stored for the rows listed in
+    the job's duplicates file. CommentIDs are deterministic, so records read again after a crash
+    simply overwrite the same items.
+    """
+    job_name = job_detail.get('batchJobName')
+    job_status = job_detail.get('status')
+    if job_status not in BATCH_JOB_SUCCEEDED_STATUSES + BATCH_JOB_FAILED_STATUSES:
+        logger.info("Batch inference job %s is %s. Nothing to do yet.", job_name, job_status)
+        return {'statusCode': 200, 'body': json.dumps(f'Ignored: job {job_name} is {job_status}.')}
+
+    job_bucket, job_root = parse_s3_uri(BATCH_INFERENCE_S3_URI or 's3://')
+    job_prefix = f"{job_root}/{job_name}" if job_root else job_name
+    try:
+        manifest_body = get_s3_client().get_object(Bucket=job_bucket, Key=f"{job_prefix}/{BATCH_JOB_MANIFEST_NAME}")['Body'].read()
+        job_manifest = json.loads(manifest_body.decode('utf-8'))
+    except Exception as e:
+        logger.error("Could not read the manifest of batch inference job %s: %s", job_name, e)
+        return {
+            'statusCode': 400,
+            'body': json.dumps(f'Unknown batch inference job {job_name}: {e}')
+        }
+    file_processed = f"s3://{job_manifest['bucket_name']}/{job_manifest['object_key']}"
+    if job_status in BATCH_JOB_FAILED_STATUSES:
+        # Rows stored without the model are in the table; the job's comments are not
+        logger.error("Batch inference job %s for %s ended with status %s: %s", job_name, file_processed, job_status, job_detail.get('message'))
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'message': f'Batch inference job {job_name} ended with status {job_status}.', 'file_processed': file_processed})
+        }
+
+    # --- Take the Lease and Load the Checkpoint ---
+    # A lease error is not answered with a response: raising lets Lambda retry the event
+    checkpoint_store = None
+    checkpoint_identity = build_batch_results_identity(job_manifest['object_identity'])
+    lease_owner = getattr(context, 'aws_request_id', None) or str(uuid.uuid4())
+    resume_key = None # Output file and byte offset of the first record not stored yet
+    resume_offset = 0
+    previous_totals = Counter() # Counters of earlier invocations for this job
+    if CHECKPOINT_TABLE_NAME:
+        checkpoint_store = CheckpointStore(get_dynamodb_client(), CHECKPOINT_TABLE_NAME)
+        remaining_seconds = context.get_remaining_time_in_millis() / 1000 if context is not None else 900
+        if not checkpoint_store.acquire_lease(checkpoint_identity, lease_owner, remaining_seconds + 5):
+            logger.info("Results of batch inference job %s are already stored or being stored by another invocation. Skipping.", job_name)
+            return {
+                'statusCode': 200,
+                'body': json.dumps(f'Skipped: results of batch inference job {job_name} are already stored or being stored by another invocation.')
+            }
+        checkpoint = checkpoint_store.load(checkpoint_identity) or {}
+        if checkpoint.get('SourceKey'):
+            resume_key = checkpoint['SourceKey']
+            resume_offset = int(checkpoint.get('NextByteOffset', 0))
+            previous_totals.update({k: int(v) for k, v in (checkpoint.get('Totals') or {}).items()})
+            logger.info("Resuming batch inference results from checkpoint: %s, byte offset %s.", resume_key, resume_offset)
+
+    logger.info("Storing results of batch inference job %s for %s...", job_name, file_processed)
+    ddb_writer = BatchItemWriter(get_dynamodb_client(), DYNAMODB_TABLE_NAME, stage_timer=stage_timer, on_write=note_results_written)
+    prompt_prefix, prompt_suffix = job_manifest['prompt_prefix'], job_manifest['prompt_suffix']
+    source = build_source_attributes(job_manifest['object_key'], job_manifest['object_identity'])
+    # Results only go into the cache if they came from the prompt the cache key describes
+    cache_results = job_manifest['prompt_version'] == PROMPT_VERSION and job_manifest['model_id'] == BEDROCK_MODEL_ID
+    # recordId -> the later rows with the same comment (only texts that repeat in the file)
+    duplicate_rows = load_duplicate_rows(get_s3_client(), job_bucket, job_manifest.get('duplicates_key'))
+    run_totals = Counter() # records_returned, llm_analysis_failed, unreadable_records of this invocation
+    committed_totals = dict(previous_totals) # Cumulative counters as of the last commit
+    committed_position = (resume_key, resume_offset)
+    records_since_commit = 0
+    stopped_for_continuation = False
+
+    def commit(output_key, next_offset, status=CHECKPOINT_STATUS_IN_PROGRESS, release_lease=False):
+        """Flushes the buffered items and records that everything before next_offset is stored."""
+        nonlocal committed_totals, committed_position, records_since_commit
+        ddb_writer.flush()
+        committed_totals = dict(previous_totals + run_totals + Counter({
+            'stored_from_job': ddb_writer.written_by_tag[True],
+            'dynamodb_write_failed': ddb_writer.failed_count,
+        }))
+        committed_position = (output_key, next_offset)
+        records_since_commit = 0
+        if checkpoint_store is not None:
+            save_position(status=status, release_lease=release_lease)
+
+    def save_position(status=CHECKPOINT_STATUS_IN_PROGRESS, release_lease=False):
+        # NextRowIndex counts the output records read so far (all files); NextByteOffset is within SourceKey
+        records_read = committed_totals.get('records_returned', 0) + committed_totals.get('unreadable_records', 0)
+        checkpoint_store.save(checkpoint_identity, lease_owner, records_read, committed_position[1], [], committed_totals,
+                              status=status, release_lease=release_lease, source_key=committed_position[0])
+
+    output_key, next_offset = resume_key, resume_offset
+    try:
+        output_bucket, output_prefix = parse_s3_uri(job_manifest['output_uri'])
+        output_keys = sorted(key for key in list_object_keys(get_s3_client(), output_bucket, output_prefix + '/') if key.endswith('.jsonl.out'))
+        if resume_key is not None:
+            output_keys = [key for key in output_keys if key >= resume_key]
+        for output_key in output_keys:
+            next_offset = resume_offset if output_key == resume_key else 0
+            for line, line_end in iter_jsonl_lines_from(get_s3_client(), output_bucket, output_key, start_offset=next_offset):
+                if checkpoint_store is not None and time.monotonic() >= stop_reading_at:
+                    stopped_for_continuation = True
+                    break
+                if records_since_commit >= CHECKPOINT_INTERVAL_ROWS:
+                    commit(output_key, next_offset)
+                next_offset = line_end
+                records_since_commit += 1
+                try:
+                    record = json.loads(line)
+                    original_row_index = row_for_record_id(record['recordId'])
+                    input_text = record['modelInput']['inputText']
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.error("Unreadable record in %s: %s", output_key, e)
+                    run_totals['unreadable_records'] += 1
+                    continue
+                run_totals['records_returned'] += 1
+                comment = input_text[len(prompt_prefix):len(input_text) - len(prompt_suffix)]
+
+                model_output = record.get('modelOutput') or {}
+                raw_llm_response_text = (model_output.get('results') or [{}])[0].get('outputText')
+                if record.get('error') is not None:
+                    error = record['error']
+                    sentiment_data = {
+                        'Error': f"Batch inference error: {error.get('errorMessage', error) if isinstance(error, dict) else error}",
+                        'StatusCode': error.get('errorCode') if isinstance(error, dict) else None,
+                    }
+                elif raw_llm_response_text is None:
+                    sentiment_data = {'Error': 'Bedrock output structure unexpected', 'RawResponseSnippet': json.dumps(model_output)[:500]}
+                else:
+                    with stage_timer.time('json_extraction'):
+                        sentiment_data = parse_analysis_output(raw_llm_response_text)
+
+                analysis_succeeded = 'Error' not in sentiment_data
+                if analysis_succeeded and cache_results:
+                    analysis_cache.put(comment, sentiment_data)
+                for row_index, row_comment in [(original_row_index, comment)] + duplicate_rows.get(record['recordId'], []):
+                    if not analysis_succeeded:
+                        run_totals['llm_analysis_failed'] += 1
+                    comment_id = build_comment_id(job_manifest['object_identity'], row_index)
+                    ddb_writer.add(build_analysis_item(row_comment, row_index, comment_id, sentiment_data, model_id=job_manifest['model_id'], source=source), tag=analysis_succeeded)
+            if stopped_for_continuation:
+                break
+        # Everything read is stored; the record stays IN_PROGRESS until the continuation finishes
+        commit(output_key, next_offset, status=CHECKPOINT_STATUS_IN_PROGRESS if stopped_for_continuation else CHECKPOINT_STATUS_COMPLETE,
+               release_lease=True)
+    except Exception as e:
+        logger.error("Error storing the output of batch inference job %s: %s", job_name, e)
+        if checkpoint_store is not None:
+            # Back to the last commit, without the lease, so Lambda's retry of the event resumes there
+            try:
+                ddb_writer.flush()
+                save_position(release_lease=True)
+            except Exception as save_error:
+                logger.error("Error saving the checkpoint of batch inference job %s: %s", job_name, save_error)
+        raise
+
+    if stopped_for_continuation:
+        # The position is saved, so an EventBridge retry or a manual re-send of the event also resumes from it
+        get_lambda_client().invoke(
+            FunctionName=context.invoked_function_arn,
+            InvocationType='Event', # Asynchronous: this invocation returns immediately
+            Payload=json.dumps({'source': 'aws.bedrock', 'detail': job_detail}).encode('utf-8')
+        )
+        logger.info("Started continuation invocation for batch inference job %s from %s, byte offset %s.", job_name, output_key, next_offset)
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'message': f'Stored {run_totals["records_returned"]} batch inference results for {file_processed}; continuing in a new invocation.',
+                'batch_job_name': job_name,
+                'continuation_started': True,
+                'file_processed': file_processed
+            })
+        }
+
+    submission_totals = job_manifest['totals']
+    records_returned = committed_totals.get('records_returned', 0)
+    missing_records = submission_totals['batch_records'] - records_returned
+    if missing_records:
+        logger.warning("Batch inference job %s returned %s of %s records.", job_name, records_returned, submission_totals['batch_records'])
+    file_totals = {
+        'total_rows': submission_totals['total_rows'],
+        'comments_skipped_empty': submission_totals['comments_skipped_empty'],
+        'rule_classified': submission_totals['rule_classified'],
+        'analysis_cache_hits': submission_totals['analysis_cache_hits'],
+        'batch_records': submission_totals['batch_records'],
+        'batch_duplicate_rows': submission_totals.get('batch_duplicate_rows', 0),
+        'batch_records_missing': missing_records,
+        'llm_analysis_failed': committed_totals.get('llm_analysis_failed', 0) + committed_totals.get('unreadable_records', 0),
+        # Rows stored at submission (rule tier, cache hits) plus the job's successful results
+        'successfully_analyzed_and_stored': submission_totals['stored_without_model'] + committed_totals.get('stored_from_job', 0),
+        'dynamodb_write_failed': submission_totals['dynamodb_write_failed'] + committed_totals.get('dynamodb_write_failed', 0),
+    }
+    logger.info("Batch inference job %s stored. File totals: %s", job_name, file_totals)
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'message': f'Stored {records_returned} batch inference results for {file_processed}.',
+            'batch_job_name': job_name,
+            'batch_job_status': job_status,
+            'dynamodb_write_round_trips': ddb_writer.round_trips,
+            'stage_timings': stage_timer.summary(),
+            'file_totals': file_totals,
+            'file_processed': file_processed
+        })
+    }
+
+
+# --- Cold-Start Report ---
+# Module-level setup ends here. The report (import time, client construction time and the
+# duration of the first invocation) is logged once per container by lambda_handler().
+MODULE_IMPORT_SECONDS = time.perf_counter() - MODULE_IMPORT_START
+cold_start_report = None # Set by the first invocation of this container
+
+
 # --- Main Lambda Handler Function ---
 def lambda_handler(event, context):
+    """Entry point. Logs the cold-start report after the container's first invocation."""
+    global cold_start_report
+    if cold_start_report is not None:
+        return process_and_publish(event, context)
+    cold_start_report = {} # Marks the first invocation as started (also for fan-out workers forked from it)
+    invocation_start = time.perf_counter()
+    try:
+        return process_and_publish(event, context)
+    finally:
+        cold_start_report.update({
+            'import_ms': round(MODULE_IMPORT_SECONDS * 1000, 1),
+            'client_init_ms': round(client_init_seconds * 1000, 1),
+            'first_invocation_ms': round((time.perf_counter() - invocation_start) * 1000, 1),
+            'dynamodb_client_mode': DYNAMODB_CLIENT_MODE,
+        })
+        logger.info("Cold start: %s", json.dumps(cold_start_report))
+
+
+def process_and_publish(event, context):
+    """process_event(), then a final data version bump if it stored items since the last one."""
+    global data_version
+    if data_version is None and DATA_VERSION_TABLE_NAME:
+        data_version = DataVersion(get_dynamodb_client(), DATA_VERSION_TABLE_NAME, DATA_VERSION_MIN_INTERVAL_SECONDS)
+    try:
+        return process_event(event, context)
+    finally:
+        if data_version is not None:
+            data_version.publish()
+
+
+def process_event(event, context):
     """
     AWS Lambda handler to process CSV feedback from S3,
     analyze using Amazon Bedrock, and store results in DynamoDB.
+    Large files are checkpointed and continued in a new invocation when time runs low.
     """
-    print("Lambda function started (Bedrock version).")
-    # print("Event:", json.dumps(event)) # Use caution when logging full event in production
+    logger.info("Lambda function started (Bedrock version).")
+    # logger.debug("Event: %s", json.dumps(event)) # Use caution when logging full event in production
 
     # --- 1. Extract S3 Bucket and Key from Event ---
     bucket_name = None
     object_key = None
+    object_version_id = None # S3 version ID (only for versioned buckets)
+    object_etag = None # Identifies the object content when there is no version ID
     file_size = 0 # Initialize file size
+    is_continuation = False # True when a previous invocation handed over the rest of the file
+    shard = None # Byte range and first row of this worker's part of the file (fan-out workers only)
+    batch_job_detail = None # State change of a Bedrock batch inference job (EventBridge)
 
     # Check for S3 trigger event structure
     if 'Records' in event and len(event['Records']) > 0 and 's3' in event['Records'][0]:
-        print("Detected S3 trigger event.")
+        logger.info("Detected S3 trigger event.")
         s3_record = event['Records'][0]['s3']
         bucket_name = s3_record['bucket']['name']
         object_key = urllib.parse.unquote_plus(s3_record['object']['key'])
+        object_version_id = s3_record['object'].get('versionId')
+        object_etag = s3_record['object'].get('eTag')
         file_size = s3_record['object'].get('size', 0)
-        print(f"File size: {file_size} bytes")
+        logger.info("File size: %s bytes", file_size)
         if file_size == 0:
-             print("Warning: Received trigger for 0-byte file, skipping.")
+             logger.warning("Received trigger for 0-byte file, skipping.")
              return {'statusCode': 200, 'body': json.dumps('Skipped 0-byte file.')}
 
     # Allow a simple manual test event structure for debugging/testing
+    # (also used by the continuation invocation, which adds version_id/etag and continuation=True)
     elif 'bucket_name' in event and 'object_key' in event:
-         print("Detected potential manual test event.")
+         logger.info("Detected potential manual test event.")
          bucket_name = event['bucket_name']
          object_key = event['object_key']
+         object_version_id = event.get('version_id')
+         object_etag = event.get('etag')
+         is_continuation = bool(event.get('continuation'))
+         shard = event.get('shard')
          # For manual test, we don't have size easily, proceed assuming non-zero
-         print(f"Manual trigger for s3://{bucket_name}/{object_key}")
+         logger.info("%s trigger for s3://%s/%s", 'Continuation' if is_continuation else 'Manual', bucket_name, object_key)
+         if shard is not None:
+             logger.info("Shard %s/%s: bytes %s-%s, first row %s", shard['index'] + 1, shard['count'], shard['start_offset'], shard['end_offset'], shard['first_row_index'])
+    # Bedrock batch inference job state change, routed here by an EventBridge rule
+    elif event.get('source') == 'aws.bedrock' and isinstance(event.get('detail'), dict):
+         batch_job_detail = event['detail']
+         logger.info("Detected batch inference job event: %s is %s.", batch_job_detail.get('batchJobName'), batch_job_detail.get('status'))
     else:
-         print("Error: Could not determine S3 bucket and key from event.")
-         # print("Event structure:", json.dumps(event)) # Avoid logging potentially sensitive event data structure
+         logger.error("Could not determine S3 bucket and key from event.")
+         # logger.debug("Event structure: %s", json.dumps(event)) # Avoid logging potentially sensitive event data structure
          return {
              'statusCode': 400,
              'body': json.dumps('Invalid event structure. Expecting S3 trigger or manual input with bucket_name and object_key.')
          }
 
-    print(f"Attempting to process s3://{bucket_name}/{object_key}")
+    if batch_job_detail is None:
+        logger.info("Attempting to process s3://%s/%s", bucket_name, object_key)
 
     # --- Validate Environment Variables ---
     # Check *after* extracting S3 info so we can return 400 for bad event structure first
     if not all([S3_BUCKET_NAME, DYNAMODB_TABLE_NAME, BEDROCK_MODEL_ID]):
          missing_vars = [var_name for var_name, var_value in {'S3_BUCKET_NAME': S3_BUCKET_NAME, 'DYNAMODB_TABLE_NAME': DYNAMODB_TABLE_NAME, 'BEDROCK_MODEL_ID': BEDROCK_MODEL_ID}.items() if not var_value]
-         print(f"Error: Required environment variables are not set: {', '.join(missing_vars)}")
+         logger.error("Required environment variables are not set: %s", ', '.join(missing_vars))
          return {
              'statusCode': 500,
              'body': json.dumps(f'Configuration error: Missing environment variables: {", ".join(missing_vars)}.')
          }
     # --- Add a log about the selected model ---
-    print(f"Using Bedrock model: {BEDROCK_MODEL_ID}")
+    logger.info("Using Bedrock model: %s", BEDROCK_MODEL_ID)
+    # Hit/miss counts in the response are per invocation; the cached entries themselves persist
+    if ANALYSIS_CACHE_TABLE_NAME:
+        analysis_cache.dynamodb_client = get_dynamodb_client()
+    analysis_cache.reset_stats()
+    bedrock_rate_controller.reset_stats()
+    stage_timer.reset()
+
+    # --- Time Budget ---
+    # No Bedrock call is started or retried once only the safety margin is left. With a checkpoint
+    # table, no new rows are read once only the continuation reserve is left (at most half the
+    # invocation, so every invocation makes progress); the rest of the file goes to a new invocation.
+    invocation_start = time.monotonic()
+    remaining_seconds = context.get_remaining_time_in_millis() / 1000 if context is not None else None
+    if remaining_seconds is not None:
+        bedrock_rate_controller.set_deadline(invocation_start + remaining_seconds - DEADLINE_SAFETY_MARGIN_SECONDS)
+        stop_reading_at = invocation_start + remaining_seconds - min(CONTINUATION_RESERVE_SECONDS, remaining_seconds / 2)
+    else:
+        bedrock_rate_controller.set_deadline(float('inf'))
+        stop_reading_at = float('inf')
+
+    # --- Store the Results of a Finished Batch Inference Job ---
+    if batch_job_detail is not None:
+        return run_batch_inference_completion(batch_job_detail, context, stop_reading_at)
 
     # Optional: Validate that the event bucket matches the configured bucket
     # This adds a safety check, uncomment if you *only* want to process files
     # from the bucket specified in the environment variable.
     # if bucket_name != S3_BUCKET_NAME:
-    #     print(f"Error: Event bucket '{bucket_name}' does not match configured bucket '{S3_BUCKET_NAME}'. Stopping.")
+    #     logger.error("Event bucket '%s' does not match configured bucket '%s'. Stopping.", bucket_name, S3_BUCKET_NAME)
     #     return {
     #         'statusCode': 400,
     #         'body': json.dumps(f'Bucket mismatch: Event bucket {bucket_name} does not match configured bucket {S3_BUCKET_NAME}. Processing stopped.')
     #     }
     # else:
-    #      print(f"Event bucket '{bucket_name}' matches configured bucket '{S3_BUCKET_NAME}'.")
+    #      logger.info("Event bucket '%s' matches configured bucket '%s'.", bucket_name, S3_BUCKET_NAME)
 
 
-    # --- Initialize DynamoDB Table Resource ---
+    # --- Initialize DynamoDB Batch Writers ---
+    # Items are buffered and written in 25-item BatchWriteItem groups instead of one put_item per row.
+    # Every persist worker thread gets its own writer from the pool; the counters are summed.
+    # The client accepts plain Python types (str, int, bool) like Table.put_item does.
     try:
-        dynamodb_table = dynamodb_resource.Table(DYNAMODB_TABLE_NAME)
-        print(f"Initialized DynamoDB table resource: {DYNAMODB_TABLE_NAME}")
+        ddb_client = get_dynamodb_client()
+        ddb_writer = BatchItemWriterPool(lambda: BatchItemWriter(ddb_client, DYNAMODB_TABLE_NAME, stage_timer=stage_timer, on_write=note_results_written))
+        logger.info("Initialized DynamoDB batch writers for table: %s", DYNAMODB_TABLE_NAME)
     except Exception as e:
-        print(f"Error initializing DynamoDB table resource '{DYNAMODB_TABLE_NAME}': {e}")
+        logger.error("Error initializing DynamoDB batch writer for table '%s': %s", DYNAMODB_TABLE_NAME, e)
         return {
             'statusCode': 500,
             'body': json.dumps(f'Error initializing DynamoDB: {e}')
         }
 
-    # --- 2. Download CSV from S3 ---
-    csv_content = None
+    # --- 2. Identify the Object Version ---
+    # CommentIDs and the checkpoint are derived from bucket, key and version (or ETag), so a
+    # retried or resumed run over the same upload overwrites its own items instead of duplicating them.
+    if not object_version_id and not object_etag:
+        try:
+            head = get_s3_client().head_object(Bucket=bucket_name, Key=object_key)
+            object_version_id = head.get('VersionId')
+            object_etag = head.get('ETag')
+        except Exception as e:
+            logger.error("Error reading metadata of file %s from bucket %s: %s", object_key, bucket_name, e)
+            return {
+                'statusCode': 500,
+                'body': json.dumps(f'Error downloading file from S3: {e}')
+            }
+    object_version = object_version_id or (object_etag or '').strip('"')
+    object_identity = build_object_identity(bucket_name, object_key, object_version)
+    logger.info("Object identity: %s", object_identity)
+    # Every item names its file and upload, so get_stats/export_csv can read one file's rows by Query
+    source = build_source_attributes(object_key, object_identity)
+
+    # --- Send Very Large Files to a Bedrock Batch Inference Job ---
+    if shard is None and not is_continuation:
+        batch_job_client = get_batch_job_client()
+        if batch_job_client is not None:
+            batch_response = run_batch_inference_submission(batch_job_client, bucket_name, object_key, object_version_id, object_etag, object_identity,
+                                                            context, stop_reading_at)
+            if batch_response is not None:
+                return batch_response
+
+    # --- Fan Out Large Files ---
+    if shard is None and not is_continuation:
+        dispatcher = get_shard_dispatcher(context)
+        if dispatcher is not None:
+            if not file_size:
+                try:
+                    file_size = get_s3_client().head_object(Bucket=bucket_name, Key=object_key).get('ContentLength', 0)
+                except Exception as e:
+                    logger.warning("Could not read the size of %s: %s. Processing inline.", object_key, e)
+            if file_size >= 2 * SHARD_TARGET_BYTES:
+                fanout_response = run_fanout_coordinator(dispatcher, bucket_name, object_key, object_version_id, object_etag, object_identity, file_size)
+                if fanout_response is not None:
+                    return fanout_response
+
+    # --- 3. Load the Checkpoint and Take the Processing Lease ---
+    checkpoint_store = None
+    lease_owner = getattr(context, 'aws_request_id', None) or str(uuid.uuid4())
+    start_row_index = 2 # Row 1 is the header
+    start_byte_offset = 0
+    end_byte_offset = None # Exclusive end of this invocation's range (shards only)
+    saved_fieldnames = None
+    previous_totals = {} # Counters of earlier invocations for this object
+    # A shard is checkpointed on its own; CommentIDs still use the object identity
+    checkpoint_identity = object_identity
+    if shard is not None:
+        start_row_index = int(shard['first_row_index'])
+        start_byte_offset = int(shard['start_offset'])
+        end_byte_offset = int(shard['end_offset'])
+        saved_fieldnames = list(shard['fieldnames'])
+        checkpoint_identity = build_shard_identity(object_identity, shard['index'])
+    if CHECKPOINT_TABLE_NAME:
+        checkpoint_store = CheckpointStore(get_dynamodb_client(), CHECKPOINT_TABLE_NAME)
+        try:
+            # The lease lasts as long as this invocation can run, so a retry after a crash or
+            # timeout can take over, but a duplicate S3 delivery during the run cannot.
+            lease_seconds = (remaining_seconds if remaining_seconds is not None else 900) + 5
+            if not checkpoint_store.acquire_lease(checkpoint_identity, lease_owner, lease_seconds):
+                logger.info("%s is already complete or being processed by another invocation. Skipping.", checkpoint_identity)
+                return {
+                    'statusCode': 200,
+                    'body': json.dumps(f'Skipped: s3://{bucket_name}/{object_key} is already complete or being processed by another invocation.')
+                }
+            checkpoint = checkpoint_store.load(checkpoint_identity) or {}
+        except Exception as e:
+            logger.error("Error accessing checkpoint table '%s': %s", CHECKPOINT_TABLE_NAME, e)
+            return {
+                'statusCode': 500,
+                'body': json.dumps(f'Error accessing checkpoint table: {e}')
+            }
+        if checkpoint.get('NextRowIndex') is not None:
+            start_row_index = int(checkpoint['NextRowIndex'])
+            start_byte_offset = int(checkpoint.get('NextByteOffset', 0))
+            saved_fieldnames = list(checkpoint.get('Fieldnames') or []) or None
+            previous_totals = {k: int(v) for k, v in (checkpoint.get('Totals') or {}).items()}
+            logger.info("Resuming from checkpoint: row %s, byte offset %s.", start_row_index, start_byte_offset)
+    elif is_continuation:
+        logger.warning("Continuation event received but CHECKPOINT_TABLE_NAME is not set. Processing from the start.")
+
+    # --- 4. Open the CSV Stream from S3 ---
+    # The object body is NOT read into memory. It is decoded chunk by chunk while the rows are
+    # being analyzed, so peak memory stays flat and the first Bedrock call starts right away.
+    # When resuming, a ranged GET starts right at the first unprocessed row.
+    get_object_args = {'Bucket': bucket_name, 'Key': object_key}
+    if object_version_id:
+        get_object_args['VersionId'] = object_version_id
+    elif object_etag:
+        get_object_args['IfMatch'] = object_etag # Fail instead of mixing rows of a replaced object
+    if end_byte_offset is not None:
+        # Shard worker: read only this shard's byte range
+        get_object_args['Range'] = f'bytes={start_byte_offset}-{end_byte_offset - 1}'
+    elif start_byte_offset > 0:
+        get_object_args['Range'] = f'bytes={start_byte_offset}-'
     try:
-        print(f"Downloading s3://{bucket_name}/{object_key}...")
+        if end_byte_offset is not None and start_byte_offset >= end_byte_offset:
+            # A resumed shard whose checkpoint is already at the end of its range
+            # (S3 would ignore an empty range and return the whole object)
+            raise ClientError({'Error': {'Code': 'InvalidRange', 'Message': 'Shard range is empty'}}, 'GetObject')
+        logger.info("Opening s3://%s/%s for streaming...", bucket_name, object_key)
         # Use the bucket_name and object_key obtained from the event trigger
-        response = s3_client.get_object(Bucket=bucket_name, Key=object_key)
-        csv_content = response['Body'].read().decode('utf-8')
-        print(f"File downloaded successfully. Content length: {len(csv_content)} characters.")
+        response = get_s3_client().get_object(**get_object_args)
+        logger.info("S3 object opened successfully. Content length: %s bytes.", response.get('ContentLength', 'unknown'))
+        line_stream = CsvLineStream(response['Body'].iter_chunks(chunk_size=CSV_STREAM_CHUNK_BYTES), start_offset=start_byte_offset)
+    except ClientError as e:
+        if start_byte_offset > 0 and e.response.get('Error', {}).get('Code') == 'InvalidRange':
+            # The checkpoint already points at the end of the file: nothing left to read
+            logger.info("Checkpoint is at the end of the file. No rows left to process.")
+            line_stream = CsvLineStream(iter(()), start_offset=start_byte_offset)
+        else:
+            logger.error("Error downloading file %s from bucket %s: %s", object_key, bucket_name, e)
+            return {
+                'statusCode': 500,
+                'body': json.dumps(f'Error downloading file from S3: {e}')
+            }
     except Exception as e:
-        print(f"Error downloading file {object_key} from bucket {bucket_name}: {e}")
+        logger.error("Error downloading file %s from bucket %s: %s", object_key, bucket_name, e)
         return {
             'statusCode': 500,
             'body': json.dumps(f'Error downloading file from S3: {e}')
         }
 
-    # --- 3. Parse CSV and Extract Comments ---
-    comments = []
+    # --- 5. Read the CSV Header ---
     try:
-        csv_file = io.StringIO(csv_content)
-        # Use DictReader with explicit fieldnames if possible, or handle errors
-        # more robustly if headers might be missing or malformed.
-        # For now, assume DictReader handles header reading correctly.
-        csv_reader = csv.DictReader(csv_file)
+        # csv.DictReader consumes the decoded lines lazily, one row at a time.
+        # A resumed stream starts mid-file, so the header saved in the checkpoint is used.
+        csv_reader = csv.DictReader(line_stream, fieldnames=saved_fieldnames)
 
-        # Store original fieldnames in case we need to add missing ones later
-        fieldnames = csv_reader.fieldnames
+        # Reading fieldnames pulls only the header row from the stream
+        fieldnames = csv_reader.fieldnames or []
 
         if COMMENT_COLUMN_NAME not in fieldnames:
             error_message = f"Error: CSV file '{object_key}' does not contain a '{COMMENT_COLUMN_NAME}' column. Found columns: {fieldnames}"
-            print(error_message)
+            logger.error(error_message)
             return {
                 'statusCode': 400,
                 'body': json.dumps(error_message)
             }
 
-        print(f"CSV headers detected: {fieldnames}")
-        # Store comments as dictionaries to keep original index
-        for i, row in enumerate(csv_reader):
-            comment_text = row.get(COMMENT_COLUMN_NAME)
-            # Store even empty/whitespace comments but flag them later
-            # We store them now to keep track of the original row index for *all* rows after the header
-            comments.append({'text': comment_text, 'original_row_index': i + 2}) # +2 for header and 0-based index
-
-
-        print(f"Parsed {len(comments)} rows (including empty/whitespace comments) from CSV.")
+        logger.info("CSV headers detected: %s", fieldnames)
 
     except Exception as e:
-        print(f"Error parsing CSV file '{object_key}': {e}")
+        logger.error("Error parsing CSV file '%s': %s", object_key, e)
         return {
             'statusCode': 500,
             'body': json.dumps(f'Error parsing CSV: {e}')
         }
 
-    if not comments:
-        print("No rows found after header in the CSV file. Exiting.")
-        return {
-            'statusCode': 200,
-            'body': json.dumps('No comments processed as no rows were found after the header.')
-        }
-
-    # --- 4. Loop through Comments, Call Bedrock, Parse Response, Write to DDB ---
-    # Using counters to track outcomes
-    successfully_analyzed_and_stored = 0 # Successfully analyzed by LLM and written to DDB
+    # --- 6. Run the Rows through the Staged Pipeline, Batch-Write Results to DDB ---
+    # parse -> analyze -> normalize -> persist, with a bounded queue in front of every stage:
+    #   - parse (the coroutine below): reads rows on a worker thread, CSV_PARSE_CHUNK_ROWS at a time,
+    #     stores empty comments as skipped, labels trivial ones with the rule tier and groups the
+    #     rest BEDROCK_BATCH_SIZE at a time (one prompt per group in batched mode)
+    #   - analyze: BEDROCK_MAX_CONCURRENCY threads call Bedrock (cache, batching, single-call fallback)
+    #   - normalize: maps each analysis onto a DynamoDB item (build_analysis_item) on the event loop
+    #   - persist: DYNAMODB_WRITE_CONCURRENCY threads, each with its own 25-item batch writer
+    # When Bedrock is slower than the reader, the analyze queue fills up and the reader waits
+    # instead of pulling more of the file (backpressure), so memory stays bounded.
+    # Each result carries its own OriginalCsvRowIndex, so completion order does not matter.
+    # Using counters to track outcomes (only updated on the event loop thread, never by the stage threads)
+    # successfully_analyzed_and_stored and failed_ddb_write are read from the batch writers after each flush
+    total_rows_from_csv = 0      # Rows read by this invocation, including empty comments
     skipped_empty_comments = 0   # Comments skipped due to being empty/whitespace
+    rule_classified = 0          # Trivial comments labeled by the rule tier (no Bedrock call)
     failed_llm_analysis = 0      # LLM call failed OR parsing LLM response failed
-    failed_ddb_write = 0         # DDB write failed (after potential LLM analysis/skip)
-
-    for i, comment_info in enumerate(comments):
-        comment = comment_info.get('text', '') # Use .get with default empty string
-        original_row_index = comment_info['original_row_index']
-
-        unique_id = str(uuid.uuid4()) # Unique ID for this comment item
-
-        print(f"\n--- Processing item for Original Row: {original_row_index} (ID: {unique_id[:8]}...) ---")
-        print(f"Comment text (raw): '{comment[:200]}{'...' if len(comment) > 200 else ''}'")
-
-        # --- Add Safety Check for Empty/Whitespace Comments ---
-        if not comment or not comment.strip():
-             print(f"Comment at original row {original_row_index} is empty or whitespace-only. Skipping LLM analysis.")
-             skipped_empty_comments += 1
-             # Store a placeholder item in DDB indicating it was skipped
-             ddb_item = {
-                 'CommentID': unique_id,
-                 'OriginalComment': comment, # Store the original value (might be empty string)
-                 'ProcessingTimestamp': datetime.datetime.utcnow().isoformat(),
-                 'OriginalCsvRowIndex': original_row_index,
-                 'Sentiment': 'Skipped - Empty',
-                 'Category': 'Skipped - Empty',
-                 'Importance': 0, # Default numeric/boolean values
-                 'IsHighRisk': False,
-                 'LLMError': 'Comment was empty or whitespace-only',
-                 'BedrockModelId': 'N/A' # No LLM call was made
-             }
-             try:
-                 print(f"Writing skipped item {unique_id} to DynamoDB...")
-                 dynamodb_table.put_item(Item=ddb_item)
-                 print(f"Successfully wrote skipped item {unique_id}.")
-             except Exception as ddb_e:
-                 print(f"Error writing skipped item {unique_id} to DynamoDB: {ddb_e}")
-                 failed_ddb_write += 1 # Count DDB write failure even for skipped items
-
-             # failed_llm_analysis is *not* incremented here because the LLM was not called due to the check
-             continue # Skip to the next comment in the loop
-        # --- End Safety Check ---
-
-
-        # --- Construct Bedrock Prompt ---
-        bedrock_prompt = bedrock_prompt_template.format(comment_placeholder=comment)
-        # Print a snippet of the full prompt
-        print(f"Full Bedrock Prompt (snippet):\n---\n{bedrock_prompt[:500]}{'...' if len(bedrock_prompt) > 500 else ''}\n---")
-
-
-        # --- Prepare Bedrock Request Body ---
-        bedrock_request_body = {
-            "inputText": bedrock_prompt,
-            "textGenerationConfig": {
-                "maxTokenCount": 500,
-                "temperature": 0.1, # Low temp for deterministic/structured output
-                "topP": 1,
-                # Omit stopSequences entirely if not needed or causing issues
-            }
+    bedrock_invocations = 0      # invoke_model calls made (batched prompts count once)
+    csv_parse_error = None       # Set if the stream breaks mid-file (rows read so far are still stored)
+    pipeline_error = None        # Set if a pipeline stage fails (rows after the last commit are left unfinished)
+    # Resume position: every row before next_row_index is committed once the pipeline is drained
+    next_row_index = start_row_index
+    next_byte_offset = start_byte_offset
+    rows_since_checkpoint = 0
+    stopped_for_continuation = False
+    # With a checkpoint table, a row whose Bedrock call hit the invocation deadline is not stored:
+    # the checkpoint goes back to the first such row ((row index, byte offset where it starts)) and
+    # a continuation redoes it. uncommitted_rows holds what each row read since the last commit
+    # added to the totals, so the rows redone later are not counted twice.
+    first_unfinished_row = None
+    uncommitted_rows = {}
+
+    def cumulative_totals():
+        """Counters for the whole object: earlier invocations plus this one so far."""
+        this_invocation = {
+            'total_rows': total_rows_from_csv,
+            'comments_skipped_empty': skipped_empty_comments,
+            'rule_classified': rule_classified,
+            'llm_analysis_failed': failed_llm_analysis,
+            'successfully_analyzed_and_stored': ddb_writer.written_by_tag[True],
+            'dynamodb_write_failed': ddb_writer.failed_count,
+            'bedrock_invocations': bedrock_invocations,
         }
+        return {k: previous_totals.get(k, 0) + v for k, v in this_invocation.items()}
 
-        # Convert the body dictionary to a JSON string bytes
-        body_bytes = json.dumps(bedrock_request_body).encode('utf-8')
-
-        # --- Call Bedrock API and Process Response ---
-        sentiment_data = None # Initialize to None before the Bedrock/Parsing try block
-        bedrock_api_error = None # Store Bedrock API error if it occurs
-        raw_llm_response_text = None # Initialize raw text to None
-
-        try: # This try block catches Bedrock API call errors
-            print(f"Calling Bedrock API with model {BEDROCK_MODEL_ID}...")
-            bedrock_response = bedrock_runtime_client.invoke_model(
-                body=body_bytes,
-                modelId=BEDROCK_MODEL_ID,
-                contentType='application/json',
-                accept='application/json'
-            )
-            print("Bedrock API call successful.")
-
-            # --- Parse the Bedrock response body (specific to Titan Text models) ---
-            response_body = bedrock_response['body'].read().decode('utf-8')
-            bedrock_raw_response_body_str = response_body
-            # print("Bedrock Response Body:", json.dumps(json.loads(response_body), indent=2)) # Uncomment for detailed debugging
-
-            response_body_json = json.loads(response_body)
-
-            if 'results' in response_body_json and len(response_body_json['results']) > 0:
-                 raw_llm_response_text = response_body_json['results'][0].get('outputText')
-                 if raw_llm_response_text is None:
-                      print("Warning: Bedrock response 'results' found, but 'outputText' is missing or None.")
-                      # raw_llm_response_text remains None, parsing block will handle it
+    # Position and totals as of the last successful drain and flush: what a checkpoint may record.
+    # After a pipeline failure the rows read since then are not all written, so it stays behind them.
+    committed_row_index, committed_byte_offset, committed_totals = start_row_index, start_byte_offset, cumulative_totals()
 
-
-                 print(f"Extracted outputText: '{raw_llm_response_text[:500]}{'...' if len(raw_llm_response_text) > 500 else ''}'")
-            else:
-                 print("Warning: Bedrock response did not contain expected 'results' or 'outputText' structure.")
-                 # Set sentiment_data to indicate output structure issue immediately
-                 sentiment_data = {'Error': 'Bedrock output structure unexpected', 'RawResponseSnippet': bedrock_raw_response_body_str[:500]}
-                 failed_llm_analysis += 1 # Count as LLM analysis failure
-
-
-        except bedrock_runtime_client.exceptions.ModelErrorException as model_err:
-             error_message = model_err.message
-             status_code = model_err.response['ResponseMetadata']['HTTPStatusCode']
-             error_body = model_err.response.get('body', b'').decode('utf-8')
-
-             print(f"Bedrock Model Error for comment '{comment[:50]}...': Status: {status_code}, Message: {error_message}, Body: {error_body[:200]}")
-             # Store Bedrock API error details in bedrock_api_error, parsing won't happen
-             bedrock_api_error = {
-                 'Error': f'Bedrock Model Error: {error_message}',
-                 'StatusCode': status_code,
-                 'RawResponseSnippet': error_body[:500]
-             }
-             failed_llm_analysis += 1 # Count as LLM analysis failure (call failed)
+    def save_checkpoint(status=CHECKPOINT_STATUS_IN_PROGRESS, release_lease=False):
+        """Records the committed progress (see drain_and_flush in run_pipeline)."""
+        try:
+            checkpoint_store.save(checkpoint_identity, lease_owner, committed_row_index, committed_byte_offset, fieldnames,
+                                  committed_totals, status=status, release_lease=release_lease)
+            logger.info("Checkpoint saved: next row %s, byte offset %s, status %s.", committed_row_index, committed_byte_offset, status)
+            return True
         except Exception as e:
-             print(f"An unexpected error occurred during Bedrock call setup or initial response read for comment '{comment[:50]}...': {e}")
-             # Store general Bedrock call error details
-             bedrock_api_error = {'Error': f'Unexpected Bedrock call error: {e}', 'RawResponseSnippet': None}
-             failed_llm_analysis += 1 # Count as LLM analysis failure (call failed)
-
-
-        # --- Attempt to parse the extracted text as JSON (ONLY if Bedrock call succeeded and no structural error) ---
-        # This try block catches errors during parsing the outputText
-        if raw_llm_response_text is not None and sentiment_data is None: # Only try parsing if we got outputText and no output structure error
-             try:
-                  text_to_parse = raw_llm_response_text.strip()
-                  json_object_str = None # Variable to hold the string that should be JSON
-
-                  # **Revised JSON extraction logic:** Find the first { and last }
-                  first_brace = text_to_parse.find('{')
-                  last_brace = text_to_parse.rfind('}')
-
-                  if first_brace != -1 and last_brace != -1 and last_brace > first_brace:
-                      # Extract the content between the first { and last } (inclusive)
-                      json_object_str = text_to_parse[first_brace : last_brace + 1].strip()
-                      print(f"Extracted potential JSON object using first {{ and last }}.")
-                  else:
-                      # If curly braces aren't found, it's not a valid JSON object output
-                      print("Error: Could not find JSON object markers ({}) in Bedrock output.")
-                      # Set sentiment_data to an error state to be stored in DDB
-                      sentiment_data = {'Error': 'Could not find JSON object in output text', 'RawResponseSnippet': raw_llm_response_text[:500]}
-                      failed_llm_analysis += 1 # Count as LLM analysis failure
-                      # Skip the json.loads step below
-
-
-                  # Now attempt to parse the extracted string (if extraction was successful)
-                  if json_object_str and sentiment_data is None: # Check sentiment_data is still None (no extraction error)
-                     parsed_json_data = json.loads(json_object_str)
-                     print("Successfully parsed extracted JSON string.")
-
-                     # --- Add logic to handle the {"rows": [...]} wrapping ---
-                     if isinstance(parsed_json_data, dict) and 'rows' in parsed_json_data and isinstance(parsed_json_data['rows'], list) and len(parsed_json_data['rows']) > 0 and isinstance(parsed_json_data['rows'][0], dict):
-                          # Found the expected wrapping, extract the inner dictionary
-                          sentiment_data = parsed_json_data['rows'][0]
-                          print("Unwrapped JSON from {'rows': [...]} structure.")
-                     else:
-                          # Assume the parsed data IS the expected sentiment_data structure
-                          sentiment_data = parsed_json_data
-                          print("Parsed JSON is the expected structure (or unwrapping not needed).")
-
-
-                     # Basic validation of parsed JSON structure and types (using the potentially unwrapped data)
-                     if sentiment_data: # Ensure sentiment_data is not None after unwrapping attempt
-                         expected_keys = ['sentiment', 'category', 'importance', 'isHighRisk']
-                         missing_keys = [key for key in expected_keys if key not in sentiment_data]
-                         if missing_keys:
-                             print(f"Warning: Parsed JSON response missing expected keys: {missing_keys}. Data: {sentiment_data}")
-                             # We still count this as a successful analysis/parse, but log the warning.
-
-                         # Optional: Validate value types/ranges if needed more strictly before DDB write
-                         # e.g., Check if sentiment is one of the allowed strings, importance is 1-5, isHighRisk is bool
-
-                     else: # This case means parsed_json_data was empty or did not contain the expected 'rows' structure correctly
-                         print("Error: Parsed JSON data was unexpectedly empty or invalid after unwrapping attempt.")
-                         sentiment_data = {'Error': 'Parsed JSON empty or invalid after unwrapping', 'RawResponseSnippet': json_object_str[:500]}
-                         failed_llm_analysis += 1 # Count as LLM analysis failure
-
-
-             except json.JSONDecodeError as j:
-                  print(f"Error parsing extracted content as JSON: {j}")
-                  print(f"Content that failed parsing: '{json_object_str}'") # Log the extracted content that failed
-                  sentiment_data = {'Error': f'JSON parsing failed: {j}', 'RawResponseSnippet': json_object_str[:500]}
-                  failed_llm_analysis += 1 # Count as LLM analysis failure
-             except Exception as e: # Catch other potential errors during parsing/unwrapping
-                  print(f"Unexpected error during Bedrock output parsing/unwrapping: {e}")
-                  # Log the content that caused error if available, default to raw outputText
-                  content_snippet = json_object_str[:500] if json_object_str else (raw_llm_response_text[:500] if raw_llm_response_text else None)
-                  sentiment_data = {'Error': f'Bedrock content parsing/unwrapping error: {e}', 'RawResponseSnippet': content_snippet}
-                  failed_llm_analysis += 1 # Count as LLM analysis failure
-
-        # Note: If raw_llm_response_text was None initially, sentiment_data remains None or was set by the output structure check.
-        # If Bedrock API failed, sentiment_data was set by the except block.
-        # The logic below now correctly handles sentiment_data being None, an error dict, or a parsed result dict.
-
-
-        # --- Prepare Data Item for DynamoDB ---
-        ddb_item = {
-            'CommentID': unique_id,
-            'OriginalComment': comment,
-            'ProcessingTimestamp': datetime.datetime.utcnow().isoformat(),
-            'OriginalCsvRowIndex': original_row_index,
-            'BedrockModelId': BEDROCK_MODEL_ID # Always record which model was attempted (even if analysis failed)
-        }
+            logger.error("Error saving checkpoint for %s: %s", checkpoint_identity, e)
+            return False
+
+    def analyze_stage(comment_infos):
+        # Analyze threads: one Bedrock round (or cache hits) per group
+        analyzed_comments, invocations = analyze_comment_batch(comment_infos)
+        return [(analyzed_comments, invocations, None)]
+
+    def normalize_stage(analyzed_group):
+        # Event loop: (comment_info, sentiment_data) pairs -> (ddb_item, analysis_succeeded)
+        nonlocal failed_llm_analysis, bedrock_invocations
+        analyzed_comments, invocations, model_id = analyzed_group
+        bedrock_invocations += invocations
+        items = []
+        for comment_info, sentiment_data in analyzed_comments:
+            original_row_index = comment_info['original_row_index']
+            if checkpoint_store is not None and sentiment_data.get('DeadlineExceeded'):
+                note_unfinished_row(comment_info)
+                continue
+            analysis_succeeded = 'Error' not in sentiment_data
+            if not analysis_succeeded:
+                failed_llm_analysis += 1
+            note_row_totals(original_row_index, 'successfully_analyzed_and_stored' if analysis_succeeded else 'llm_analysis_failed')
+            # Deterministic ID (object version + row), assigned when the row was read
+            ddb_item = build_analysis_item(comment_info['text'], comment_info['original_row_index'], comment_info['comment_id'], sentiment_data, model_id=model_id, source=source)
+            items.append((ddb_item, analysis_succeeded))
+        return items
+
+    def note_row_totals(original_row_index, *names):
+        # Event loop only (read loop and normalize stage)
+        if checkpoint_store is not None:
+            uncommitted_rows.setdefault(original_row_index, Counter()).update(names)
+
+    def note_unfinished_row(comment_info):
+        nonlocal first_unfinished_row
+        position = (comment_info['original_row_index'], comment_info['byte_offset'])
+        if first_unfinished_row is None or position < first_unfinished_row:
+            first_unfinished_row = position
+
+    def persist_stage(item_and_tag):
+        # Persist threads: the pool hands each thread its own batch writer
+        ddb_item, analysis_succeeded = item_and_tag
+        ddb_writer.add(ddb_item, tag=analysis_succeeded)
+
+    pipeline = StagedPipeline()
+    pipeline.add_stage('analyze', analyze_stage, concurrency=BEDROCK_MAX_CONCURRENCY, queue_size=PIPELINE_ANALYZE_QUEUE_SIZE, blocking=True)
+    pipeline.add_stage('normalize', normalize_stage, queue_size=PIPELINE_QUEUE_SIZE)
+    pipeline.add_stage('persist', persist_stage, concurrency=DYNAMODB_WRITE_CONCURRENCY, queue_size=PIPELINE_QUEUE_SIZE, blocking=True)
+
+    async def run_pipeline():
+        nonlocal total_rows_from_csv, skipped_empty_comments, rule_classified, csv_parse_error, pipeline_error
+        nonlocal next_row_index, next_byte_offset, rows_since_checkpoint, stopped_for_continuation
+        loop = asyncio.get_running_loop()
+        pending_group = [] # Non-empty comments waiting to fill the next group
+
+        async def drain_and_flush():
+            """Finishes every row read so far and writes it, so the checkpoint can move past it."""
+            nonlocal pending_group, committed_row_index, committed_byte_offset, committed_totals
+            if pending_group:
+                await pipeline.put(pending_group)
+                pending_group = []
+            await pipeline.drain()
+            await loop.run_in_executor(None, ddb_writer.flush)
+            if first_unfinished_row is None:
+                committed_row_index, committed_byte_offset, committed_totals = next_row_index, next_byte_offset, cumulative_totals()
+                uncommitted_rows.clear()
+            else:
+                # Commit only the rows before the first unfinished one; the rest is redone (and counted) later
+                rewound = sum((counts for row_index, counts in uncommitted_rows.items() if row_index >= first_unfinished_row[0]), Counter())
+                committed_row_index, committed_byte_offset = first_unfinished_row
+                committed_totals = {name: value - rewound[name] for name, value in cumulative_totals().items()}
 
-        # Add analysis results or error info based on sentiment_data
-        if sentiment_data and 'Error' not in sentiment_data:
-            # Successfully parsed analysis results (after potential unwrapping)
-            print(f"Mapping analysis results to DynamoDB item structure for {unique_id}.")
-            # Use .get with a default in case the model misses a key or provides None/empty
-            ddb_item['Sentiment'] = sentiment_data.get('sentiment', 'Unknown')
-            ddb_item['Category'] = sentiment_data.get('category', 'Unknown')
-
-            # Handle Importance (must be DynamoDB Number)
-            # Get importance, defaulting to 0 if key is missing
-            importance = sentiment_data.get('importance')
+        logger.info("Analyzing comments with up to %s concurrent Bedrock calls, %s comment(s) per prompt, %s DynamoDB writer(s).", BEDROCK_MAX_CONCURRENCY, BEDROCK_BATCH_SIZE, DYNAMODB_WRITE_CONCURRENCY)
+        await pipeline.start()
+        try:
             try:
-                # Ensure it's treated as a number; int() is fine for DynamoDB Number type
-                # Handle cases where model might return importance as a string like "4" (as seen in logs)
-                ddb_item['Importance'] = int(importance) if importance is not None and importance != '' else 0
-            except (ValueError, TypeError):
-                 print(f"Warning: Could not parse Importance '{importance}' as integer for item {unique_id}. Storing as 0.")
-                 ddb_item['Importance'] = 0 # Default to 0 on parse failure
-
-            # Handle IsHighRisk (must be DynamoDB Boolean)
-            # Get risk, defaulting to False if key is missing
-            risk = sentiment_data.get('isHighRisk')
-            # Check explicitly for Python bool True/False or string representations ('true', 'false', 'yes', 'no')
-            if isinstance(risk, bool):
-                 ddb_item['IsHighRisk'] = risk
-            elif isinstance(risk, str):
-                 risk_lower = risk.lower()
-                 if risk_lower in ['true', 'yes']:
-                     ddb_item['IsHighRisk'] = True
-                 elif risk_lower in ['false', 'no']:
-                      ddb_item['IsHighRisk'] = False
-                 else:
-                      print(f"Warning: Could not parse IsHighRisk string '{risk}' as boolean for item {unique_id}. Storing as False.")
-                      ddb_item['IsHighRisk'] = False # Default to False on unparseable string
-            else:
-                 print(f"Warning: Could not parse IsHighRisk value '{risk}' as boolean for item {unique_id}. Storing as False.")
-                 ddb_item['IsHighRisk'] = False # Default to False for unexpected types
-
-        elif sentiment_data and 'Error' in sentiment_data:
-            # Bedrock call or parsing failed, add error details
-            print(f"Storing error details for item {unique_id} (Original Row: {original_row_index}) due to LLM analysis/parsing failure.")
-            ddb_item['LLMError'] = sentiment_data['Error']
-            if sentiment_data.get('RawResponseSnippet') is not None:
-                 ddb_item['LLMRawResponseSnippet'] = sentiment_data['RawResponseSnippet']
-            if sentiment_data.get('StatusCode') is not None:
-                 # Ensure StatusCode is stored as a Number if it's an int
-                 try:
-                      ddb_item['LLMStatusCode'] = int(sentiment_data['StatusCode'])
-                 except (ValueError, TypeError):
-                      ddb_item['LLMStatusCode'] = str(sentiment_data['StatusCode']) # Store as string if not int
-
-            # Store 'Failed Analysis' status and default values for primary attributes
-            ddb_item['Sentiment'] = 'Failed Analysis'
-            ddb_item['Category'] = 'Failed Analysis'
-            ddb_item['Importance'] = 0
-            ddb_item['IsHighRisk'] = False
-            # BedrockModelId is already added above
-
-
-        # --- Put Item into DynamoDB ---
+                row_iterator = iter_comment_rows(csv_reader, first_row_index=start_row_index, line_stream=line_stream)
+                while True:
+                    comment_infos, read_error = await loop.run_in_executor(None, read_row_chunk, row_iterator, CSV_PARSE_CHUNK_ROWS, line_stream)
+                    for comment_info in comment_infos:
+                        total_rows_from_csv += 1
+                        comment = comment_info.get('text', '') # Use .get with default empty string
+                        original_row_index = comment_info['original_row_index']
+                        comment_info['comment_id'] = build_comment_id(object_identity, original_row_index)
+                        comment_info['byte_offset'] = next_byte_offset # Where this row starts (the previous row's end)
+                        note_row_totals(original_row_index, 'total_rows')
+
+                        # --- Add Safety Check for Empty/Whitespace Comments ---
+                        if not comment or not comment.strip():
+                             logger.debug("Comment at original row %s is empty or whitespace-only. Skipping LLM analysis.", original_row_index)
+                             skipped_empty_comments += 1
+                             note_row_totals(original_row_index, 'comments_skipped_empty')
+                             # Store a placeholder item in DDB indicating it was skipped (straight to persist)
+                             # failed_llm_analysis is *not* incremented here because the LLM was not called due to the check
+                             # Tagged False so it never counts as analyzed; a failed write still counts in failed_ddb_write
+                             await pipeline.put((build_skipped_item(comment, original_row_index, comment_info['comment_id'], source=source), False), stage_name='persist')
+                        # --- End Safety Check ---
+                        else:
+                            # --- Rule Tier: Label Trivial Comments Without Calling Bedrock ---
+                            rule_match = None
+                            if rule_classifier is not None:
+                                with stage_timer.time('rule_classify'):
+                                    rule_match = rule_classifier.classify(comment)
+                            if rule_match is not None:
+                                rule_name, rule_analysis = rule_match
+                                logger.debug("Comment at original row %s matched rule '%s'. Skipping Bedrock call.", original_row_index, rule_name)
+                                rule_classified += 1
+                                note_row_totals(original_row_index, 'rule_classified')
+                                # Skips analyze; counts as successfully analyzed (tag True) once written
+                                await pipeline.put(([(comment_info, rule_analysis)], 0, rule_classifier.model_id), stage_name='normalize')
+                            else:
+                                pending_group.append(comment_info)
+                                if len(pending_group) >= BEDROCK_BATCH_SIZE:
+                                    group, pending_group = pending_group, []
+                                    await pipeline.put(group) # Waits here while the analyze queue is full
+
+                        # --- Checkpoint Bookkeeping ---
+                        next_row_index = original_row_index + 1
+                        next_byte_offset = comment_info['next_byte_offset']
+                        rows_since_checkpoint += 1
+                        if checkpoint_store is not None:
+                            if time.monotonic() >= stop_reading_at or first_unfinished_row is not None:
+                                logger.info("Remaining time is low. Stopping after row %s and handing over to a new invocation.", original_row_index)
+                                stopped_for_continuation = True
+                                break
+                            if rows_since_checkpoint >= CHECKPOINT_INTERVAL_ROWS:
+                                await drain_and_flush()
+                                save_checkpoint()
+                                rows_since_checkpoint = 0
+
+                    if stopped_for_continuation:
+                        break
+                    if read_error is not None:
+                        # Malformed CSV or undecodable bytes part-way through the file. Rows already read
+                        # are still analyzed and stored below; the response reports the error.
+                        logger.error("Error parsing CSV file '%s' after %s rows: %s", object_key, total_rows_from_csv, read_error)
+                        csv_parse_error = read_error
+                        break
+                    if len(comment_infos) < CSV_PARSE_CHUNK_ROWS:
+                        break # End of the stream
+
+                # Submit the last partial group, drain the rows still in the pipeline and flush the writes
+                await drain_and_flush()
+                if first_unfinished_row is not None and not stopped_for_continuation:
+                    # Rows hit the Bedrock deadline: the file is not complete, a continuation redoes them
+                    logger.info("Bedrock calls for rows from %s were not made before the deadline. Handing over to a new invocation.", first_unfinished_row[0])
+                    stopped_for_continuation = True
+
+            except Exception as e:
+                # A stage failed (re-raised by put()/drain()) or the writer could not flush. The pipeline
+                # has discarded its queued work, so it is not drained again: the checkpoint stays at the
+                # last committed row and the next run redoes the rest.
+                logger.error("Processing pipeline failed for '%s' after %s rows: %s", object_key, total_rows_from_csv, e)
+                pipeline_error = e
+        finally:
+            await pipeline.close()
+
+    asyncio.run(run_pipeline())
+    pipeline_stats = pipeline.get_stats()
+
+    # Count as success only if LLM analysis succeeded AND DDB write succeeded
+    successfully_analyzed_and_stored = ddb_writer.written_by_tag[True]
+    failed_ddb_write = ddb_writer.failed_count # Includes failed writes of skipped items
+
+    # --- 7. Save the Final Checkpoint / Hand Over to a Continuation Invocation ---
+    continuation_started = False
+    if checkpoint_store is not None:
+        if stopped_for_continuation and pipeline_error is None:
+            # Release the lease first so the continuation can take it over right away
+            if save_checkpoint(release_lease=True):
+                try:
+                    get_lambda_client().invoke(
+                        FunctionName=context.invoked_function_arn,
+                        InvocationType='Event', # Asynchronous: this invocation returns immediately
+                        Payload=json.dumps({
+                            'bucket_name': bucket_name,
+                            'object_key': object_key,
+                            'version_id': object_version_id,
+                            'etag': object_etag,
+                            'continuation': True,
+                            'shard': shard, # Shard workers continue within their own range
+                        }).encode('utf-8')
+                    )
+                    continuation_started = True
+                    logger.info("Started continuation invocation from row %s.", committed_row_index)
+                except Exception as e:
+                    # The checkpoint is saved, so an S3 retry or a manual re-run resumes from it
+                    logger.error("Error starting continuation invocation: %s", e)
+        else:
+            # After a parse error or a pipeline failure the record stays IN_PROGRESS at the last committed row
+            finished = csv_parse_error is None and pipeline_error is None
+            save_checkpoint(status=CHECKPOINT_STATUS_COMPLETE if finished else CHECKPOINT_STATUS_IN_PROGRESS, release_lease=True)
+
+    # --- 8. Report a Finished Shard to the Fan-out Completion Record ---
+    fanout_file_totals = None
+    if shard is not None and not stopped_for_continuation and csv_parse_error is None and pipeline_error is None and CHECKPOINT_TABLE_NAME:
         try:
-            print(f"Writing item {unique_id} (Original Row: {original_row_index}) to DynamoDB table {DYNAMODB_TABLE_NAME}...")
-            # Boto3 `put_item` automatically handles Python data types (str, int, bool, list, dict, None)
-            # None values mean the attribute is simply not included in the item.
-            item_to_write = {k: v for k, v in ddb_item.items() if v is not None}
-
-            response = dynamodb_table.put_item(
-                Item=item_to_write
-            )
-            print(f"Successfully wrote item {unique_id} to DynamoDB. Status: {response.get('ResponseMetadata',{}).get('HTTPStatusCode')}")
-            # Increment success counter only if LLM analysis succeeded AND DDB write succeeded
-            if sentiment_data and 'Error' not in sentiment_data:
-                 successfully_analyzed_and_stored += 1
-
+            job_store = ShardJobStore(get_dynamodb_client(), CHECKPOINT_TABLE_NAME)
+            fanout_file_totals = job_store.record_shard_result(object_identity, shard['index'], cumulative_totals())
+            if fanout_file_totals is not None:
+                logger.info("Last shard finished. Fan-out job for %s is complete: %s", object_identity, fanout_file_totals)
         except Exception as e:
-            print(f"Error writing item {unique_id} to DynamoDB: {e}")
-            failed_ddb_write += 1
-
+            logger.error("Error recording result of shard %s: %s", shard['index'], e)
 
-    print(f"\n--- Lambda function finished processing {len(comments)} original rows ---")
-    total_rows_from_csv = len(comments)
-
-    print(f"\n--- Final Summary ---")
-    print(f"Total comments found in CSV: {total_rows_from_csv}")
-    print(f"Comments skipped (empty/whitespace): {skipped_empty_comments}")
-    print(f"LLM analysis failed or parsing response failed: {failed_llm_analysis}")
-    print(f"Successfully analyzed by LLM and stored in DDB: {successfully_analyzed_and_stored}")
-    print(f"DynamoDB write failed: {failed_ddb_write}")
+    if total_rows_from_csv == 0 and start_row_index == 2 and csv_parse_error is None and pipeline_error is None:
+        logger.info("No rows found after header in the CSV file. Exiting.")
+        return {
+            'statusCode': 200,
+            'body': json.dumps('No comments processed as no rows were found after the header.')
+        }
 
+    logger.info("--- Lambda function finished processing %s original rows (rows %s to %s) ---", total_rows_from_csv, start_row_index, next_row_index - 1)
+
+    logger.info("--- Final Summary ---")
+    logger.info("Total comments found in CSV: %s", total_rows_from_csv)
+    logger.info("Comments skipped (empty/whitespace): %s", skipped_empty_comments)
+    logger.info("Comments labeled by the rule tier: %s", rule_classified)
+    logger.info("LLM analysis failed or parsing response failed: %s", failed_llm_analysis)
+    logger.info("Successfully analyzed by LLM and stored in DDB: %s", successfully_analyzed_and_stored)
+    logger.info("DynamoDB write failed: %s", failed_ddb_write)
+    logger.info("DynamoDB write round trips: %s", ddb_writer.round_trips)
+    logger.info("Bedrock invocations: %s", bedrock_invocations)
+    throttling_stats = bedrock_rate_controller.get_stats()
+    logger.info("Bedrock rate controller: %s", throttling_stats)
+    cache_stats = analysis_cache.get_stats()
+    logger.info("Analysis cache: %s memory hits, %s persistent hits, %s misses", cache_stats['memory_hits'], cache_stats['persistent_hits'], cache_stats['misses'])
+    stage_timings = stage_timer.summary()
+    logger.info("Stage timings (ms): %s", stage_timings)
+    logger.info("Pipeline stages: %s", pipeline_stats)
+
+    # --- Emit Stage Metrics (CloudWatch Embedded Metric Format) ---
+    # EMF must be a raw JSON log line, so it is printed directly instead of going through the
+    # logger (whose format adds a level/timestamp prefix). CloudWatch turns it into metrics.
+    if METRICS_NAMESPACE:
+        print(json.dumps(stage_timer.to_emf(
+            METRICS_NAMESPACE,
+            {'Function': 'ProcessFeedback'},
+            {
+                'RowsProcessed': total_rows_from_csv,
+                'RuleClassified': rule_classified,
+                'BedrockInvocations': bedrock_invocations,
+                'LLMAnalysisFailed': failed_llm_analysis,
+                'DynamoDBWriteFailed': failed_ddb_write,
+            }
+        )))
+
+    # Counters are for this invocation; the checkpoint record holds the totals for the whole file
+    summary = {
+        'message': f'CSV processing complete. Total comments found: {total_rows_from_csv}.',
+        'comments_skipped_empty': skipped_empty_comments,
+        'rule_classified': rule_classified,
+        'llm_analysis_failed': failed_llm_analysis,
+        'successfully_analyzed_and_stored': successfully_analyzed_and_stored,
+        'dynamodb_write_failed': failed_ddb_write,
+        'dynamodb_write_round_trips': ddb_writer.round_trips,
+        'bedrock_invocations': bedrock_invocations,
+        'bedrock_throttling': throttling_stats,
+        'analysis_cache': cache_stats,
+        'stage_timings': stage_timings,
+        'pipeline': pipeline_stats,
+        'file_processed': f's3://{bucket_name}/{object_key}'
+    }
+    if checkpoint_store is not None:
+        summary['checkpoint'] = {
+            'start_row_index': start_row_index,
+            'next_row_index': committed_row_index,
+            'continuation_started': continuation_started,
+            'file_totals': committed_totals,
+        }
+    if shard is not None:
+        summary['shard'] = {
+            'index': shard['index'],
+            'count': shard['count'],
+            'shard_totals': cumulative_totals(),
+            'fanout_file_totals': fanout_file_totals, # Set only by the worker that completed the job
+        }
+    if stopped_for_continuation:
+        summary['message'] = f'Processed rows {start_row_index} to {committed_row_index - 1}; the rest of the file continues in a new invocation.'
+    if pipeline_error is not None:
+        summary['message'] = f'Processing pipeline failed after {total_rows_from_csv} rows: {pipeline_error}'
+        summary['pipeline_error'] = f'{type(pipeline_error).__name__}: {pipeline_error}'
+        return {
+            'statusCode': 500,
+            'body': json.dumps(summary)
+        }
+    if csv_parse_error is not None:
+        summary['message'] = f'Error parsing CSV after {total_rows_from_csv} rows: {csv_parse_error}'
+        return {
+            'statusCode': 500,
+            'body': json.dumps(summary)
+        }
 
     return {
         'statusCode': 200,
-        'body': json.dumps({
-            'message': f'CSV processing complete. Total comments found: {total_rows_from_csv}.',
-            'comments_skipped_empty': skipped_empty_comments,
-            'llm_analysis_failed': failed_llm_analysis,
-            'successfully_analyzed_and_stored': successfully_analyzed_and_stored,
-            'dynamodb_write_failed': failed_ddb_write,
-            'file_processed': f's3://{bucket_name}/{object_key}'
-        })
-    }
\ No newline at end of file
+        'body': json.dumps(summary)
+    }
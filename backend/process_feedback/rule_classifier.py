@@ -0,0 +1,126 @@
+import re
+import json
+import hashlib
+import unicodedata
+
+from analysis_cache import normalize_comment
+
+# --- Constants ---
+# Written to BedrockModelId for rule-classified comments (followed by the lexicon version),
+# so they can be told apart from model results in the table and in the CSV export.
+RULE_TIER_MODEL_ID_PREFIX = 'rule-based'
+
+# Punctuation, symbols and emoticon filler around a short answer ("なし。", "Thanks!!", "- n/a -")
+EDGE_FILLER_PATTERN = re.compile(r'^[\s\W_ー〜～]+|[\s\W_ー〜～]+$')
+
+# Built-in lexicon. Phrases and patterns must match the WHOLE comment after normalization
+# (NFKC, collapsed whitespace, case folding) and removal of leading/trailing punctuation,
+# so a longer comment that merely contains "thanks" still goes to the model.
+DEFAULT_RULES = [
+    {
+        'name': 'no_comment',
+        'phrases': [
+            'none', 'no', 'nope', 'nothing', 'nothing special', 'nothing in particular', 'nothing to add',
+            'no comment', 'no comments', 'n/a', 'na', 'nil', 'not applicable',
+            'なし', '無し', 'ない', '特になし', '特に無し', '特にない', '特にありません', '特にないです',
+            'ありません', 'ないです', '特記事項なし', 'とくになし',
+        ],
+        'patterns': [r'(特に)?(なし|無し|ない|ありません)(です)?'],
+        'result': {'sentiment': 'Neutral', 'category': 'Other', 'importance': 1, 'isHighRisk': False},
+    },
+    {
+        'name': 'thanks',
+        'phrases': [
+            'thanks', 'thank you', 'thank you very much', 'thanks a lot', 'thx', 'ty',
+            'ありがとう', 'ありがとうございます', 'ありがとうございました', 'お疲れ様でした', 'おつかれさまでした',
+        ],
+        'patterns': [r'(どうも|本当に|ほんとうに)?ありがとう(ございます|ございました)?'],
+        'result': {'sentiment': 'Positive', 'category': 'Other', 'importance': 1, 'isHighRisk': False},
+    },
+    {
+        'name': 'short_positive',
+        'phrases': [
+            'good', 'very good', 'great', 'excellent', 'nice',
+            '良かった', 'よかった', '良かったです', 'よかったです', '満足', '満足です', '楽しかった', '楽しかったです',
+        ],
+        'patterns': [],
+        'result': {'sentiment': 'Positive', 'category': 'Other', 'importance': 1, 'isHighRisk': False},
+    },
+    {
+        # A bare "ok"/"fine" in course feedback is lukewarm at best, not praise
+        'name': 'short_neutral',
+        'phrases': ['ok', 'okay', 'fine'],
+        'patterns': [],
+        'result': {'sentiment': 'Neutral', 'category': 'Other', 'importance': 1, 'isHighRisk': False},
+    },
+]
+
+# Result for comments with no letters or digits at all ("-", "...", "???") or shorter than the minimum length
+NO_CONTENT_RESULT = {'sentiment': 'Neutral', 'category': 'Other', 'importance': 1, 'isHighRisk': False}
+
+
+def load_rules(lexicon_path=None):
+    """Returns the rule list from a JSON file (same shape as DEFAULT_RULES), or the built-in lexicon."""
+    if not lexicon_path:
+        return DEFAULT_RULES
+    with open(lexicon_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def has_content(text):
+    """True if the text contains at least one letter or digit (any script)."""
+    return any(unicodedata.category(ch)[0] in ('L', 'N') for ch in text)
+
+
+def is_too_short(text, min_length):
+    """
+    True if the text is shorter than min_length characters. A single kanji/kana ("良", "神")
+    can be a real answer, so text with CJK characters is never too short.
+    """
+    if len(text) >= min_length:
+        return False
+    return not any(unicodedata.name(ch, '').startswith(('CJK', 'HIRAGANA', 'KATAKANA')) for ch in text)
+
+
+class RuleClassifier:
+    """
+    Cheap pre-classification of trivial comments ("none", "特になし", "thanks", "-") so they skip Bedrock.
+
+    The lexicon is compiled once: exact phrases go into a dict (one lookup per comment) and
+    the regex patterns of each rule into one anchored alternation. Comments without letters or
+    digits, or shorter than min_length characters (Latin text only), get NO_CONTENT_RESULT.
+    classify() returns (rule_name, analysis_dict) or None when the comment needs the model.
+    """
+
+    def __init__(self, rules, min_length=2):
+        self.min_length = min_length
+        self._phrase_index = {} # normalized phrase -> rule
+        self._compiled_patterns = [] # (compiled regex, rule)
+        for rule in rules:
+            for phrase in rule.get('phrases', []):
+                self._phrase_index.setdefault(self.normalize(phrase), rule)
+            if rule.get('patterns'):
+                combined = '|'.join(f'(?:{pattern})' for pattern in rule['patterns'])
+                self._compiled_patterns.append((re.compile(f'(?:{combined})'), rule))
+        # Part of BedrockModelId, so a lexicon change is visible in the stored items
+        version_source = json.dumps({'rules': rules, 'min_length': min_length}, sort_keys=True, ensure_ascii=False)
+        self.version = hashlib.sha256(version_source.encode('utf-8')).hexdigest()[:12]
+        self.model_id = f"{RULE_TIER_MODEL_ID_PREFIX}:{self.version}"
+
+    @staticmethod
+    def normalize(comment):
+        return EDGE_FILLER_PATTERN.sub('', normalize_comment(comment))
+
+    def classify(self, comment):
+        normalized = self.normalize(comment)
+        if not has_content(normalized) or is_too_short(normalized, self.min_length):
+            return 'no_content', dict(NO_CONTENT_RESULT)
+        rule = self._phrase_index.get(normalized)
+        if rule is None:
+            for pattern, candidate in self._compiled_patterns:
+                if pattern.fullmatch(normalized):
+                    rule = candidate
+                    break
+        if rule is None:
+            return None
+        return rule['name'], dict(rule['result'])
@@ -0,0 +1,195 @@
+import csv
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+from botocore.exceptions import ClientError
+
+# --- Constants ---
+FANOUT_STATUS_RUNNING = 'RUNNING'
+FANOUT_STATUS_COMPLETE = 'COMPLETE'
+
+
+def build_shard_identity(object_identity, shard_index):
+    """Identity of one shard of an object version (used for the shard's own checkpoint)."""
+    return f"{object_identity}#shard={shard_index}"
+
+
+def plan_shards(line_stream, target_shard_bytes):
+    """
+    Splits a CSV into row-aligned byte ranges of about target_shard_bytes each.
+
+    line_stream is a CsvLineStream over the whole object. The file is parsed once with
+    csv.reader, so a boundary never falls inside a quoted multi-line field, and every shard
+    knows the row index it starts at (CommentIDs stay the same as in unsharded processing).
+    Returns (fieldnames, shards); each shard is a dict with index, start_offset, end_offset
+    (exclusive) and first_row_index. No Bedrock calls happen here.
+    """
+    reader = csv.reader(line_stream)
+    fieldnames = next(reader, None)
+    if fieldnames is None:
+        return [], []
+
+    shards = []
+    shard_start = line_stream.bytes_consumed # First byte after the header row
+    shard_first_row = 2 # Row 1 is the header
+    row_index = 1
+    for _ in reader:
+        row_index += 1
+        if line_stream.bytes_consumed - shard_start >= target_shard_bytes:
+            shards.append({
+                'index': len(shards),
+                'start_offset': shard_start,
+                'end_offset': line_stream.bytes_consumed,
+                'first_row_index': shard_first_row,
+            })
+            shard_start = line_stream.bytes_consumed
+            shard_first_row = row_index + 1
+    if row_index >= shard_first_row:
+        # Rows after the last full shard
+        shards.append({
+            'index': len(shards),
+            'start_offset': shard_start,
+            'end_offset': line_stream.bytes_consumed,
+            'first_row_index': shard_first_row,
+        })
+    return fieldnames, shards
+
+
+def sum_shard_totals(totals_list):
+    """Adds up the per-shard summary counters into totals for the whole file."""
+    file_totals = {}
+    for totals in totals_list:
+        for key, value in (totals or {}).items():
+            file_totals[key] = file_totals.get(key, 0) + int(value)
+    return file_totals
+
+
+class ShardJobStore:
+    """
+    Completion record of one fan-out job, stored in the checkpoint table (partition key
+    'CheckpointId') next to the per-shard checkpoints.
+
+    The coordinator creates the record with the shard count. Each worker adds its shard index
+    to the CompletedShards string set and its counters to ShardTotals; both updates are
+    idempotent, so a retried shard is never counted twice. The worker that completes the set
+    adds up ShardTotals into FileTotals and marks the job COMPLETE.
+    """
+
+    def __init__(self, dynamodb_client, table_name):
+        # dynamodb_client must accept plain Python types (e.g. dynamodb_resource.meta.client)
+        self.dynamodb_client = dynamodb_client
+        self.table_name = table_name
+
+    @staticmethod
+    def job_id(object_identity):
+        return hashlib.sha256(f"{object_identity}#fanout".encode('utf-8')).hexdigest()
+
+    def create_job(self, object_identity, shard_count):
+        """
+        Creates the completion record. Returns False if a job for this object version already
+        exists (a duplicate S3 delivery), in which case nothing should be dispatched.
+        """
+        now = int(time.time())
+        try:
+            self.dynamodb_client.put_item(
+                TableName=self.table_name,
+                Item={
+                    'CheckpointId': self.job_id(object_identity),
+                    'ObjectIdentity': object_identity,
+                    'JobStatus': FANOUT_STATUS_RUNNING,
+                    'ShardCount': shard_count,
+                    'ShardTotals': {},
+                    'CreatedAt': now,
+                    'UpdatedAt': now,
+                },
+                ConditionExpression='attribute_not_exists(CheckpointId)'
+            )
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def record_shard_result(self, object_identity, shard_index, totals):
+        """
+        Records one finished shard. Returns the file totals if this call completed the job,
+        otherwise None.
+        """
+        job_id = self.job_id(object_identity)
+        response = self.dynamodb_client.update_item(
+            TableName=self.table_name,
+            Key={'CheckpointId': job_id},
+            UpdateExpression='SET ShardTotals.#shard = :totals, UpdatedAt = :now ADD CompletedShards :shard_set',
+            ExpressionAttributeNames={'#shard': str(shard_index)},
+            ExpressionAttributeValues={
+                ':totals': totals,
+                ':now': int(time.time()),
+                ':shard_set': {str(shard_index)},
+            },
+            ReturnValues='ALL_NEW'
+        )
+        job = response.get('Attributes', {})
+        if len(job.get('CompletedShards', ())) < int(job.get('ShardCount', 0)) or job.get('JobStatus') == FANOUT_STATUS_COMPLETE:
+            return None
+
+        file_totals = sum_shard_totals(job.get('ShardTotals', {}).values())
+        try:
+            self.dynamodb_client.update_item(
+                TableName=self.table_name,
+                Key={'CheckpointId': job_id},
+                UpdateExpression='SET FileTotals = :file_totals, JobStatus = :complete, UpdatedAt = :now',
+                ConditionExpression='JobStatus <> :complete',
+                ExpressionAttributeValues={
+                    ':file_totals': file_totals,
+                    ':complete': FANOUT_STATUS_COMPLETE,
+                    ':now': int(time.time()),
+                }
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return None # Another worker finished the job at the same time
+            raise
+        return file_totals
+
+
+# --- Shard Dispatchers ---
+class LambdaShardDispatcher:
+    """Starts one asynchronous worker invocation of the function per shard."""
+
+    # Results arrive through the completion record, not from dispatch()
+    returns_results = False
+
+    def __init__(self, lambda_client, function_name):
+        self.lambda_client = lambda_client
+        self.function_name = function_name
+
+    def dispatch(self, shard_events):
+        for shard_event in shard_events:
+            self.lambda_client.invoke(
+                FunctionName=self.function_name,
+                InvocationType='Event',
+                Payload=json.dumps(shard_event).encode('utf-8')
+            )
+        return None
+
+
+class LocalProcessPoolDispatcher:
+    """
+    Stand-in for Lambda fan-out: runs each shard through the handler in a local process pool
+    and returns the shard responses in shard order. Used for offline testing and benchmarks.
+    initializer runs once in every worker process (e.g. to install stub clients).
+    """
+
+    returns_results = True
+
+    def __init__(self, handler, max_workers, initializer=None, initargs=()):
+        self.handler = handler # Module-level function, so it can be pickled
+        self.max_workers = max_workers
+        self.initializer = initializer
+        self.initargs = initargs
+
+    def dispatch(self, shard_events):
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=self.initializer, initargs=self.initargs) as executor:
+            return list(executor.map(self.handler, shard_events, [None] * len(shard_events)))
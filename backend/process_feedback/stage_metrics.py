@@ -0,0 +1,100 @@
+import math
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+# --- Constants ---
+# Samples kept per stage for the percentiles. Above this, reservoir sampling keeps a uniform
+# sample, so memory stays bounded however many rows a file has (count/total/max stay exact).
+MAX_SAMPLES_PER_STAGE = 10000
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list (fraction in 0..1)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class StageTimer:
+    """
+    Collects wall-clock durations per pipeline stage (S3 download, CSV parse, prompt build,
+    Bedrock call, JSON extraction, DynamoDB write) and summarizes them as count/total/p50/p95/max.
+    Thread-safe: the Bedrock worker threads record into the same timer.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drops all samples (call at the start of each invocation)."""
+        with self._lock:
+            self._stages = {} # stage -> {'count', 'total', 'max', 'samples'}
+
+    def record(self, stage, seconds):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = {'count': 0, 'total': 0.0, 'max': 0.0, 'samples': []}
+            stats['count'] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            if len(stats['samples']) < MAX_SAMPLES_PER_STAGE:
+                stats['samples'].append(seconds)
+            else:
+                slot = random.randrange(stats['count'])
+                if slot < MAX_SAMPLES_PER_STAGE:
+                    stats['samples'][slot] = seconds
+
+    @contextmanager
+    def time(self, stage):
+        """with stage_timer.time('bedrock_call'): ... records the duration of the block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def summary(self):
+        """{stage: {count, total_ms, p50_ms, p95_ms, max_ms}} for every stage recorded so far."""
+        with self._lock:
+            stages = {stage: (stats['count'], stats['total'], stats['max'], sorted(stats['samples'])) for stage, stats in self._stages.items()}
+        return {
+            stage: {
+                'count': count,
+                'total_ms': round(total * 1000, 3),
+                'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+                'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+                'max_ms': round(maximum * 1000, 3),
+            }
+            for stage, (count, total, maximum, samples) in stages.items()
+        }
+
+    def to_emf(self, namespace, dimensions, extra_metrics=None):
+        """
+        Builds one CloudWatch Embedded Metric Format record with <stage>_p50/_p95/_max metrics
+        (milliseconds) plus extra_metrics ({name: count}). Print it as a single JSON line and
+        CloudWatch extracts the metrics from the log, no PutMetricData call needed.
+        """
+        record = dict(dimensions)
+        metric_definitions = []
+        for stage, stats in self.summary().items():
+            for statistic in ('p50', 'p95', 'max'):
+                name = f"{stage}_{statistic}"
+                record[name] = stats[f"{statistic}_ms"]
+                metric_definitions.append({'Name': name, 'Unit': 'Milliseconds'})
+        for name, value in (extra_metrics or {}).items():
+            record[name] = value
+            metric_definitions.append({'Name': name, 'Unit': 'Count'})
+        record['_aws'] = {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [list(dimensions.keys())],
+                'Metrics': metric_definitions,
+            }],
+        }
+        return record
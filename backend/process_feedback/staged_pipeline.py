@@ -0,0 +1,138 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineStage:
+    """One stage of a StagedPipeline: a bounded input queue served by `concurrency` workers."""
+
+    def __init__(self, name, worker, concurrency, queue_size, blocking):
+        self.name = name
+        self.worker = worker
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.blocking = blocking
+        self.queue = None # Created in start(), inside the running event loop
+        self.executor = None
+        # Stats
+        self.processed = 0
+        self.max_queue_depth = 0
+        self.blocked_puts = 0 # Puts that had to wait for room in this stage's queue
+        self.blocked_seconds = 0.0
+
+
+class StagedPipeline:
+    """
+    Runs items through a chain of stages connected by bounded asyncio queues.
+
+    A worker takes one item from its stage's queue, runs the stage function on it and puts every
+    item the function returns into the next stage's queue. Stage functions with blocking=True
+    (network calls: Bedrock, DynamoDB) run in the stage's own thread pool of `concurrency` threads;
+    the others run on the event loop and must be quick.
+    put() waits while the first queue is full, and a worker waits while the next queue is full,
+    so a slow stage pushes back all the way to the producer and memory stays bounded.
+    Stage functions are expected to handle their own errors. An unexpected exception is logged,
+    stops further work and is re-raised by put()/drain().
+    """
+
+    def __init__(self):
+        self.stages = []
+        self._tasks = []
+        self._error = None
+
+    def add_stage(self, name, worker, concurrency=1, queue_size=100, blocking=False):
+        """Appends a stage. worker(item) returns an iterable of items for the next stage (or None)."""
+        self.stages.append(PipelineStage(name, worker, max(1, concurrency), max(1, queue_size), blocking))
+
+    async def start(self):
+        for stage in self.stages:
+            stage.queue = asyncio.Queue(maxsize=stage.queue_size)
+            if stage.blocking:
+                stage.executor = ThreadPoolExecutor(max_workers=stage.concurrency, thread_name_prefix=f'pipeline-{stage.name}')
+        for position, stage in enumerate(self.stages):
+            next_stage = self.stages[position + 1] if position + 1 < len(self.stages) else None
+            for _ in range(stage.concurrency):
+                self._tasks.append(asyncio.create_task(self._run_worker(stage, next_stage)))
+
+    async def put(self, item, stage_name=None):
+        """Queues an item for the first stage (or the named stage), waiting while that queue is full."""
+        self._raise_if_failed()
+        stage = self._get_stage(stage_name) if stage_name else self.stages[0]
+        await self._enqueue(stage, item)
+
+    async def drain(self):
+        """Waits until every item queued so far has gone through the last stage."""
+        # Items only move forward, so once a stage's queue is joined nothing more can arrive there
+        for stage in self.stages:
+            await stage.queue.join()
+        self._raise_if_failed()
+
+    async def close(self):
+        """Stops the workers and the stage thread pools. Call drain() first to finish the queued items."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for stage in self.stages:
+            if stage.executor is not None:
+                stage.executor.shutdown(wait=True)
+                stage.executor = None
+
+    def get_stats(self):
+        return {
+            stage.name: {
+                'concurrency': stage.concurrency,
+                'queue_size': stage.queue_size,
+                'processed': stage.processed,
+                'max_queue_depth': stage.max_queue_depth,
+                'blocked_puts': stage.blocked_puts,
+                'blocked_seconds': round(stage.blocked_seconds, 3),
+            }
+            for stage in self.stages
+        }
+
+    def _get_stage(self, name):
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        raise KeyError(f"No pipeline stage named '{name}'")
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise self._error
+
+    async def _enqueue(self, stage, item):
+        if stage.queue.full():
+            # Backpressure: the stage is behind, so the caller waits instead of buffering more
+            stage.blocked_puts += 1
+            wait_start = time.perf_counter()
+            await stage.queue.put(item)
+            stage.blocked_seconds += time.perf_counter() - wait_start
+        else:
+            stage.queue.put_nowait(item)
+        stage.max_queue_depth = max(stage.max_queue_depth, stage.queue.qsize())
+
+    async def _run_worker(self, stage, next_stage):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await stage.queue.get()
+            try:
+                if self._error is not None:
+                    continue # Pipeline has failed: discard what is left so drain() returns
+                if stage.executor is not None:
+                    outputs = await loop.run_in_executor(stage.executor, stage.worker, item)
+                else:
+                    outputs = stage.worker(item)
+                stage.processed += 1
+                if next_stage is not None:
+                    for output in outputs or ():
+                        await self._enqueue(next_stage, output)
+            except Exception as e:
+                logger.error("Unexpected error in pipeline stage '%s': %s", stage.name, e)
+                if self._error is None:
+                    self._error = e
+            finally:
+                stage.queue.task_done()
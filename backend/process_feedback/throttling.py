@@ -0,0 +1,172 @@
+import logging
+import time
+import random
+import threading
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# Error codes that mean "slow down / try again later" rather than "this request is bad"
+RETRYABLE_ERROR_CODES = {
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceUnavailableException',
+    'ModelNotReadyException',
+}
+RETRYABLE_HTTP_STATUS_CODES = {429, 503}
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a call cannot be started or retried before the invocation deadline."""
+
+
+def is_retryable_error(error):
+    """True for throttling and service-unavailable errors from a boto3 client call."""
+    if not isinstance(error, ClientError):
+        return False
+    error_code = error.response.get('Error', {}).get('Code')
+    status_code = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return error_code in RETRYABLE_ERROR_CODES or status_code in RETRYABLE_HTTP_STATUS_CODES
+
+
+class AdaptiveRateController:
+    """
+    Adaptive rate and concurrency limiter for Bedrock calls.
+
+    A token bucket caps the request rate and a separate limit caps the number of calls in flight.
+    Both follow AIMD: every success raises them additively (about +additive_increase per second
+    at full speed for the rate, +1 per limit's worth of successes for concurrency), and every
+    throttling/service-unavailable response cuts them by multiplicative_decrease (at most once
+    per decrease_cooldown_seconds, so one burst of 429s counts as one congestion signal).
+    Retries use full-jitter exponential backoff and stop at the invocation deadline.
+    The learned rate is kept across warm invocations; the counters are reset per invocation.
+    Thread-safe: shared by all Bedrock worker threads.
+    """
+
+    def __init__(self, initial_rate, min_rate, max_rate, max_concurrency, additive_increase=1.0, multiplicative_decrease=0.5,
+                 decrease_cooldown_seconds=1.0, max_attempts=8, base_backoff_seconds=0.25, max_backoff_seconds=8.0):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_concurrency = max_concurrency
+        self.additive_increase = additive_increase
+        self.multiplicative_decrease = multiplicative_decrease
+        self.decrease_cooldown_seconds = decrease_cooldown_seconds
+        self.max_attempts = max_attempts
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+
+        self._cond = threading.Condition()
+        self._rate = min(max(initial_rate, min_rate), max_rate) # Tokens (requests) per second
+        self._tokens = 1.0
+        self._last_refill = time.monotonic()
+        self._concurrency_limit = float(max_concurrency)
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._deadline = float('inf') # time.monotonic() value after which no call is started
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Zeroes the per-invocation counters (the learned rate is kept)."""
+        with self._cond:
+            self.calls = 0
+            self.retries = 0
+            self.throttle_events = 0
+            self.gave_up = 0
+
+    def set_deadline(self, deadline):
+        """Sets the time.monotonic() deadline for the current invocation."""
+        with self._cond:
+            self._deadline = deadline
+            self._cond.notify_all()
+
+    def get_stats(self):
+        with self._cond:
+            return {
+                'current_rate_per_second': round(self._rate, 3),
+                'current_concurrency_limit': int(self._concurrency_limit),
+                'calls': self.calls,
+                'retries': self.retries,
+                'throttle_events': self.throttle_events,
+                'gave_up': self.gave_up,
+            }
+
+    def call(self, fn):
+        """
+        Runs fn() under the rate/concurrency limits, retrying throttling and service-unavailable
+        errors with jittered backoff until max_attempts or the deadline. Other errors are raised
+        immediately; the last retryable error is raised once max_attempts is reached, and
+        DeadlineExceeded (from that error) when the deadline leaves no time for another attempt.
+        """
+        for attempt in range(self.max_attempts):
+            self._acquire()
+            try:
+                result = fn()
+            except Exception as e:
+                self._release()
+                if not is_retryable_error(e):
+                    raise
+                self._on_throttle()
+                backoff = random.uniform(0, min(self.max_backoff_seconds, self.base_backoff_seconds * (2 ** attempt)))
+                if attempt + 1 >= self.max_attempts:
+                    with self._cond:
+                        self.gave_up += 1
+                    raise
+                if time.monotonic() + backoff >= self._deadline:
+                    with self._cond:
+                        self.gave_up += 1
+                    raise DeadlineExceeded('Invocation deadline reached before the Bedrock call could be retried') from e
+                with self._cond:
+                    self.retries += 1
+                time.sleep(backoff)
+                continue
+            self._release()
+            self._on_success()
+            return result
+
+    def _refill(self, now):
+        # Caller holds the lock. Bucket capacity is one second of traffic (at least one token).
+        capacity = max(1.0, self._rate)
+        self._tokens = min(capacity, self._tokens + (now - self._last_refill) * self._rate)
+        self._last_refill = now
+
+    def _acquire(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now >= self._deadline:
+                    self.gave_up += 1
+                    raise DeadlineExceeded('Invocation deadline reached before the Bedrock call could start')
+                self._refill(now)
+                if self._tokens >= 1.0 and self._in_flight < int(self._concurrency_limit):
+                    self._tokens -= 1.0
+                    self._in_flight += 1
+                    self.calls += 1
+                    return
+                # Wait for the next token (or for a slot to be released, which notifies us)
+                wait_seconds = (1.0 - self._tokens) / self._rate if self._tokens < 1.0 else 0.05
+                self._cond.wait(timeout=min(wait_seconds, self._deadline - now))
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _on_success(self):
+        with self._cond:
+            # Additive increase, spread over the calls made in one second at the current rate
+            self._rate = min(self.max_rate, self._rate + self.additive_increase / self._rate)
+            self._concurrency_limit = min(float(self.max_concurrency), self._concurrency_limit + 1.0 / self._concurrency_limit)
+
+    def _on_throttle(self):
+        with self._cond:
+            self.throttle_events += 1
+            now = time.monotonic()
+            if now - self._last_decrease < self.decrease_cooldown_seconds:
+                return
+            self._last_decrease = now
+            self._rate = max(self.min_rate, self._rate * self.multiplicative_decrease)
+            self._concurrency_limit = max(1.0, self._concurrency_limit * self.multiplicative_decrease)
+            self._tokens = 0.0 # Drop any burst left in the bucket
+            logger.warning("Bedrock throttling detected. Reducing rate to %.2f/s and concurrency to %d.", self._rate, int(self._concurrency_limit))
@@ -0,0 +1,87 @@
+"""
+Cold-start benchmark: for each handler and DYNAMODB_CLIENT_MODE, imports the handler in a fresh
+interpreter and constructs the real boto3 clients an ordinary invocation needs (no request is
+sent, so no AWS account is needed):
+
+    python -m benchmarks.cold_start --repeat 5
+    python -m benchmarks.cold_start --functions get_stats --modes client resource
+
+import_ms is the handler module's own import time (MODULE_IMPORT_SECONDS, boto3 included);
+client_init_ms is the time of the get_*() calls the first invocation makes.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+from benchmarks.scenarios import BENCHMARK_ENV, REPO_ROOT, load_handler
+
+# --- Constants ---
+# Client getters called by a plain invocation of each handler (S3 upload / API request)
+HANDLER_CLIENT_GETTERS = {
+    'process_feedback': ['get_s3_client', 'get_dynamodb_client', 'get_bedrock_runtime_client'],
+    'get_stats': ['get_table'],
+    'export_csv': ['get_table'],
+}
+DYNAMODB_CLIENT_MODES = ['client', 'resource']
+
+
+def measure(function_name):
+    """Runs in the child process: import, then client construction."""
+    process_start = time.perf_counter()
+    module = load_handler(function_name)
+    load_seconds = time.perf_counter() - process_start
+    init_start = time.perf_counter()
+    for getter in HANDLER_CLIENT_GETTERS[function_name]:
+        getattr(module, getter)()
+    return {
+        'import_ms': round(module.MODULE_IMPORT_SECONDS * 1000, 1),
+        'load_ms': round(load_seconds * 1000, 1), # Includes sibling modules imported by the handler
+        'client_init_ms': round((time.perf_counter() - init_start) * 1000, 1),
+    }
+
+
+def run_child(function_name, mode):
+    env = dict(os.environ, **BENCHMARK_ENV, DYNAMODB_CLIENT_MODE=mode)
+    completed = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.cold_start', '--child', function_name],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"{function_name} ({mode}) failed:\n{completed.stderr}")
+    # The handler may print at import; the measurement is the last line
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure handler import and client construction time.')
+    parser.add_argument('--functions', nargs='+', choices=sorted(HANDLER_CLIENT_GETTERS), default=list(HANDLER_CLIENT_GETTERS))
+    parser.add_argument('--modes', nargs='+', choices=DYNAMODB_CLIENT_MODES, default=DYNAMODB_CLIENT_MODES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Optional JSON report path')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child)))
+        return
+
+    report = {}
+    for function_name in args.functions:
+        for mode in args.modes:
+            runs = [run_child(function_name, mode) for _ in range(args.repeat)]
+            summary = {key: round(statistics.median(run[key] for run in runs), 1) for key in runs[0]}
+            summary['total_ms'] = round(summary['load_ms'] + summary['client_init_ms'], 1)
+            report[f'{function_name}/{mode}'] = summary
+            print(f"  {function_name:18s} {mode:9s} import {summary['import_ms']:7.1f} ms  load {summary['load_ms']:7.1f} ms  "
+                  f"client init {summary['client_init_ms']:7.1f} ms  total {summary['total_ms']:7.1f} ms (median of {args.repeat})")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
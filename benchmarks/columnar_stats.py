@@ -0,0 +1,151 @@
+"""
+Columnar snapshot benchmark: /stats computed from a full scan (one mapped dict per item) against
+the columnar snapshot of get_stats/columnar_snapshot.py, on one synthetic table:
+
+    python -m benchmarks.columnar_stats --rows 1000000 --repeat 3
+
+Measured: the scan path (counts only, and with the comment lists), building the snapshot, an
+incremental refresh after --new-rows more items (delivered to the stream consumer, which writes
+the snapshot's change files), loading the snapshot into a cold container
+(download to the cache directory and mmap) and the vectorized aggregation on its own. Scan pages
+are not throttled here (no --dynamodb-scan-mb-per-second), so the scan times are CPU time only.
+"""
+import io
+import os
+import json
+import time
+import uuid
+import shutil
+import argparse
+import tempfile
+import statistics
+import contextlib
+
+from boto3.dynamodb.types import TypeSerializer
+
+from benchmarks import fakes
+from benchmarks.scenarios import BENCHMARK_ENV, TABLE_NAME, SNAPSHOT_S3_URI, load_handler, install_fakes, seed_analysis_table
+
+
+def timed(function, repeat):
+    """(last result, median seconds) of repeat calls."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        durations.append(time.perf_counter() - start)
+    return result, statistics.median(durations)
+
+
+def quiet(function):
+    """Calls function with the handler's log lines discarded."""
+    def call():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return function()
+    return call
+
+
+STREAM_BATCH_SIZE = 100 # Records per stream batch (the event source mapping's BatchSize)
+
+
+def add_new_items(module, dynamodb_resource, count):
+    """
+    Items processed after the snapshot (as a later upload would write them), and their INSERT
+    records delivered to the stream consumer in batches. Returns the batches (lists of records).
+    """
+    serializer = TypeSerializer()
+    records = []
+    for index in range(count):
+        item = {
+            'CommentID': str(uuid.uuid5(uuid.NAMESPACE_URL, f'benchmark-new#{index}')),
+            'OriginalComment': '追加のコメント',
+            'ProcessingTimestamp': f'2026-01-01T00:00:{index % 60:02d}',
+            'Sentiment': 'Negative', 'Category': 'Facilities', 'Importance': 4, 'IsHighRisk': index % 10 == 0,
+        }
+        dynamodb_resource.store.put(TABLE_NAME, item)
+        records.append({
+            'eventSource': 'aws:dynamodb', 'eventName': 'INSERT',
+            'dynamodb': {'SequenceNumber': str(1000 + index), 'NewImage': {name: serializer.serialize(value) for name, value in fakes.to_dynamodb_types(item).items()}},
+        })
+    batches = [records[start:start + STREAM_BATCH_SIZE] for start in range(0, len(records), STREAM_BATCH_SIZE)]
+    for batch in batches:
+        module.update_stats_counters(batch)
+    return batches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare /stats from a scan with /stats from the columnar snapshot.')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--new-rows', type=int, default=10000, help='Items added before the incremental refresh')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Optional JSON report path')
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix='stats-snapshot-')
+    os.environ.update(BENCHMARK_ENV)
+    os.environ.update({'STATS_SNAPSHOT_S3_URI': SNAPSHOT_S3_URI, 'STATS_SNAPSHOT_CACHE_DIR': cache_dir})
+    dynamodb_resource = fakes.FakeDynamoDBResource()
+    dynamodb_resource.store.create_table(TABLE_NAME)
+    seed_start = time.perf_counter()
+    seed_analysis_table(dynamodb_resource, args.rows, {'seed': args.seed})
+    print(f"Seeded {args.rows} items in {time.perf_counter() - seed_start:.1f}s.")
+    s3_client = fakes.FakeS3Client()
+    module = load_handler('get_stats')
+    install_fakes(module, s3_client, dynamodb_resource, None, None)
+    import columnar_snapshot # Importable once load_handler has put backend/get_stats on sys.path
+
+    report = {'rows': args.rows, 'new_rows': args.new_rows, 'seconds': {}}
+    seconds = report['seconds']
+    try:
+        # Scan path: the snapshot is switched off by clearing its store and URI
+        snapshot_uri = module.STATS_SNAPSHOT_S3_URI
+        module.STATS_SNAPSHOT_S3_URI, module.snapshot_store = None, None
+        scan_counts, seconds['scan_counts'] = timed(quiet(lambda: module.compute_stats_response(False)), args.repeat)
+        scan_lists, seconds['scan_with_lists'] = timed(quiet(lambda: module.compute_stats_response(True)), args.repeat)
+        module.STATS_SNAPSHOT_S3_URI = snapshot_uri
+
+        _, seconds['snapshot_full_build'] = timed(quiet(lambda: module.refresh_stats_snapshot(full=True)), 1)
+        report['snapshot_bytes'] = len(next(iter(s3_client.objects.values())))
+
+        def cold_container():
+            # A new container: no mapped snapshot and an empty /tmp, so load() downloads and maps it
+            module.snapshot_store = None
+            for name in os.listdir(cache_dir):
+                os.remove(os.path.join(cache_dir, name))
+            return module.compute_stats_response(False)
+        snapshot_counts, seconds['snapshot_counts_cold'] = timed(quiet(cold_container), args.repeat)
+        # Warm container: the snapshot is mapped, only the aggregation and the response remain
+        _, seconds['snapshot_counts_warm'] = timed(quiet(lambda: module.compute_stats_response(False)), args.repeat)
+        snapshot_lists, seconds['snapshot_with_lists'] = timed(quiet(lambda: module.compute_stats_response(True)), args.repeat)
+        # The vectorized aggregation alone, on a fresh view (columns not yet copied out of the buffer)
+        data = s3_client.objects[columnar_snapshot.parse_s3_uri(SNAPSHOT_S3_URI)]
+        _, seconds['vectorized_counts_only'] = timed(lambda: columnar_snapshot.StatsSnapshot(data).counts(), args.repeat)
+
+        _, seconds['stream_change_files'] = timed(quiet(lambda: add_new_items(module, dynamodb_resource, args.new_rows)), 1)
+        refresh, seconds['snapshot_incremental_refresh'] = timed(quiet(lambda: module.refresh_stats_snapshot()), 1)
+        report['incremental_refresh'] = json.loads(refresh['body'])
+
+        counts_fields = ('total_comments', 'sentiment_counts', 'category_counts', 'high_risk_count', 'importance_distribution', 'sentiment_importance_matrix')
+        scan_body, snapshot_body = json.loads(scan_counts['body']), json.loads(snapshot_counts['body'])
+        report['counts_identical'] = all(scan_body[field] == snapshot_body[field] for field in counts_fields)
+        report['lists_identical'] = all(
+            [item['CommentID'] for item in json.loads(scan_lists['body'])[name]] == [item['CommentID'] for item in json.loads(snapshot_lists['body'])[name]]
+            for name in ('top_important_comments', 'high_risk_comments_list')
+        )
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print(f"  snapshot: {report['snapshot_bytes']:,d} bytes ({report['snapshot_bytes'] / max(args.rows, 1):.1f} bytes/row)")
+    for name, value in seconds.items():
+        print(f"  {name:30s} {value * 1000:10.1f} ms")
+    print(f"  incremental refresh: {json.dumps(report['incremental_refresh'])}")
+    print(f"  counts identical: {report['counts_identical']}, lists identical: {report['lists_identical']}")
+    report['seconds'] = {name: round(value, 4) for name, value in seconds.items()}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
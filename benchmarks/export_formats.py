@@ -0,0 +1,96 @@
+"""
+Export format benchmark: GET /export/csv's body in every format (csv, csv.gz, jsonl, parquet),
+with every column and with a subset (columns=, read with a ProjectionExpression), on one
+synthetic table:
+
+    python -m benchmarks.export_formats --rows 200000 --repeat 3
+
+Reported per format: the exported size (bytes and bytes/row) and the median handler time, and
+whether the file reads back with the same rows. Scan pages are not throttled here, so the times
+are CPU time only. format=parquet is skipped when pyarrow is not installed.
+"""
+import io
+import os
+import csv
+import gzip
+import json
+import time
+import base64
+import argparse
+import statistics
+import contextlib
+
+from benchmarks import fakes
+from benchmarks.scenarios import BENCHMARK_ENV, TABLE_NAME, load_handler, install_fakes, seed_analysis_table
+
+SUBSET_COLUMNS = 'CommentID,ProcessingTimestamp,Sentiment,Category,Importance,IsHighRisk'
+
+
+def export_event(format_name, columns):
+    query = {'format': format_name}
+    if columns:
+        query['columns'] = columns
+    return {'httpMethod': 'GET', 'resource': '/export/csv', 'path': '/export/csv', 'headers': {}, 'queryStringParameters': query}
+
+
+def read_back(format_name, content):
+    """Exported file -> list of CommentID values, in file order."""
+    if format_name in ('csv', 'csv.gz'):
+        text = (gzip.decompress(content) if format_name == 'csv.gz' else content).decode('utf-8')
+        return [row['CommentID'] for row in csv.DictReader(io.StringIO(text))]
+    if format_name == 'jsonl':
+        return [json.loads(line)['CommentID'] for line in content.decode('utf-8').splitlines()]
+    import pyarrow.parquet
+    return pyarrow.parquet.read_table(io.BytesIO(content), columns=['CommentID']).column('CommentID').to_pylist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the size and time of the export formats.')
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Optional JSON report path')
+    args = parser.parse_args()
+
+    os.environ.update(BENCHMARK_ENV)
+    dynamodb_resource = fakes.FakeDynamoDBResource()
+    dynamodb_resource.store.create_table(TABLE_NAME)
+    seed_start = time.perf_counter()
+    seed_analysis_table(dynamodb_resource, args.rows, {'seed': args.seed})
+    print(f"Seeded {args.rows} items in {time.perf_counter() - seed_start:.1f}s.")
+    module = load_handler('export_csv')
+    install_fakes(module, fakes.FakeS3Client(), dynamodb_resource, None, None)
+    import export_formats # Importable once load_handler has put backend/export_csv on sys.path
+
+    expected_ids = sorted(item['CommentID'] for item in dynamodb_resource.store.tables[TABLE_NAME]['items'].values())
+    report = {'rows': args.rows, 'formats': {}}
+    for format_name in export_formats.FORMATS:
+        if format_name == 'parquet' and export_formats.pyarrow is None:
+            print("  parquet: skipped (pyarrow is not installed)")
+            continue
+        for label, columns in (('all', None), ('subset', SUBSET_COLUMNS)):
+            durations = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    response = module.lambda_handler(export_event(format_name, columns), None)
+                durations.append(time.perf_counter() - start)
+            body = response['body']
+            content = base64.b64decode(body) if response['isBase64Encoded'] else body.encode('utf-8')
+            result = {
+                'bytes': len(content),
+                'bytes_per_row': round(len(content) / max(args.rows, 1), 1),
+                'seconds': round(statistics.median(durations), 4),
+                'content_type': response['headers']['Content-Type'],
+                'round_trip_ok': sorted(read_back(format_name, content)) == expected_ids,
+            }
+            report['formats'][f'{format_name} ({label})'] = result
+            print(f"  {format_name + ' (' + label + ')':20s} {result['bytes']:>14,d} bytes {result['bytes_per_row']:8.1f} B/row "
+                  f"{result['seconds'] * 1000:10.1f} ms  round trip: {result['round_trip_ok']}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
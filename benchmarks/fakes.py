@@ -0,0 +1,815 @@
+"""
+In-process stand-ins for the boto3 clients used by the Lambda handlers (S3, DynamoDB, Bedrock
+Runtime, Lambda), with configurable latency, throttling and failure injection.
+
+They implement only the calls and arguments the handlers actually use, with the same
+response shapes as boto3 (DynamoDB resource reads return Decimal numbers, Bedrock returns
+the Titan Text body, errors are botocore ClientErrors). Each fake counts its calls.
+"""
+import io
+import re
+import json
+import time
+import bisect
+import random
+import hashlib
+import threading
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+# --- Constants ---
+# DynamoDB Scan/Query returns at most 1 MB of data per page
+DDB_PAGE_BYTES = 1024 * 1024
+SENTIMENTS = ['Positive', 'Negative', 'Neutral', 'Mixed']
+CATEGORIES = ['Lecture Content', 'Lecture Materials', 'Operations', 'Other']
+
+
+class Latency:
+    """Sleeps mean_ms +/- jitter_ms (uniform) per call; 0 disables the delay."""
+
+    def __init__(self, mean_ms=0.0, jitter_ms=0.0, seed=None):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sleep(self):
+        if self.mean_ms <= 0 and self.jitter_ms <= 0:
+            return
+        with self._lock:
+            delay_ms = self._rng.uniform(self.mean_ms - self.jitter_ms, self.mean_ms + self.jitter_ms)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+
+
+def client_error(code, operation, http_status=400, message=None):
+    return ClientError({'Error': {'Code': code, 'Message': message or code}, 'ResponseMetadata': {'HTTPStatusCode': http_status}}, operation)
+
+
+class CallCounter:
+    """Thread-safe call counters shared by the fakes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def get(self, name):
+        with self._lock:
+            return self.counts.get(name, 0)
+
+
+# --- S3 ---
+class FakeStreamingBody:
+    """botocore StreamingBody over a byte range of a local file or bytes object."""
+
+    def __init__(self, source, start, end, bandwidth_bytes_per_second=None):
+        self._file = open(source, 'rb') if isinstance(source, str) else io.BytesIO(source)
+        self._file.seek(start)
+        self._remaining = end - start
+        self.bandwidth_bytes_per_second = bandwidth_bytes_per_second
+
+    def read(self, amt=None):
+        if self._remaining <= 0:
+            return b''
+        size = self._remaining if amt is None else min(amt, self._remaining)
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        if self.bandwidth_bytes_per_second and data:
+            time.sleep(len(data) / self.bandwidth_bytes_per_second)
+        if self._remaining <= 0:
+            self._file.close()
+        return data
+
+    def iter_chunks(self, chunk_size=1024):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self._file.close()
+
+
+class FakeS3Client:
+    """
+    Objects are registered as {(bucket, key): local file path or bytes}. get_object honours Range
+    ('bytes=a-b' / 'bytes=a-') and IfMatch (412 PreconditionFailed if the object's ETag differs);
+    VersionId is accepted and ignored.
+    put_object and upload_file keep the uploaded bytes in memory; list_objects_v2 pages in key order.
+    Multipart uploads keep their parts until completed (parts but the last must be at least 5 MiB).
+    """
+
+    def __init__(self, objects=None, first_byte_latency=None, bandwidth_mb_per_second=None, failure_rate=0.0, seed=None):
+        self.objects = dict(objects or {})
+        self.first_byte_latency = first_byte_latency or Latency()
+        self.bandwidth_bytes_per_second = bandwidth_mb_per_second * 1024 * 1024 if bandwidth_mb_per_second else None
+        self.failure_rate = failure_rate
+        self.counter = CallCounter()
+        self._rng = random.Random(seed)
+        self.multipart_uploads = {} # UploadId -> {PartNumber: bytes}
+        self._lock = threading.Lock()
+
+    def _size(self, source):
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                return f.seek(0, 2)
+        return len(source)
+
+    def _lookup(self, bucket, key, operation):
+        self.counter.add(operation)
+        self.first_byte_latency.sleep()
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            raise client_error('InternalError', operation, 500)
+        source = self.objects.get((bucket, key))
+        if source is None:
+            raise client_error('NoSuchKey', operation, 404)
+        return source
+
+    def object_etag(self, Bucket, Key):
+        """Quoted ETag of a registered object (as in an S3 event or HeadObject)."""
+        source = self.objects[(Bucket, Key)]
+        # Uploaded objects: the MD5 of the content, as put_object returns it; local files: of the key
+        return '"' + hashlib.md5(source if isinstance(source, bytes) else Key.encode('utf-8')).hexdigest() + '"'
+
+    def head_object(self, Bucket, Key, **kwargs):
+        source = self._lookup(Bucket, Key, 'HeadObject')
+        return {'ContentLength': self._size(source), 'ETag': self.object_etag(Bucket, Key)}
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, **kwargs):
+        source = self._lookup(Bucket, Key, 'GetObject')
+        etag = self.object_etag(Bucket, Key)
+        if IfMatch is not None and IfMatch.strip('"') != etag.strip('"'):
+            raise client_error('PreconditionFailed', 'GetObject', 412)
+        size = self._size(source)
+        start, end = 0, size
+        if Range:
+            first, last = Range.split('=', 1)[1].split('-', 1)
+            start = int(first)
+            end = min(size, int(last) + 1) if last else size
+            if start >= size:
+                raise client_error('InvalidRange', 'GetObject', 416)
+        return {
+            'Body': FakeStreamingBody(source, start, end, self.bandwidth_bytes_per_second),
+            'ContentLength': end - start,
+            'ETag': etag,
+        }
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.counter.add('PutObject')
+        self.first_byte_latency.sleep()
+        self.objects[(Bucket, Key)] = Body if isinstance(Body, bytes) else Body.encode('utf-8')
+        return {'ETag': f'"{hashlib.md5(self.objects[(Bucket, Key)]).hexdigest()}"'}
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        with open(Filename, 'rb') as f:
+            return self.put_object(Bucket=Bucket, Key=Key, Body=f.read())
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self.counter.add('CreateMultipartUpload')
+        upload_id = hashlib.md5(f'{Bucket}/{Key}/{len(self.multipart_uploads)}'.encode('utf-8')).hexdigest()
+        with self._lock:
+            self.multipart_uploads[upload_id] = {}
+        return {'UploadId': upload_id, 'Bucket': Bucket, 'Key': Key}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        self.counter.add('UploadPart')
+        self.first_byte_latency.sleep()
+        if self.bandwidth_bytes_per_second:
+            time.sleep(len(Body) / self.bandwidth_bytes_per_second)
+        with self._lock:
+            parts = self.multipart_uploads.get(UploadId)
+            if parts is None:
+                raise client_error('NoSuchUpload', 'UploadPart', 404)
+            parts[PartNumber] = bytes(Body)
+        return {'ETag': f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        self.counter.add('CompleteMultipartUpload')
+        with self._lock:
+            parts = self.multipart_uploads.pop(UploadId, None)
+        if parts is None:
+            raise client_error('NoSuchUpload', 'CompleteMultipartUpload', 404)
+        numbers = [part['PartNumber'] for part in MultipartUpload['Parts']]
+        if numbers != sorted(numbers) or any(number not in parts for number in numbers):
+            raise client_error('InvalidPart', 'CompleteMultipartUpload')
+        if any(len(parts[number]) < 5 * 1024 * 1024 for number in numbers[:-1]):
+            raise client_error('EntityTooSmall', 'CompleteMultipartUpload')
+        self.objects[(Bucket, Key)] = b''.join(parts[number] for number in numbers)
+        return {'Bucket': Bucket, 'Key': Key}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self.counter.add('AbortMultipartUpload')
+        with self._lock:
+            self.multipart_uploads.pop(UploadId, None)
+        return {}
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, **kwargs):
+        params = Params or {}
+        return f"https://{params.get('Bucket')}.s3.amazonaws.com/{params.get('Key')}?X-Amz-Expires={ExpiresIn}&X-Amz-Signature=fake"
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self.counter.add('DeleteObject')
+        self.first_byte_latency.sleep()
+        self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        self.counter.add('DeleteObjects')
+        self.first_byte_latency.sleep()
+        for entry in Delete['Objects']:
+            self.objects.pop((Bucket, entry['Key']), None)
+        return {'Deleted': [{'Key': entry['Key']} for entry in Delete['Objects']]}
+
+    def list_objects_v2(self, Bucket, Prefix='', MaxKeys=1000, ContinuationToken=None, **kwargs):
+        self.counter.add('ListObjectsV2')
+        self.first_byte_latency.sleep()
+        keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+        start = int(ContinuationToken) if ContinuationToken else 0
+        page = keys[start:start + MaxKeys]
+        response = {'Contents': [{'Key': key, 'Size': self._size(self.objects[(Bucket, key)])} for key in page], 'KeyCount': len(page)}
+        response['IsTruncated'] = start + MaxKeys < len(keys)
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = str(start + MaxKeys)
+        return response
+
+
+# --- DynamoDB ---
+def to_dynamodb_types(value):
+    """Converts plain Python numbers to Decimal, like the resource layer stores them."""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {k: to_dynamodb_types(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [to_dynamodb_types(v) for v in value]
+    return value
+
+
+def approximate_item_bytes(item):
+    return len(json.dumps(item, default=str, ensure_ascii=False).encode('utf-8'))
+
+
+class FakeDynamoDBStore:
+    """
+    In-memory tables shared by the resource and client fakes. Items keep insertion order, which
+    is also the scan order; 'order'/'positions' make resuming a scan at ExclusiveStartKey O(1).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tables = {} # name -> {'key': attribute name, 'items': {key: item}, 'order': [key], 'positions': {key: index}, 'sizes': {key: bytes}}
+
+    def create_table(self, name, key_attribute='CommentID', range_attribute=None):
+        """
+        A table with a partition key, or with a partition and a sort key (range_attribute). Items of
+        the latter are keyed by (partition value, sort value) and can be read with a Query of the table.
+        """
+        with self._lock:
+            table = self.tables.setdefault(name, {'key': key_attribute, 'range': range_attribute, 'items': {}, 'order': [], 'positions': {}, 'sizes': {}, 'segments': {}, 'indexes': {}})
+            if range_attribute:
+                # The table's own key, queried like an index (IndexName None)
+                table['indexes'][None] = {'hash': key_attribute, 'range': range_attribute, 'entries': {}}
+
+    @staticmethod
+    def key_value(table, key):
+        """Store key of a key (or item) dict: the partition value, or (partition, sort) for a composite key."""
+        if table.get('range'):
+            return key[table['key']], key[table['range']]
+        return key[table['key']]
+
+    @staticmethod
+    def key_attributes(table, item):
+        """The primary key attributes of an item, as LastEvaluatedKey returns them."""
+        names = (table['key'], table['range']) if table.get('range') else (table['key'],)
+        return {name: item[name] for name in names}
+
+    def create_index(self, table_name, index_name, hash_attribute, range_attribute):
+        """Global secondary index (projection ALL). Items without hash_attribute are not in it (sparse)."""
+        table = self.tables[table_name]
+        with self._lock:
+            index = {'hash': hash_attribute, 'range': range_attribute, 'entries': {}}
+            table['indexes'][index_name] = index
+            for key, item in table['items'].items():
+                self._index_put(index, key, item)
+
+    @staticmethod
+    def _index_put(index, key, item):
+        if index['hash'] in item and index['range'] in item:
+            bisect.insort(index['entries'].setdefault(item[index['hash']], []), (item[index['range']], key))
+
+    @staticmethod
+    def _index_remove(index, key, item):
+        if item is not None and index['hash'] in item and index['range'] in item:
+            entries = index['entries'][item[index['hash']]]
+            del entries[bisect.bisect_left(entries, (item[index['range']], key))]
+
+    def _reindex(self, table, key, old_item, new_item):
+        for index in table['indexes'].values():
+            self._index_remove(index, key, old_item)
+            if new_item is not None:
+                self._index_put(index, key, new_item)
+
+    def index_entries(self, table_name, index_name, hash_value):
+        """(range value, table key) pairs of one index partition, ascending."""
+        index = self.tables[table_name]['indexes'][index_name]
+        return index, index['entries'].get(hash_value, [])
+
+    def put(self, table_name, item):
+        table = self.tables[table_name]
+        key = self.key_value(table, item)
+        with self._lock:
+            if key not in table['items']:
+                table['positions'][key] = len(table['order'])
+                table['order'].append(key)
+                table['segments'].clear()
+            old_item = table['items'].get(key)
+            table['items'][key] = to_dynamodb_types(item)
+            self._reindex(table, key, old_item, table['items'][key])
+            # Measured once here so paging a scan does not cost the handler under test anything
+            table['sizes'][key] = approximate_item_bytes(item)
+
+    def get(self, table_name, key):
+        table = self.tables[table_name]
+        with self._lock:
+            return table['items'].get(self.key_value(table, key))
+
+    def add(self, table_name, key, deltas, sets=None, removes=()):
+        """UpdateItem: creates the item if needed, ADDs to numeric attributes, SETs and REMOVEs attributes."""
+        table = self.tables[table_name]
+        with self._lock:
+            key_value = self.key_value(table, key)
+            old_item = table['items'].get(key_value)
+            if old_item is None:
+                table['positions'][key_value] = len(table['order'])
+                table['order'].append(key_value)
+                table['segments'].clear()
+                table['items'][key_value] = dict(key)
+            else:
+                old_item = dict(old_item)
+            item = table['items'][key_value]
+            for name, value in deltas.items():
+                item[name] = item.get(name, Decimal(0)) + to_dynamodb_types(value)
+            for name, value in (sets or {}).items():
+                item[name] = to_dynamodb_types(value)
+            for name in removes:
+                item.pop(name, None)
+            self._reindex(table, key_value, old_item, item)
+            table['sizes'][key_value] = approximate_item_bytes(item)
+
+    def delete(self, table_name, key):
+        table = self.tables[table_name]
+        with self._lock:
+            key_value = self.key_value(table, key)
+            old_item = table['items'].pop(key_value, None)
+            if old_item is not None:
+                self._reindex(table, key_value, old_item, None)
+                # Rebuild the scan order without the deleted key
+                table['order'].remove(key_value)
+                table['positions'] = {k: i for i, k in enumerate(table['order'])}
+                table['segments'].clear()
+                table['sizes'].pop(key_value, None)
+
+    def scan_order(self, table_name, segment=None, total_segments=None):
+        """Keys in scan order and their positions, for the whole table or one parallel-scan segment."""
+        table = self.tables[table_name]
+        if not total_segments:
+            return table['order'], table['positions']
+        with self._lock:
+            if total_segments not in table['segments']:
+                # Keys are assigned to segments by hash, like DynamoDB spreads them over partitions
+                orders = [[] for _ in range(total_segments)]
+                for key in table['order']:
+                    orders[int(hashlib.md5(str(key).encode('utf-8')).hexdigest()[:8], 16) % total_segments].append(key)
+                table['segments'][total_segments] = [(order, {k: i for i, k in enumerate(order)}) for order in orders]
+            return table['segments'][total_segments][segment]
+
+    def count(self, table_name):
+        return len(self.tables[table_name]['order'])
+
+
+def parse_conditions(expression):
+    """
+    'a = :x AND b BETWEEN :y AND :z AND c >= :w' -> [(name, operator, [value names])]. Only the
+    conjunctions of comparisons that the handlers send (key conditions and filters) are supported.
+    """
+    tokens = expression.split()
+    conditions, position = [], 0
+    while position < len(tokens):
+        name, operator = tokens[position], tokens[position + 1].upper()
+        if operator == 'BETWEEN':
+            conditions.append((name, operator, [tokens[position + 2], tokens[position + 4]]))
+            position += 5
+        elif operator in ('=', '<', '<=', '>', '>='):
+            conditions.append((name, operator, [tokens[position + 2]]))
+            position += 3
+        else:
+            raise NotImplementedError(f"Fake condition not supported: {expression}")
+        if position < len(tokens):
+            if tokens[position].upper() != 'AND':
+                raise NotImplementedError(f"Fake conditions support AND only: {expression}")
+            position += 1
+    return conditions
+
+
+def condition_matches(item, conditions, names, values):
+    """True if the item satisfies every parsed condition (a missing attribute never matches)."""
+    for name, operator, value_names in conditions:
+        attribute = names.get(name, name)
+        if attribute not in item:
+            return False
+        actual = item[attribute]
+        operands = [to_dynamodb_types(values[value_name]) for value_name in value_names]
+        if operator == 'BETWEEN':
+            matched = operands[0] <= actual <= operands[1]
+        else:
+            matched = {'=': actual == operands[0], '<': actual < operands[0], '<=': actual <= operands[0],
+                       '>': actual > operands[0], '>=': actual >= operands[0]}[operator]
+        if not matched:
+            return False
+    return True
+
+
+def project(item, projection_expression, attribute_names):
+    names = [attribute_names.get(name.strip(), name.strip()) for name in projection_expression.split(',')]
+    return {name: item[name] for name in names if name in item}
+
+
+class FakeDynamoDBClient:
+    """Low-level client (plain Python types in, Decimal out) with unprocessed-item and failure injection."""
+
+    def __init__(self, store, latency=None, unprocessed_rate=0.0, failure_rate=0.0, seed=None, scan_mb_per_second=0.0):
+        self.store = store
+        self.latency = latency or Latency()
+        # Read throughput of one Scan request stream (0 = unlimited); a page of N MB takes N / rate seconds more
+        self.scan_mb_per_second = scan_mb_per_second
+        self.unprocessed_rate = unprocessed_rate
+        self.failure_rate = failure_rate
+        self.counter = CallCounter()
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._transact_lock = threading.Lock()
+
+    def _random(self):
+        with self._rng_lock:
+            return self._rng.random()
+
+    def _request(self, operation):
+        self.counter.add(operation)
+        self.latency.sleep()
+        if self.failure_rate and self._random() < self.failure_rate:
+            raise client_error('InternalServerError', operation, 500)
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        self._request('BatchWriteItem')
+        unprocessed = {}
+        for table_name, requests in RequestItems.items():
+            for request in requests:
+                if self.unprocessed_rate and self._random() < self.unprocessed_rate:
+                    unprocessed.setdefault(table_name, []).append(request)
+                    continue
+                self.store.put(table_name, request['PutRequest']['Item'])
+                self.counter.add('ItemsWritten')
+        return {'UnprocessedItems': unprocessed}
+
+    def put_item(self, TableName, Item, **kwargs):
+        self._request('PutItem')
+        self.store.put(TableName, Item)
+        self.counter.add('ItemsWritten')
+        return {}
+
+    def get_item(self, TableName, Key, **kwargs):
+        self._request('GetItem')
+        item = self.store.get(TableName, Key)
+        return {'Item': dict(item)} if item is not None else {}
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        self._request('BatchGetItem')
+        responses = {}
+        for table_name, request in RequestItems.items():
+            items = [self.store.get(table_name, key) for key in request['Keys']]
+            if request.get('ProjectionExpression'):
+                items = [project(item, request['ProjectionExpression'], request.get('ExpressionAttributeNames') or {}) for item in items if item is not None]
+            responses[table_name] = [dict(item) for item in items if item is not None]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeNames=None, ExpressionAttributeValues=None, ReturnValues=None, **kwargs):
+        """Supports 'ADD #a :v, ...', 'SET #a = :v, ...' and 'REMOVE #a, ...' sections (no functions or paths)."""
+        self._request('UpdateItem')
+        return self._update(TableName, Key, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues, ReturnValues)
+
+    def transact_write_items(self, TransactItems, **kwargs):
+        """
+        Put (with an optional 'attribute_not_exists(#k)' condition) and Update actions, applied
+        together or not at all: a failed condition cancels the transaction like DynamoDB does.
+        """
+        self._request('TransactWriteItems')
+        with self._transact_lock:
+            reasons = []
+            for action in TransactItems:
+                put = action.get('Put')
+                exists = put is not None and put.get('ConditionExpression') and self.store.get(put['TableName'], put['Item']) is not None
+                reasons.append({'Code': 'ConditionalCheckFailed' if exists else 'None'})
+            if any(reason['Code'] != 'None' for reason in reasons):
+                error = client_error('TransactionCanceledException', 'TransactWriteItems')
+                error.response['CancellationReasons'] = reasons
+                raise error
+            for action in TransactItems:
+                if 'Put' in action:
+                    self.store.put(action['Put']['TableName'], action['Put']['Item'])
+                else:
+                    update = action['Update']
+                    self._update(update['TableName'], update['Key'], update['UpdateExpression'], update.get('ExpressionAttributeNames'), update.get('ExpressionAttributeValues'))
+                self.counter.add('ItemsWritten')
+        return {}
+
+    def _update(self, TableName, Key, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues, ReturnValues=None):
+        names = ExpressionAttributeNames or {}
+        deltas, sets, removes = {}, {}, []
+        for action, clauses in re.findall(r'(ADD|SET|REMOVE)\s+(.*?)(?=\s+(?:ADD|SET|REMOVE)\s|$)', UpdateExpression):
+            for clause in clauses.split(','):
+                parts = clause.replace('=', ' ').split()
+                name = names.get(parts[0], parts[0])
+                if action == 'ADD':
+                    deltas[name] = ExpressionAttributeValues[parts[1]]
+                elif action == 'SET':
+                    sets[name] = ExpressionAttributeValues[parts[1]]
+                else:
+                    removes.append(name)
+        self.store.add(TableName, Key, deltas, sets, removes)
+        if ReturnValues == 'UPDATED_NEW':
+            item = self.store.get(TableName, Key)
+            return {'Attributes': {name: item[name] for name in list(deltas) + list(sets)}}
+        return {}
+
+    def delete_item(self, TableName, Key, **kwargs):
+        self._request('DeleteItem')
+        self.store.delete(TableName, Key)
+        return {}
+
+    def scan(self, TableName, **kwargs):
+        return scan_table(self, self.store, TableName, **kwargs)
+
+    def query(self, TableName, **kwargs):
+        return query_index(self, self.store, TableName, **kwargs)
+
+
+def scan_table(owner, store, table_name, ExclusiveStartKey=None, Limit=None, Segment=None, TotalSegments=None,
+               ProjectionExpression=None, ExpressionAttributeNames=None, FilterExpression=None, ExpressionAttributeValues=None, **kwargs):
+    """Scan with 1 MB pages, Limit, parallel segments, ProjectionExpression and FilterExpression."""
+    owner._request('Scan')
+    table = store.tables[table_name]
+    items = table['items']
+    order, positions = store.scan_order(table_name, Segment, TotalSegments)
+    position = 0
+    if ExclusiveStartKey is not None:
+        position = positions[store.key_value(table, ExclusiveStartKey)] + 1
+
+    page, page_bytes, more = [], 0, False
+    while position < len(order):
+        key = order[position]
+        item = items[key]
+        page_bytes += table['sizes'][key]
+        if page and page_bytes > DDB_PAGE_BYTES:
+            more = True
+            break
+        page.append(item)
+        position += 1
+        if Limit and len(page) >= Limit:
+            more = position < len(order)
+            break
+
+    scan_mb_per_second = getattr(owner, 'scan_mb_per_second', 0)
+    if scan_mb_per_second and page_bytes:
+        # Pages are read (and billed) in full, whatever the projection returns
+        time.sleep(min(page_bytes, DDB_PAGE_BYTES) / (1024 * 1024) / scan_mb_per_second)
+
+    # Like DynamoDB, the filter runs after the page is read: Limit and the 1 MB count the items read
+    matched = page
+    if FilterExpression:
+        conditions = parse_conditions(FilterExpression)
+        matched = [item for item in page if condition_matches(item, conditions, ExpressionAttributeNames or {}, ExpressionAttributeValues or {})]
+    response = {
+        'Items': [project(item, ProjectionExpression, ExpressionAttributeNames or {}) if ProjectionExpression else dict(item) for item in matched],
+        'Count': len(matched),
+        'ScannedCount': len(page),
+    }
+    if more and page:
+        response['LastEvaluatedKey'] = store.key_attributes(table, page[-1])
+    return response
+
+
+def query_index(owner, store, table_name, KeyConditionExpression, ExpressionAttributeValues, IndexName=None,
+                ExpressionAttributeNames=None, ScanIndexForward=True, ExclusiveStartKey=None, Limit=None,
+                ProjectionExpression=None, FilterExpression=None, **kwargs):
+    """
+    Query of a global secondary index, or of a table with a sort key (no IndexName): 'hash = :value',
+    optionally AND a condition on the range key (=, <, <=, >, >=, BETWEEN), and a FilterExpression.
+    """
+    owner._request('Query')
+    names = ExpressionAttributeNames or {}
+    key_conditions = parse_conditions(KeyConditionExpression)
+    hash_name, operator, (value_name,) = key_conditions[0]
+    if operator != '=':
+        raise NotImplementedError(f"Fake query needs an equality condition on the hash key first: {KeyConditionExpression}")
+    table = store.tables[table_name]
+    index, entries = store.index_entries(table_name, IndexName, ExpressionAttributeValues[value_name])
+    if names.get(hash_name, hash_name) != index['hash']:
+        raise NotImplementedError(f"Fake query supports the index hash key only: {KeyConditionExpression}")
+    range_conditions = key_conditions[1:]
+    if range_conditions:
+        if len(range_conditions) > 1 or names.get(range_conditions[0][0], range_conditions[0][0]) != index['range']:
+            raise NotImplementedError(f"Fake query supports one condition on the index range key: {KeyConditionExpression}")
+        # Entries are sorted by range value: narrow them to the condition like the real key lookup
+        _, range_operator, range_value_names = range_conditions[0]
+        bounds = [to_dynamodb_types(ExpressionAttributeValues[value_name]) for value_name in range_value_names]
+        low, high = 0, len(entries)
+        if range_operator in ('=', '>=', 'BETWEEN'):
+            low = bisect.bisect_left(entries, bounds[0], key=lambda entry: entry[0])
+        elif range_operator == '>':
+            low = bisect.bisect_right(entries, bounds[0], key=lambda entry: entry[0])
+        if range_operator in ('=', '<=', 'BETWEEN'):
+            high = bisect.bisect_right(entries, bounds[-1], key=lambda entry: entry[0])
+        elif range_operator == '<':
+            high = bisect.bisect_left(entries, bounds[0], key=lambda entry: entry[0])
+        entries = entries[low:high]
+    ordered = entries if ScanIndexForward else entries[::-1]
+    position = 0
+    if ExclusiveStartKey is not None:
+        # Resume right after the start key's entry
+        entry = (to_dynamodb_types(ExclusiveStartKey[index['range']]), store.key_value(table, ExclusiveStartKey))
+        position = bisect.bisect_right(entries, entry) if ScanIndexForward else len(entries) - bisect.bisect_left(entries, entry)
+
+    page, page_bytes, more = [], 0, False
+    while position < len(ordered):
+        key = ordered[position][1]
+        page_bytes += table['sizes'][key]
+        if page and page_bytes > DDB_PAGE_BYTES:
+            more = True
+            break
+        page.append(table['items'][key])
+        position += 1
+        if Limit and len(page) >= Limit:
+            more = position < len(ordered)
+            break
+
+    scan_mb_per_second = getattr(owner, 'scan_mb_per_second', 0)
+    if scan_mb_per_second and page_bytes:
+        time.sleep(min(page_bytes, DDB_PAGE_BYTES) / (1024 * 1024) / scan_mb_per_second)
+
+    matched = page
+    if FilterExpression:
+        conditions = parse_conditions(FilterExpression)
+        matched = [item for item in page if condition_matches(item, conditions, names, ExpressionAttributeValues)]
+    response = {
+        'Items': [project(item, ProjectionExpression, names) if ProjectionExpression else dict(item) for item in matched],
+        'Count': len(matched),
+        'ScannedCount': len(page),
+    }
+    if more and page:
+        last = page[-1]
+        response['LastEvaluatedKey'] = dict(store.key_attributes(table, last), **{index['hash']: last[index['hash']], index['range']: last[index['range']]})
+    return response
+
+
+class FakeDynamoDBTable:
+    def __init__(self, resource, name):
+        self.resource = resource
+        self.name = name
+        self.table_name = name
+
+    def scan(self, **kwargs):
+        return scan_table(self.resource.meta.client, self.resource.store, self.name, **kwargs)
+
+    def query(self, **kwargs):
+        return query_index(self.resource.meta.client, self.resource.store, self.name, **kwargs)
+
+    def put_item(self, Item, **kwargs):
+        return self.resource.meta.client.put_item(TableName=self.name, Item=Item)
+
+    def get_item(self, Key, **kwargs):
+        return self.resource.meta.client.get_item(TableName=self.name, Key=Key)
+
+
+class _Meta:
+    pass
+
+
+class FakeDynamoDBResource:
+    """boto3.resource('dynamodb') stand-in: Table(name) plus meta.client."""
+
+    def __init__(self, store=None, **client_options):
+        self.store = store or FakeDynamoDBStore()
+        self.meta = _Meta()
+        self.meta.client = FakeDynamoDBClient(self.store, **client_options)
+
+    def Table(self, name):
+        self.store.create_table(name)
+        return FakeDynamoDBTable(self, name)
+
+
+# --- Bedrock Runtime ---
+class FakeModelErrorException(Exception):
+    """Mirrors bedrock-runtime's ModelErrorException (message + response)."""
+
+    def __init__(self, message, status_code=424, body=b''):
+        super().__init__(message)
+        self.message = message
+        self.response = {'ResponseMetadata': {'HTTPStatusCode': status_code}, 'body': body}
+
+
+class _BedrockExceptions:
+    ModelErrorException = FakeModelErrorException
+
+
+def fake_analysis(comment):
+    """Deterministic analysis for a comment (same text, same answer)."""
+    digest = hashlib.md5(comment.encode('utf-8')).digest()
+    return {
+        'sentiment': SENTIMENTS[digest[0] % len(SENTIMENTS)],
+        'category': CATEGORIES[digest[1] % len(CATEGORIES)],
+        'importance': 1 + digest[2] % 5,
+        'isHighRisk': digest[3] % 10 == 0,
+    }
+
+
+class FakeBedrockRuntimeClient:
+    """
+    invoke_model for Titan Text request/response bodies. Answers single-comment prompts with a
+    JSON object and batched prompts ("[c1] ..." lines) with a JSON array.
+    Throttles when more than max_concurrency calls are in flight or with throttle_rate; fails
+    with a model error at failure_rate and returns unparseable text at malformed_rate.
+    """
+
+    exceptions = _BedrockExceptions
+
+    def __init__(self, latency=None, per_comment_latency_ms=0.0, throttle_rate=0.0, max_concurrency=None, failure_rate=0.0, malformed_rate=0.0, seed=None):
+        self.latency = latency or Latency()
+        self.per_comment_latency_ms = per_comment_latency_ms
+        self.throttle_rate = throttle_rate
+        self.max_concurrency = max_concurrency
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.counter = CallCounter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def _random(self):
+        with self._lock:
+            return self._rng.random()
+
+    def invoke_model(self, body, modelId, **kwargs):
+        self.counter.add('InvokeModel')
+        with self._lock:
+            self._in_flight += 1
+            over_capacity = self.max_concurrency is not None and self._in_flight > self.max_concurrency
+        try:
+            if over_capacity or (self.throttle_rate and self._random() < self.throttle_rate):
+                self.counter.add('Throttled')
+                raise client_error('ThrottlingException', 'InvokeModel', 429, 'Too many requests, please wait before trying again.')
+
+            prompt = json.loads(body)['inputText']
+            batch_ids = re.findall(r'^\[(c\d+)\] (.*)$', prompt, re.M)
+            comments = len(batch_ids) or 1
+            self.counter.add('CommentsAnalyzed', comments)
+            self.latency.sleep()
+            if self.per_comment_latency_ms:
+                time.sleep(self.per_comment_latency_ms * comments / 1000)
+
+            if self.failure_rate and self._random() < self.failure_rate:
+                self.counter.add('Failed')
+                raise FakeModelErrorException('Model failed to process the request', body=b'{"message": "injected failure"}')
+            if self.malformed_rate and self._random() < self.malformed_rate:
+                output_text = 'Sorry, I cannot produce JSON for this request.'
+            elif batch_ids:
+                output_text = json.dumps([dict(fake_analysis(text), id=local_id) for local_id, text in batch_ids], ensure_ascii=False)
+            else:
+                comment = prompt.rsplit('Comment:', 1)[-1].strip()
+                output_text = json.dumps(fake_analysis(comment), ensure_ascii=False)
+            response_body = json.dumps({'results': [{'outputText': output_text, 'completionReason': 'FINISH'}]}).encode('utf-8')
+            return {'body': FakeStreamingBody(response_body, 0, len(response_body))}
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+
+# --- Lambda ---
+class FakeLambdaClient:
+    """Records invoke() calls (continuations, shard fan-out) without running them."""
+
+    def __init__(self):
+        self.counter = CallCounter()
+        self.invocations = []
+
+    def invoke(self, FunctionName, InvocationType='RequestResponse', Payload=b'', **kwargs):
+        self.counter.add('Invoke')
+        self.invocations.append({'FunctionName': FunctionName, 'InvocationType': InvocationType, 'Payload': json.loads(Payload or b'null')})
+        return {'StatusCode': 202}
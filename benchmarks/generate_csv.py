@@ -0,0 +1,86 @@
+"""
+Synthetic feedback CSV generator for the benchmarks.
+
+Scales the shape of samples/testinput.csv (one 'Comment' column, short Japanese course-survey
+comments) to any number of rows, with a configurable share of exact duplicates, trivial
+answers ("特になし", "thanks") and empty comments, and a configurable comment length.
+
+    python -m benchmarks.generate_csv --rows 100000 --duplicate-rate 0.3 --output /tmp/feedback_100k.csv
+"""
+import os
+import csv
+import random
+import argparse
+
+# --- Constants ---
+SAMPLE_CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'samples', 'testinput.csv')
+COMMENT_COLUMN_NAME = 'Comment'
+# Short boilerplate answers, the kind the rule tier labels without Bedrock
+TRIVIAL_COMMENTS = ['特になし', 'なし', '特にありません。', 'ありがとうございました。', 'None', 'n/a', 'Thanks!', '-', 'Good']
+# Previously generated comments kept as candidates for duplicates
+DUPLICATE_POOL_SIZE = 10000
+
+
+def load_sample_comments(sample_path=SAMPLE_CSV_PATH):
+    """Returns the non-empty comments of the sample CSV."""
+    with open(sample_path, encoding='utf-8', newline='') as f:
+        return [row[COMMENT_COLUMN_NAME] for row in csv.DictReader(f) if (row.get(COMMENT_COLUMN_NAME) or '').strip()]
+
+
+def iter_synthetic_comments(rows, duplicate_rate=0.2, trivial_rate=0.05, empty_rate=0.01, comment_length=40, seed=42, sample_comments=None):
+    """
+    Yields `rows` comments. Unique comments are built from sample sentences until they reach
+    about comment_length characters and carry a serial number, so they never collide by accident;
+    duplicates repeat an earlier unique comment exactly.
+    """
+    rng = random.Random(seed)
+    sample_comments = sample_comments or load_sample_comments()
+    duplicate_pool = []
+    for row_number in range(rows):
+        draw = rng.random()
+        if draw < empty_rate:
+            yield ''
+        elif draw < empty_rate + trivial_rate:
+            yield rng.choice(TRIVIAL_COMMENTS)
+        elif draw < empty_rate + trivial_rate + duplicate_rate and duplicate_pool:
+            yield rng.choice(duplicate_pool)
+        else:
+            parts = [rng.choice(sample_comments)]
+            while sum(len(part) for part in parts) < comment_length:
+                parts.append(rng.choice(sample_comments))
+            comment = f"{''.join(parts)}（No.{row_number}）"
+            if len(duplicate_pool) < DUPLICATE_POOL_SIZE:
+                duplicate_pool.append(comment)
+            else:
+                duplicate_pool[rng.randrange(DUPLICATE_POOL_SIZE)] = comment
+            yield comment
+
+
+def write_synthetic_csv(output_path, rows, **options):
+    """Writes the synthetic CSV (header 'Comment', fields quoted like the sample). Returns the file size in bytes."""
+    with open(output_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+        writer.writerow([COMMENT_COLUMN_NAME])
+        for comment in iter_synthetic_comments(rows, **options):
+            writer.writerow([comment])
+    return os.path.getsize(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic feedback CSV shaped like samples/testinput.csv.')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--duplicate-rate', type=float, default=0.2, help='Share of rows that repeat an earlier comment exactly')
+    parser.add_argument('--trivial-rate', type=float, default=0.05, help='Share of boilerplate answers ("特になし", "thanks")')
+    parser.add_argument('--empty-rate', type=float, default=0.01, help='Share of empty comments')
+    parser.add_argument('--comment-length', type=int, default=40, help='Approximate length of a unique comment in characters')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+
+    size = write_synthetic_csv(args.output, args.rows, duplicate_rate=args.duplicate_rate, trivial_rate=args.trivial_rate,
+                               empty_rate=args.empty_rate, comment_length=args.comment_length, seed=args.seed)
+    print(f"Wrote {args.rows} rows ({size} bytes) to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
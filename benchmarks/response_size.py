@@ -0,0 +1,115 @@
+"""
+Response encoding benchmark: size and serialization time of get_stats response bodies, encoded
+the previous way (json.dumps with default separators, ASCII escapes and the `obj % 1` Decimal
+callback) and the current way (compact UTF-8 JSON, then gzip and, if installed, brotli):
+
+    python -m benchmarks.response_size --rows 50000 --repeat 5
+
+The bodies come from a synthetic table of --rows items (same generator as benchmarks.run):
+the pre-pagination /stats body with every comment, /stats?include_comments=true, one 200-item
+GET /comments page, and the raw scanned items (with their Decimal numbers).
+"""
+import io
+import os
+import json
+import time
+import argparse
+import statistics
+import contextlib
+from decimal import Decimal
+
+from benchmarks import fakes
+from benchmarks.scenarios import BENCHMARK_ENV, TABLE_NAME, load_handler, install_fakes, seed_analysis_table
+
+
+def legacy_decimal_default(obj):
+    """get_stats' decimal_default before compact encoding, kept here as the baseline."""
+    if isinstance(obj, Decimal):
+        if obj % 1 == 0:
+            return int(obj)
+        else:
+            return float(obj)
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+def build_payloads(module, dynamodb_resource):
+    """Response bodies (as Python values) of the synthetic table."""
+    def call(event):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return json.loads(module.lambda_handler(event, None)['body'])
+
+    store = dynamodb_resource.store
+    order, _ = store.scan_order(TABLE_NAME)
+    raw_items = [dict(store.tables[TABLE_NAME]['items'][key]) for key in order]
+    processable = [module.map_comment_item(item) for item in raw_items if item.get('Sentiment') != 'Skipped - Empty']
+    by_importance = sorted(processable, key=lambda item: item.get('Importance', 0), reverse=True)
+    return {
+        # /stats before it was split into counts and GET /comments pages
+        'stats_all_comments': {
+            'all_mapped_comments_list': processable,
+            'top_important_comments': [item for item in by_importance if item.get('Importance', 0) >= 4],
+            'high_risk_comments_list': [item for item in by_importance if item.get('IsHighRisk')],
+        },
+        'stats_include_comments': call({'path': '/stats', 'queryStringParameters': {'include_comments': 'true'}}),
+        'comments_page_200': call({'resource': '/comments', 'queryStringParameters': {'filter': 'all', 'limit': '200'}}),
+        'raw_items': raw_items,
+    }
+
+
+def timed(function, repeat):
+    """(result, median seconds) of repeat calls."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        durations.append(time.perf_counter() - start)
+    return result, statistics.median(durations)
+
+
+def measure(payload, encoder, repeat):
+    """Sizes and median times of one payload: previous encoding, compact JSON, compressed."""
+    legacy, legacy_seconds = timed(lambda: json.dumps(payload, default=legacy_decimal_default), repeat)
+    compact, compact_seconds = timed(lambda: encoder.dumps_compact(payload), repeat)
+    data = compact.encode('utf-8')
+    results = {
+        'legacy': {'bytes': len(legacy.encode('utf-8')), 'ms': round(legacy_seconds * 1000, 2)},
+        'compact': {'bytes': len(data), 'ms': round(compact_seconds * 1000, 2)},
+    }
+    for encoding in ('gzip', 'br'):
+        if encoding == 'br' and encoder.brotli is None:
+            continue
+        compressed, compress_seconds = timed(lambda: encoder.compress(data, encoding), repeat)
+        results[f'compact+{encoding}'] = {'bytes': len(compressed), 'ms': round((compact_seconds + compress_seconds) * 1000, 2)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure get_stats response body size and serialization time.')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Optional JSON report path')
+    args = parser.parse_args()
+
+    os.environ.update(BENCHMARK_ENV)
+    dynamodb_resource = fakes.FakeDynamoDBResource()
+    dynamodb_resource.store.create_table(TABLE_NAME)
+    seed_analysis_table(dynamodb_resource, args.rows, {'seed': args.seed})
+    module = load_handler('get_stats')
+    install_fakes(module, None, dynamodb_resource, None, None)
+    import response_encoding # Importable once load_handler has put backend/get_stats on sys.path
+
+    report = {'rows': args.rows, 'brotli_available': response_encoding.brotli is not None, 'payloads': {}}
+    for name, payload in build_payloads(module, dynamodb_resource).items():
+        results = report['payloads'][name] = measure(payload, response_encoding, args.repeat)
+        baseline = results['legacy']['bytes']
+        print(f"  {name}")
+        for encoding, result in results.items():
+            print(f"    {encoding:14s} {result['bytes']:>11,d} bytes ({result['bytes'] / baseline:6.1%})  {result['ms']:8.2f} ms")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Retry consistency check: how the work is split across invocations, or how often it is delivered,
+must not change what ends up in the tables:
+
+    python -m benchmarks.retry_consistency --rows 1000
+
+1. process_feedback with a checkpoint table, once in a single invocation and once with a short
+   timeout, so the deadline cuts off Bedrock calls (those rows are rewound) and continuation
+   invocations finish the file. The final file_totals (bedrock_invocations aside: calls cut off
+   by the deadline are made again) and the stored items must be identical.
+2. The get_stats stream consumer applies every batch of new items, then one batch again (Lambda
+   retrying a batch that had succeeded). The stats counters and trend rollups must not change.
+
+Exits with status 1 if a check fails.
+"""
+import io
+import os
+import sys
+import copy
+import json
+import argparse
+import tempfile
+import contextlib
+
+from benchmarks import fakes
+from benchmarks.scenarios import (BENCHMARK_ENV, BUCKET_NAME, OBJECT_KEY, TABLE_NAME, STATS_TABLE_NAME, TREND_TABLE_NAME,
+                                  FakeContext, load_handler, install_fakes)
+from benchmarks.generate_csv import write_synthetic_csv
+from benchmarks.columnar_stats import add_new_items
+
+CHECKPOINT_TABLE_NAME = 'feedbackcheckpoints'
+# Stored item attributes compared between the two runs (ProcessingTimestamp differs by design)
+COMPARED_ATTRIBUTES = ('OriginalCsvRowIndex', 'OriginalComment', 'Sentiment', 'Category', 'Importance', 'IsHighRisk', 'LLMError')
+
+
+def process_file(csv_path, timeout_seconds, bedrock_latency_ms):
+    """
+    Runs process_feedback on the file, following its continuation invocations until it finishes.
+    Returns (file_totals of the checkpoint, {CommentID: compared attributes}, number of invocations).
+    """
+    s3_client = fakes.FakeS3Client()
+    s3_client.objects[(BUCKET_NAME, OBJECT_KEY)] = csv_path
+    dynamodb_resource = fakes.FakeDynamoDBResource()
+    dynamodb_resource.store.create_table(TABLE_NAME)
+    dynamodb_resource.store.create_table(CHECKPOINT_TABLE_NAME, key_attribute='CheckpointId')
+    bedrock_client = fakes.FakeBedrockRuntimeClient(latency=fakes.Latency(bedrock_latency_ms, bedrock_latency_ms / 4, seed=42), seed=42)
+    lambda_client = fakes.FakeLambdaClient()
+    module = load_handler('process_feedback') # A fresh module: no warm analysis cache from an earlier run
+    install_fakes(module, s3_client, dynamodb_resource, bedrock_client, lambda_client)
+
+    event = {'Records': [{'s3': {
+        'bucket': {'name': BUCKET_NAME},
+        'object': {'key': OBJECT_KEY, 'size': os.path.getsize(csv_path), 'eTag': s3_client.object_etag(BUCKET_NAME, OBJECT_KEY)},
+    }}]}
+    invocations = 0
+    while True:
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = module.lambda_handler(event, FakeContext('process_feedback', timeout_seconds))
+        invocations += 1
+        if response.get('statusCode') != 200:
+            raise RuntimeError(f"Invocation {invocations} failed: {response}")
+        checkpoint = json.loads(response['body'])['checkpoint']
+        if not checkpoint['continuation_started']:
+            break
+        event = lambda_client.invocations[-1]['Payload'] # The continuation the invocation started
+    items = {
+        item['CommentID']: {name: item.get(name) for name in COMPARED_ATTRIBUTES}
+        for item in dynamodb_resource.store.tables[TABLE_NAME]['items'].values()
+    }
+    return checkpoint['file_totals'], items, invocations
+
+
+def check_continued_file(args):
+    """Check 1: a run stopped by the deadline and continued ends with the single-run totals and items."""
+    os.environ.update({
+        'CHECKPOINT_TABLE_NAME': CHECKPOINT_TABLE_NAME,
+        'CHECKPOINT_INTERVAL_ROWS': str(args.checkpoint_interval_rows),
+        # Bedrock calls stop DEADLINE_SAFETY_MARGIN_SECONDS before the end, reading stops
+        # CONTINUATION_RESERVE_SECONDS before it: the calls in flight in between are cut off
+        'CONTINUATION_RESERVE_SECONDS': str(args.timeout_seconds / 3),
+        'DEADLINE_SAFETY_MARGIN_SECONDS': str(args.timeout_seconds / 2),
+        'BEDROCK_MAX_RATE_PER_SECOND': '1000',
+    })
+    with tempfile.TemporaryDirectory() as work_dir:
+        csv_path = os.path.join(work_dir, 'feedback.csv')
+        write_synthetic_csv(csv_path, args.rows, seed=args.seed)
+        single_file_totals, single_items, _ = process_file(csv_path, 900, args.bedrock_latency_ms)
+        continued_file_totals, continued_items, invocations = process_file(csv_path, args.timeout_seconds, args.bedrock_latency_ms)
+
+    single_totals = {name: value for name, value in single_file_totals.items() if name != 'bedrock_invocations'}
+    continued_totals = {name: value for name, value in continued_file_totals.items() if name != 'bedrock_invocations'}
+    print(f"  single run:     {json.dumps(single_file_totals)}")
+    print(f"  {invocations} invocations: {json.dumps(continued_file_totals)}")
+    different_items = [comment_id for comment_id in single_items.keys() | continued_items.keys() if single_items.get(comment_id) != continued_items.get(comment_id)]
+    print(f"  items: {len(single_items)} / {len(continued_items)}, different: {len(different_items)}")
+    return {
+        'invocations': invocations,
+        'single_run_totals': single_file_totals,
+        'continued_totals': continued_file_totals,
+        'different_items': len(different_items),
+        'passed': invocations > 1 and single_totals == continued_totals and single_totals['total_rows'] == args.rows and not different_items,
+    }
+
+
+def check_replayed_batch(args):
+    """Check 2: applying a stream batch a second time leaves the counters and rollups unchanged."""
+    os.environ.update({'STATS_TABLE_NAME': STATS_TABLE_NAME, 'TREND_TABLE_NAME': TREND_TABLE_NAME})
+    dynamodb_resource = fakes.FakeDynamoDBResource()
+    dynamodb_resource.store.create_table(TABLE_NAME)
+    dynamodb_resource.store.create_table(STATS_TABLE_NAME, key_attribute='CounterKey')
+    dynamodb_resource.store.create_table(TREND_TABLE_NAME, key_attribute='Granularity', range_attribute='Bucket')
+    module = load_handler('get_stats')
+    install_fakes(module, fakes.FakeS3Client(), dynamodb_resource, None, None)
+    from stats_counters import TOTAL_ATTRIBUTE # Importable once load_handler has put backend/get_stats on sys.path
+
+    def tables():
+        # Every item of both tables, applied markers included: a replay must not add or change any
+        return {name: copy.deepcopy(dynamodb_resource.store.tables[name]['items']) for name in (STATS_TABLE_NAME, TREND_TABLE_NAME)}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        batches = add_new_items(module, dynamodb_resource, args.stream_rows)
+        before = tables()
+        module.update_stats_counters(batches[len(batches) // 2])
+        after = tables()
+    total_comments = module.get_stats_counter_store().read_totals()[TOTAL_ATTRIBUTE]
+    print(f"  {len(batches)} batches applied, batch {len(batches) // 2} replayed: {total_comments} comments counted")
+    print(f"  counters unchanged: {before[STATS_TABLE_NAME] == after[STATS_TABLE_NAME]}, rollups unchanged: {before[TREND_TABLE_NAME] == after[TREND_TABLE_NAME]}")
+    return {
+        'batches': len(batches),
+        'total_comments': total_comments,
+        'passed': before == after and total_comments == args.stream_rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that continued runs and replayed stream batches do not change the totals.')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--timeout-seconds', type=float, default=3.0, help='Invocation timeout of the continued run')
+    parser.add_argument('--checkpoint-interval-rows', type=int, default=100)
+    parser.add_argument('--bedrock-latency-ms', type=float, default=80.0)
+    parser.add_argument('--stream-rows', type=int, default=1000, help='New items delivered to the stream consumer')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Optional JSON report path')
+    args = parser.parse_args()
+
+    os.environ.update(BENCHMARK_ENV)
+    print("Continued file:")
+    report = {'continued_file': check_continued_file(args)}
+    print("Replayed stream batch:")
+    report['replayed_batch'] = check_replayed_batch(args)
+    for name, result in report.items():
+        print(f"  {name}: {'passed' if result['passed'] else 'FAILED'}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if not all(result['passed'] for result in report.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""
+Offline benchmark runner. Generates a synthetic CSV, runs each scenario REPEAT times (one child
+process per run, see benchmarks/scenarios.py) and writes a JSON report that can be diffed
+against an earlier one:
+
+    python -m benchmarks.run --rows 5000 --repeat 3
+    python -m benchmarks.run --scenarios process_feedback get_stats --compare benchmarks/results/<sha>.json
+    python -m benchmarks.run --scenarios get_stats export_csv --rows 50000 --scan-segments 1 2 4 8 16
+
+No AWS account is needed: S3, DynamoDB, Bedrock and Lambda are replaced by the fakes in
+benchmarks/fakes.py, with latency injected per call.
+"""
+import os
+import sys
+import json
+import math
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks.scenarios import SCENARIOS, REPO_ROOT, run_scenario
+from benchmarks.generate_csv import write_synthetic_csv
+
+# --- Constants ---
+RESULTS_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+RESULT_SCHEMA_VERSION = 1
+# Metrics compared by --compare: (key in the summary, True if higher is better)
+COMPARED_METRICS = [('rows_per_second_p50', True), ('elapsed_seconds_p95', False), ('peak_rss_mb_max', False), ('bedrock_calls_per_1k_rows', False)]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile (same definition as backend/process_feedback/stage_metrics.py)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_child(name, config):
+    """Runs one scenario invocation in a fresh interpreter and returns its measurements."""
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(config, f)
+        config_path = f.name
+    result_path = config_path + '.result'
+    try:
+        completed = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.run', '--child', name, '--child-config', config_path, '--child-result', result_path],
+            cwd=REPO_ROOT, capture_output=True, text=True
+        )
+        if completed.returncode != 0 or not os.path.exists(result_path):
+            return {'scenario': name, 'error': completed.stderr.strip().splitlines()[-20:]}
+        with open(result_path, encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        for path in (config_path, result_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def summarize(runs):
+    """Aggregates the runs of one scenario (failed runs are counted, not averaged)."""
+    # 304 is the expected answer of a conditional request (get_stats_not_modified)
+    ok_runs = [run for run in runs if 'error' not in run and run.get('status_code') in (200, 304)]
+    summary = {'runs': len(runs), 'failed_runs': len(runs) - len(ok_runs)}
+    if not ok_runs:
+        return summary
+    elapsed = [run['elapsed_seconds'] for run in ok_runs]
+    throughput = [run['rows_per_second'] for run in ok_runs if run.get('rows_per_second')]
+    summary.update({
+        'elapsed_seconds_p50': percentile(elapsed, 0.50),
+        'elapsed_seconds_p95': percentile(elapsed, 0.95),
+        'rows_per_second_p50': percentile(throughput, 0.50),
+        'peak_rss_mb_max': max(run['peak_rss_mb'] for run in ok_runs),
+        'import_seconds_p50': percentile([run['import_seconds'] for run in ok_runs], 0.50),
+    })
+    if 'bedrock_calls_per_1k_rows' in ok_runs[0]:
+        summary['bedrock_calls_per_1k_rows'] = percentile([run['bedrock_calls_per_1k_rows'] for run in ok_runs], 0.50)
+        summary['bedrock_throttled_p50'] = percentile([run['bedrock_throttled'] for run in ok_runs], 0.50)
+    # Per-stage p95 of the median run, so "which stage got slower" is visible without opening the runs
+    median_run = sorted(ok_runs, key=lambda run: run['elapsed_seconds'])[len(ok_runs) // 2]
+    if median_run.get('stage_timings'):
+        summary['stage_p95_ms'] = {stage: stats['p95_ms'] for stage, stats in median_run['stage_timings'].items()}
+    return summary
+
+
+def compare(report, baseline_path):
+    """Prints the change of the main metrics against an earlier report."""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('git_commit')}):")
+    for name, current in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS:
+            old, new = previous['summary'].get(metric), current['summary'].get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = change < 0 if higher_is_better else change > 0
+            print(f"  {name:28s} {metric:26s} {old:>10} -> {new:>10} ({change:+.1f}%){'  <-- regression' if worse and abs(change) >= 10 else ''}")
+
+
+def scenario_variants(names, scan_segments, config):
+    """(scenario, report label, config) per run series: one per segment count for full-scan read scenarios."""
+    for name in names:
+        if not scan_segments or not SCENARIOS[name].get('parallel_scan'):
+            yield name, name, config
+            continue
+        for segments in scan_segments:
+            yield name, f"{name}[segments={segments}]", dict(config, env=dict(config['env'], SCAN_TOTAL_SEGMENTS=str(segments)))
+
+
+def parse_env(values):
+    env = {}
+    for value in values or []:
+        key, _, setting = value.partition('=')
+        env[key] = setting
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the offline benchmarks for the three Lambda handlers.')
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--duplicate-rate', type=float, default=0.2)
+    parser.add_argument('--trivial-rate', type=float, default=0.05)
+    parser.add_argument('--empty-rate', type=float, default=0.01)
+    parser.add_argument('--comment-length', type=int, default=40)
+    parser.add_argument('--bedrock-latency-ms', type=float, default=80.0, help='Mean latency of one InvokeModel call')
+    parser.add_argument('--bedrock-jitter-ms', type=float, default=20.0)
+    parser.add_argument('--bedrock-per-comment-ms', type=float, default=5.0, help='Extra latency per comment in a batched call')
+    parser.add_argument('--bedrock-throttle-rate', type=float, default=0.0)
+    parser.add_argument('--bedrock-failure-rate', type=float, default=0.0)
+    parser.add_argument('--dynamodb-latency-ms', type=float, default=5.0)
+    parser.add_argument('--dynamodb-scan-mb-per-second', type=float, default=10.0, help='Read throughput of one Scan request stream (0 = unlimited)')
+    parser.add_argument('--dynamodb-unprocessed-rate', type=float, default=0.0)
+    parser.add_argument('--s3-first-byte-ms', type=float, default=20.0)
+    parser.add_argument('--s3-bandwidth-mb-per-second', type=float, default=80.0)
+    parser.add_argument('--scan-segments', type=int, nargs='+', metavar='N',
+                        help='Run each full-scan read scenario once per segment count (SCAN_TOTAL_SEGMENTS), reported as <scenario>[segments=N]')
+    parser.add_argument('--env', action='append', metavar='KEY=VALUE', help='Extra Lambda environment variable for every scenario (repeatable)')
+    parser.add_argument('--output', help='Report path (default benchmarks/results/<commit>-<timestamp>.json)')
+    parser.add_argument('--compare', metavar='REPORT', help='Earlier report to compare against')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--child-config', help=argparse.SUPPRESS)
+    parser.add_argument('--child-result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Child process: one scenario run, result handed back through a file (stdout belongs to the handler)
+        with open(args.child_config, encoding='utf-8') as f:
+            config = json.load(f)
+        result = run_scenario(args.child, config)
+        with open(args.child_result, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return
+
+    generator = {
+        'duplicate_rate': args.duplicate_rate, 'trivial_rate': args.trivial_rate, 'empty_rate': args.empty_rate,
+        'comment_length': args.comment_length, 'seed': args.seed,
+    }
+    config = {
+        'rows': args.rows,
+        'seed': args.seed,
+        'generator': generator,
+        'latency': {
+            'bedrock_ms': args.bedrock_latency_ms, 'bedrock_jitter_ms': args.bedrock_jitter_ms,
+            'bedrock_per_comment_ms': args.bedrock_per_comment_ms, 'dynamodb_ms': args.dynamodb_latency_ms,
+            'dynamodb_scan_mb_per_second': args.dynamodb_scan_mb_per_second,
+            's3_first_byte_ms': args.s3_first_byte_ms, 's3_bandwidth_mb_per_second': args.s3_bandwidth_mb_per_second,
+        },
+        'bedrock': {'throttle_rate': args.bedrock_throttle_rate, 'failure_rate': args.bedrock_failure_rate},
+        'dynamodb_unprocessed_rate': args.dynamodb_unprocessed_rate,
+        'env': parse_env(args.env),
+    }
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        config['csv_path'] = os.path.join(work_dir, 'feedback.csv')
+        csv_bytes = write_synthetic_csv(config['csv_path'], args.rows, **generator)
+        print(f"Synthetic CSV: {args.rows} rows, {csv_bytes} bytes")
+
+        report = {
+            'schema_version': RESULT_SCHEMA_VERSION,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'config': dict(config, csv_path=None, csv_bytes=csv_bytes, repeat=args.repeat),
+            'scenarios': {},
+        }
+        for name, label, variant_config in scenario_variants(args.scenarios, args.scan_segments, config):
+            runs = []
+            for attempt in range(args.repeat):
+                run = run_child(name, variant_config)
+                runs.append(run)
+                if 'error' in run:
+                    print(f"  {label} run {attempt + 1}: FAILED\n    " + '\n    '.join(run['error']))
+                else:
+                    print(f"  {label} run {attempt + 1}: {run['elapsed_seconds']:.2f}s, {run['rows_per_second']} rows/s, peak RSS {run['peak_rss_mb']} MB")
+            report['scenarios'][label] = {'summary': summarize(runs), 'runs': runs}
+
+    output_path = args.output or os.path.join(RESULTS_DIR, f"{report['git_commit']}-{time.strftime('%Y%m%d%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nReport written to {output_path}")
+    for name, scenario in report['scenarios'].items():
+        print(f"  {name:28s} {json.dumps({k: v for k, v in scenario['summary'].items() if k != 'stage_p95_ms'})}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
-// Function to create the Sentiment by Importance Stacked Bar Chart (uses all_mapped_comments_list)
-function createSentimentImportanceChart(canvasElement, allMappedCommentsList) {
+// Function to create the Sentiment by Importance Stacked Bar Chart (uses sentiment_importance_matrix from /stats)
+function createSentimentImportanceChart(canvasElement, sentimentImportanceMatrix) {
     const importanceLevels = ['1', '2', '3', '4', '5'];
     // Define all expected sentiments, including analysis outcomes, in the desired legend order
     const allSentimentsInOrder = ['Positive', 'Negative', 'Neutral', 'Mixed', 'Unknown', 'Skipped - Empty', 'Failed Analysis'];
@@ -11,23 +11,13 @@ function createSentimentImportanceChart(canvasElement, allMappedCommentsList) {
         return acc;
     }, {});
 
-    allMappedCommentsList.forEach(item => {
-        // Get importance, ensuring it's a number between 1 and 5
-        const importance = item.Importance !== undefined ? item.Importance : null;
-        const sentiment = item.Sentiment || 'Unknown'; // Default to Unknown if sentiment is missing
-
-        if (typeof importance === 'number' && importance >= 1 && importance <= 5) {
-             // Ensure sentiment is one of the expected ones, fallback to Unknown if unexpected
-            const mappedSentiment = allSentimentsInOrder.includes(sentiment) ? sentiment : 'Unknown';
-            countsByImportance[importance][mappedSentiment]++;
-        } else {
-            // Log items with invalid/missing importance if necessary
-            if (importance !== null && importance !== 0) {
-                 console.warn("Skipping item with invalid/unexpected importance for sentiment/importance chart:", item);
-            } else {
-                 // Optionally count items with Importance 0 or null under an 'N/A' or '0' category if you add one
-            }
-        }
+    // The backend returns { sentiment: { importanceLevel: count, ... }, ... }, already counted
+    Object.entries(sentimentImportanceMatrix).forEach(([sentiment, countsByLevel]) => {
+        // Ensure sentiment is one of the expected ones, fallback to Unknown if unexpected
+        const mappedSentiment = allSentimentsInOrder.includes(sentiment) ? sentiment : 'Unknown';
+        importanceLevels.forEach(level => {
+            countsByImportance[level][mappedSentiment] += countsByLevel[level] || 0;
+        });
     });
 
     // Prepare datasets for the stacked bar chart
@@ -142,6 +132,7 @@ let sentimentBarChart = null;
 let categoryBarChart = null;
 let importanceDistributionChart = null;
 let sentimentImportanceChart = null;
+let trendChart = null;
 
 // --- Define Color Palettes in JavaScript ---
 const chartColors = {
@@ -191,7 +182,9 @@ document.addEventListener('DOMContentLoaded', () => {
     // }
 
     fetchAndDisplayStats();
+    setupLoadMoreButtons();
     setupExportButton();
+    setupTrendControls();
 });
 
 // Function to destroy existing charts before creating new ones
@@ -251,27 +244,11 @@ async function fetchAndDisplayStats() {
 
     try {
         console.log(`Attempting to fetch stats from: ${API_BASE_URL}/stats`);
-        const response = await fetch(`${API_BASE_URL}/stats`);
-
-        if (!response.ok) {
-            // Handle non-2xx status codes (e.g., 400, 500)
-            const errorText = await response.text();
-             console.error(`Fetch failed with HTTP status ${response.status}:`, errorText);
-            throw new Error(`HTTP error ${response.status}: ${errorText}`);
-        }
-
-        const data = await response.json(); // This parses the OUTER API Gateway response { statusCode, headers, body }
-
-        console.log("Outer API Gateway response:", data); // Log the outer structure
-
-        // --- Check if the outer response has a body and parse the inner JSON string ---
-        if (!data || !data.body || typeof data.body !== 'string') {
-            console.error('API response is missing the body or body is not a string:', data);
-             throw new Error('API returned unexpected response structure.');
-        }
+        // Sends the ETag of the stored response; unchanged data comes back as 304 and the stored body is reused
+        const statsBody = await fetchStatsBody();
 
-        // Parse the JSON string inside the 'body' property
-        const stats = JSON.parse(data.body);
+        // Parse the JSON string of the inner 'body' property
+        const stats = JSON.parse(statsBody);
 
         console.log("Inner stats data parsed successfully:", stats); // Log the actual stats object
 
@@ -294,6 +271,7 @@ async function fetchAndDisplayStats() {
              highRiskCountEl.textContent = `Total High-Risk: 0`;
              highRiskTableBody.innerHTML = '<tr><td colspan="5">No high-risk comments identified.</td></tr>';
              topImportantTableBody.innerHTML = '<tr><td colspan="5">No top important comments identified.</td></tr>';
+             hideLoadMoreButtons();
 
             // Hide charts if no data
              if(sentimentCanvas) sentimentCanvas.style.display = 'none';
@@ -384,104 +362,35 @@ async function fetchAndDisplayStats() {
             categoryCanvas.style.display = 'none';
         }
 
-        // --- Display Importance Distribution Chart (using all_mapped_comments_list) ---
-         // This requires the backend to return stats.all_mapped_comments_list
-         if (importanceDistributionCanvas && stats.all_mapped_comments_list && Array.isArray(stats.all_mapped_comments_list) && stats.all_mapped_comments_list.length > 0) {
+        // --- Display Importance Distribution Chart (using importance_distribution) ---
+         // The backend counts the comments per importance level, so no comment list is needed here
+         if (importanceDistributionCanvas && stats.importance_distribution && typeof stats.importance_distribution === 'object') {
              importanceDistributionCanvas.style.display = 'block'; // Show canvas
              console.log("Creating Importance Distribution Chart...");
-             createImportanceDistributionChart(importanceDistributionCanvas, stats.all_mapped_comments_list); // Pass the list of comments
+             createImportanceDistributionChart(importanceDistributionCanvas, stats.importance_distribution);
          } else if (importanceDistributionCanvas) {
-             console.log("No data or list found for Importance Distribution Chart.");
+             console.log("No importance_distribution found for Importance Distribution Chart.");
              importanceDistributionCanvas.style.display = 'none';
          }
 
-         // --- Display Sentiment by Importance Stacked Bar Chart (using all_mapped_comments_list) ---
-         // This requires the backend to return stats.all_mapped_comments_list
-         if (sentimentImportanceCanvas && stats.all_mapped_comments_list && Array.isArray(stats.all_mapped_comments_list) && stats.all_mapped_comments_list.length > 0) {
+         // --- Display Sentiment by Importance Stacked Bar Chart (using sentiment_importance_matrix) ---
+         if (sentimentImportanceCanvas && stats.sentiment_importance_matrix && typeof stats.sentiment_importance_matrix === 'object' && Object.keys(stats.sentiment_importance_matrix).length > 0) {
              sentimentImportanceCanvas.style.display = 'block'; // Show canvas
              console.log("Creating Sentiment by Importance Chart...");
-             createSentimentImportanceChart(sentimentImportanceCanvas, stats.all_mapped_comments_list); // Pass the list of comments
+             createSentimentImportanceChart(sentimentImportanceCanvas, stats.sentiment_importance_matrix);
          } else if (sentimentImportanceCanvas) {
-             console.log("No data or list found for Sentiment by Importance Chart.");
+             console.log("No sentiment_importance_matrix found for Sentiment by Importance Chart.");
              sentimentImportanceCanvas.style.display = 'none';
          }
 
 
-        // --- Display High-Risk Comments (Table) ---
+        // --- Display High-Risk Comments and Top Important Comments (Tables) ---
+        // The comments are loaded page by page from GET /comments, not from the /stats response
         highRiskCountEl.textContent = `Total High-Risk: ${stats.high_risk_count || 0}`;
          console.log(`High-risk comments count reported by backend: ${stats.high_risk_count || 0}`);
-        const highRiskCommentRows = [];
-        // Check if high_risk_comments_list is an array and has items
-        if (stats.high_risk_comments_list && Array.isArray(stats.high_risk_comments_list) && stats.high_risk_comments_list.length > 0) {
-             console.log(`Populating ${stats.high_risk_comments_list.length} high-risk comments table...`);
-             // Optional: Sort high-risk comments by importance (high to low)
-             const sortedHighRisk = [...stats.high_risk_comments_list].sort((a, b) => (b.Importance || 0) - (a.Importance || 0));
-
-            sortedHighRisk.forEach(comment => {
-                 // Ensure each comment object is valid before accessing properties
-                if (comment && typeof comment === 'object') {
-                    // Safely access properties with defaults
-                    const importance = comment.Importance !== undefined ? comment.Importance : 'N/A';
-                    const originalComment = comment.OriginalComment || 'No Comment Text';
-                    const sentiment = comment.Sentiment || 'N/A';
-                    const category = comment.Category || 'N/A';
-                    const originalRowIndex = comment.OriginalCsvRowIndex !== undefined ? comment.OriginalCsvRowIndex : 'N/A';
-
-                    highRiskCommentRows.push(`
-                        <tr>
-                            <td>${importance}</td>
-                            <td>${escapeHTML(originalComment)}</td>
-                            <td>${sentiment}</td>
-                            <td>${category}</td>
-                            <td>${originalRowIndex}</td>
-                        </tr>`);
-                    } else {
-                         console.warn("Encountered invalid item in high_risk_comments_list:", comment);
-                    }
-            });
-        } else {
-             console.log("No high_risk_comments_list data for table.");
-             highRiskCommentRows.push('<tr><td colspan="5">No high-risk comments identified.</td></tr>');
-        }
-        highRiskTableBody.innerHTML = highRiskCommentRows.join('');
-
-
-        // --- Display Top Important Comments (Table) ---
-        const topImportantCommentRows = [];
-         // Check if top_important_comments is an array and has items
-         if (stats.top_important_comments && Array.isArray(stats.top_important_comments) && stats.top_important_comments.length > 0) {
-            console.log(`Populating ${stats.top_important_comments.length} top important comments table...`);
-            // The list is already sorted by importance from the backend
-            // Optional: Limit the number of displayed top comments if the list is very long
-            // const commentsToDisplay = stats.top_important_comments.slice(0, 20); // Show max 20
-            // commentsToDisplay.forEach(comment => { ... });
-            stats.top_important_comments.forEach(comment => {
-                 // Ensure each comment object is valid before accessing properties
-                if (comment && typeof comment === 'object') {
-                     // Safely access properties with defaults
-                    const importance = comment.Importance !== undefined ? comment.Importance : 'N/A';
-                    const originalComment = comment.OriginalComment || 'No Comment Text';
-                    const sentiment = comment.Sentiment || 'N/A';
-                    const category = comment.Category || 'N/A';
-                    const originalRowIndex = comment.OriginalCsvRowIndex !== undefined ? comment.OriginalCsvRowIndex : 'N/A';
-
-                    topImportantCommentRows.push(`
-                        <tr>
-                            <td>${importance}</td>
-                            <td>${escapeHTML(originalComment)}</td>
-                            <td>${sentiment}</td>
-                            <td>${category}</td>
-                            <td>${originalRowIndex}</td>
-                        </tr>`);
-                    } else {
-                         console.warn("Encountered invalid item in top_important_comments:", comment);
-                    }
-            });
-        } else {
-             console.log("No top_important_comments data for table.");
-             topImportantCommentRows.push('<tr><td colspan="5">No top important comments identified.</td></tr>');
-        }
-        topImportantTableBody.innerHTML = topImportantCommentRows.join('');
+        resetCommentTable('highRisk');
+        resetCommentTable('topImportant');
+        await Promise.all([loadCommentsPage('highRisk'), loadCommentsPage('topImportant')]);
 
 
     } catch (error) {
@@ -501,6 +410,7 @@ async function fetchAndDisplayStats() {
         categoryTableBody.innerHTML = '<tr><td colspan="4">Error loading data.</td></tr>';
         highRiskTableBody.innerHTML = '<tr><td colspan="5">Error loading data.</td></tr>';
         topImportantTableBody.innerHTML = '<tr><tr><td colspan="5">Error loading data.</td></tr>';
+        hideLoadMoreButtons();
     }
 }
 
@@ -682,28 +592,12 @@ function createCategoryChart(canvasElement, categoryCounts, categoryPercentages)
 }
 
 
-// Function to create the Importance Distribution Chart (uses all_mapped_comments_list)
-function createImportanceDistributionChart(canvasElement, allMappedCommentsList) {
-    // Count how many comments have each importance level (1-5)
-    const importanceCounts = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0};
-
-    allMappedCommentsList.forEach(item => {
-        // Get importance, ensuring it's a number between 1 and 5
-        const importance = item.Importance !== undefined ? item.Importance : null;
-         if (typeof importance === 'number' && importance >= 1 && importance <= 5) {
-             importanceCounts[importance]++;
-         } else {
-             // Log a warning if an item has unexpected importance data, excluding 0 or null
-             if (importance !== null && importance !== 0) {
-                console.warn("Skipping item with invalid/unexpected importance for distribution chart:", item);
-             }
-         }
-    });
-
+// Function to create the Importance Distribution Chart (uses importance_distribution from /stats)
+function createImportanceDistributionChart(canvasElement, importanceDistribution) {
     // Use labels 1 through 5
     const labels = ['1', '2', '3', '4', '5'];
-    // Map counts to labels, ensuring 0 for levels with no comments
-    const data = labels.map(label => importanceCounts[parseInt(label)] || 0);
+    // The backend counts the comments per importance level; ensure 0 for levels with no comments
+    const data = labels.map(label => importanceDistribution[label] || 0);
 
 
     // Define colors for importance levels (e.g., greener for low, redder for high), using the JS palette
@@ -778,21 +672,413 @@ function createImportanceDistributionChart(canvasElement, allMappedCommentsList)
 }
 
 
+// --- Trend Chart (GET /trends) ---
+// Each preset reads only the hourly or daily rollup buckets of its range; the comparison below
+// the title puts the last period (7 days or 24 hours) next to the one before it.
+const TREND_PRESETS = {
+    hours48: { granularity: 'hour', buckets: 48, comparePeriod: 24, periodLabel: '直近24時間' },
+    days30: { granularity: 'day', buckets: 30, comparePeriod: 7, periodLabel: '直近7日間' },
+    days90: { granularity: 'day', buckets: 90, comparePeriod: 7, periodLabel: '直近7日間' }
+};
+
+function setupTrendControls() {
+    const rangeSelect = document.getElementById('trend-range');
+    if (!rangeSelect) {
+        console.error("Trend range select not found!");
+        return;
+    }
+    rangeSelect.addEventListener('change', () => loadTrend(rangeSelect.value));
+    loadTrend(rangeSelect.value);
+}
+
+async function loadTrend(presetKey) {
+    const preset = TREND_PRESETS[presetKey] || TREND_PRESETS.days30;
+    const summaryElement = document.getElementById('trend-summary');
+    const canvasElement = document.getElementById('trendChart');
+    // Buckets are in UTC: 'from' is the start of the oldest bucket, 'to' defaults to now on the backend
+    const bucketMillis = preset.granularity === 'hour' ? 3600 * 1000 : 24 * 3600 * 1000;
+    const from = new Date(Date.now() - bucketMillis * (preset.buckets - 1));
+    const params = new URLSearchParams({ granularity: preset.granularity, from: from.toISOString().slice(0, 19) });
+    try {
+        const body = await fetchApiBody(`/trends?${params.toString()}`);
+        createTrendChart(canvasElement, body.buckets || [], preset.granularity);
+        if (summaryElement) summaryElement.textContent = trendSummary(body.buckets || [], preset);
+    } catch (error) {
+        console.error("Error fetching trends:", error);
+        if (summaryElement) summaryElement.textContent = `推移データを取得できませんでした: ${error.message}`;
+        if (trendChart) {
+            trendChart.destroy();
+            trendChart = null;
+        }
+    }
+}
+
+// Bucket key ('2025-04-01T09' or '2025-04-01', UTC) -> axis label in the browser's time zone
+function trendBucketLabel(bucket, granularity) {
+    if (granularity !== 'hour') return bucket;
+    const moment = new Date(`${bucket}:00:00Z`);
+    return `${moment.getMonth() + 1}/${moment.getDate()} ${String(moment.getHours()).padStart(2, '0')}:00`;
+}
+
+// Negative and high-risk shares of the last comparePeriod buckets against the period before them
+function trendSummary(buckets, preset) {
+    const sum = (slice) => slice.reduce((totals, bucket) => ({
+        processable: totals.processable + bucket.total_processable_comments,
+        negative: totals.negative + ((bucket.sentiment_counts || {}).Negative || 0),
+        highRisk: totals.highRisk + bucket.high_risk_count
+    }), { processable: 0, negative: 0, highRisk: 0 });
+    const current = sum(buckets.slice(-preset.comparePeriod));
+    const previous = sum(buckets.slice(-2 * preset.comparePeriod, -preset.comparePeriod));
+    const rate = (count, total) => total > 0 ? (count / total * 100) : null;
+    const describe = (label, count, total, previousCount, previousTotal) => {
+        const currentRate = rate(count, total);
+        const previousRate = rate(previousCount, previousTotal);
+        if (currentRate === null) return `${label}: データなし`;
+        if (previousRate === null) return `${label}: ${currentRate.toFixed(1)}%`;
+        const change = currentRate - previousRate;
+        return `${label}: ${currentRate.toFixed(1)}% (前期間比 ${change >= 0 ? '+' : ''}${change.toFixed(1)}pt)`;
+    };
+    return `${preset.periodLabel} — ` +
+        describe('ネガティブ', current.negative, current.processable, previous.negative, previous.processable) + ' / ' +
+        describe('ハイリスク', current.highRisk, current.processable, previous.highRisk, previous.processable);
+}
+
+function createTrendChart(canvasElement, buckets, granularity) {
+    if (!canvasElement) {
+        console.error("Trend chart canvas not found!");
+        return;
+    }
+    if (trendChart) {
+        trendChart.destroy();
+        trendChart = null;
+    }
+    trendChart = new Chart(canvasElement, {
+        data: {
+            labels: buckets.map(bucket => trendBucketLabel(bucket.bucket, granularity)),
+            datasets: [
+                {
+                    type: 'line',
+                    label: 'Negative',
+                    data: buckets.map(bucket => (bucket.sentiment_counts || {}).Negative || 0),
+                    borderColor: chartColors.sentiment.Negative,
+                    backgroundColor: chartColors.sentiment.Negative,
+                    tension: 0.2,
+                    yAxisID: 'y'
+                },
+                {
+                    type: 'line',
+                    label: 'High Risk',
+                    data: buckets.map(bucket => bucket.high_risk_count),
+                    borderColor: '#6610f2',
+                    backgroundColor: '#6610f2',
+                    tension: 0.2,
+                    yAxisID: 'y'
+                },
+                {
+                    type: 'bar',
+                    label: 'Processed Comments',
+                    data: buckets.map(bucket => bucket.total_processable_comments),
+                    backgroundColor: 'rgba(0, 123, 255, 0.2)',
+                    borderColor: 'rgba(0, 123, 255, 0.4)',
+                    borderWidth: 1,
+                    yAxisID: 'y'
+                }
+            ]
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            interaction: {
+                mode: 'index',
+                intersect: false
+            },
+            plugins: {
+                title: {
+                    display: true,
+                    text: granularity === 'hour' ? 'Hourly Trend' : 'Daily Trend',
+                    color: '#343a40'
+                }
+            },
+            scales: {
+                y: {
+                    beginAtZero: true,
+                    ticks: {
+                        precision: 0,
+                        color: '#6c757d'
+                    },
+                    title: {
+                        display: true,
+                        text: 'Count',
+                        color: '#343a40'
+                    }
+                },
+                x: {
+                    ticks: {
+                        color: '#6c757d',
+                        maxRotation: 0,
+                        autoSkip: true
+                    }
+                }
+            }
+        }
+    });
+}
+
+
+// --- Paginated Comment Tables (GET /comments) ---
+const COMMENTS_PAGE_SIZE = 50;
+// Only the columns shown in the tables are requested (the backend projects the items to these fields)
+const COMMENT_TABLE_FIELDS = 'Importance,OriginalComment,Sentiment,Category,OriginalCsvRowIndex';
+
+// One entry per comment table: the /comments filter, the rows loaded so far and the cursor of the next page
+const commentTables = {
+    highRisk: {
+        filter: 'high_risk',
+        tableBodySelector: '#high-risk-table tbody',
+        loadMoreButtonId: 'high-risk-load-more',
+        emptyMessage: 'No high-risk comments identified.',
+        rows: [],
+        nextCursor: null,
+        loading: false
+    },
+    topImportant: {
+        filter: 'important',
+        tableBodySelector: '#top-important-table tbody',
+        loadMoreButtonId: 'top-important-load-more',
+        emptyMessage: 'No top important comments identified.',
+        rows: [],
+        nextCursor: null,
+        loading: false
+    }
+};
+
+// Fetches an API path and returns the parsed inner JSON body (same response handling as /stats)
+async function fetchApiBody(path, options = {}) {
+    const response = await fetch(`${API_BASE_URL}${path}`, options);
+    if (!response.ok) {
+        const errorText = await response.text();
+        throw new Error(`HTTP error ${response.status}: ${errorText}`);
+    }
+    const data = await response.json();
+    if (!data || !data.body || typeof data.body !== 'string') {
+        throw new Error('API returned unexpected response structure.');
+    }
+    const body = JSON.parse(data.body);
+    if (body && body.error) {
+        throw new Error(`Backend error: ${body.error}`);
+    }
+    return body;
+}
+
+// --- Conditional /stats Requests ---
+// The last /stats body and its ETag are kept in localStorage, so that a page load without new data
+// gets a 304 (one GetItem on the backend) instead of a recomputed response.
+const STATS_STORAGE_KEY = 'feedbackStatsResponse';
+
+function readStoredStats() {
+    try {
+        const stored = JSON.parse(localStorage.getItem(STATS_STORAGE_KEY) || 'null');
+        return stored && stored.etag && typeof stored.body === 'string' ? stored : null;
+    } catch (error) {
+        return null; // Storage disabled or an unreadable entry: load without it
+    }
+}
+
+function storeStats(etag, body) {
+    try {
+        localStorage.setItem(STATS_STORAGE_KEY, JSON.stringify({ etag, body }));
+    } catch (error) {
+        console.warn('Could not store the stats response:', error);
+    }
+}
+
+// Fetches /stats with If-None-Match and returns the inner body string (the stored one on 304)
+async function fetchStatsBody() {
+    const stored = readStoredStats();
+    const response = await fetch(`${API_BASE_URL}/stats`, { headers: stored ? { 'If-None-Match': stored.etag } : {} });
+    if (response.status === 304 && stored) {
+        console.log(`Stats not modified (${stored.etag}); using the stored response.`);
+        return stored.body;
+    }
+    if (!response.ok) {
+        // Handle non-2xx status codes (e.g., 400, 500)
+        const errorText = await response.text();
+        console.error(`Fetch failed with HTTP status ${response.status}:`, errorText);
+        throw new Error(`HTTP error ${response.status}: ${errorText}`);
+    }
+
+    const data = await response.json(); // This parses the OUTER API Gateway response { statusCode, headers, body }
+    console.log("Outer API Gateway response:", data); // Log the outer structure
+
+    // The wrapped form carries the status code and ETag inside the outer response
+    if (data && data.statusCode === 304 && stored) {
+        console.log(`Stats not modified (${stored.etag}); using the stored response.`);
+        return stored.body;
+    }
+    // --- Check if the outer response has a body and parse the inner JSON string ---
+    if (!data || !data.body || typeof data.body !== 'string') {
+        console.error('API response is missing the body or body is not a string:', data);
+        throw new Error('API returned unexpected response structure.');
+    }
+    const etag = response.headers.get('ETag') || (data.headers && data.headers.ETag);
+    if (etag) {
+        storeStats(etag, data.body);
+    }
+    return data.body;
+}
+
+function resetCommentTable(tableKey) {
+    const state = commentTables[tableKey];
+    state.rows = [];
+    state.nextCursor = null;
+    document.querySelector(state.tableBodySelector).innerHTML = '<tr><td colspan="5">Loading comments...</td></tr>';
+}
+
+// Loads the next page of a comment table and appends it
+async function loadCommentsPage(tableKey) {
+    const state = commentTables[tableKey];
+    if (state.loading) {
+        return; // A page is already being loaded
+    }
+    state.loading = true;
+    const loadMoreButton = document.getElementById(state.loadMoreButtonId);
+    if (loadMoreButton) loadMoreButton.disabled = true;
+
+    try {
+        // A page can come back short when few comments match the filter;
+        // keep following the cursor until a full page has arrived or there is nothing left
+        let newRows = 0;
+        do {
+            const params = new URLSearchParams({ filter: state.filter, limit: COMMENTS_PAGE_SIZE, fields: COMMENT_TABLE_FIELDS });
+            if (state.nextCursor) {
+                params.set('cursor', state.nextCursor);
+            }
+            const page = await fetchApiBody(`/comments?${params.toString()}`);
+            state.rows.push(...(page.items || []));
+            newRows += (page.items || []).length;
+            state.nextCursor = page.next_cursor || null;
+        } while (state.nextCursor && newRows < COMMENTS_PAGE_SIZE);
+        console.log(`Loaded ${newRows} ${state.filter} comments (${state.rows.length} in total, more: ${Boolean(state.nextCursor)}).`);
+        renderCommentTable(state);
+    } catch (error) {
+        console.error(`Error loading ${state.filter} comments:`, error);
+        if (state.rows.length === 0) {
+            document.querySelector(state.tableBodySelector).innerHTML = '<tr><td colspan="5">Error loading data.</td></tr>';
+        }
+        // The cursor still points at the page that failed, so "load more" retries it
+    } finally {
+        state.loading = false;
+        if (loadMoreButton) {
+            loadMoreButton.disabled = false;
+            loadMoreButton.hidden = !state.nextCursor;
+        }
+    }
+}
+
+function renderCommentTable(state) {
+    const tableBody = document.querySelector(state.tableBodySelector);
+    if (state.rows.length === 0) {
+        tableBody.innerHTML = `<tr><td colspan="5">${state.emptyMessage}</td></tr>`;
+        return;
+    }
+    // Pages arrive in table order; show the loaded comments by importance (high to low)
+    const sortedRows = [...state.rows].sort((a, b) => (b.Importance || 0) - (a.Importance || 0));
+    tableBody.innerHTML = sortedRows.map(comment => {
+        // Safely access properties with defaults
+        const importance = comment.Importance !== undefined ? comment.Importance : 'N/A';
+        const originalComment = comment.OriginalComment || 'No Comment Text';
+        const sentiment = comment.Sentiment || 'N/A';
+        const category = comment.Category || 'N/A';
+        const originalRowIndex = comment.OriginalCsvRowIndex !== undefined ? comment.OriginalCsvRowIndex : 'N/A';
+        return `
+                        <tr>
+                            <td>${importance}</td>
+                            <td>${escapeHTML(originalComment)}</td>
+                            <td>${sentiment}</td>
+                            <td>${category}</td>
+                            <td>${originalRowIndex}</td>
+                        </tr>`;
+    }).join('');
+}
+
+function setupLoadMoreButtons() {
+    Object.entries(commentTables).forEach(([tableKey, state]) => {
+        const loadMoreButton = document.getElementById(state.loadMoreButtonId);
+        if (loadMoreButton) {
+            loadMoreButton.addEventListener('click', () => loadCommentsPage(tableKey));
+        } else {
+            console.error(`Load more button #${state.loadMoreButtonId} not found!`);
+        }
+    });
+}
+
+function hideLoadMoreButtons() {
+    Object.values(commentTables).forEach(state => {
+        const loadMoreButton = document.getElementById(state.loadMoreButtonId);
+        if (loadMoreButton) loadMoreButton.hidden = true;
+    });
+}
+
+
+// --- Export (POST /export/jobs?format=) ---
+// The export runs as a job on the backend (written to S3 in the background); the page polls its
+// status and downloads the file from the presigned URL once it is complete. The format comes
+// from the #export-format select (csv, csv.gz, jsonl or parquet).
+const EXPORT_POLL_INTERVAL_MS = 2000;
+const EXPORT_MAX_WAIT_MS = 15 * 60 * 1000; // The job's Lambda timeout
+
 function setupExportButton() {
     const exportButton = document.getElementById('export-button');
     // Check if the button element exists
     if (exportButton) {
-        exportButton.addEventListener('click', () => {
-            console.log("Export button clicked. Triggering CSV download...");
-            // Simply navigate to the export endpoint. The browser handles the download due to Content-Disposition header.
-            // Ensure the export Lambda also has CORS headers!
-            window.location.href = `${API_BASE_URL}/export/csv`;
-        });
+        exportButton.addEventListener('click', () => runExportJob(exportButton));
     } else {
         console.error("Export button element not found!");
     }
 }
 
+function setExportStatus(message, isError = false) {
+    const exportStatus = document.getElementById('export-status');
+    if (exportStatus) {
+        exportStatus.textContent = message;
+        exportStatus.className = isError ? 'export-status error' : 'export-status';
+    }
+}
+
+async function runExportJob(exportButton) {
+    console.log("Export button clicked. Starting export job...");
+    exportButton.disabled = true;
+    setExportStatus('エクスポートを開始しています...');
+    try {
+        const formatSelect = document.getElementById('export-format');
+        const format = formatSelect ? formatSelect.value : 'csv';
+        const job = await fetchApiBody(`/export/jobs?format=${encodeURIComponent(format)}`, { method: 'POST' });
+        const startedAt = Date.now();
+        while (Date.now() - startedAt < EXPORT_MAX_WAIT_MS) {
+            await new Promise(resolve => setTimeout(resolve, EXPORT_POLL_INTERVAL_MS));
+            const status = await fetchApiBody(`/export/jobs/${encodeURIComponent(job.job_id)}`);
+            if (status.status === 'COMPLETE') {
+                setExportStatus(`エクスポート完了 (${status.row_count.toLocaleString()} 件)。ダウンロードを開始します。`);
+                // The presigned URL serves the file with Content-Disposition: attachment
+                window.location.href = status.download_url;
+                return;
+            }
+            if (status.status === 'FAILED') {
+                throw new Error(status.error_message || 'Export job failed.');
+            }
+            setExportStatus(status.row_count > 0
+                ? `エクスポート中... (${status.row_count.toLocaleString()} 件)`
+                : 'エクスポート中...');
+        }
+        throw new Error('Export did not finish in time.');
+    } catch (error) {
+        console.error("Error exporting data:", error);
+        setExportStatus(`エクスポートに失敗しました: ${error.message}`, true);
+    } finally {
+        exportButton.disabled = false;
+    }
+}
+
 // Simple helper function to prevent basic XSS if comments contain HTML/script tags
 function escapeHTML(str) {
     // Ensure input is treated as a string